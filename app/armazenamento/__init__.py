@@ -0,0 +1,50 @@
+"""Armazenamento dos dados das coletas fora dos documentos do Mongo.
+
+- `datasets`: partes completo/treino/teste de `arquivos` em Parquet (GridFS ou disco), com
+  leitura única por `carregar_df` e migração preguiçosa do base64-XLSX antigo; treino/teste de
+  uma divisão são posições sobre o completo (`salvar_divisao`/`salvar_indices`); `salvar_bloco`/
+  `ler_bloco` guardam bytes crus no mesmo backend (partes dos uploads em andamento).
+- `blobs`: registro dos blobs endereçados por conteúdo (sha256) e das suas referências;
+  `reter_refs`/`apagar_refs` somam e subtraem, `coletar_orfaos` apaga os sem referência.
+- `datasets_exemplo`: cache dos datasets de exemplo já preparados (partes compartilhadas entre
+  as coletas dos alunos), por assinatura dos parâmetros. Importado direto pelo router.
+- `figuras`: cache endereçado por conteúdo dos PNGs da avaliação de modelos, com poda LRU.
+- `partes_pipeline`: valor completo dos campos pesados dos pipelines salvos (o documento fica
+  com o resumo e a referência). Importado direto pelo router.
+"""
+from app.armazenamento.datasets import (
+    PARTES,
+    DatasetIndisponivel,
+    apagar_refs,
+    campos_set,
+    campos_unset_legado,
+    carregar_df,
+    coletar_orfaos,
+    contar_linhas,
+    ler_bloco,
+    reter_refs,
+    salvar_bloco,
+    salvar_divisao,
+    salvar_indices,
+    salvar_partes,
+)
+from app.armazenamento.figuras import gravar_figuras, ler_figuras
+
+__all__ = [
+    "PARTES",
+    "DatasetIndisponivel",
+    "apagar_refs",
+    "campos_set",
+    "campos_unset_legado",
+    "carregar_df",
+    "coletar_orfaos",
+    "contar_linhas",
+    "gravar_figuras",
+    "ler_bloco",
+    "ler_figuras",
+    "reter_refs",
+    "salvar_bloco",
+    "salvar_divisao",
+    "salvar_indices",
+    "salvar_partes",
+]
@@ -0,0 +1,123 @@
+"""Registro dos blobs dos datasets, endereçados por conteúdo, com contagem de referências.
+
+Cada parte gravada virava um blob novo (chave uuid), mesmo quando o conteúdo já existia: o
+mesmo CSV do Iris reenviado pela turma inteira, o treino de uma planilha igual ao completo, a
+cópia do teste que cada modelo treinado guardava. Agora a chave de um blob é o sha256 dos bytes
+(``<hash>.<formato>``), e este registro guarda, por chave, quantas referências de documentos
+apontam para ele:
+
+- gravar um conteúdo que já existe só soma uma referência — nenhum byte novo no backend;
+- quem passa a apontar para um blob existente (a coleta de um dataset de exemplo já preparado,
+  o modelo que guarda o teste da coleta) soma uma com `reter`;
+- `apagar_refs` subtrai em vez de apagar, e o blob só sai na coleta de órfãos
+  (`datasets.coletar_orfaos`), depois de ``DATASET_BLOBS_CARENCIA_MIN`` sem referência — uma
+  folga para quem leu a referência de um documento e ainda vai gravá-la em outro.
+
+Backends do registro, como no limite de taxa (``DATASET_BLOBS_REGISTRO``):
+
+- ``mongo`` (padrão): coleção `blobs_datasets`, um documento por chave com ``refs``,
+  ``backend``, ``bytes`` e ``atualizado_em``; os `$inc` são atômicos entre os workers;
+- ``memoria``: dicionário do processo (um worker só, e os testes).
+
+Blobs antigos (chave uuid, sem ``hash`` na referência) ficam fora do registro e continuam
+apagados na hora, como antes.
+"""
+from __future__ import annotations
+
+import os
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+REGISTRO = os.getenv("DATASET_BLOBS_REGISTRO", "mongo").strip().lower()
+_COLECAO = "blobs_datasets"
+
+
+def _agora() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class _Memoria:
+    def __init__(self):
+        self.entradas: Dict[str, dict] = {}
+
+    async def registrar(self, chave: str, backend: str, tamanho: int) -> Optional[dict]:
+        anterior = self.entradas.get(chave)
+        atual = dict(anterior) if anterior else {"_id": chave, "refs": 0, "backend": backend, "bytes": tamanho}
+        atual["refs"] += 1
+        atual["atualizado_em"] = _agora()
+        self.entradas[chave] = atual
+        return anterior
+
+    async def somar(self, chave: str, delta: int) -> None:
+        entrada = self.entradas.get(chave)
+        if entrada is not None:
+            entrada["refs"] += delta
+            entrada["atualizado_em"] = _agora()
+
+    async def orfaos(self, limite: datetime, maximo: int) -> List[dict]:
+        return [dict(e) for e in self.entradas.values()
+                if e["refs"] <= 0 and e["atualizado_em"] < limite][:maximo]
+
+    async def remover_se_orfao(self, chave: str, limite: datetime) -> bool:
+        entrada = self.entradas.get(chave)
+        if entrada is None or entrada["refs"] > 0 or entrada["atualizado_em"] >= limite:
+            return False
+        del self.entradas[chave]
+        return True
+
+
+class _Mongo:
+    def __init__(self):
+        self._colecao = None
+
+    def colecao(self):
+        # Import tardio (como em datasets.py): o módulo continua importável sem MONGO_URL.
+        if self._colecao is None:
+            from app import database
+            self._colecao = database.db[_COLECAO]
+        return self._colecao
+
+    async def registrar(self, chave: str, backend: str, tamanho: int) -> Optional[dict]:
+        # Devolve o documento ANTES do $inc: None quer dizer "conteúdo novo, grave o blob".
+        return await self.colecao().find_one_and_update(
+            {"_id": chave},
+            {"$inc": {"refs": 1}, "$set": {"atualizado_em": _agora()},
+             "$setOnInsert": {"backend": backend, "bytes": tamanho}},
+            upsert=True,
+        )
+
+    async def somar(self, chave: str, delta: int) -> None:
+        await self.colecao().update_one(
+            {"_id": chave}, {"$inc": {"refs": delta}, "$set": {"atualizado_em": _agora()}}
+        )
+
+    async def orfaos(self, limite: datetime, maximo: int) -> List[dict]:
+        cursor = self.colecao().find({"refs": {"$lte": 0}, "atualizado_em": {"$lt": limite}})
+        return await cursor.to_list(maximo)
+
+    async def remover_se_orfao(self, chave: str, limite: datetime) -> bool:
+        # Condicional: se alguém reteve o blob entre a busca e aqui, ele fica.
+        res = await self.colecao().delete_one(
+            {"_id": chave, "refs": {"$lte": 0}, "atualizado_em": {"$lt": limite}}
+        )
+        return res.deleted_count == 1
+
+
+_memoria = _Memoria()
+_mongo = _Mongo()
+
+
+def registro():
+    return _memoria if REGISTRO == "memoria" else _mongo
+
+
+async def criar_indices() -> None:
+    """Busca dos órfãos (startup da API; create_index é idempotente)."""
+    if REGISTRO == "mongo":
+        await _mongo.colecao().create_index([("refs", 1), ("atualizado_em", 1)])
+
+
+def limpar() -> None:
+    """Esvazia o registro em memória (testes)."""
+    global _memoria
+    _memoria = _Memoria()
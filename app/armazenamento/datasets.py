@@ -0,0 +1,558 @@
+"""Armazenamento colunar dos datasets das coletas (`arquivos`).
+
+Antes, cada porta de entrada (CSV, XLSX, URL, dataset de exemplo) gravava o completo, o treino e o
+teste como XLSX em base64 DENTRO do documento de `arquivos`, e cada leitura (treino, avaliação,
+pairplot, prévia da configuração) decodificava o XLSX de novo com o openpyxl. Num upload de 50 MB
+essa ida e volta dominava a latência da requisição, e o base64 inflava o documento em ~33%.
+
+Agora cada parte é um Parquet (tipado e comprimido, via pyarrow) guardado FORA do documento, num
+backend plugável:
+
+- ``gridfs`` (padrão): bucket `datasets` no próprio Mongo — entra no backup do banco e vale para
+  todos os workers;
+- ``disco``: diretório local (``DATASET_STORE_DIR``), útil em desenvolvimento e nos testes.
+
+O documento guarda só a referência de cada parte em ``armazenamento.<parte>``
+(``{"backend", "chave", "hash", "formato", "num_linhas", "bytes"}``). A chave é o sha256 do
+conteúdo: bytes iguais viram um blob só, com as referências contadas em `blobs` e os órfãos
+apagados por :func:`coletar_orfaos`. Treino e teste de uma divisão não são cópias: são o vetor
+de posições (``.npy``) sobre o completo, e a referência leva a do completo em ``base``. A
+leitura é uma só,
+:func:`carregar_df`, e faz a **migração preguiçosa**: um documento antigo (só com
+``content_<parte>_base64``) é lido como antes, convertido para Parquet e regravado na primeira
+vez que alguém o usa — sem script de migração e sem janela de manutenção.
+"""
+from __future__ import annotations
+
+import asyncio
+import base64
+import hashlib
+import logging
+import os
+import re
+import uuid
+from datetime import datetime, timedelta, timezone
+from io import BytesIO, StringIO
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+from bson import ObjectId
+
+from app.armazenamento import blobs
+from app.funcoes_genericas.validacao import MAX_ARQUIVO_BASE64
+
+logger = logging.getLogger(__name__)
+
+PARTES = ("completo", "treino", "teste")
+FORMATO = "parquet"
+
+# zstd comprime melhor que o snappy padrão com custo de leitura parecido; o pyarrow que já
+# acompanha o projeto traz o codec.
+_COMPRESSAO = "zstd"
+
+BACKEND_PADRAO = os.getenv("DATASET_STORE", "gridfs").strip().lower() or "gridfs"
+STORE_DIR = Path(
+    os.getenv("DATASET_STORE_DIR") or (Path(__file__).resolve().parents[2] / "dataset_store")
+)
+_BUCKET_GRIDFS = "datasets"
+# Chave endereçada por conteúdo (sha256 + formato). As antigas são uuid (disco) ou ObjectId.
+_CHAVE_CONTEUDO = re.compile(r"^[0-9a-f]{64}\.[a-z0-9]+$")
+FORMATO_INDICES = "npy"
+CARENCIA = timedelta(minutes=float(os.getenv("DATASET_BLOBS_CARENCIA_MIN", "60")))
+GC_INTERVALO_SEC = float(os.getenv("DATASET_BLOBS_GC_INTERVALO_SEC", "3600"))
+
+
+class DatasetIndisponivel(Exception):
+    """A parte pedida do dataset não pôde ser lida.
+
+    `kind` segue o mesmo espírito do `SandboxError`: quem chama decide o status HTTP —
+    ``nao_encontrado`` (coleta inexistente), ``ausente`` (coleta sem essa parte),
+    ``grande`` (conteúdo legado acima do teto) ou ``corrompido`` (não deu para decodificar).
+    """
+
+    def __init__(self, message: str, kind: str = "ausente"):
+        super().__init__(message)
+        self.kind = kind
+
+
+# ------------------------------------------------------------------ (de)serialização
+
+def _normalizar_para_arrow(df: pd.DataFrame) -> pd.DataFrame:
+    """Deixa o dataframe gravável em Parquet sem mudar o que o aluno vê.
+
+    Parquet exige nome de coluna texto e um tipo por coluna. CSV de aluno traz colunas
+    `object` misturando número e texto ("12", 7, "n/d"); o XLSX aceitava, o Arrow recusa.
+    Só essas colunas viram texto (mantendo os nulos) — as numéricas seguem tipadas.
+    """
+    import pyarrow as pa
+
+    df = df.reset_index(drop=True)
+    if not all(isinstance(c, str) for c in df.columns):
+        df.columns = [str(c) for c in df.columns]
+    for col in df.columns:
+        if df[col].dtype != object:
+            continue
+        try:
+            pa.array(df[col], from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    return df
+
+
+def serializar_df(df: pd.DataFrame) -> bytes:
+    buffer = BytesIO()
+    _normalizar_para_arrow(df).to_parquet(
+        buffer, engine="pyarrow", index=False, compression=_COMPRESSAO
+    )
+    return buffer.getvalue()
+
+
+def desserializar_df(dados: bytes) -> pd.DataFrame:
+    return pd.read_parquet(BytesIO(dados), engine="pyarrow")
+
+
+def serializar_indices(indices) -> bytes:
+    indices = np.asarray(indices)
+    tipo = np.int32 if len(indices) == 0 or indices.max() < 2**31 else np.int64
+    buffer = BytesIO()
+    np.save(buffer, indices.astype(tipo, copy=False), allow_pickle=False)
+    return buffer.getvalue()
+
+
+def desserializar_indices(dados: bytes) -> np.ndarray:
+    return np.load(BytesIO(dados), allow_pickle=False)
+
+
+def decodificar_base64_legado(b64: str) -> pd.DataFrame:
+    """Lê o formato antigo: XLSX (openpyxl/xlrd) ou CSV cru, em base64.
+
+    Mesma cascata que estava copiada em cada leitor (treino, avaliação, pairplot, prévia).
+    """
+    binario = base64.b64decode(b64)
+    try:
+        return pd.read_excel(BytesIO(binario), engine="openpyxl")
+    except Exception:
+        pass
+    try:
+        return pd.read_excel(BytesIO(binario), engine="xlrd")
+    except Exception:
+        pass
+    try:
+        texto = binario.decode("utf-8")
+    except UnicodeDecodeError:
+        texto = binario.decode("latin-1")
+    primeira = texto.split("\n", 1)[0]
+    sep = "\t" if "\t" in primeira else ";" if ";" in primeira else ","
+    return pd.read_csv(StringIO(texto), sep=sep)
+
+
+# ------------------------------------------------------------------ backends
+
+class _BackendDisco:
+    nome = "disco"
+
+    def __init__(self, raiz: Path):
+        self.raiz = raiz
+
+    def _caminho(self, chave: str) -> Path:
+        # A chave é gerada aqui (uuid), mas vem do banco na leitura: nada de subir diretório.
+        if not chave or "/" in chave or "\\" in chave or chave.startswith("."):
+            raise DatasetIndisponivel(f"Chave de dataset inválida: {chave!r}", "corrompido")
+        return self.raiz / chave
+
+    async def gravar(self, dados: bytes, formato: str = FORMATO, chave: Optional[str] = None) -> str:
+        chave = chave or f"{uuid.uuid4().hex}.{formato}"
+
+        def _gravar():
+            self.raiz.mkdir(parents=True, exist_ok=True)
+            destino = self._caminho(chave)
+            # Grava num temporário e renomeia: um leitor nunca vê arquivo pela metade. O nome
+            # do temporário é único porque dois uploads do mesmo conteúdo gravam a mesma chave.
+            tmp = destino.with_name(f".{destino.name}.{uuid.uuid4().hex}.tmp")
+            tmp.write_bytes(dados)
+            os.replace(tmp, destino)
+
+        await asyncio.to_thread(_gravar)
+        return chave
+
+    async def existe(self, chave: str) -> bool:
+        return await asyncio.to_thread(self._caminho(chave).exists)
+
+    async def ler(self, chave: str) -> bytes:
+        caminho = self._caminho(chave)
+        try:
+            return await asyncio.to_thread(caminho.read_bytes)
+        except FileNotFoundError:
+            raise DatasetIndisponivel("Conteúdo do dataset não encontrado no armazenamento.", "ausente")
+
+    async def apagar(self, chave: str) -> None:
+        await asyncio.to_thread(self._caminho(chave).unlink, True)
+
+
+class _BackendGridFS:
+    nome = "gridfs"
+
+    def __init__(self):
+        self._bucket = None
+
+    def _bucket_atual(self):
+        # Import tardio (como nos seeds): o módulo continua importável sem MONGO_URL.
+        if self._bucket is None:
+            from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+            from app import database
+
+            self._bucket = AsyncIOMotorGridFSBucket(database.db, bucket_name=_BUCKET_GRIDFS)
+        return self._bucket
+
+    @staticmethod
+    def _file_id(chave: str):
+        # Endereçada por conteúdo, a chave é o próprio `_id`; as antigas eram ObjectId.
+        if _CHAVE_CONTEUDO.match(chave or ""):
+            return chave
+        if ObjectId.is_valid(chave):
+            return ObjectId(chave)
+        raise DatasetIndisponivel(f"Chave de dataset inválida: {chave!r}", "corrompido")
+
+    async def gravar(self, dados: bytes, formato: str = FORMATO, chave: Optional[str] = None) -> str:
+        if chave is None:
+            file_id = await self._bucket_atual().upload_from_stream(
+                f"dataset.{formato}", dados, metadata={"formato": formato}
+            )
+            return str(file_id)
+        from gridfs.errors import FileExists
+        from pymongo.errors import DuplicateKeyError
+
+        try:
+            await self._bucket_atual().upload_from_stream_with_id(
+                chave, chave, dados, metadata={"formato": formato}
+            )
+        except (FileExists, DuplicateKeyError):
+            pass  # outro worker gravou o mesmo conteúdo antes: os bytes são os mesmos
+        return chave
+
+    async def existe(self, chave: str) -> bool:
+        from app import database
+
+        achado = await database.db[f"{_BUCKET_GRIDFS}.files"].find_one({"_id": self._file_id(chave)}, {"_id": 1})
+        return achado is not None
+
+    async def ler(self, chave: str) -> bytes:
+        file_id = self._file_id(chave)
+        from gridfs.errors import NoFile
+
+        try:
+            stream = await self._bucket_atual().open_download_stream(file_id)
+        except NoFile:
+            raise DatasetIndisponivel("Conteúdo do dataset não encontrado no armazenamento.", "ausente")
+        return await stream.read()
+
+    async def apagar(self, chave: str) -> None:
+        from gridfs.errors import NoFile
+
+        try:
+            await self._bucket_atual().delete(self._file_id(chave))
+        except (DatasetIndisponivel, NoFile):
+            pass
+
+
+_backends: Dict[str, Any] = {}
+
+
+def backend(nome: Optional[str] = None):
+    """Backend pelo nome (padrão: ``DATASET_STORE``). Instâncias reaproveitadas por processo."""
+    nome = (nome or BACKEND_PADRAO).lower()
+    if nome not in _backends:
+        if nome == "disco":
+            _backends[nome] = _BackendDisco(STORE_DIR)
+        elif nome == "gridfs":
+            _backends[nome] = _BackendGridFS()
+        else:
+            raise ValueError(f"Backend de dataset desconhecido: {nome!r} (use 'gridfs' ou 'disco').")
+    return _backends[nome]
+
+
+# ------------------------------------------------------------------ API
+
+async def _guardar(dados: bytes, formato: str) -> dict:
+    """Grava `dados` pelo conteúdo: se o blob já existe, só soma uma referência no registro."""
+    digest = await asyncio.to_thread(lambda: hashlib.sha256(dados).hexdigest())
+    chave = f"{digest}.{formato}"
+    be = backend()
+    anterior = await blobs.registro().registrar(chave, be.nome, len(dados))
+    if anterior is not None:
+        # O registro é de quem gravou primeiro (o backend pode ter mudado desde então).
+        be = backend(anterior.get("backend"))
+    try:
+        # Registrado mas sem bytes: gravação anterior que falhou no meio, ou coletado agora.
+        if anterior is None or not await be.existe(chave):
+            await be.gravar(dados, formato, chave=chave)
+    except BaseException:
+        await blobs.registro().somar(chave, -1)
+        raise
+    return {"backend": be.nome, "chave": chave, "hash": digest, "formato": formato, "bytes": len(dados)}
+
+
+async def salvar_df(df: pd.DataFrame) -> dict:
+    """Grava um dataframe no backend ativo e devolve a referência para o documento."""
+    # Serializar é CPU: fora do event loop.
+    dados = await asyncio.to_thread(serializar_df, df)
+    ref = await _guardar(dados, FORMATO)
+    ref["num_linhas"] = int(df.shape[0])
+    return ref
+
+
+async def salvar_indices(base: dict, indices) -> dict:
+    """Grava uma parte como posições (iloc) sobre a referência `base` (o completo).
+
+    A referência devolvida carrega a da base e também a retém: enquanto o treino existir, o
+    completo sobre o qual ele foi dividido não é coletado.
+    """
+    dados = await asyncio.to_thread(serializar_indices, indices)
+    ref = await _guardar(dados, FORMATO_INDICES)
+    await reter_refs([base])
+    ref.update({"num_linhas": int(len(indices)), "base": base})
+    return ref
+
+
+async def salvar_partes(partes: Dict[str, pd.DataFrame]) -> Dict[str, dict]:
+    """Grava várias partes (``completo``/``treino``/``teste``) e devolve ``{parte: ref}``.
+
+    Para um documento novo, o resultado vai inteiro em ``armazenamento``; para atualizar um
+    existente, use :func:`campos_set` e não perca as partes que não mudaram.
+    """
+    refs = {}
+    for parte, df in partes.items():
+        if parte not in PARTES:
+            raise ValueError(f"Parte de dataset desconhecida: {parte!r}")
+        refs[parte] = await salvar_df(df)
+    return refs
+
+
+async def salvar_divisao(df: pd.DataFrame, idx_treino, idx_teste) -> Dict[str, dict]:
+    """O completo em Parquet e o treino/teste como posições sobre ele (ver `dividir_indices`).
+
+    Nenhuma parte é materializada: o pico de memória é o do próprio completo.
+    """
+    completo = await salvar_df(df)
+    return {
+        "completo": completo,
+        "treino": await salvar_indices(completo, idx_treino),
+        "teste": await salvar_indices(completo, idx_teste),
+    }
+
+
+async def salvar_bloco(dados: bytes, formato: str) -> dict:
+    """Grava bytes crus (ex.: uma parte de upload em andamento) no backend ativo.
+
+    Mesma referência de :func:`salvar_df` — então :func:`apagar_refs` serve para os dois —,
+    mas sem `num_linhas`: o conteúdo não é um Parquet.
+    """
+    return await _guardar(bytes(dados), formato)
+
+
+async def ler_bloco(ref: dict) -> bytes:
+    """Bytes de uma referência gravada por :func:`salvar_bloco`."""
+    try:
+        return await backend(ref.get("backend")).ler(ref["chave"])
+    except DatasetIndisponivel:
+        raise
+    except Exception as e:
+        raise DatasetIndisponivel(f"Erro ao ler o bloco armazenado: {e}", "corrompido")
+
+
+def campos_set(refs: Dict[str, dict]) -> Dict[str, Any]:
+    """`$set` das referências por caminho (``armazenamento.treino``...), sem tocar nas outras."""
+    return {f"armazenamento.{parte}": ref for parte, ref in refs.items()}
+
+
+def campos_unset_legado(partes: Iterable[str]) -> Dict[str, str]:
+    """`$unset` do base64 antigo das partes regravadas — senão o documento continua gordo."""
+    return {f"content_{parte}_base64": "" for parte in partes}
+
+
+async def ler_ref(ref: dict, bases: Optional[Dict[str, pd.DataFrame]] = None) -> pd.DataFrame:
+    """DataFrame de uma referência. Numa divisão, lê a base e aplica as posições; quem vai ler
+    várias partes da mesma coleta passa um `bases` ({chave: df}) e lê o completo uma vez só —
+    endereçado por conteúdo, o que está numa chave nunca muda."""
+    try:
+        dados = await backend(ref.get("backend")).ler(ref["chave"])
+    except DatasetIndisponivel:
+        raise
+    except Exception as e:
+        raise DatasetIndisponivel(f"Erro ao ler o dataset armazenado: {e}", "corrompido")
+    base = ref.get("base")
+    try:
+        if base:
+            indices = await asyncio.to_thread(desserializar_indices, dados)
+        else:
+            # Decodificar Parquet é CPU: fora do event loop.
+            return await asyncio.to_thread(desserializar_df, dados)
+    except Exception as e:
+        raise DatasetIndisponivel(f"Erro ao decodificar o dataset armazenado: {e}", "corrompido")
+    completo = bases.get(base.get("chave")) if bases is not None else None
+    if completo is None:
+        completo = await ler_ref(base)
+        if bases is not None:
+            bases[base.get("chave")] = completo
+    try:
+        return completo.iloc[indices].reset_index(drop=True)
+    except IndexError as e:
+        raise DatasetIndisponivel(f"Divisão incompatível com o dataset armazenado: {e}", "corrompido")
+
+
+def _chaves_registradas(ref: Optional[dict]) -> Iterable[str]:
+    """Chaves do registro que a referência segura: a própria e, numa divisão, a da base."""
+    while ref:
+        if ref.get("hash") and ref.get("chave"):
+            yield ref["chave"]
+        ref = ref.get("base")
+
+
+async def reter_refs(refs: Iterable[Optional[dict]]) -> None:
+    """Mais um documento passa a apontar para estas referências (já gravadas)."""
+    for ref in refs:
+        for chave in _chaves_registradas(ref):
+            await blobs.registro().somar(chave, 1)
+
+
+async def apagar_refs(refs: Iterable[Optional[dict]]) -> None:
+    """Solta partes que deixaram de ser referenciadas. Best-effort: um blob órfão só ocupa
+    espaço, e falhar aqui não pode derrubar a redivisão que já foi gravada.
+
+    Endereçadas por conteúdo, elas só perdem uma referência — o blob pode ser de outra coleta
+    também, e sai em :func:`coletar_orfaos`. As antigas (uuid) são apagadas na hora, exceto as
+    ``compartilhado`` dos datasets de exemplo, de antes do registro."""
+    for ref in refs:
+        if not ref or not ref.get("chave"):
+            continue
+        try:
+            if ref.get("hash"):
+                for chave in _chaves_registradas(ref):
+                    await blobs.registro().somar(chave, -1)
+            elif not ref.get("compartilhado"):
+                await backend(ref.get("backend")).apagar(ref["chave"])
+        except Exception as e:
+            logger.warning("Falha ao apagar parte de dataset %s: %s", ref.get("chave"), e)
+
+
+async def coletar_orfaos(carencia: timedelta = CARENCIA, maximo: int = 500) -> int:
+    """Apaga do backend os blobs sem referência há mais de `carencia`. Devolve quantos."""
+    registro = blobs.registro()
+    limite = datetime.now(timezone.utc) - carencia
+    apagados = 0
+    for entrada in await registro.orfaos(limite, maximo):
+        chave = entrada["_id"]
+        # Sai do registro ANTES do backend: um upload do mesmo conteúdo a partir daqui
+        # registra de novo e regrava os bytes. Sobra a janela entre as duas linhas (regravar
+        # e este `apagar` cruzarem), que exige um conteúdo parado há toda a carência voltar
+        # exatamente agora; o leitor veria "ausente", e o próximo upload igual o regrava.
+        if not await registro.remover_se_orfao(chave, limite):
+            continue
+        try:
+            await backend(entrada.get("backend")).apagar(chave)
+            apagados += 1
+        except Exception as e:
+            logger.warning("Falha ao apagar blob órfão %s: %s", chave[:12], e)
+    return apagados
+
+
+async def executar_coleta_orfaos() -> None:
+    """Laço da coleta de órfãos (startup da API). Falha de uma rodada só é logada."""
+    if GC_INTERVALO_SEC <= 0:
+        return
+    while True:
+        try:
+            apagados = await coletar_orfaos()
+            if apagados:
+                logger.info("Blobs de datasets órfãos apagados: %d", apagados)
+        except Exception as e:
+            logger.warning("Coleta de blobs órfãos falhou: %s", e)
+        await asyncio.sleep(GC_INTERVALO_SEC)
+
+
+def _campo_legado(doc: dict, parte: str) -> Optional[str]:
+    b64 = doc.get(f"content_{parte}_base64")
+    if not b64 and parte == "completo":
+        # Coletas antigas de XLSX não guardavam o completo; a redivisão relia o treino.
+        b64 = doc.get("content_treino_base64")
+    return b64 or None
+
+
+async def _migrar_parte(doc: dict, parte: str, df: pd.DataFrame) -> None:
+    """Regrava a parte lida do base64 antigo como Parquet. Best-effort: se falhar, a próxima
+    leitura simplesmente decodifica o base64 de novo."""
+    if not doc.get("_id"):
+        return
+    try:
+        from app import database
+
+        ref = await salvar_df(df)
+        update: Dict[str, Any] = {"$set": campos_set({parte: ref})}
+        if doc.get(f"content_{parte}_base64"):
+            update["$unset"] = campos_unset_legado([parte])
+        await database.arquivos.update_one({"_id": doc["_id"]}, update)
+        doc.setdefault("armazenamento", {})[parte] = ref
+    except Exception as e:
+        logger.warning("Migração preguiçosa da parte '%s' falhou: %s", parte, e)
+
+
+async def contar_linhas(doc: dict, parte: str) -> int:
+    """Linhas de uma parte. A referência já traz `num_linhas`, então o caso comum não lê o blob;
+    documentos antigos caem em :func:`carregar_df` (e são migrados de carona)."""
+    ref = (doc.get("armazenamento") or {}).get(parte)
+    if ref and ref.get("num_linhas") is not None:
+        return int(ref["num_linhas"])
+    return len(await carregar_df(doc.get("_id"), parte, doc=doc))
+
+
+async def carregar_df(
+    arquivo_id: Any,
+    parte: str = "treino",
+    *,
+    doc: Optional[dict] = None,
+    usuario_id: Optional[str] = None,
+    bases: Optional[Dict[str, pd.DataFrame]] = None,
+) -> pd.DataFrame:
+    """Lê uma parte (``completo``/``treino``/``teste``) de uma coleta de `arquivos`.
+
+    Quem já buscou o documento (normalmente com o escopo por dono) passa `doc` e poupa a ida ao
+    banco; sem `doc`, a busca usa `usuario_id` quando informado. Levanta
+    :class:`DatasetIndisponivel` em vez de devolver vazio, porque cada chamador tem o seu
+    status HTTP para "sem dados". `bases` é repassado a :func:`ler_ref`.
+    """
+    if parte not in PARTES:
+        raise ValueError(f"Parte de dataset desconhecida: {parte!r}")
+
+    if doc is None:
+        from app import database
+
+        oid = arquivo_id if isinstance(arquivo_id, ObjectId) else (
+            ObjectId(str(arquivo_id)) if ObjectId.is_valid(str(arquivo_id)) else None
+        )
+        if oid is None:
+            raise DatasetIndisponivel("Identificador de arquivo inválido.", "nao_encontrado")
+        filtro: Dict[str, Any] = {"_id": oid}
+        if usuario_id is not None:
+            filtro["usuario_id"] = usuario_id
+        doc = await database.arquivos.find_one(filtro)
+        if not doc:
+            raise DatasetIndisponivel("Arquivo não encontrado.", "nao_encontrado")
+
+    ref = (doc.get("armazenamento") or {}).get(parte)
+    if ref:
+        return await ler_ref(ref, bases)
+
+    b64 = _campo_legado(doc, parte)
+    if not b64:
+        raise DatasetIndisponivel(f"Conteúdo de {parte} ausente na coleta.", "ausente")
+    if len(b64) > MAX_ARQUIVO_BASE64:
+        raise DatasetIndisponivel("Arquivo muito grande. O limite é de 50 MB.", "grande")
+    try:
+        df = await asyncio.to_thread(decodificar_base64_legado, b64)
+    except Exception as e:
+        raise DatasetIndisponivel(f"Erro ao processar o arquivo: {e}", "corrompido")
+
+    await _migrar_parte(doc, parte, df)
+    return df
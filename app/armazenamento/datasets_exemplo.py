@@ -0,0 +1,130 @@
+"""Cache dos datasets de exemplo já preparados, endereçado pela assinatura dos parâmetros.
+
+`GET /toy_datasets/{nome}` gerava (ou recarregava do sklearn) o dataset, mapeava os rótulos,
+dividia treino/teste, calculava o perfil e gravava as três partes de novo para CADA aluno. Uma
+turma de 40 abrindo a mesma atividade fazia 40 ciclos idênticos e 120 blobs iguais no
+armazenamento. O resultado só depende de (dataset, semente, parâmetros do gerador, test_size) e
+da versão do código de preparo — isso vira a chave (sha256), e a entrada guarda:
+
+- as referências das partes (``armazenamento``), gravadas uma vez: os documentos de `arquivos`
+  de todos os alunos apontam para os mesmos blobs, que são imutáveis. A gravação deixa uma
+  referência que é do cache (as entradas não expiram no disco, então ela não é solta), e
+  cada coleta nova soma a sua com `reter_refs` — a redivisão de um aluno solta só a dele;
+- o que a resposta e o documento precisam (colunas, prévia, perfil, tamanhos), já em JSON.
+
+Dois níveis: LRU em memória (``DATASETS_EXEMPLO_CACHE_ENTRADAS`` por processo; 0 desliga o
+cache) e um JSON por chave em ``DATASETS_EXEMPLO_CACHE_DIR`` (padrão ``<DATASET_CACHE_DIR>/
+preparados``, ao lado do cache do UCI/OpenML), que sobrevive a restart e vale para os outros
+workers. Pedidos simultâneos da mesma chave esperam a primeira preparação em vez de repeti-la.
+Falha de cache nunca quebra a requisição: no pior caso o dataset é preparado de novo.
+"""
+from __future__ import annotations
+
+import asyncio
+import copy
+import hashlib
+import json
+import logging
+import os
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict
+
+from app.models.dataset_loaders import CACHE_DIR as _CACHE_DIR_DATASETS
+
+logger = logging.getLogger(__name__)
+
+# Entra na chave: mudar o preparo (mapeamento de rótulos, divisão, perfil) é subir a versão, e
+# as entradas antigas deixam de casar sem ninguém lembrar de apagá-las.
+VERSAO = 2
+MAX_ENTRADAS = int(os.getenv("DATASETS_EXEMPLO_CACHE_ENTRADAS", "64"))
+CACHE_DIR = Path(os.getenv("DATASETS_EXEMPLO_CACHE_DIR") or (_CACHE_DIR_DATASETS / "preparados"))
+
+_memoria: "OrderedDict[str, dict]" = OrderedDict()
+_em_andamento: Dict[str, asyncio.Future] = {}
+
+
+def chave(**assinatura: Any) -> str:
+    """sha256 da assinatura (mais a versão do preparo). Parâmetro ``None`` conta como valor."""
+    resumo = json.dumps({"versao": VERSAO, **assinatura}, sort_keys=True, default=str)
+    return hashlib.sha256(resumo.encode()).hexdigest()
+
+
+def _caminho(chave_: str) -> Path:
+    return CACHE_DIR / f"{chave_}.json"
+
+
+def _ler_disco(chave_: str):
+    try:
+        return json.loads(_caminho(chave_).read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning("cache de datasets de exemplo: entrada %s ilegível: %s", chave_[:12], e)
+        return None
+
+
+def _gravar_disco(chave_: str, entrada: dict) -> None:
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    destino = _caminho(chave_)
+    # Temporário + rename: outro worker nunca lê JSON pela metade.
+    tmp = destino.with_name(f".{destino.name}.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(entrada), encoding="utf-8")
+    os.replace(tmp, destino)
+
+
+def _lembrar(chave_: str, entrada: dict) -> None:
+    _memoria[chave_] = entrada
+    _memoria.move_to_end(chave_)
+    while len(_memoria) > MAX_ENTRADAS:
+        _memoria.popitem(last=False)
+
+
+async def obter(chave_: str, preparar: Callable[[], Awaitable[dict]]) -> dict:
+    """Entrada de `chave_`: da memória, do disco ou de `preparar()` — chamado uma vez só por
+    chave, mesmo com vários pedidos ao mesmo tempo. Devolve uma cópia: quem chama pode mexer."""
+    if MAX_ENTRADAS <= 0:
+        return await preparar()
+
+    entrada = _memoria.get(chave_)
+    if entrada is not None:
+        _memoria.move_to_end(chave_)
+        return copy.deepcopy(entrada)
+
+    entrada = await asyncio.to_thread(_ler_disco, chave_)
+    if entrada is not None:
+        _lembrar(chave_, entrada)
+        return copy.deepcopy(entrada)
+
+    pendente = _em_andamento.get(chave_)
+    if pendente is not None:
+        return copy.deepcopy(await asyncio.shield(pendente))
+
+    futuro = asyncio.get_running_loop().create_future()
+    _em_andamento[chave_] = futuro
+    try:
+        entrada = await preparar()
+    except BaseException as e:
+        futuro.set_exception(e)
+        futuro.exception()  # marcada como vista: sem ninguém esperando, o asyncio não reclama
+        raise
+    else:
+        futuro.set_result(entrada)
+    finally:
+        _em_andamento.pop(chave_, None)
+
+    _lembrar(chave_, entrada)
+    try:
+        await asyncio.to_thread(_gravar_disco, chave_, entrada)
+    except Exception as e:
+        logger.warning("cache de datasets de exemplo: falha ao gravar %s: %s", chave_[:12], e)
+    return copy.deepcopy(entrada)
+
+
+def limpar(disco: bool = False) -> None:
+    """Esvazia a memória (e o diretório, com ``disco=True``). Usado pelos testes."""
+    _memoria.clear()
+    _em_andamento.clear()
+    if disco and CACHE_DIR.exists():
+        for caminho in CACHE_DIR.glob("*.json"):
+            caminho.unlink(missing_ok=True)
@@ -0,0 +1,241 @@
+"""Cache endereçado por conteúdo das figuras da avaliação de modelos (PNG).
+
+Reabrir a tela de avaliação re-ajustava os visualizadores do Yellowbrick e recodificava cada
+PNG, mesmo com o modelo e o teste intactos — e o render é a parte cara da avaliação. Uma
+figura só depende de quatro coisas: o modelo (o `checksum` dos bytes), os dados que ela
+desenha, o gráfico (slug de `GRAFICOS_IDS`) e o tema (paleta/cores/fonte + versão do código
+de desenho). `metricas.py` junta os três primeiros itens que não são o slug num **prefixo**
+(sha256) e este módulo guarda uma figura por ``<prefixo>.<slug>.png``: o mesmo conteúdo cai
+sempre na mesma chave, então não há invalidação a fazer — tema novo é prefixo novo, e as
+figuras velhas saem pelo LRU.
+
+Backends, como os dos datasets (``FIGURAS_CACHE_STORE``, padrão o de ``DATASET_STORE``):
+
+- ``gridfs``: bucket `figuras`; o prefixo, o slug e o último uso vão em ``metadata``;
+- ``disco``: ``FIGURAS_CACHE_DIR`` (padrão ``<DATASET_STORE_DIR>/figuras``); o último uso é
+  o mtime do arquivo.
+
+Passando de ``FIGURAS_CACHE_MAX_MB`` (0 desliga o cache), as figuras usadas há mais tempo
+são apagadas até o total cair para 90% do teto. Medir o total custa uma varredura (glob + stat
+de cada PNG, ou um ``$group`` em `figuras.files`), então ela não roda a cada gravação: o
+processo soma o que grava sobre a última medição e só remede quando a soma passa do teto ou
+a medição tem mais de ``FIGURAS_CACHE_PODA_SEC`` (os outros workers também gravam). Erro de
+cache nunca quebra a avaliação: quem chama recebe "não achei" e renderiza.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import re
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from app.armazenamento.datasets import BACKEND_PADRAO, STORE_DIR
+
+logger = logging.getLogger(__name__)
+
+STORE = (os.getenv("FIGURAS_CACHE_STORE") or BACKEND_PADRAO).strip().lower()
+CACHE_DIR = Path(os.getenv("FIGURAS_CACHE_DIR") or (STORE_DIR / "figuras"))
+MAX_BYTES = int(float(os.getenv("FIGURAS_CACHE_MAX_MB", "256")) * 1024 * 1024)
+_PODA_INTERVALO_SEC = float(os.getenv("FIGURAS_CACHE_PODA_SEC", "600"))
+_BUCKET_GRIDFS = "figuras"
+# A poda desce até esta fração do teto, para não rodar a cada figura nova.
+_ALVO_PODA = 0.9
+
+# Prefixo é um sha256 hex; slug, um identificador de GRAFICOS_IDS. Nada que suba diretório.
+_PREFIXO_OK = re.compile(r"^[0-9a-f]{16,64}$")
+_SLUG_OK = re.compile(r"^[a-z0-9_]+$")
+
+
+def _validar(prefixo: str, slug: Optional[str] = None) -> bool:
+    return bool(_PREFIXO_OK.match(prefixo or "")) and (slug is None or bool(_SLUG_OK.match(slug)))
+
+
+# ------------------------------------------------------------------ backends
+
+class _CacheDisco:
+    nome = "disco"
+
+    def __init__(self, raiz: Path):
+        self.raiz = raiz
+
+    def _ler(self, prefixo: str) -> Dict[str, bytes]:
+        achadas = {}
+        agora = time.time()
+        for caminho in self.raiz.glob(f"{prefixo}.*.png"):
+            slug = caminho.name[len(prefixo) + 1:-len(".png")]
+            try:
+                achadas[slug] = caminho.read_bytes()
+                os.utime(caminho, (agora, agora))  # último uso, para o LRU
+            except FileNotFoundError:
+                continue  # podada entre o glob e a leitura
+        return achadas
+
+    def _gravar(self, prefixo: str, figuras: Dict[str, bytes]) -> None:
+        self.raiz.mkdir(parents=True, exist_ok=True)
+        for slug, png in figuras.items():
+            destino = self.raiz / f"{prefixo}.{slug}.png"
+            # Temporário + rename: leitor concorrente nunca vê PNG pela metade.
+            tmp = destino.with_name(f".{destino.name}.{os.getpid()}.tmp")
+            tmp.write_bytes(png)
+            os.replace(tmp, destino)
+
+    def _podar(self, max_bytes: int) -> Tuple[int, int]:
+        arquivos = []
+        for caminho in self.raiz.glob("*.png"):
+            try:
+                st = caminho.stat()
+            except FileNotFoundError:
+                continue
+            arquivos.append((st.st_mtime, st.st_size, caminho))
+        total = sum(tamanho for _, tamanho, _ in arquivos)
+        if total <= max_bytes:
+            return 0, total
+        apagadas = 0
+        for _, tamanho, caminho in sorted(arquivos, key=lambda a: a[0]):
+            if total <= max_bytes * _ALVO_PODA:
+                break
+            caminho.unlink(missing_ok=True)
+            total -= tamanho
+            apagadas += 1
+        return apagadas, total
+
+    async def ler(self, prefixo: str) -> Dict[str, bytes]:
+        return await asyncio.to_thread(self._ler, prefixo)
+
+    async def gravar(self, prefixo: str, figuras: Dict[str, bytes]) -> None:
+        await asyncio.to_thread(self._gravar, prefixo, figuras)
+
+    async def podar(self, max_bytes: int) -> Tuple[int, int]:
+        return await asyncio.to_thread(self._podar, max_bytes)
+
+
+class _CacheGridFS:
+    nome = "gridfs"
+
+    def __init__(self):
+        self._bucket = None
+        self._indices = False
+
+    async def _bucket_atual(self):
+        # Import tardio (como em datasets.py): o módulo continua importável sem MONGO_URL.
+        if self._bucket is None:
+            from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+            from app import database
+
+            self._bucket = AsyncIOMotorGridFSBucket(database.db, bucket_name=_BUCKET_GRIDFS)
+            self._arquivos = database.db[f"{_BUCKET_GRIDFS}.files"]
+        if not self._indices:
+            # Busca por prefixo e poda pelo último uso; create_index é idempotente.
+            await self._arquivos.create_index("metadata.prefixo")
+            await self._arquivos.create_index("metadata.usado_em")
+            self._indices = True
+        return self._bucket
+
+    async def ler(self, prefixo: str) -> Dict[str, bytes]:
+        bucket = await self._bucket_atual()
+        achadas, ids = {}, []
+        async for arquivo in self._arquivos.find({"metadata.prefixo": prefixo}, {"metadata.slug": 1}):
+            slug = (arquivo.get("metadata") or {}).get("slug")
+            if not slug or slug in achadas:
+                continue  # dois requests renderizaram a mesma figura: qualquer uma serve
+            stream = await bucket.open_download_stream(arquivo["_id"])
+            achadas[slug] = await stream.read()
+            ids.append(arquivo["_id"])
+        if ids:
+            await self._arquivos.update_many(
+                {"_id": {"$in": ids}}, {"$set": {"metadata.usado_em": datetime.now(timezone.utc)}}
+            )
+        return achadas
+
+    async def gravar(self, prefixo: str, figuras: Dict[str, bytes]) -> None:
+        bucket = await self._bucket_atual()
+        agora = datetime.now(timezone.utc)
+        for slug, png in figuras.items():
+            await bucket.upload_from_stream(
+                f"{prefixo}.{slug}.png", png,
+                metadata={"prefixo": prefixo, "slug": slug, "usado_em": agora},
+            )
+
+    async def podar(self, max_bytes: int) -> Tuple[int, int]:
+        bucket = await self._bucket_atual()
+        soma = await self._arquivos.aggregate(
+            [{"$group": {"_id": None, "total": {"$sum": "$length"}}}]
+        ).to_list(1)
+        total = soma[0]["total"] if soma else 0
+        if total <= max_bytes:
+            return 0, total
+        apagadas = 0
+        async for arquivo in self._arquivos.find({}, {"length": 1}).sort("metadata.usado_em", 1):
+            if total <= max_bytes * _ALVO_PODA:
+                break
+            await bucket.delete(arquivo["_id"])
+            total -= arquivo.get("length") or 0
+            apagadas += 1
+        return apagadas, total
+
+
+_caches: Dict[str, object] = {}
+# Total em bytes por backend, deste processo: última medição + o que gravou desde então.
+_contas: Dict[str, dict] = {}
+
+
+def cache(nome: Optional[str] = None):
+    """Backend do cache pelo nome (padrão: ``FIGURAS_CACHE_STORE``). Um por processo."""
+    nome = (nome or STORE).lower()
+    if nome not in _caches:
+        if nome == "disco":
+            _caches[nome] = _CacheDisco(CACHE_DIR)
+        elif nome == "gridfs":
+            _caches[nome] = _CacheGridFS()
+        else:
+            raise ValueError(f"Backend de cache de figuras desconhecido: {nome!r} (use 'gridfs' ou 'disco').")
+    return _caches[nome]
+
+
+async def _podar_se_preciso(backend, gravados: int) -> int:
+    """Poda só quando a conta corrente passa do teto ou envelhece; senão só soma os bytes.
+
+    A soma superestima (regravar a mesma figura conta duas vezes), o que só adianta a
+    próxima medição — nunca deixa o cache passar do teto sem podar.
+    """
+    conta = _contas.setdefault(backend.nome, {"bytes": None, "medido_em": 0.0})
+    agora = time.monotonic()
+    if conta["bytes"] is not None:
+        conta["bytes"] += gravados
+        if conta["bytes"] <= MAX_BYTES and agora - conta["medido_em"] < _PODA_INTERVALO_SEC:
+            return 0
+    apagadas, total = await backend.podar(MAX_BYTES)
+    conta.update(bytes=total, medido_em=agora)
+    return apagadas
+
+
+# ------------------------------------------------------------------ API
+
+async def ler_figuras(prefixo: str) -> Dict[str, bytes]:
+    """PNGs já renderizados para o prefixo, por slug (``{}`` sem cache ou em qualquer falha)."""
+    if MAX_BYTES <= 0 or not _validar(prefixo):
+        return {}
+    try:
+        return await cache().ler(prefixo)
+    except Exception as e:
+        logger.warning("cache de figuras: falha ao ler %s: %s", prefixo[:12], e)
+        return {}
+
+
+async def gravar_figuras(prefixo: str, figuras: Dict[str, bytes]) -> None:
+    """Guarda PNGs recém-renderizados e poda o cache se passou do teto. Nunca levanta."""
+    figuras = {slug: png for slug, png in figuras.items() if _validar(prefixo, slug) and png}
+    if MAX_BYTES <= 0 or not figuras:
+        return
+    try:
+        backend = cache()
+        await backend.gravar(prefixo, figuras)
+        apagadas = await _podar_se_preciso(backend, sum(len(png) for png in figuras.values()))
+        if apagadas:
+            logger.info("cache de figuras: %d figura(s) antigas removidas (LRU)", apagadas)
+    except Exception as e:
+        logger.warning("cache de figuras: falha ao gravar %s: %s", prefixo[:12], e)
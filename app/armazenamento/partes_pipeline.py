@@ -0,0 +1,150 @@
+"""Partes pesadas dos pipelines salvos, fora do documento de `pipelines`.
+
+`resultadoColetaDado` (prévia das linhas, colunas), `resultadoTreinamento` e
+`resultadosDasAvaliacoes` (com os PNGs do Yellowbrick em base64 sob ``_visualizacoes``) iam
+inteiros no documento do pipeline. A listagem devolvia até 200 documentos assim, a galeria 100, e
+o ranking e a evolução tinham de projetar em volta desses campos. Agora, ao gravar:
+
+- cada um desses campos fica no documento como um **resumo** (`resumir`): os escalares e os
+  valores pequenos ficam, e os grandes saem. Também sai, sempre, ``_visualizacoes``. Continuam
+  inline os valores das métricas, a matriz de confusão, a identidade da base (nome, alvo,
+  divisão) e os ids/runs dos modelos treinados, que é o que a listagem, a galeria, a evolução,
+  o ranking e os artefatos leem;
+- o valor completo vai para `pipelines_partes`, um documento por campo, e o pipeline guarda
+  ``partes: {campo: {"id", "bytes"}}``. Campo cujo resumo é o próprio valor fica só inline.
+
+A parte é imutável: regravar um campo cria uma parte nova, troca a referência no pipeline e só
+então apaga a anterior, então quem lê nunca vê referência para parte que ainda não existe.
+`completar` devolve o documento inteiro (`GET /pipelines/{id}`); `ler_parte` serve um campo só
+(`GET /pipelines/{id}/partes/{campo}`). Documentos antigos, sem ``partes``, são lidos como
+estão; ``scripts/deploy/separar_partes_pipelines.py`` os migra.
+"""
+from __future__ import annotations
+
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+import bson
+from bson import ObjectId
+
+logger = logging.getLogger(__name__)
+
+CAMPOS = ("resultadoColetaDado", "resultadoTreinamento", "resultadosDasAvaliacoes")
+# Lista ou texto acima disto (em bytes de BSON) sai do resumo. As linhas da prévia e as listas
+# de colunas passam fácil; a matriz de confusão de até ~30 classes fica.
+LIMITE_INLINE = int(os.getenv("PIPELINE_RESUMO_MAX_BYTES", "2048"))
+_VISUALIZACOES = "_visualizacoes"
+
+
+def _colecao():
+    # Import tardio (como em blobs.py): o módulo continua importável sem MONGO_URL.
+    from app import database
+    return database.pipelines_partes
+
+
+def tamanho(valor: Any) -> int:
+    """Bytes de BSON que `valor` ocupa num documento."""
+    return len(bson.encode({"v": valor}))
+
+
+def resumir(valor: Any) -> Any:
+    """O que fica inline: dicts percorridos, escalares mantidos, listas/textos grandes fora."""
+    if isinstance(valor, dict):
+        return {k: resumir(v) for k, v in valor.items()
+                if k != _VISUALIZACOES and not _grande(v)}
+    return valor
+
+
+def _grande(valor: Any) -> bool:
+    return isinstance(valor, (list, str, bytes)) and tamanho(valor) > LIMITE_INLINE
+
+
+async def separar(pipeline_id: ObjectId, campos: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, dict]]:
+    """Grava as partes pesadas de `campos` e devolve ``(inline, partes)``.
+
+    ``inline`` tem, para cada campo pesado presente, o resumo (ou o próprio valor, se ele já é
+    pequeno); ``partes`` as referências novas. Só os campos de `CAMPOS` são olhados.
+    """
+    inline: Dict[str, Any] = {}
+    partes: Dict[str, dict] = {}
+    novos = []
+    agora = datetime.now(timezone.utc)
+    for campo in CAMPOS:
+        if campo not in campos:
+            continue
+        valor = campos[campo]
+        resumo = resumir(valor)
+        inline[campo] = resumo
+        if resumo == valor:
+            continue
+        parte_id = ObjectId()
+        bytes_ = tamanho(valor)
+        novos.append({"_id": parte_id, "pipeline_id": pipeline_id, "campo": campo,
+                      "conteudo": valor, "bytes": bytes_, "criado_em": agora})
+        partes[campo] = {"id": parte_id, "bytes": bytes_}
+    if novos:
+        await _colecao().insert_many(novos, ordered=False)
+    return inline, partes
+
+
+def campos_de_atualizacao(inline: Dict[str, Any], partes: Dict[str, dict]) -> Tuple[dict, dict]:
+    """``$set``/``$unset`` do pipeline para os campos regravados em `inline`."""
+    definir = dict(inline)
+    remover = {}
+    for campo in inline:
+        if campo in partes:
+            definir[f"partes.{campo}"] = partes[campo]
+        else:
+            remover[f"partes.{campo}"] = ""
+    return definir, remover
+
+
+def substituidas(anteriores: Optional[dict], campos: Iterable[str]) -> list:
+    """Ids das partes antigas dos `campos` regravados (apagar depois de trocar a referência)."""
+    anteriores = anteriores or {}
+    return [anteriores[c]["id"] for c in campos if isinstance(anteriores.get(c), dict)
+            and anteriores[c].get("id") is not None]
+
+
+async def apagar(ids: Iterable[ObjectId]) -> None:
+    ids = list(ids)
+    if not ids:
+        return
+    try:
+        await _colecao().delete_many({"_id": {"$in": ids}})
+    except Exception as e:
+        # Parte órfã não quebra nada (ninguém a referencia); o script de migração as recolhe.
+        logger.warning("Partes de pipeline não apagadas (%s): %s", len(ids), e)
+
+
+async def apagar_do_pipeline(doc: Optional[dict]) -> None:
+    await apagar(substituidas((doc or {}).get("partes"), CAMPOS))
+
+
+async def completar(doc: dict) -> dict:
+    """O documento com cada campo resumido trocado pelo valor completo (uma consulta)."""
+    partes = doc.get("partes") or {}
+    ids = {p["id"]: c for c, p in partes.items() if isinstance(p, dict) and p.get("id") is not None}
+    if not ids:
+        return doc
+    completo = dict(doc)
+    async for parte in _colecao().find({"_id": {"$in": list(ids)}}, {"conteudo": 1}):
+        completo[ids[parte["_id"]]] = parte.get("conteudo")
+    return completo
+
+
+async def ler_parte(doc: dict, campo: str) -> Any:
+    """Valor completo de um campo: da parte, se ele foi separado; senão o que está inline."""
+    ref = (doc.get("partes") or {}).get(campo)
+    if isinstance(ref, dict) and ref.get("id") is not None:
+        parte = await _colecao().find_one({"_id": ref["id"]}, {"conteudo": 1})
+        if parte is not None:
+            return parte.get("conteudo")
+    return doc.get(campo)
+
+
+async def criar_indices() -> None:
+    """Busca por pipeline (migração, órfãos). create_index é idempotente."""
+    await _colecao().create_index("pipeline_id")
@@ -1,14 +1,18 @@
+import asyncio
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException
 from typing_extensions import Annotated
-from typing import Optional
+from typing import IO, Optional, Tuple
 import pandas as pd
-import base64
-from io import StringIO
 from bson import ObjectId
-from app.coleta_dados.configuracao_treinamento import aviso_estratificacao, dividir_dataframe
+from app.armazenamento import (
+    DatasetIndisponivel, apagar_refs, campos_set, campos_unset_legado, carregar_df, salvar_divisao,
+    salvar_partes,
+)
+from app.coleta_dados.configuracao_treinamento import aviso_estratificacao, dividir_indices
 from app.database import arquivos, configuracoes_treinamento
 from app.schemas.schemas import ReDivisaoColetaRequest
-from app.funcoes_genericas.funcoes_genericas import gerar_colunas_detalhes, df_para_base64, decode_excel_base64_df, converter_numpy
+from app.funcoes_genericas.funcoes_genericas import gerar_colunas_detalhes, converter_numpy
+from app.funcoes_genericas.perfil_dados import perfilar
 from app.funcoes_genericas.validacao import validar_object_id
 from app.security import id_usuario_atual
 
@@ -22,51 +26,57 @@ SEPARADORES = {
 }
 
 
-def _validar_csv_ou_tsv(file: UploadFile):
-    filename = (file.filename or "").lower()
-    if not filename.endswith((".csv", ".tsv")):
+def _validar_csv_ou_tsv(filename: Optional[str]):
+    if not (filename or "").lower().endswith((".csv", ".tsv")):
         raise HTTPException(400, "Arquivo deve ser CSV ou TSV")
 
 
-def _resolver_separador(file: UploadFile, separador: str) -> str:
-    filename = (file.filename or "").lower()
-    if filename.endswith(".tsv") and separador == "virgula":
+def _resolver_separador(filename: Optional[str], separador: str) -> str:
+    if (filename or "").lower().endswith(".tsv") and separador == "virgula":
         return "\t"
     return SEPARADORES.get(separador, ",")
 
 
-@router.post("/csv/preview")
-async def preview_csv(
-    file: Annotated[UploadFile, File()],
-    separador: Annotated[str, Form()] = "virgula",
-    encoding: Annotated[str, Form()] = "utf-8",
-    linhas: Annotated[int, Form()] = 10,
-):
-    _validar_csv_ou_tsv(file)
-
-    content = await file.read()
-    sep = _resolver_separador(file, separador)
+def ler_csv(arquivo: IO[bytes], sep: str, encoding: str,
+            nrows: Optional[int] = None) -> Tuple[pd.DataFrame, str]:
+    """Lê o CSV direto do arquivo binário e devolve ``(df, encoding usado)``.
 
+    Antes o upload inteiro ia para a memória (`await file.read()`) e depois virava `str`
+    (`decode`) antes do parse — três cópias do arquivo. O `UploadFile` já é um arquivo em spool
+    (disco acima de 1 MB) e o tokenizer do pandas lê em blocos, então basta entregar o arquivo;
+    com `nrows` (prévia) ele nem chega ao fim. Se o encoding pedido falhar, tenta latin-1.
+    """
     try:
-        text = content.decode(encoding)
-        df = pd.read_csv(StringIO(text), sep=sep, nrows=linhas)
+        arquivo.seek(0)
+        return pd.read_csv(arquivo, sep=sep, encoding=encoding, nrows=nrows), encoding
     except UnicodeDecodeError:
         try:
-            text = content.decode("latin-1")
-            df = pd.read_csv(StringIO(text), sep=sep, nrows=linhas)
-            encoding = "latin-1"
+            arquivo.seek(0)
+            return pd.read_csv(arquivo, sep=sep, encoding="latin-1", nrows=nrows), "latin-1"
         except Exception as e:
             raise HTTPException(400, f"Erro ao decodificar arquivo: {e}")
     except Exception as e:
         raise HTTPException(400, f"Erro ao ler CSV: {e}")
 
-    colunas = df.columns.tolist()
-    preview = df.head(linhas).to_dict(orient="records")
-    colunas_detalhes = gerar_colunas_detalhes(df)
 
+@router.post("/csv/preview")
+async def preview_csv(
+    file: Annotated[UploadFile, File()],
+    separador: Annotated[str, Form()] = "virgula",
+    encoding: Annotated[str, Form()] = "utf-8",
+    linhas: Annotated[int, Form()] = 10,
+):
+    _validar_csv_ou_tsv(file.filename)
+    sep = _resolver_separador(file.filename, separador)
+    df, encoding = await asyncio.to_thread(ler_csv, file.file, sep, encoding, linhas)
+    return resposta_preview(df, linhas, separador, encoding)
+
+
+def resposta_preview(df: pd.DataFrame, linhas: int, separador: str, encoding: str) -> dict:
+    preview = df.head(linhas).to_dict(orient="records")
     return {
-        "colunas": colunas,
-        "colunas_detalhes": colunas_detalhes,
+        "colunas": df.columns.tolist(),
+        "colunas_detalhes": gerar_colunas_detalhes(df),
         "preview": preview,
         "num_linhas_preview": len(preview),
         "separador_usado": separador,
@@ -86,45 +96,58 @@ async def upload_csv(
     separador: Annotated[str, Form()] = "virgula",
     encoding: Annotated[str, Form()] = "utf-8",
 ):
-    _validar_csv_ou_tsv(file)
-
-    content = await file.read()
-    sep = _resolver_separador(file, separador)
-
-    try:
-        text = content.decode(encoding)
-        df = pd.read_csv(StringIO(text), sep=sep)
-    except UnicodeDecodeError:
-        try:
-            text = content.decode("latin-1")
-            df = pd.read_csv(StringIO(text), sep=sep)
-        except Exception as e:
-            raise HTTPException(400, f"Erro ao decodificar arquivo: {e}")
-    except Exception as e:
-        raise HTTPException(400, f"Erro ao ler CSV: {e}")
+    _validar_csv_ou_tsv(file.filename)
+    sep = _resolver_separador(file.filename, separador)
+    # Parse é CPU (segundos para 50 MB): fora do event loop.
+    df, _ = await asyncio.to_thread(ler_csv, file.file, sep, encoding)
+    return await registrar_coleta_csv(
+        df, filename=file.filename, tipo=tipo, test_size=test_size, shuffle=shuffle,
+        stratify=stratify, stratify_column=stratify_column, id_coleta=id_coleta,
+    )
 
-    content_b64 = base64.b64encode(content).decode("utf-8")
 
+async def registrar_coleta_csv(
+    df: pd.DataFrame,
+    *,
+    filename: Optional[str],
+    tipo: str,
+    test_size: Optional[float] = 0.2,
+    shuffle: bool = True,
+    stratify: bool = False,
+    stratify_column: Optional[str] = None,
+    id_coleta: Optional[str] = None,
+) -> dict:
+    """Grava o CSV já lido como coleta nova (treino) ou como o teste de uma coleta existente.
+
+    Comum ao `POST /csv` e à finalização do upload em partes (`upload_em_partes.py`), que
+    devolvem a mesma resposta.
+    """
     if tipo == "teste" and id_coleta:
         coleta_oid = validar_object_id(id_coleta, "id_coleta")
         # Escopo por dono (IDOR): só escreve/lê a própria coleta.
         _dono = id_usuario_atual()
+        doc = await arquivos.find_one({"_id": coleta_oid, "usuario_id": _dono})
+        if not doc:
+            raise HTTPException(status_code=404, detail="Coleta não encontrada.")
+
+        refs = await salvar_partes({"teste": df})
         res_upd = await arquivos.update_one(
             {"_id": coleta_oid, "usuario_id": _dono},
-            {"$set": {
-                "arquivo_nome_teste": file.filename,
-                "content_teste_base64": content_b64,
-            }}
+            {
+                "$set": {"arquivo_nome_teste": filename, **campos_set(refs)},
+                "$unset": campos_unset_legado(["teste"]),
+            }
         )
         if res_upd.matched_count == 0:
+            await apagar_refs(refs.values())
             raise HTTPException(status_code=404, detail="Coleta não encontrada.")
-
-        doc = await arquivos.find_one({"_id": coleta_oid, "usuario_id": _dono})
-        if not doc:
-            raise HTTPException(status_code=404, detail="Coleta não encontrada.")
+        await apagar_refs([(doc.get("armazenamento") or {}).get("teste")])
         config = await configuracoes_treinamento.find_one({"id_coleta": coleta_oid})
 
-        df_treino = decode_excel_base64_df(doc.get("content_treino_base64", ""))
+        try:
+            df_treino = await carregar_df(coleta_oid, "treino", doc=doc)
+        except DatasetIndisponivel:
+            df_treino = pd.DataFrame()
         df_teste = df
 
         atributos = doc.get("atributos", {})
@@ -133,9 +156,9 @@ async def upload_csv(
         return converter_numpy({
             "id_coleta": str(id_coleta),
             "id_configuracoes_treinamento": str(config["_id"]) if config else None,
-            "filename": file.filename,
+            "filename": filename,
             "arquivo_nome_treino": doc.get("arquivo_nome_treino"),
-            "arquivo_nome_teste": file.filename,
+            "arquivo_nome_teste": filename,
             "tipo": tipo,
             "num_linhas_total": int(df_treino.shape[0] + df_teste.shape[0]),
             "num_linhas_treino": int(df_treino.shape[0]),
@@ -154,8 +177,7 @@ async def upload_csv(
 
     colunas_detalhes = gerar_colunas_detalhes(df)
     atributos = {coluna: False for coluna in df.columns}
-
-    content_completo_b64 = content_b64
+    perfil = await asyncio.to_thread(perfilar, df)
 
     test_size = test_size or 0.2
     if not 0 < test_size < 1:
@@ -165,25 +187,26 @@ async def upload_csv(
     # simples quando o dataset não permite (classe com um único exemplo) em vez de recusar o
     # upload — com estratificação ligada por padrão, um 400 aqui barraria dados reais.
     pediu_estratificar = bool(stratify)
-    df_treino, df_teste, estratificou = dividir_dataframe(
+    idx_treino, idx_teste, estratificou = dividir_indices(
         df,
         ReDivisaoColetaRequest(test_size=test_size, shuffle=shuffle,
                                stratify=stratify, target=stratify_column),
     )
     stratify = estratificou
 
-    content_treino_b64 = df_para_base64(df_treino)
-    content_teste_b64 = df_para_base64(df_teste)
+    # Treino e teste vão como posições sobre o completo: nenhuma parte é materializada.
+    armazenamento = await salvar_divisao(df, idx_treino, idx_teste)
+    previews = {parte: df.iloc[idx[:5]].to_dict(orient="records")
+                for parte, idx in (("treino", idx_treino), ("teste", idx_teste))}
 
     doc_arquivo = {
-        "arquivo_nome_treino": file.filename,
-        "content_completo_base64": content_completo_b64,
-        "content_treino_base64": content_treino_b64,
-        "content_teste_base64": content_teste_b64,
+        "arquivo_nome_treino": filename,
+        "armazenamento": armazenamento,
         "num_linhas_total": df.shape[0],
         "num_colunas": df.shape[1],
         "atributos": atributos,
         "colunas_detalhes": colunas_detalhes,
+        "perfil": perfil,
         "usuario_id": id_usuario_atual(),
     }
 
@@ -209,18 +232,18 @@ async def upload_csv(
     return converter_numpy({
         "id_coleta": id_coleta_novo,
         "id_configuracoes_treinamento": id_configuracoes_treinamento,
-        "filename": file.filename,
-        "arquivo_nome_treino": file.filename,
+        "filename": filename,
+        "arquivo_nome_treino": filename,
         "tipo": tipo,
         "num_linhas_total": df.shape[0],
-        "num_linhas_treino": df_treino.shape[0],
-        "num_linhas_teste": df_teste.shape[0],
+        "num_linhas_treino": len(idx_treino),
+        "num_linhas_teste": len(idx_teste),
         "num_colunas": df.shape[1],
         "colunas": df.columns.tolist(),
         "colunas_detalhes": colunas_detalhes,
         "atributos": atributos,
-        "preview_treino": df_treino.head(5).to_dict(orient="records"),
-        "preview_teste": df_teste.head(5).to_dict(orient="records"),
+        "preview_treino": previews["treino"],
+        "preview_teste": previews["teste"],
         "prever_categoria": False,
         "dados_rotulados": False,
         "shuffle": shuffle,
@@ -2,14 +2,23 @@
 
 O servidor baixa o recurso (evita CORS), valida o endereço contra alvos internos/
 privados (defesa contra SSRF), faz o parse (CSV/TSV/JSON/Excel) e armazena no mesmo
-formato dos uploads (`arquivos` + `configuracoes_treinamento`), devolvendo a mesma
-resposta do `upload_csv` — para o front consumir igual a um arquivo enviado.
+formato dos uploads (`arquivos` + `app.armazenamento` + `configuracoes_treinamento`), devolvendo
+a mesma resposta do `upload_csv` — para o front consumir igual a um arquivo enviado.
+
+Memória: um arquivo de 50 MB chegava a ocupar várias vezes o tamanho no processo — o download
+acumulado em `bytes` (``content += chunk`` recopia tudo a cada pedaço: quadrático), decodificado
+inteiro para `str`, o DataFrame, e as três partes ao mesmo tempo. Agora o download vai para um
+arquivo temporário em spool (memória até ``_SPOOL_EM_MEMORIA``, disco depois), o formato sai
+dos primeiros bytes, o CSV é lido pelo pandas direto do arquivo (o tokenizer em C lê em blocos
+e infere os tipos por coluna — sem a cópia em `str`) e o download é liberado antes da divisão.
+Treino e teste nem chegam a existir como DataFrame: `salvar_divisao` grava o completo e as duas
+partes como arrays de posições sobre ele. Medição em `scripts/bench-ingestao-url.py`.
 """
-import base64
+import asyncio
 import ipaddress
 import socket
-from io import BytesIO, StringIO
-from typing import Any, Dict
+import tempfile
+from typing import IO, Any, Dict, Tuple
 from urllib.parse import urlparse
 
 import httpx
@@ -17,20 +26,25 @@ import pandas as pd
 from bson import ObjectId
 from fastapi import APIRouter, Body, HTTPException
 
+from app.armazenamento import salvar_divisao
 from app.database import arquivos, configuracoes_treinamento
 from app.security import id_usuario_atual
-from app.coleta_dados.configuracao_treinamento import aviso_estratificacao, dividir_dataframe
+from app.coleta_dados.configuracao_treinamento import aviso_estratificacao, dividir_indices
 from app.schemas.schemas import ReDivisaoColetaRequest
 from app.funcoes_genericas.funcoes_genericas import (
     converter_numpy,
-    df_para_base64,
     gerar_colunas_detalhes,
 )
+from app.funcoes_genericas.perfil_dados import perfilar
 
 router = APIRouter()
 
 MAX_BYTES = 50 * 1024 * 1024  # 50 MB
 TIMEOUT = 30.0
+# Até aqui o download fica na memória; acima, o spool passa para um arquivo temporário.
+_SPOOL_EM_MEMORIA = 4 * 1024 * 1024
+# O bastante para reconhecer o formato e o separador (primeira linha do CSV).
+_AMOSTRA = 64 * 1024
 
 
 def _ip_bloqueado(ip: ipaddress._BaseAddress) -> bool:
@@ -93,20 +107,51 @@ def _cliente_com_ip_fixo(host: str, ip: str):
                              transport=_TransportePinado())
 
 
-def parse_conteudo_df(content: bytes, url: str, content_type: str) -> pd.DataFrame:
+def detectar_formato(inicio: bytes, url: str, content_type: str) -> Tuple[str, str]:
+    """(formato, separador) a partir dos primeiros bytes, da extensão e do Content-Type.
+
+    A assinatura do arquivo vem antes: servidor de dados aberto manda planilha como
+    ``application/octet-stream`` e CSV como ``text/plain`` o tempo todo. `formato` é
+    ``excel``, ``json`` ou ``csv``; o separador só vale para ``csv``.
+    """
     nome = (urlparse(url).path or "").lower()
     ct = (content_type or "").lower()
+    if inicio.startswith((b"PK\x03\x04", b"\xd0\xcf\x11\xe0")):   # zip (xlsx) / OLE2 (xls)
+        return "excel", ""
     if nome.endswith((".xlsx", ".xls")) or "spreadsheet" in ct or "excel" in ct:
-        return pd.read_excel(BytesIO(content), engine="openpyxl")
-    if nome.endswith(".json") or "json" in ct:
-        return pd.read_json(BytesIO(content))
+        return "excel", ""
+    if inicio.lstrip(b"\xef\xbb\xbf \t\r\n")[:1] in (b"{", b"[") or nome.endswith(".json") or "json" in ct:
+        return "json", ""
+    primeira = inicio.split(b"\n", 1)[0].decode("utf-8", errors="replace")
+    if nome.endswith(".tsv"):
+        return "csv", "\t"
+    return "csv", (";" if primeira.count(";") > primeira.count(",") else ",")
+
+
+def parse_conteudo_df(arquivo: IO[bytes], url: str, content_type: str) -> pd.DataFrame:
+    """DataFrame do conteúdo baixado, lido direto do arquivo (sem decodificar tudo para `str`)."""
+    arquivo.seek(0)
+    formato, sep = detectar_formato(arquivo.read(_AMOSTRA), url, content_type)
+    arquivo.seek(0)
+    if formato == "excel":
+        return pd.read_excel(arquivo, engine="openpyxl")
+    if formato == "json":
+        return pd.read_json(arquivo)
     try:
-        text = content.decode("utf-8")
+        return pd.read_csv(arquivo, sep=sep, encoding="utf-8")
     except UnicodeDecodeError:
-        text = content.decode("latin-1")
-    primeira = text.split("\n", 1)[0]
-    sep = "\t" if nome.endswith(".tsv") else (";" if primeira.count(";") > primeira.count(",") else ",")
-    return pd.read_csv(StringIO(text), sep=sep)
+        arquivo.seek(0)
+        return pd.read_csv(arquivo, sep=sep, encoding="latin-1")
+
+
+async def _baixar(resp, destino: IO[bytes]) -> None:
+    """Copia o corpo da resposta para `destino`, pedaço a pedaço, respeitando MAX_BYTES."""
+    total = 0
+    async for chunk in resp.aiter_bytes():
+        total += len(chunk)
+        if total > MAX_BYTES:
+            raise HTTPException(status_code=413, detail="Arquivo muito grande (limite 50 MB).")
+        destino.write(chunk)
 
 
 @router.post("/url")
@@ -123,28 +168,27 @@ async def ingerir_url(payload: Dict[str, Any] = Body(...)):
 
     # Download server-side: IP FIXADO no valor validado (anti-rebind), sem seguir
     # redirects (evita salto p/ alvo interno) e com teto de tamanho.
-    try:
-        async with _cliente_com_ip_fixo(host, ip_validado) as client:
-            async with client.stream("GET", url) as resp:
-                if resp.is_redirect:
-                    raise HTTPException(status_code=400, detail="A URL redireciona; use o link direto do arquivo.")
-                if resp.status_code >= 400:
-                    raise HTTPException(status_code=400, detail=f"Falha ao baixar (HTTP {resp.status_code}).")
-                content = b""
-                async for chunk in resp.aiter_bytes():
-                    content += chunk
-                    if len(content) > MAX_BYTES:
-                        raise HTTPException(status_code=413, detail="Arquivo muito grande (limite 50 MB).")
-                content_type = resp.headers.get("content-type", "")
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Erro ao baixar a URL: {e}")
+    with tempfile.SpooledTemporaryFile(max_size=_SPOOL_EM_MEMORIA) as baixado:
+        try:
+            async with _cliente_com_ip_fixo(host, ip_validado) as client:
+                async with client.stream("GET", url) as resp:
+                    if resp.is_redirect:
+                        raise HTTPException(status_code=400, detail="A URL redireciona; use o link direto do arquivo.")
+                    if resp.status_code >= 400:
+                        raise HTTPException(status_code=400, detail=f"Falha ao baixar (HTTP {resp.status_code}).")
+                    await _baixar(resp, baixado)
+                    content_type = resp.headers.get("content-type", "")
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Erro ao baixar a URL: {e}")
 
-    try:
-        df = parse_conteudo_df(content, url, content_type)
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Não foi possível ler os dados da URL: {e}")
+        try:
+            # Parse é CPU (segundos para 50 MB): fora do event loop.
+            df = await asyncio.to_thread(parse_conteudo_df, baixado, url, content_type)
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Não foi possível ler os dados da URL: {e}")
+    # Daqui em diante o download já foi liberado: só o DataFrame ocupa memória.
     if df.empty or len(df.columns) == 0:
         raise HTTPException(status_code=400, detail="O conteúdo da URL não tem dados tabulares.")
 
@@ -152,23 +196,28 @@ async def ingerir_url(payload: Dict[str, Any] = Body(...)):
         test_size = 0.2
     colunas_detalhes = gerar_colunas_detalhes(df)
     atributos = {c: False for c in df.columns}
+    perfil = await asyncio.to_thread(perfilar, df)
     # Mesmo divisor das outras portas. Na ingestão por URL ainda não há alvo escolhido, então
     # a estratificação não se aplica aqui — antes o pedido era ignorado em silêncio e a config
     # gravava `stratify: true`, mentindo sobre o que aconteceu.
-    df_treino, df_teste, estratificou = dividir_dataframe(
+    idx_treino, idx_teste, estratificou = dividir_indices(
         df, ReDivisaoColetaRequest(test_size=test_size, shuffle=shuffle, stratify=stratify, target=None)
     )
+    # Treino e teste vão como posições sobre o completo: nenhuma parte é materializada.
+    armazenamento = await salvar_divisao(df, idx_treino, idx_teste)
+    previews = {parte: df.iloc[idx[:5]].to_dict(orient="records")
+                for parte, idx in (("treino", idx_treino), ("teste", idx_teste))}
+
     nome_arq = (urlparse(url).path.rsplit("/", 1)[-1]) or "dados_url"
 
     doc_arquivo = {
         "arquivo_nome_treino": nome_arq,
-        "content_completo_base64": base64.b64encode(content).decode("utf-8"),
-        "content_treino_base64": df_para_base64(df_treino),
-        "content_teste_base64": df_para_base64(df_teste),
+        "armazenamento": armazenamento,
         "num_linhas_total": int(df.shape[0]),
         "num_colunas": int(df.shape[1]),
         "atributos": atributos,
         "colunas_detalhes": colunas_detalhes,
+        "perfil": perfil,
         "origem_url": url,
         "usuario_id": id_usuario_atual(),
     }
@@ -187,11 +236,11 @@ async def ingerir_url(payload: Dict[str, Any] = Body(...)):
         "id_coleta": id_coleta,
         "id_configuracoes_treinamento": str(rconf.inserted_id),
         "filename": nome_arq, "arquivo_nome_treino": nome_arq, "tipo": "treino",
-        "num_linhas_total": df.shape[0], "num_linhas_treino": df_treino.shape[0], "num_linhas_teste": df_teste.shape[0],
+        "num_linhas_total": df.shape[0], "num_linhas_treino": len(idx_treino), "num_linhas_teste": len(idx_teste),
         "num_colunas": df.shape[1], "colunas": df.columns.tolist(), "colunas_detalhes": colunas_detalhes,
         "atributos": atributos,
-        "preview_treino": df_treino.head(5).to_dict(orient="records"),
-        "preview_teste": df_teste.head(5).to_dict(orient="records"),
+        "preview_treino": previews["treino"],
+        "preview_teste": previews["teste"],
         "prever_categoria": False, "dados_rotulados": False, "shuffle": shuffle,
         "stratify": estratificou,
         "aviso_estratificacao": aviso_estratificacao(bool(stratify), estratificou),
@@ -1,15 +1,19 @@
+import asyncio
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Query
 from bson import ObjectId
 
 from typing import Optional
 import pandas as pd
-from io import BytesIO
-import base64
 
-from app.coleta_dados.configuracao_treinamento import aviso_estratificacao, dividir_dataframe
+from app.armazenamento import (
+    DatasetIndisponivel, apagar_refs, campos_set, campos_unset_legado, carregar_df, salvar_divisao,
+    salvar_partes,
+)
+from app.coleta_dados.configuracao_treinamento import aviso_estratificacao, dividir_indices
 from app.database import arquivos, configuracoes_treinamento
 from app.schemas.schemas import ReDivisaoColetaRequest
-from app.funcoes_genericas.funcoes_genericas import validar_xlsx, ler_excel, df_para_base64, gerar_colunas_detalhes, montar_resposta_coleta, converter_numpy
+from app.funcoes_genericas.funcoes_genericas import validar_xlsx, ler_excel, gerar_colunas_detalhes, montar_resposta_coleta, converter_numpy
+from app.funcoes_genericas.perfil_dados import perfilar
 from app.security import id_usuario_atual
 
 
@@ -42,37 +46,36 @@ async def upload_xlsx(
         df, _ = await ler_excel(file)
         arquivo_nome_treino = file.filename
 
-        content_completo_b64 = df_para_base64(df)
-
         if not 0 < test_size < 1:
             raise HTTPException(status_code=400, detail="test_size deve estar entre 0 e 1.")
 
         # Mesmo divisor da redivisão: cai numa divisão simples quando o dataset não permite
-        # estratificar, em vez de recusar o upload (ver `dividir_dataframe`).
+        # estratificar, em vez de recusar o upload (ver `dividir_indices`).
         pediu_estratificar = bool(stratify)
-        df_treino, df_teste, estratificou = dividir_dataframe(
+        idx_treino, idx_teste, estratificou = dividir_indices(
             df,
             ReDivisaoColetaRequest(test_size=test_size, shuffle=shuffle,
                                    stratify=stratify, target=stratify_column),
         )
         stratify = estratificou
 
-        content_treino_b64 = df_para_base64(df_treino)
-        content_teste_b64 = df_para_base64(df_teste)
+        # Guardadas como posições sobre o completo; os dataframes só montam a resposta.
+        armazenamento = await salvar_divisao(df, idx_treino, idx_teste)
+        df_treino, df_teste = df.iloc[idx_treino], df.iloc[idx_teste]
 
         colunas_detalhes = gerar_colunas_detalhes(df)
-        
+        perfil = await asyncio.to_thread(perfilar, df)
+
         atributos = {coluna: False for coluna in df.columns}
 
         doc_arquivo = {
             "arquivo_nome_treino": arquivo_nome_treino,
-            "content_completo_base64": content_completo_b64,
-            "content_treino_base64": content_treino_b64,
-            "content_teste_base64": content_teste_b64,
+            "armazenamento": armazenamento,
             "num_linhas_total": df.shape[0],
             "num_colunas": df.shape[1],
             "atributos": atributos,  # salva no banco como dict
             "colunas_detalhes": colunas_detalhes,
+            "perfil": perfil,
             "usuario_id": id_usuario_atual(),
         }
 
@@ -104,30 +107,32 @@ async def upload_xlsx(
             raise HTTPException(400, "Arquivo 'file_teste' obrigatório para tipo 'teste'")
 
         validar_xlsx(file_teste, "teste")
-        df_teste, content_teste = await ler_excel(file_teste)
-        content_teste_b64 = base64.b64encode(content_teste).decode("utf-8")
+        df_teste, _ = await ler_excel(file_teste)
         arquivo_nome_teste = file_teste.filename
 
+        doc_original = await arquivos.find_one({"_id": ObjectId(id_coleta), "usuario_id": id_usuario_atual()})
+        if not doc_original:
+            raise HTTPException(404, "Documento com id_coleta não encontrado")
+
         if file_treino is not None:
             validar_xlsx(file_treino, "treino")
-            df_treino, content_treino = await ler_excel(file_treino)
-            content_treino_b64 = base64.b64encode(content_treino).decode("utf-8")
+            df_treino, _ = await ler_excel(file_treino)
             arquivo_nome_treino = file_treino.filename
+            partes = {"completo": df_treino, "treino": df_treino, "teste": df_teste}
+            # O completo mudou: o perfil guardado é dele.
+            extras = {"perfil": await asyncio.to_thread(perfilar, df_treino)}
         else:
-            doc_original = await arquivos.find_one({"_id": ObjectId(id_coleta), "usuario_id": id_usuario_atual()})
-            if not doc_original:
-                raise HTTPException(404, "Documento com id_coleta não encontrado")
-
-            content_completo_b64 = doc_original.get("content_completo_base64")
-            if content_completo_b64 is None:
+            try:
+                df_treino = await carregar_df(id_coleta, "completo", doc=doc_original)
+            except DatasetIndisponivel:
                 raise HTTPException(400, "Conteúdo completo do treino não encontrado no banco")
-
-            bytes_treino = base64.b64decode(content_completo_b64)
-            df_treino = pd.read_excel(BytesIO(bytes_treino))
-            content_treino_b64 = content_completo_b64
             arquivo_nome_treino = doc_original.get("arquivo_nome_treino", None)
+            # O completo já está guardado: o treino passa a ser ele inteiro, como antes.
+            partes = {"treino": df_treino, "teste": df_teste}
+            extras = {}
 
         colunas_detalhes = gerar_colunas_detalhes(df_treino)
+        refs = await salvar_partes(partes)
 
         update_result = await arquivos.update_one(
             {"_id": ObjectId(id_coleta), "usuario_id": id_usuario_atual()},
@@ -135,19 +140,22 @@ async def upload_xlsx(
                 "$set": {
                     "arquivo_nome_treino": arquivo_nome_treino,
                     "arquivo_nome_teste": arquivo_nome_teste,
-                    "content_completo_base64": content_treino_b64,
-                    "content_treino_base64": content_treino_b64,
-                    "content_teste_base64": content_teste_b64,
+                    **campos_set(refs),
                     "num_linhas_treino": df_treino.shape[0],
                     "num_linhas_teste": df_teste.shape[0],
                     "num_colunas": df_treino.shape[1],
                     "colunas_detalhes": colunas_detalhes,
-                }
+                    **extras,
+                },
+                "$unset": campos_unset_legado(refs),
             }
         )
 
         if update_result.modified_count == 0:
+            await apagar_refs(refs.values())
             raise HTTPException(404, "Documento com id_coleta não encontrado")
+        antigas = doc_original.get("armazenamento") or {}
+        await apagar_refs(antigas.get(p) for p in refs)
 
     # Aqui retornamos a lista simples de nomes das colunas para o front
     resposta = montar_resposta_coleta(
@@ -182,14 +190,10 @@ async def get_unique_values(
     raise HTTPException(404, "Coleta não encontrada")
 
   try:
-    content_completo_b64 = doc.get("content_completo_base64") or doc.get("content_treino_base64")
-    if not content_completo_b64:
-        raise HTTPException(400, "Conteúdo da coleta não encontrado")
-    content_bytes = base64.b64decode(content_completo_b64)
-    df = pd.read_excel(BytesIO(content_bytes), engine='openpyxl')
-  except HTTPException:
-      raise
-  except Exception as e:
+    df = await carregar_df(id_coleta, "completo", doc=doc)
+  except DatasetIndisponivel as e:
+    if e.kind == "ausente":
+      raise HTTPException(400, "Conteúdo da coleta não encontrado")
     raise HTTPException(500, f"Erro ao processar dados: {e}")
 
   valores_unicos = {}
@@ -3,36 +3,28 @@ from typing import Optional
 from fastapi import APIRouter, HTTPException
 from bson import ObjectId
 
+from app.armazenamento import (
+    DatasetIndisponivel, apagar_refs, campos_set, campos_unset_legado, carregar_df, salvar_indices,
+    salvar_partes,
+)
 from app.database import arquivos, configuracoes_treinamento
 from app.deps import train_test_split
-from app.funcoes_genericas.funcoes_genericas import df_para_base64, converter_numpy
+from app.funcoes_genericas.funcoes_genericas import converter_numpy
 from app.schemas.schemas import ConfiguracaoColetaRequest, ReDivisaoColetaRequest
 from app.utils.seed import get_sklearn_random_state
 from app.funcoes_genericas.validacao import validar_object_id
 from app.security import id_usuario_atual
+import numpy as np
 import pandas as pd
-import base64
-from io import BytesIO, StringIO
 
 router = APIRouter()
 
 
-def decode_base64_df(base64_string: str) -> pd.DataFrame:
-    if not base64_string:
-        return pd.DataFrame()
+async def _carregar_ou_vazio(coleta_doc: dict, parte: str, bases: Optional[dict] = None) -> pd.DataFrame:
+    """A prévia da configuração mostra o que houver: parte ausente ou ilegível vira vazio."""
     try:
-        binary = base64.b64decode(base64_string)
-        try:
-            return pd.read_excel(BytesIO(binary), engine="openpyxl")
-        except Exception:
-            try:
-                return pd.read_excel(BytesIO(binary), engine="xlrd")
-            except Exception:
-                text = binary.decode("utf-8")
-                primeira_linha = text.split("\n")[0]
-                sep = "\t" if "\t" in primeira_linha else ";" if ";" in primeira_linha else ","
-                return pd.read_csv(StringIO(text), sep=sep)
-    except Exception:
+        return await carregar_df(coleta_doc.get("_id"), parte, doc=coleta_doc, bases=bases)
+    except DatasetIndisponivel:
         return pd.DataFrame()
 
 
@@ -51,15 +43,19 @@ def aviso_estratificacao(pedido: bool, estratificou: bool) -> Optional[str]:
     return AVISO_SEM_ESTRATIFICACAO if pedido and not estratificou else None
 
 
-def dividir_dataframe(df: pd.DataFrame, config: ReDivisaoColetaRequest,
-                      estratificar: Optional[bool] = None) -> tuple[pd.DataFrame, pd.DataFrame, bool]:
-    """Divide treino/teste e devolve também SE a estratificação realmente aconteceu.
+def dividir_indices(df: pd.DataFrame, config: ReDivisaoColetaRequest,
+                    estratificar: Optional[bool] = None) -> tuple[np.ndarray, np.ndarray, bool]:
+    """Posições (iloc) de treino e de teste, e SE a estratificação realmente aconteceu.
 
     `estratificar` sobrepõe `config.stratify` (usado quando o servidor decide o padrão pela
     tarefa). Quando a estratificação é pedida mas o dataset não permite — alguma classe com
     um único exemplo, o caso mais comum em CSV de aluno — caímos numa divisão simples em vez
     de recusar a operação: com estratificação LIGADA POR PADRÃO em classificação, um erro
     duro aqui viraria parede para dados reais. Quem chama informa ao aluno o que valeu.
+
+    Divide só as posições: quem precisa poupar memória (ingestão por URL) materializa uma
+    parte de cada vez. O sorteio depende só de ``len(df)``, do alvo e da semente — é o mesmo
+    de dividir o próprio DataFrame.
     """
     pedido = config.stratify if estratificar is None else estratificar
     coluna = config.target if config.target and config.target in df.columns else None
@@ -67,7 +63,7 @@ def dividir_dataframe(df: pd.DataFrame, config: ReDivisaoColetaRequest,
 
     def _dividir(valores):
         return train_test_split(
-            df,
+            np.arange(len(df)),
             test_size=config.test_size,
             random_state=get_sklearn_random_state() or 42,
             shuffle=config.shuffle,
@@ -88,6 +84,14 @@ def dividir_dataframe(df: pd.DataFrame, config: ReDivisaoColetaRequest,
         raise HTTPException(status_code=400, detail=f"Não foi possível dividir os dados com essa configuração: {exc}")
 
 
+def dividir_dataframe(df: pd.DataFrame, config: ReDivisaoColetaRequest,
+                      estratificar: Optional[bool] = None) -> tuple[pd.DataFrame, pd.DataFrame, bool]:
+    """Divide treino/teste e devolve também SE a estratificação realmente aconteceu
+    (ver `dividir_indices`)."""
+    treino, teste, estratificou = dividir_indices(df, config, estratificar)
+    return df.iloc[treino], df.iloc[teste], estratificou
+
+
 @router.put("/{tipo}/{configurar_treinamento_id}")
 async def configurar_treinamento(configurar_treinamento_id: str, config: ConfiguracaoColetaRequest):
     config_oid = validar_object_id(configurar_treinamento_id)
@@ -154,8 +158,10 @@ async def get_configuracoe(configurar_treinamento_id: str):
     if not coleta_doc:
         raise HTTPException(status_code=404, detail="Documento de coleta não encontrado.")
 
-    df_treino = decode_base64_df(coleta_doc.get("content_treino_base64", ""))
-    df_teste = decode_base64_df(coleta_doc.get("content_teste_base64", ""))
+    # Treino e teste costumam ser posições sobre o mesmo completo: lido uma vez só para os dois.
+    bases = {}
+    df_treino = await _carregar_ou_vazio(coleta_doc, "treino", bases)
+    df_teste = await _carregar_ou_vazio(coleta_doc, "teste", bases)
 
     preview_treino = df_treino.head(5).to_dict(orient="records")
     preview_teste = df_teste.head(5).to_dict(orient="records")
@@ -177,6 +183,8 @@ async def get_configuracoe(configurar_treinamento_id: str):
         "preview_treino": preview_treino,
         "preview_teste": preview_teste,
         "colunas_detalhes": coleta_doc.get("colunas_detalhes"),
+        # Estatísticas por coluna da ingestão (`perfil_dados`); None em coleta antiga.
+        "perfil": coleta_doc.get("perfil"),
         "num_linhas_treino": df_treino.shape[0],
         "num_linhas_teste": df_teste.shape[0],
         "num_linhas_total": df_treino.shape[0] + df_teste.shape[0],
@@ -202,7 +210,7 @@ async def redividir_coleta(configurar_treinamento_id: str, config: ReDivisaoCole
     if not coleta_doc:
         raise HTTPException(status_code=404, detail="Documento de coleta não encontrado.")
 
-    df_completo = decode_base64_df(coleta_doc.get("content_completo_base64") or coleta_doc.get("content_treino_base64", ""))
+    df_completo = await _carregar_ou_vazio(coleta_doc, "completo")
     if df_completo.empty:
         raise HTTPException(status_code=400, detail="Conteúdo completo da coleta não encontrado.")
 
@@ -213,19 +221,31 @@ async def redividir_coleta(configurar_treinamento_id: str, config: ReDivisaoCole
     e_classificacao = prever_categoria and dados_rotulados
     pedido = config.stratify if config.stratify is not None else e_classificacao
 
-    df_treino, df_teste, estratificou = dividir_dataframe(df_completo, config, estratificar=pedido)
-    content_treino_b64 = df_para_base64(df_treino)
-    content_teste_b64 = df_para_base64(df_teste)
+    idx_treino, idx_teste, estratificou = dividir_indices(df_completo, config, estratificar=pedido)
+    # O completo não muda: a divisão nova são só posições sobre ele. Sem a referência (migração
+    # do base64 antigo que falhou nesta leitura), grava as partes inteiras como antes.
+    completo = (coleta_doc.get("armazenamento") or {}).get("completo")
+    if completo:
+        refs = {"treino": await salvar_indices(completo, idx_treino),
+                "teste": await salvar_indices(completo, idx_teste)}
+    else:
+        refs = await salvar_partes({"treino": df_completo.iloc[idx_treino],
+                                    "teste": df_completo.iloc[idx_teste]})
 
     await arquivos.update_one(
         {"_id": ObjectId(id_coleta), "usuario_id": id_usuario_atual()},
-        {"$set": {
-            "content_treino_base64": content_treino_b64,
-            "content_teste_base64": content_teste_b64,
-            "num_linhas_treino": int(df_treino.shape[0]),
-            "num_linhas_teste": int(df_teste.shape[0]),
-        }},
+        {
+            "$set": {
+                **campos_set(refs),
+                "num_linhas_treino": int(len(idx_treino)),
+                "num_linhas_teste": int(len(idx_teste)),
+            },
+            "$unset": campos_unset_legado(refs),
+        },
     )
+    # A divisão anterior deixou de ser referenciada: sai do armazenamento.
+    antigas = coleta_doc.get("armazenamento") or {}
+    await apagar_refs(antigas.get(p) for p in refs)
 
     update_config = {
         "test_size": config.test_size,
@@ -248,14 +268,14 @@ async def redividir_coleta(configurar_treinamento_id: str, config: ReDivisaoCole
         "arquivo_nome_treino": coleta_doc.get("arquivo_nome_treino"),
         "arquivo_nome_teste": "",
         "num_linhas_total": int(df_completo.shape[0]),
-        "num_linhas_treino": int(df_treino.shape[0]),
-        "num_linhas_teste": int(df_teste.shape[0]),
+        "num_linhas_treino": int(len(idx_treino)),
+        "num_linhas_teste": int(len(idx_teste)),
         "num_colunas": int(df_completo.shape[1]),
         "colunas": df_completo.columns.tolist(),
         "colunas_detalhes": coleta_doc.get("colunas_detalhes"),
         "atributos": config_doc.get("atributos"),
-        "preview_treino": df_treino.head(5).to_dict(orient="records"),
-        "preview_teste": df_teste.head(5).to_dict(orient="records"),
+        "preview_treino": df_completo.iloc[idx_treino[:5]].to_dict(orient="records"),
+        "preview_teste": df_completo.iloc[idx_teste[:5]].to_dict(orient="records"),
         "target": config.target if config.target is not None else config_doc.get("target"),
         "tipo_target": config_doc.get("tipo_target"),
         "prever_categoria": config_doc.get("prever_categoria", False),
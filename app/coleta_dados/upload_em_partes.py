@@ -0,0 +1,321 @@
+"""Upload de CSV grande em partes, retomável, com processamento em background.
+
+`POST /coleta_dados/csv` recebe o arquivo inteiro num request só: numa rede de laboratório um
+CSV de turma de 50 MB cai no meio e recomeça do zero, e o worker segura o parse e as gravações
+enquanto o request está aberto. Aqui o fluxo é:
+
+1. ``POST /csv/sessoes`` — abre a sessão com as opções do upload (as mesmas do `/csv`);
+2. ``PUT /csv/sessoes/{id}/partes/{n}`` — corpo cru, até ``PARTE_MAX_BYTES`` por parte. Cada
+   parte vai direto para o armazenamento dos datasets (GridFS ou disco, `salvar_bloco`), então
+   qualquer worker recebe qualquer parte e nada fica na memória do processo. Reenviar a parte
+   ``n`` substitui a anterior: para retomar, o front consulta ``GET /csv/sessoes/{id}`` e manda
+   só as que faltam;
+3. ``GET /csv/sessoes/{id}/preview`` — prévia a partir da PRIMEIRA parte só, sem esperar o resto;
+4. ``POST /csv/sessoes/{id}/finalizar`` — 202 na hora; o worker monta as partes num arquivo em
+   spool, faz o parse e grava a coleta (`registrar_coleta_csv`, a mesma do `/csv`) numa task.
+   O front acompanha ``status``/``progresso`` em ``GET /csv/sessoes/{id}``, e a resposta do
+   `/csv` aparece em ``resultado`` quando ``status == "concluida"``.
+
+O estado vive no Mongo (`uploads_csv`), não no worker: o polling pode cair em qualquer um. Se o
+worker do processamento morrer, a sessão fica ``processando`` sem progresso e pode ser
+finalizada de novo depois de ``_PROCESSAMENTO_TRAVADO``. Sessões paradas há mais de
+``UPLOAD_SESSAO_TTL_HORAS`` são apagadas (com as partes) por `limpar_sessoes_abandonadas`.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import tempfile
+from datetime import datetime, timedelta, timezone
+from io import BytesIO
+from typing import Any, Dict, List, Optional, Set
+
+from fastapi import APIRouter, HTTPException, Request, status
+
+from app.armazenamento import DatasetIndisponivel, apagar_refs, ler_bloco, salvar_bloco
+from app.coleta_dados.coleta_dados_csv import (
+    _resolver_separador,
+    _validar_csv_ou_tsv,
+    ler_csv,
+    registrar_coleta_csv,
+    resposta_preview,
+)
+from app.funcoes_genericas.validacao import validar_object_id
+from app.schemas.schemas import SessaoUploadCsvRequest
+from app.security import id_usuario_atual
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+MAX_BYTES = 50 * 1024 * 1024  # 50 MB, o mesmo teto da ingestão por URL
+PARTE_MAX_BYTES = int(os.getenv("UPLOAD_PARTE_MAX_BYTES", str(8 * 1024 * 1024)))
+SESSAO_TTL_HORAS = float(os.getenv("UPLOAD_SESSAO_TTL_HORAS", "24"))
+# Sem progresso há esse tempo, a sessão "processando" é de um worker que morreu.
+_PROCESSAMENTO_TRAVADO = timedelta(minutes=10)
+# Na montagem, acima disso o spool vai para o disco.
+_SPOOL_EM_MEMORIA = 4 * 1024 * 1024
+# A limpeza roda no máximo uma vez por intervalo por worker (na abertura de sessões).
+_LIMPEZA_INTERVALO = timedelta(hours=1)
+_ultima_limpeza: Optional[datetime] = None
+# Referências fortes das tasks de finalização: o loop só guarda referências fracas.
+_tarefas: Set[asyncio.Task] = set()
+
+
+def _colecao():
+    # Import tardio (como em telemetria.py): os testes trocam `app.database.uploads_csv`.
+    from app import database
+    return database.uploads_csv
+
+
+def _agora() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+async def _sessao_do_usuario(id_sessao: str) -> dict:
+    oid = validar_object_id(id_sessao, "id_sessao")
+    sessao = await _colecao().find_one({"_id": oid, "usuario_id": id_usuario_atual()})
+    if not sessao:
+        raise HTTPException(status_code=404, detail="Sessão de upload não encontrada.")
+    return sessao
+
+
+def _numeros(sessao: dict) -> List[int]:
+    return sorted(int(n) for n in (sessao.get("partes") or {}))
+
+
+def _situacao(sessao: dict) -> dict:
+    partes = sessao.get("partes") or {}
+    resposta = {
+        "id_sessao": str(sessao["_id"]),
+        "filename": sessao.get("filename"),
+        "status": sessao.get("status"),
+        "partes_recebidas": _numeros(sessao),
+        "bytes_recebidos": sum(int(p.get("bytes", 0)) for p in partes.values()),
+        "parte_max_bytes": PARTE_MAX_BYTES,
+        "progresso": sessao.get("progresso"),
+    }
+    if sessao.get("erro"):
+        resposta["erro"] = sessao["erro"]
+    if sessao.get("resultado"):
+        resposta["resultado"] = json.loads(sessao["resultado"])
+    return resposta
+
+
+@router.post("/csv/sessoes", status_code=status.HTTP_201_CREATED)
+async def criar_sessao(payload: SessaoUploadCsvRequest):
+    _validar_csv_ou_tsv(payload.filename)
+    await _limpar_se_for_a_hora()
+    agora = _agora()
+    doc = {
+        **payload.model_dump(),
+        "usuario_id": id_usuario_atual(),
+        "status": "aberta",
+        "partes": {},
+        "progresso": None,
+        "criado_em": agora,
+        "atualizado_em": agora,
+    }
+    res = await _colecao().insert_one(doc)
+    doc["_id"] = res.inserted_id
+    return _situacao(doc)
+
+
+@router.get("/csv/sessoes/{id_sessao}")
+async def consultar_sessao(id_sessao: str):
+    return _situacao(await _sessao_do_usuario(id_sessao))
+
+
+@router.put("/csv/sessoes/{id_sessao}/partes/{numero}")
+async def enviar_parte(id_sessao: str, numero: int, request: Request):
+    sessao = await _sessao_do_usuario(id_sessao)
+    if sessao.get("status") != "aberta":
+        raise HTTPException(status_code=409, detail="A sessão já foi finalizada.")
+    if not 0 <= numero < MAX_BYTES // 1024:
+        raise HTTPException(status_code=400, detail="Número de parte inválido.")
+
+    # Corpo cru, lido aos pedaços com teto: uma parte nunca passa de PARTE_MAX_BYTES na memória.
+    dados = bytearray()
+    async for chunk in request.stream():
+        dados.extend(chunk)
+        if len(dados) > PARTE_MAX_BYTES:
+            raise HTTPException(status_code=413,
+                                detail=f"Parte maior que o limite de {PARTE_MAX_BYTES} bytes.")
+    if not dados:
+        raise HTTPException(status_code=400, detail="Parte vazia.")
+    outras = sum(int(p.get("bytes", 0)) for n, p in (sessao.get("partes") or {}).items()
+                 if int(n) != numero)
+    if outras + len(dados) > MAX_BYTES:
+        raise HTTPException(status_code=413, detail="Arquivo muito grande (limite 50 MB).")
+
+    ref = await salvar_bloco(dados, "csv.parte")
+    # `find_one_and_update` devolve o documento de ANTES: a parte substituída (reenvio) é
+    # apagada do armazenamento depois que a nova já está referenciada.
+    antes = await _colecao().find_one_and_update(
+        {"_id": sessao["_id"], "usuario_id": sessao["usuario_id"], "status": "aberta"},
+        {"$set": {f"partes.{numero}": ref, "atualizado_em": _agora()}},
+    )
+    if not antes:
+        await apagar_refs([ref])
+        raise HTTPException(status_code=409, detail="A sessão já foi finalizada.")
+    substituida = (antes.get("partes") or {}).get(str(numero))
+    if substituida:
+        await apagar_refs([substituida])
+    return {"numero": numero, "bytes": len(dados)}
+
+
+@router.get("/csv/sessoes/{id_sessao}/preview")
+async def preview_sessao(id_sessao: str, linhas: int = 10):
+    """Prévia só com a parte 0: o aluno escolhe separador/encoding antes do upload terminar."""
+    sessao = await _sessao_do_usuario(id_sessao)
+    partes = sessao.get("partes") or {}
+    if "0" not in partes:
+        raise HTTPException(status_code=400, detail="A primeira parte ainda não foi enviada.")
+    try:
+        dados = await ler_bloco(partes["0"])
+    except DatasetIndisponivel as e:
+        raise HTTPException(status_code=410, detail=str(e))
+    if len(partes) > 1 or sessao.get("status") != "aberta":
+        # Há mais partes depois desta: a última linha pode estar cortada no meio.
+        fim = dados.rfind(b"\n")
+        dados = dados[:fim + 1] if fim >= 0 else dados
+    separador, encoding = sessao.get("separador", "virgula"), sessao.get("encoding", "utf-8")
+    sep = _resolver_separador(sessao.get("filename"), separador)
+    df, encoding = await asyncio.to_thread(ler_csv, BytesIO(dados), sep, encoding, linhas)
+    return resposta_preview(df, linhas, separador, encoding)
+
+
+@router.post("/csv/sessoes/{id_sessao}/finalizar", status_code=status.HTTP_202_ACCEPTED)
+async def finalizar_sessao(id_sessao: str):
+    sessao = await _sessao_do_usuario(id_sessao)
+    numeros = _numeros(sessao)
+    if not numeros:
+        raise HTTPException(status_code=400, detail="Nenhuma parte foi enviada.")
+    faltando = sorted(set(range(numeros[-1] + 1)) - set(numeros))
+    if faltando:
+        raise HTTPException(status_code=400, detail=f"Partes faltando: {faltando}.")
+
+    # Transição atômica: dois cliques em "finalizar" (ou dois workers) não processam duas vezes.
+    agora = _agora()
+    travado = agora - _PROCESSAMENTO_TRAVADO
+    assumida = await _colecao().find_one_and_update(
+        {"_id": sessao["_id"], "usuario_id": sessao["usuario_id"], "$or": [
+            {"status": {"$in": ["aberta", "erro"]}},
+            {"status": "processando", "atualizado_em": {"$lt": travado}},
+        ]},
+        {"$set": {"status": "processando", "atualizado_em": agora,
+                  "progresso": {"etapa": "montando", "percentual": 0}},
+         "$unset": {"erro": ""}},
+    )
+    if not assumida:
+        raise HTTPException(status_code=409, detail="A sessão já está sendo processada ou foi concluída.")
+
+    # A task herda o contexto do request (usuário atual), que `registrar_coleta_csv` usa.
+    tarefa = asyncio.create_task(processar_sessao(assumida))
+    _tarefas.add(tarefa)
+    tarefa.add_done_callback(_tarefas.discard)
+    return {"id_sessao": id_sessao, "status": "processando"}
+
+
+@router.delete("/csv/sessoes/{id_sessao}")
+async def cancelar_sessao(id_sessao: str):
+    sessao = await _sessao_do_usuario(id_sessao)
+    if sessao.get("status") == "processando":
+        raise HTTPException(status_code=409, detail="A sessão está sendo processada.")
+    await _colecao().delete_one({"_id": sessao["_id"], "usuario_id": sessao["usuario_id"]})
+    await apagar_refs((sessao.get("partes") or {}).values())
+    return {"mensagem": "Sessão de upload cancelada."}
+
+
+# ------------------------------------------------------------------ processamento
+
+async def _progresso(sessao: dict, etapa: str, percentual: int) -> None:
+    await _colecao().update_one(
+        {"_id": sessao["_id"]},
+        {"$set": {"progresso": {"etapa": etapa, "percentual": percentual},
+                  "atualizado_em": _agora()}},
+    )
+
+
+async def processar_sessao(sessao: dict) -> None:
+    """Monta as partes, faz o parse e grava a coleta. Roda em background (ver `finalizar`).
+
+    Falhas viram ``status: "erro"`` com a mensagem em ``erro`` — as partes ficam, então o front
+    pode finalizar de novo sem reenviar nada.
+    """
+    partes = sessao.get("partes") or {}
+    numeros = _numeros(sessao)
+    try:
+        with tempfile.SpooledTemporaryFile(max_size=_SPOOL_EM_MEMORIA) as montado:
+            for i, n in enumerate(numeros):
+                montado.write(await ler_bloco(partes[str(n)]))
+                await _progresso(sessao, "montando", int(50 * (i + 1) / len(numeros)))
+            await _progresso(sessao, "lendo", 50)
+            sep = _resolver_separador(sessao.get("filename"), sessao.get("separador", "virgula"))
+            df, _ = await asyncio.to_thread(ler_csv, montado, sep, sessao.get("encoding", "utf-8"))
+        await _progresso(sessao, "gravando", 75)
+        resultado = await registrar_coleta_csv(
+            df, filename=sessao.get("filename"), tipo=sessao.get("tipo", "treino"),
+            test_size=sessao.get("test_size"), shuffle=sessao.get("shuffle", True),
+            stratify=sessao.get("stratify", False), stratify_column=sessao.get("stratify_column"),
+            id_coleta=sessao.get("id_coleta"),
+        )
+    except Exception as e:
+        detalhe = e.detail if isinstance(e, HTTPException) else f"Erro ao processar o arquivo: {e}"
+        logger.warning("Upload em partes %s falhou: %s", sessao["_id"], detalhe)
+        await _colecao().update_one(
+            {"_id": sessao["_id"]},
+            {"$set": {"status": "erro", "erro": detalhe, "progresso": None, "atualizado_em": _agora()}},
+        )
+        return
+
+    # `resultado` vai como JSON: as prévias têm os nomes das colunas do aluno como chave, e
+    # nome de campo com "." ou "$" não entra num documento do Mongo.
+    await _colecao().update_one(
+        {"_id": sessao["_id"]},
+        {"$set": {"status": "concluida", "resultado": json.dumps(resultado, default=str),
+                  "progresso": {"etapa": "concluida", "percentual": 100},
+                  "atualizado_em": _agora()},
+         "$unset": {"partes": ""}},
+    )
+    await apagar_refs(partes.values())
+
+
+# ------------------------------------------------------------------ manutenção
+
+async def limpar_sessoes_abandonadas(agora: Optional[datetime] = None) -> int:
+    """Apaga sessões paradas há mais de ``SESSAO_TTL_HORAS`` e as partes delas.
+
+    Não é um índice TTL de propósito: o TTL apagaria o documento e deixaria as partes órfãs no
+    GridFS/disco. Devolve quantas sessões apagou.
+    """
+    if SESSAO_TTL_HORAS <= 0:
+        return 0
+    limite = (agora or _agora()) - timedelta(hours=SESSAO_TTL_HORAS)
+    apagadas = 0
+    async for sessao in _colecao().find({"atualizado_em": {"$lt": limite}}):
+        res = await _colecao().delete_one({"_id": sessao["_id"], "atualizado_em": {"$lt": limite}})
+        if res.deleted_count:
+            await apagar_refs((sessao.get("partes") or {}).values())
+            apagadas += 1
+    return apagadas
+
+
+async def _limpar_se_for_a_hora() -> None:
+    global _ultima_limpeza
+    agora = _agora()
+    if _ultima_limpeza is not None and agora - _ultima_limpeza < _LIMPEZA_INTERVALO:
+        return
+    _ultima_limpeza = agora
+    try:
+        await limpar_sessoes_abandonadas(agora)
+    except Exception as e:
+        logger.warning("Limpeza das sessões de upload falhou: %s", e)
+
+
+async def criar_indices() -> None:
+    col = _colecao()
+    await col.create_index([("usuario_id", 1), ("criado_em", -1)])
+    await col.create_index("atualizado_em")
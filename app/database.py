@@ -44,6 +44,8 @@ opcoes_graficos = db["graficos"]
 
 arquivos = db["arquivos"]
 configuracoes_treinamento = db["configuracoes_treinamento"]
+# Uploads de CSV em partes ainda não finalizados (`app/coleta_dados/upload_em_partes.py`).
+uploads_csv = db["uploads_csv"]
 
 # =========================
 # MODELOS TREINADOS
@@ -60,6 +62,12 @@ tutor_audit = db["tutor_audit"]
 # PIPELINES
 # =========================
 pipelines = db["pipelines"]
+# Valor completo dos campos pesados dos pipelines (prévia da coleta, PNGs da avaliação); o
+# pipeline guarda o resumo e a referência. Ver `app/armazenamento/partes_pipeline.py`.
+pipelines_partes = db["pipelines_partes"]
+# Índice da evolução do aluno (aluno × base → tentativas compactas), mantido por
+# `app/evolucao_alunos.py` a cada pipeline gravado ou excluído.
+evolucao_alunos = db["evolucao_alunos"]
 
 # =========================
 # TURMAS E ATIVIDADES (professor)
@@ -69,6 +77,12 @@ atividades = db["atividades"]
 # Submissões dos desafios de montagem (nota + regras). Coleção própria, SEM TTL: é
 # registro de avaliação, diferente da telemetria em `atividade_usuario` (expira em 90d).
 submissoes_montagem = db["submissoes_montagem"]
+# Ranking materializado das atividades de pipeline (atividade × aluno), mantido por
+# `app/ranking_atividades.py` a cada submissão.
+ranking_atividades = db["ranking_atividades"]
+# Retrato do progresso das turmas (turma × aluno), servido por `GET /turmas/{id}/progresso`.
+# Ver `app/progresso_turmas.py`.
+progresso_turmas = db["progresso_turmas"]
 
 # =========================
 # HISTÓRICO DE CHAT
@@ -84,6 +98,8 @@ configuracoes_tutor = db["configuracoes_tutor"]
 # ATIVIDADES DOS USUÁRIOS (telemetria)
 # =========================
 atividade_usuario = db["atividade_usuario"]
+# Resumo por hora × tipo × ação × usuário, mantido por `app/telemetria_rollup.py` (painéis).
+atividade_rollup = db["atividade_rollup"]
 
 # =========================
 # RUNS DO MLFLOW ↔ USUÁRIO (artefatos)
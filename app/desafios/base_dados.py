@@ -14,6 +14,7 @@ from __future__ import annotations
 
 from typing import Any, Dict, Optional
 
+from app.funcoes_genericas.perfil_dados import perfilar
 from app.models.dataset_config import get_dataset_config
 from app.models.dataset_loaders import carregar_dataframe
 
@@ -37,21 +38,29 @@ def inspecionar_dados(df, alvo: Optional[str] = None) -> Dict[str, bool]:
     """
     if df is None or getattr(df, "empty", True):
         return dict(DADOS_CONSERVADOR)
+    return inspecionar_perfil(perfilar(df), alvo=alvo)
 
-    colunas_x = [c for c in df.columns if c != alvo]
 
-    faltantes = bool(df[colunas_x].isnull().any().any()) if colunas_x else False
+def inspecionar_perfil(perfil: Optional[dict], alvo: Optional[str] = None) -> Dict[str, bool]:
+    """`inspecionar_dados` a partir do perfil já calculado (`app.funcoes_genericas.perfil_dados`),
+    sem tocar no dataframe — é o mesmo perfil guardado com as coletas."""
+    if not perfil or not perfil.get("colunas"):
+        return dict(DADOS_CONSERVADOR)
+
+    colunas_x = [c for c in perfil["colunas"] if c["nome"] != alvo]
+
+    faltantes = any(c["nulos"] > 0 for c in colunas_x)
 
-    numericas = [c for c in colunas_x if str(df[c].dtype) in ("int64", "float64", "int32", "float32")]
+    # "Texto" é tudo o que não tem amplitude (bool e categóricas inclusive): é o que pede encoder.
+    numericas = [c for c in colunas_x if "min" in c]
     texto = len(numericas) < len(colunas_x)
 
     escalas_diferentes = False
     amplitudes = []
     for coluna in numericas:
-        serie = df[coluna].dropna()
-        if serie.empty:
+        if coluna["min"] is None or coluna["max"] is None:
             continue
-        amplitude = float(serie.max()) - float(serie.min())
+        amplitude = coluna["max"] - coluna["min"]
         if amplitude > 0:
             amplitudes.append(amplitude)
     if len(amplitudes) >= 2:
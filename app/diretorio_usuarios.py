@@ -0,0 +1,148 @@
+"""Diretório de identidade dos usuários: id → nome, e-mail e papel, só para exibição.
+
+As telas das turmas (alunos, progresso, ranking de desafio) e o ranking materializado buscavam
+documentos de `usuarios` por id só para mostrar o nome — `_mapa_usuarios` trazia o documento
+INTEIRO, com o hash da senha, a cada página. Aqui:
+
+- **projeção**: só ``nome_usuario``/``nome``/``email``/``role``;
+- **lote**: ids pedidos na mesma volta do event loop (os ramos de um `asyncio.gather`, requests
+  simultâneas) viram UM ``$in``, e um id já em voo não é pedido de novo — o DataLoader;
+- **cache** por worker, com TTL (``DIRETORIO_USUARIOS_TTL_SEC``) e teto de itens, compartilhado
+  entre as rotas. `app.security.invalidar_usuario`, que toda rota que muda um usuário já chama,
+  também o tira daqui; nos outros workers a mudança aparece em até um TTL.
+
+Cada entrada é ``{"nome", "email", "role"}``; ``nome`` é ``nome_usuario`` ou ``nome`` (o
+fallback "—" continua com quem exibe). Usuário inexistente não entra no cache (pode ser criado
+a seguir) e só não aparece no resultado. 0 em qualquer dos dois limites desliga o cache (o lote
+continua).
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List
+
+from bson import ObjectId
+
+logger = logging.getLogger(__name__)
+
+TTL_SEC = float(os.getenv("DIRETORIO_USUARIOS_TTL_SEC", "300"))
+MAX_ITENS = int(os.getenv("DIRETORIO_USUARIOS_MAX_ITENS", "20000"))
+_PROJECAO = {"nome_usuario": 1, "nome": 1, "email": 1, "role": 1}
+
+_cache: "OrderedDict[str, tuple]" = OrderedDict()   # id -> (expira, entrada)
+_em_voo: Dict[str, asyncio.Future] = {}
+_fila: List[str] = []
+# Invalidados enquanto a busca deles estava em voo: o resultado serve a quem esperava, mas não
+# entra no cache (pode ser de antes da mudança).
+_descartar: set = set()
+
+
+def _colecao():
+    # Import tardio (como em ranking_atividades.py): o módulo continua importável sem MONGO_URL.
+    from app import database
+    return database.colecao_usuario
+
+
+def _entrada(doc: dict) -> dict:
+    return {"nome": doc.get("nome_usuario") or doc.get("nome"),
+            "email": doc.get("email"), "role": doc.get("role")}
+
+
+def _guardar(uid: str, entrada: dict, agora: float) -> None:
+    if TTL_SEC <= 0 or MAX_ITENS <= 0:
+        return
+    _cache[uid] = (agora + TTL_SEC, entrada)
+    _cache.move_to_end(uid)
+    while len(_cache) > MAX_ITENS:
+        _cache.popitem(last=False)
+
+
+async def _carregar(lote: List[str]) -> None:
+    futuros = {uid: _em_voo[uid] for uid in lote if uid in _em_voo}
+    try:
+        achados = {}
+        cur = _colecao().find({"_id": {"$in": [ObjectId(uid) for uid in futuros]}}, _PROJECAO)
+        async for doc in cur:
+            achados[str(doc["_id"])] = _entrada(doc)
+        agora = time.monotonic()
+        for uid, entrada in achados.items():
+            if uid not in _descartar:
+                _guardar(uid, entrada, agora)
+        for uid, fut in futuros.items():
+            if not fut.done():
+                fut.set_result(achados.get(uid))
+    except Exception as e:
+        for fut in futuros.values():
+            if not fut.done():
+                fut.set_exception(e)
+                # Quem espera ainda recebe o erro; um id que ninguém chegou a aguardar (o
+                # chamador saiu no primeiro erro) não vira "exception was never retrieved".
+                fut.exception()
+    finally:
+        for uid, fut in futuros.items():
+            if _em_voo.get(uid) is fut:
+                del _em_voo[uid]
+            _descartar.discard(uid)
+
+
+def _disparar() -> None:
+    if not _fila:
+        return
+    lote = list(_fila)
+    _fila.clear()
+    asyncio.ensure_future(_carregar(lote))
+
+
+async def buscar(ids: Iterable) -> Dict[str, dict]:
+    """``{id: {"nome", "email", "role"}}`` dos usuários existentes entre `ids`.
+
+    Os que estão no cache saem dele; os outros entram no próximo lote (no máximo um ``$in`` por
+    volta do event loop, para todos os chamadores). Ids inválidos são ignorados.
+    """
+    loop = asyncio.get_running_loop()
+    agora = time.monotonic()
+    resultado: Dict[str, dict] = {}
+    esperar: Dict[str, asyncio.Future] = {}
+    for aid in ids or []:
+        uid = str(aid)
+        if uid in resultado or uid in esperar or not ObjectId.is_valid(uid):
+            continue
+        em_cache = _cache.get(uid)
+        if em_cache is not None and em_cache[0] > agora:
+            _cache.move_to_end(uid)
+            resultado[uid] = dict(em_cache[1])
+            continue
+        fut = _em_voo.get(uid)
+        if fut is None or fut.get_loop() is not loop:
+            fut = loop.create_future()
+            _em_voo[uid] = fut
+            _fila.append(uid)
+        esperar[uid] = fut
+    if _fila:
+        loop.call_soon(_disparar)
+    for uid, fut in esperar.items():
+        # shield: um chamador cancelado não cancela a busca dos outros que esperam o mesmo id.
+        entrada = await asyncio.shield(fut)
+        if entrada is not None:
+            resultado[uid] = dict(entrada)
+    return resultado
+
+
+def invalidar(usuario_id) -> None:
+    """Tira o usuário do cache deste worker (perfil, status ou exclusão mudaram)."""
+    uid = str(usuario_id)
+    _cache.pop(uid, None)
+    if uid in _em_voo:
+        _descartar.add(uid)
+
+
+def limpar() -> None:
+    """Esvazia o diretório (testes)."""
+    _cache.clear()
+    _em_voo.clear()
+    _fila.clear()
+    _descartar.clear()
@@ -0,0 +1,183 @@
+"""Índice de evolução dos alunos (`evolucao_alunos`).
+
+`GET /pipelines/evolucao` lia até 500 pipelines do aluno, reagrupava por base e recalculava o
+valor da métrica e o chute burro de cada tentativa a cada request — o bloco de evolução é
+pedido toda vez que o aluno abre um pipeline. Agora há **um documento por aluno × base**
+(nome normalizado do dataset + alvo) com as ``tentativas`` em ordem cronológica, cada uma um
+registro compacto de `app.pipelines_evolucao.registro_da_tentativa`: os valores das métricas
+já reduzidos entre os modelos, o chute burro da acurácia e o que mudou de configuração. A
+leitura é uma consulta pelo índice ``user_id``; o que sobra em Python é escolher a métrica do
+critério e os deltas, sobre floats.
+
+Manutenção incremental: criar, copiar, atualizar ou excluir um pipeline
+(`app/routers/pipelines.py`) chama `registrar`, que tira a tentativa de onde ela estava e a
+insere (``$push`` com ``$sort``) na base atual — o pipeline pode ter mudado de base numa edição.
+
+O aluno tem um documento-marca (``_id: {user_id}``, ``versao``) quando o índice dele está
+montado. Sem a marca (aluno antigo, falha ao registrar, `VERSAO` nova) a próxima leitura monta o
+índice a partir dos pipelines (`reconstruir`) — custo de uma leitura da rota antiga, uma vez.
+
+Um pipeline salvo enquanto o índice é montado pode ter ficado fora da leitura dos pipelines, e
+`registrar` não tem índice onde aplicá-lo. Por isso a marca tem uma ``geracao``: `iniciar` a
+incrementa (e tira a ``versao``) ANTES da leitura, `registrar` sem índice montado a incrementa de
+novo, e `reconstruir` só grava a ``versao`` se a geração ainda é a que `iniciar` devolveu. Se
+mudou, o índice fica sem marca e a próxima leitura o monta outra vez, já com o pipeline novo.
+"""
+from __future__ import annotations
+
+import logging
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from app.pipelines_evolucao import identidade_da_base, registro_da_tentativa
+
+logger = logging.getLogger(__name__)
+
+# Entra na marca do aluno: mudar o formato do registro é subir a versão, e cada aluno é
+# reconstruído na primeira leitura.
+VERSAO = 1
+# Só o que `registro_da_tentativa` lê: `resultadoColetaDado` pode ser grande, então vêm apenas
+# os campos de identidade e divisão.
+PROJECAO = {
+    "nome": 1, "dataCriacao": 1, "dataModificacao": 1, "atividade_id": 1,
+    "modeloSelecionado": 1, "modelosSelecionados": 1, "preProcessamentoConfig": 1,
+    "resultadosDasAvaliacoes": 1,
+    "resultadoColetaDado.datasetId": 1, "resultadoColetaDado.nomeDataset": 1,
+    "resultadoColetaDado.treino.nomeArquivo": 1, "resultadoColetaDado.target": 1,
+    "resultadoColetaDado.preverCategoria": 1, "resultadoColetaDado.dadosRotulados": 1,
+    "resultadoColetaDado.porcentagemTreino": 1,
+}
+
+
+def _colecao():
+    # Import tardio (como em ranking_atividades.py): o módulo continua importável sem MONGO_URL.
+    from app import database
+    return database.evolucao_alunos
+
+
+def _id_marca(user_id: str) -> dict:
+    return {"user_id": user_id}
+
+
+def _id_base(user_id: str, registro: dict) -> dict:
+    base, alvo = identidade_da_base(registro)
+    return {"user_id": user_id, "base": base, "alvo": alvo}
+
+
+async def ler(user_id: str) -> Optional[List[dict]]:
+    """Registros de tentativa do aluno, ou `None` se o índice dele ainda não está montado."""
+    docs = await _colecao().find({"user_id": user_id}).to_list(length=None)
+    marca = next((d for d in docs if d["_id"] == _id_marca(user_id)), None)
+    if not marca or marca.get("versao") != VERSAO:
+        return None
+    registros = [t for d in docs for t in d.get("tentativas") or []]
+    # Duas edições simultâneas do mesmo pipeline podem deixar a tentativa em dobro ($pull e
+    # $push de cada uma intercalados). Raro; quem vê remonta o índice em vez de mostrar.
+    if len({r["pipeline_id"] for r in registros}) != len(registros):
+        return None
+    return registros
+
+
+async def iniciar(user_id: str) -> Optional[int]:
+    """Abre uma reconstrução: nova ``geracao`` na marca, sem ``versao``. Chamar ANTES de ler os
+    pipelines que vão para `reconstruir`.
+
+    Não levanta; numa falha devolve None e a reconstrução não marca o índice.
+    """
+    from pymongo import ReturnDocument
+
+    try:
+        marca = await _colecao().find_one_and_update(
+            {"_id": _id_marca(user_id)},
+            {"$inc": {"geracao": 1}, "$unset": {"versao": ""}, "$set": {"user_id": user_id}},
+            upsert=True, return_document=ReturnDocument.AFTER)
+        return marca.get("geracao")
+    except Exception as e:
+        logger.warning("Índice de evolução do usuário %s: reconstrução não aberta (%s)", user_id, e)
+        return None
+
+
+async def reconstruir(user_id: str, docs: List[dict], geracao: Optional[int]) -> List[dict]:
+    """Monta o índice do aluno a partir dos pipelines (`PROJECAO`) e devolve os registros.
+
+    `geracao` é a de `iniciar`, chamado antes de ler `docs`: a marca só é gravada se nenhum
+    pipeline foi registrado desde então.
+
+    Não levanta: a leitura que pediu a reconstrução já tem o que mostrar. A marca é gravada por
+    último, então uma falha no meio deixa o aluno para ser reconstruído de novo.
+    """
+    from pymongo import ReplaceOne
+
+    registros = [r for r in map(registro_da_tentativa, docs) if r]
+    bases: dict = {}
+    for r in registros:
+        _id = _id_base(user_id, r)
+        bases.setdefault(tuple(_id.values()), {"_id": _id, **_id, "tentativas": []})["tentativas"].append(r)
+    agora = datetime.now(timezone.utc)
+    operacoes = []
+    for base in bases.values():
+        base["tentativas"].sort(key=lambda r: r["data"])
+        operacoes.append(ReplaceOne({"_id": base["_id"]}, {**base, "atualizado_em": agora}, upsert=True))
+    try:
+        colecao = _colecao()
+        if operacoes:
+            await colecao.bulk_write(operacoes, ordered=False)
+        manter = [b["_id"] for b in bases.values()] + [_id_marca(user_id)]
+        await colecao.delete_many({"user_id": user_id, "_id": {"$nin": manter}})
+        if geracao is not None:
+            await colecao.update_one({"_id": _id_marca(user_id), "geracao": geracao},
+                                     {"$set": {"versao": VERSAO, "atualizado_em": agora}})
+    except Exception as e:
+        logger.warning("Índice de evolução do usuário %s não gravado: %s", user_id, e)
+    return registros
+
+
+async def registrar(user_id: Optional[str], pipeline_id, doc: Optional[dict]) -> None:
+    """Atualiza a tentativa `pipeline_id` depois que o pipeline foi gravado (`doc`) ou excluído
+    (`doc=None`).
+
+    Nunca levanta: o pipeline já foi gravado. Numa falha o aluno perde a marca e a próxima
+    leitura reconstrói o índice.
+    """
+    if not user_id:
+        return
+    colecao = _colecao()
+    pipeline_id = str(pipeline_id)
+    try:
+        marca = await colecao.find_one({"_id": _id_marca(user_id)})
+        # Sem marca, ainda não montado: a primeira leitura já inclui este pipeline. Uma montagem
+        # em andamento pode não incluir; a geração nova impede que ela marque o índice.
+        if not marca or marca.get("versao") != VERSAO:
+            if marca:
+                await colecao.update_one({"_id": _id_marca(user_id)}, {"$inc": {"geracao": 1}})
+            return
+        await colecao.update_many({"user_id": user_id, "tentativas.pipeline_id": pipeline_id},
+                                  {"$pull": {"tentativas": {"pipeline_id": pipeline_id}}})
+        registro = registro_da_tentativa(doc) if doc else None
+        if registro:
+            _id = _id_base(user_id, registro)
+            await colecao.update_one(
+                {"_id": _id},
+                {"$set": {**_id, "atualizado_em": datetime.now(timezone.utc)},
+                 "$push": {"tentativas": {"$each": [registro], "$sort": {"data": 1}}}},
+                upsert=True)
+        await colecao.delete_many({"user_id": user_id, "tentativas": {"$size": 0}})
+    except Exception as e:
+        logger.warning("Índice de evolução do usuário %s não atualizado (%s); será reconstruído",
+                       user_id, e)
+        try:
+            await colecao.delete_one({"_id": _id_marca(user_id)})
+        except Exception:
+            pass
+
+
+def recentes(registros: List[dict], limite: int) -> List[dict]:
+    """As `limite` tentativas mais recentes (o `limite` da rota, que antes cortava a consulta)."""
+    if len(registros) <= limite:
+        return registros
+    return sorted(registros, key=lambda r: r["data"], reverse=True)[:limite]
+
+
+async def criar_indices() -> None:
+    """Leitura por aluno (startup da API; create_index é idempotente)."""
+    await _colecao().create_index("user_id")
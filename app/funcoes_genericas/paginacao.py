@@ -0,0 +1,91 @@
+"""Paginação por cursor (keyset) das listagens ordenadas por data: telemetria, runs e chats.
+
+`.skip(n)` obriga o Mongo a percorrer os `n` documentos pulados: as páginas do fundo da grade
+de telemetria ficavam cada vez mais lentas. Com cursor, a página seguinte começa onde a
+anterior parou — o filtro ``campo <= último valor`` cai direto no índice que já existe para a
+ordenação (``timestamp``, ``criado_em``...), e o custo é o de uma página, em qualquer
+profundidade.
+
+O desempate é pelos ``_id`` já entregues com o MESMO valor do campo, e não por um sort
+secundário em ``_id``: um sort composto ``(campo, _id)`` não seria atendido pelos índices
+existentes (todos terminam no campo de data) e viraria sort em memória. O lote da telemetria
+grava vários eventos no mesmo milissegundo, então esse conjunto existe — mas é pequeno.
+
+O cursor é opaco para o front (base64 de um JSON): valor do campo + ids vistos naquele valor.
+Não é assinado de propósito — só posiciona a página; o filtro de escopo (LGPD, dono) continua
+sendo aplicado pelo servidor em toda chamada.
+"""
+from __future__ import annotations
+
+import base64
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+
+from bson import ObjectId
+from fastapi import HTTPException
+
+# Teto da contagem no modo aproximado: acima disso o front mostra "10000+".
+TOTAL_APROXIMADO_MAX = 10000
+
+
+def _id_para_json(valor: Any) -> Any:
+    return {"$oid": str(valor)} if isinstance(valor, ObjectId) else valor
+
+
+def _id_de_json(valor: Any) -> Any:
+    return ObjectId(valor["$oid"]) if isinstance(valor, dict) and "$oid" in valor else valor
+
+
+def codificar_cursor(valor: datetime, ids: List[Any]) -> str:
+    bruto = json.dumps({"v": valor.isoformat(), "ids": [_id_para_json(i) for i in ids]},
+                       separators=(",", ":"))
+    return base64.urlsafe_b64encode(bruto.encode()).decode().rstrip("=")
+
+
+def decodificar_cursor(cursor: str) -> Tuple[datetime, List[Any]]:
+    try:
+        bruto = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        dados = json.loads(bruto)
+        return datetime.fromisoformat(dados["v"]), [_id_de_json(i) for i in dados["ids"]]
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor de paginação inválido.")
+
+
+def filtro_da_pagina(filtro: dict, campo: str, cursor: Optional[str]) -> dict:
+    """`filtro` restrito ao que vem depois do cursor, na ordem ``campo`` decrescente."""
+    if not cursor:
+        return filtro
+    valor, vistos = decodificar_cursor(cursor)
+    depois = {campo: {"$lte": valor}}
+    if vistos:
+        depois["_id"] = {"$nin": vistos}
+    # `$and`: o filtro pode já ter uma faixa no mesmo campo (data_inicio/data_fim).
+    return {"$and": [filtro, depois]} if filtro else depois
+
+
+def proximo_cursor(docs: List[dict], campo: str, limit: int,
+                   cursor: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+    """Recebe até ``limit + 1`` documentos (ordem ``campo`` desc) e devolve a página e o cursor
+    da próxima (None na última). O documento a mais só serve para saber se há próxima."""
+    pagina, tem_mais = docs[:limit], len(docs) > limit
+    if not tem_mais or not pagina or not isinstance(pagina[-1].get(campo), datetime):
+        return pagina, None
+    ultimo = pagina[-1][campo]
+    ids = [d["_id"] for d in pagina if d.get(campo) == ultimo]
+    if cursor:
+        valor_anterior, vistos = decodificar_cursor(cursor)
+        if valor_anterior == ultimo:   # a página inteira caiu no mesmo milissegundo
+            ids = vistos + ids
+    return pagina, codificar_cursor(ultimo, ids)
+
+
+async def contar(colecao, filtro: dict, *, aproximado: bool = False) -> Tuple[int, bool]:
+    """(total, é_aproximado). Sem filtro, a contagem estimada dos metadados (O(1)); no modo
+    aproximado, conta só até ``TOTAL_APROXIMADO_MAX`` — o scan para no teto."""
+    if not filtro:
+        return await colecao.estimated_document_count(), False
+    if aproximado:
+        n = await colecao.count_documents(filtro, limit=TOTAL_APROXIMADO_MAX + 1)
+        return min(n, TOTAL_APROXIMADO_MAX), n > TOTAL_APROXIMADO_MAX
+    return await colecao.count_documents(filtro), False
@@ -0,0 +1,127 @@
+"""Perfil por coluna de um dataset, calculado uma vez na ingestão e guardado com a coleta.
+
+Cada consumidor varria o dataframe de novo para a sua pergunta: o treino (`isnull().any()` e
+dtype numérico por coluna, a cada treino), o pairplot (quais colunas são numéricas), o perfil do
+desafio (faltantes, texto, amplitudes) — e `gerar_colunas_detalhes` só olhava o nome do dtype.
+`perfilar` faz uma passada vetorizada só e responde a todos:
+
+- ``dtype``, ``tipo`` (o mesmo rótulo de `colunas_detalhes`) e ``numerica`` (a mesma regra do
+  `is_numeric_dtype` que o treino e o pairplot usavam — bool conta, o estimador aceita);
+- ``nulos`` e ``distintos``;
+- ``min``/``max``/``media``/``desvio`` das numéricas que não são bool;
+- ``top``: as categorias mais frequentes das demais (bool incluído).
+
+O resultado vai em ``arquivos.perfil`` (lista por coluna — nome de coluna do aluno não serve de
+chave de documento no Mongo) e é do **completo**. O treino é um subconjunto dele, então "sem nulos
+no completo" e o dtype valem para o treino; "tem nulos no completo" não diz nada do treino, e
+quem precisa da resposta exata (a validação do treino) varre só nesse caso. Coletas antigas não
+têm perfil: as funções daqui devolvem ``None`` e o chamador varre como antes.
+"""
+from __future__ import annotations
+
+import math
+from typing import Any, Dict, Iterable, List, Optional
+
+import pandas as pd
+
+from app.funcoes_genericas.funcoes_genericas import mapear_tipo
+
+VERSAO = 1
+TOP_CATEGORIAS = 5
+
+
+def _numero(valor: Any) -> Optional[float]:
+    """float JSON-seguro (NaN/Inf viram None, como no `converter_numpy`)."""
+    try:
+        valor = float(valor)
+    except (TypeError, ValueError):
+        return None
+    return valor if math.isfinite(valor) else None
+
+
+def _tem_amplitude(serie: pd.Series) -> bool:
+    return pd.api.types.is_numeric_dtype(serie) and not pd.api.types.is_bool_dtype(serie)
+
+
+def perfilar(df: pd.DataFrame, top: int = TOP_CATEGORIAS) -> dict:
+    """Perfil do dataframe inteiro: ``{"versao", "num_linhas", "colunas": [...]}``."""
+    nulos = df.isna().sum()
+    continuas = [c for c in df.columns if _tem_amplitude(df[c])]
+    estatisticas = (df[continuas].agg(["min", "max", "mean", "std", "nunique"])
+                    if continuas else pd.DataFrame())
+
+    colunas = []
+    for nome in df.columns:
+        serie = df[nome]
+        coluna: Dict[str, Any] = {
+            "nome": str(nome),
+            "dtype": str(serie.dtype),
+            "tipo": mapear_tipo(str(serie.dtype)),
+            "numerica": bool(pd.api.types.is_numeric_dtype(serie)),
+            "nulos": int(nulos[nome]),
+        }
+        if nome in estatisticas.columns:
+            est = estatisticas[nome]
+            coluna.update({
+                "distintos": int(est["nunique"]),
+                "min": _numero(est["min"]),
+                "max": _numero(est["max"]),
+                "media": _numero(est["mean"]),
+                "desvio": _numero(est["std"]),
+            })
+        else:
+            # `value_counts` já é a contagem por categoria: o total de distintos sai dele, sem
+            # uma segunda passada de `nunique`.
+            contagens = serie.value_counts(dropna=True)
+            coluna["distintos"] = int(len(contagens))
+            coluna["top"] = [{"valor": str(v), "contagem": int(n)}
+                             for v, n in contagens.head(top).items()]
+        colunas.append(coluna)
+    return {"versao": VERSAO, "num_linhas": int(len(df)), "colunas": colunas}
+
+
+def _por_nome(perfil: Optional[dict]) -> Optional[Dict[str, dict]]:
+    if not perfil or perfil.get("versao") != VERSAO:
+        return None
+    return {c["nome"]: c for c in perfil.get("colunas") or []}
+
+
+def coluna(perfil: Optional[dict], nome: str) -> Optional[dict]:
+    colunas = _por_nome(perfil)
+    return colunas.get(str(nome)) if colunas is not None else None
+
+
+def numericas(perfil: Optional[dict], nomes: Iterable[str]) -> Optional[List[str]]:
+    """Quais de `nomes` são numéricas, na ordem dada. None se o perfil não cobre todas."""
+    colunas = _por_nome(perfil)
+    nomes = list(nomes)
+    if colunas is None or any(str(n) not in colunas for n in nomes):
+        return None
+    return [n for n in nomes if colunas[str(n)]["numerica"]]
+
+
+def sem_nulos(perfil: Optional[dict], nomes: Iterable[str]) -> bool:
+    """True quando o perfil GARANTE que nenhuma das colunas tem nulo (em qualquer parte).
+
+    False quer dizer "não sei" (sem perfil, coluna fora dele ou nulos no completo): o chamador
+    varre a parte que tem em mãos.
+    """
+    colunas = _por_nome(perfil)
+    if colunas is None:
+        return False
+    return all(str(n) in colunas and colunas[str(n)]["nulos"] == 0 for n in nomes)
+
+
+def resumo_para_tutor(perfil: Optional[dict], max_colunas: int = 30) -> Optional[List[dict]]:
+    """Versão compacta para o contexto do tutor: só o que ajuda a explicar os dados."""
+    if _por_nome(perfil) is None:
+        return None
+    resumo = []
+    for c in perfil["colunas"][:max_colunas]:
+        item = {"coluna": c["nome"], "tipo": c["tipo"], "nulos": c["nulos"], "distintos": c.get("distintos")}
+        if "min" in c:
+            item.update({k: c.get(k) for k in ("min", "max", "media")})
+        else:
+            item["mais_frequentes"] = [t["valor"] for t in c.get("top", [])[:3]]
+        resumo.append(item)
+    return resumo
@@ -0,0 +1,182 @@
+"""Limite de taxa compartilhado entre os workers: chat do tutor e ingestão de telemetria.
+
+Os dois limites eram listas de timestamps por usuário, na memória de cada worker: refeitas com
+uma list comprehension a cada mensagem, sem teto de chaves e multiplicadas pelo número de
+workers do uvicorn (20 mensagens/min viravam 40 com dois). Aqui:
+
+- **janela deslizante por contador** (e não por log de timestamps): cada chave guarda só a
+  contagem da janela atual e a da anterior; a estimativa é
+  ``anterior * (fração da janela atual que falta) + atual``. O(1) por checagem, memória fixa
+  por chave — e erra pouco perto da borda da janela, o suficiente para limite de abuso;
+- **Mongo como fonte da verdade** (``LIMITE_TAXA_STORE=mongo``, o padrão): um documento por
+  ``(chave, janela)`` em `limites_taxa`, incrementado com um `find_one_and_update` condicional
+  — checar e consumir é uma operação atômica só, e os workers veem a mesma conta. O TTL em
+  ``expira_em`` apaga as janelas velhas;
+- **caminho rápido no processo**: a contagem da janela anterior não muda mais, então fica em
+  cache local; e quem estourou fica bloqueado localmente até a estimativa voltar a caber, sem
+  ida ao banco. No caso comum é um round-trip por mensagem; no abuso, nenhum;
+- **Mongo fora do ar não derruba o chat**: passando de ``LIMITE_TAXA_TIMEOUT_SEC``, a checagem
+  cai para o contador local (o limite volta a ser por worker, como era), e o banco só é tentado
+  de novo depois de ``_PAUSA_SEM_MONGO`` — senão cada mensagem esperaria o timeout.
+
+``LIMITE_TAXA_STORE=memoria`` usa só o contador local (um worker só, e os testes). Os caches
+locais têm teto de ``LIMITE_TAXA_MAX_CHAVES`` chaves, com LRU.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+STORE = os.getenv("LIMITE_TAXA_STORE", "mongo").strip().lower()
+MAX_CHAVES = int(os.getenv("LIMITE_TAXA_MAX_CHAVES", "100000"))
+TIMEOUT_SEC = float(os.getenv("LIMITE_TAXA_TIMEOUT_SEC", "1"))
+_COLECAO = "limites_taxa"
+_PAUSA_SEM_MONGO = 30.0
+_sem_mongo_ate = 0.0
+
+
+def _lembrar(cache: OrderedDict, chave, valor) -> None:
+    cache[chave] = valor
+    cache.move_to_end(chave)
+    while len(cache) > MAX_CHAVES:
+        cache.popitem(last=False)
+
+
+def _estimativa(anterior: float, atual: float, agora: float, janela: float) -> float:
+    return anterior * (1 - (agora % janela) / janela) + atual
+
+
+def _livre_em(anterior: float, atual: float, maximo: int, indice: int, janela: float) -> float:
+    """Quando a estimativa volta a comportar 1 unidade, se ninguém mais consumir."""
+    livre = maximo - 1 - atual
+    if livre < 0 or anterior <= 0:
+        # `atual` só cresce dentro da janela: antes da próxima não cabe nada.
+        return (indice + 1) * janela
+    return indice * janela + janela * max(0.0, 1 - livre / anterior)
+
+
+# ------------------------------------------------------------------ backends
+
+class _Memoria:
+    """Contador local: ``chave -> [índice da janela, atual, anterior]``."""
+
+    def __init__(self):
+        self._contas: OrderedDict = OrderedDict()
+
+    def permitir(self, chave: str, maximo: int, janela: float, custo: int, agora: float) -> bool:
+        indice = int(agora // janela)
+        conta = self._contas.get(chave)
+        if conta is None or conta[0] < indice - 1:
+            conta = [indice, 0, 0]
+        elif conta[0] == indice - 1:
+            conta = [indice, 0, conta[1]]
+        if _estimativa(conta[2], conta[1], agora, janela) + custo > maximo:
+            _lembrar(self._contas, chave, conta)
+            return False
+        conta[1] += custo
+        _lembrar(self._contas, chave, conta)
+        return True
+
+
+class _Mongo:
+    def __init__(self, colecao=None):
+        self._colecao = colecao
+        self._anteriores: OrderedDict = OrderedDict()   # "chave:janela" fechada -> contagem
+        self._bloqueados: OrderedDict = OrderedDict()   # chave -> instante em que volta a caber
+
+    def colecao(self):
+        # Import tardio (como em datasets.py): o módulo continua importável sem MONGO_URL.
+        if self._colecao is None:
+            from app import database
+            self._colecao = database.db[_COLECAO]
+        return self._colecao
+
+    async def _contagem(self, doc_id: str) -> int:
+        doc = await self.colecao().find_one({"_id": doc_id}, {"n": 1})
+        return int((doc or {}).get("n") or 0)
+
+    async def permitir(self, chave: str, maximo: int, janela: float, custo: int, agora: float) -> bool:
+        from pymongo import ReturnDocument
+        from pymongo.errors import DuplicateKeyError
+
+        if self._bloqueados.get(chave, 0) > agora:
+            return False
+        self._bloqueados.pop(chave, None)
+
+        indice = int(agora // janela)
+        id_anterior = f"{chave}:{indice - 1}"
+        anterior = self._anteriores.get(id_anterior)
+        if anterior is None:
+            anterior = await self._contagem(id_anterior)
+            _lembrar(self._anteriores, id_anterior, anterior)
+
+        # Maior contagem atual com que ainda cabe `custo`: a condição vai no filtro do update,
+        # então checar e consumir são uma operação só no banco.
+        teto = math.floor(maximo - custo - _estimativa(anterior, 0, agora, janela))
+        if teto >= 0:
+            try:
+                await self.colecao().find_one_and_update(
+                    {"_id": f"{chave}:{indice}", "n": {"$lte": teto}},
+                    {"$inc": {"n": custo},
+                     # A janela ainda serve de "anterior" durante a próxima.
+                     "$setOnInsert": {"expira_em": datetime.fromtimestamp((indice + 2) * janela,
+                                                                          tz=timezone.utc)}},
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER,
+                )
+                return True
+            except DuplicateKeyError:
+                pass   # o documento existe e não passou no filtro: estourou
+        atual = await self._contagem(f"{chave}:{indice}")
+        _lembrar(self._bloqueados, chave, _livre_em(anterior, atual, maximo, indice, janela))
+        return False
+
+
+_memoria = _Memoria()
+_mongo = _Mongo()
+
+
+# ------------------------------------------------------------------ API
+
+async def permitir(escopo: str, chave: str, *, maximo: int, janela: float, custo: int = 1,
+                   agora: Optional[float] = None) -> bool:
+    """Consome `custo` do limite de `chave` (``maximo`` por ``janela`` segundos) se couber.
+
+    Devolve False sem consumir nada quando não cabe — quem chama decide a resposta (429).
+    """
+    global _sem_mongo_ate
+    chave = f"{escopo}:{chave}"
+    agora = time.time() if agora is None else agora
+    custo = max(1, int(custo))
+    if STORE == "mongo" and time.monotonic() >= _sem_mongo_ate:
+        try:
+            return await asyncio.wait_for(
+                _mongo.permitir(chave, maximo, janela, custo, agora), TIMEOUT_SEC
+            )
+        except Exception as e:
+            _sem_mongo_ate = time.monotonic() + _PAUSA_SEM_MONGO
+            logger.warning("limite de taxa: Mongo indisponível (%s); contador local por %.0f s",
+                           type(e).__name__, _PAUSA_SEM_MONGO)
+    return _memoria.permitir(chave, maximo, janela, custo, agora)
+
+
+async def criar_indices() -> None:
+    """TTL das janelas velhas (startup da API; create_index é idempotente)."""
+    if STORE == "mongo":
+        await _mongo.colecao().create_index("expira_em", expireAfterSeconds=0)
+
+
+def limpar() -> None:
+    """Zera os contadores locais (testes)."""
+    global _memoria, _mongo, _sem_mongo_ate
+    _memoria = _Memoria()
+    _mongo = _Mongo()
+    _sem_mongo_ate = 0.0
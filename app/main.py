@@ -42,9 +42,18 @@ from app.routers import visualizacao
 from app.routers import admin
 from app.routers import atividade
 from app.routers import sistema
-from app.coleta_dados import coleta_dados_csv_router, coleta_dados_xlxs_router, coleta_dados_url_router, configuracao_treinamento_router
+from app.coleta_dados import coleta_dados_csv_router, coleta_dados_xlxs_router, coleta_dados_url_router, configuracao_treinamento_router, upload_em_partes_router
+from app.coleta_dados import upload_em_partes
+from app.armazenamento import blobs
+from app.armazenamento.datasets import executar_coleta_orfaos
 from app.metricas import router as metricas_router
+from app.metricas import execucao as execucao_avaliacao
+from app import (
+    evolucao_alunos, limite_taxa, progresso_turmas, ranking_atividades, telemetria,
+    telemetria_rollup, tutor_http,
+)
 from app.security import definir_usuario_atual
+from app.sandbox import encerrar_zygote, iniciar_zygote
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
@@ -70,6 +79,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Cursor da próxima página das listas de conversas do tutor (o corpo é a lista).
+    expose_headers=["X-Proximo-Cursor"],
 )
 
 # Rotas públicas (sem autenticação)
@@ -95,6 +106,7 @@ app.include_router(artefatos.router, dependencies=auth_dependency)
 app.include_router(coleta_dados_xlxs_router, prefix="/coleta_dados", dependencies=auth_dependency)
 app.include_router(coleta_dados_csv_router, prefix="/coleta_dados", dependencies=auth_dependency)
 app.include_router(coleta_dados_url_router, prefix="/coleta_dados", dependencies=auth_dependency)
+app.include_router(upload_em_partes_router, prefix="/coleta_dados", dependencies=auth_dependency)
 app.include_router(configuracao_treinamento_router, prefix="/configurar_treinamento", dependencies=auth_dependency)
 
 app.include_router(knn.router, prefix="/classificador/treinamento", dependencies=auth_dependency)
@@ -173,6 +185,34 @@ async def criar_indices_atividade():
                 pass
 
 
+@app.on_event("startup")
+async def iniciar_rollup_telemetria():
+    # Resumo por hora da telemetria, lido pelos painéis (resumo, tempo-preso, progresso da
+    # turma). Índices (TTL igual ao dos eventos) e o compactador periódico em background.
+    try:
+        await telemetria_rollup.criar_indices(ATIVIDADE_TTL_DIAS)
+    except Exception:
+        pass
+    app.state.rollup_task = asyncio.create_task(telemetria_rollup.executar())
+
+
+@app.on_event("shutdown")
+async def parar_rollup_telemetria():
+    tarefa = getattr(app.state, "rollup_task", None)
+    if tarefa is not None:
+        tarefa.cancel()
+
+
+@app.on_event("startup")
+async def criar_indices_limite_taxa():
+    # TTL das janelas do limite de taxa (chat e telemetria): documento de janela velha some
+    # sozinho. create_index é idempotente.
+    try:
+        await limite_taxa.criar_indices()
+    except Exception:
+        pass
+
+
 @app.on_event("startup")
 async def criar_indices_mlflow_runs():
     # Associação run↔usuário (artefatos): consulta por usuário + data, ordenada por
@@ -186,6 +226,46 @@ async def criar_indices_mlflow_runs():
         pass
 
 
+@app.on_event("startup")
+async def criar_indices_historico_chat():
+    # Lista de conversas do usuário (e do aluno, para o professor), mais recentes primeiro e
+    # paginada por cursor em atualizado_em. create_index é idempotente.
+    try:
+        from app.database import historico_chat
+        await historico_chat.create_index([("usuario_id", 1), ("atualizado_em", -1)])
+    except Exception:
+        pass
+
+
+@app.on_event("startup")
+async def preparar_uploads_em_partes():
+    # Sessões de upload de CSV em partes: consulta por dono e limpeza das paradas (com as
+    # partes gravadas no armazenamento dos datasets). create_index é idempotente.
+    try:
+        await upload_em_partes.criar_indices()
+        await upload_em_partes.limpar_sessoes_abandonadas()
+    except Exception:
+        pass
+
+
+@app.on_event("startup")
+async def iniciar_coleta_blobs_orfaos():
+    # Blobs dos datasets endereçados por conteúdo: índice da busca de órfãos e o laço que
+    # apaga os que ficaram sem referência (depois da carência). create_index é idempotente.
+    try:
+        await blobs.criar_indices()
+    except Exception:
+        pass
+    app.state.coleta_blobs_task = asyncio.create_task(executar_coleta_orfaos())
+
+
+@app.on_event("shutdown")
+async def parar_coleta_blobs_orfaos():
+    tarefa = getattr(app.state, "coleta_blobs_task", None)
+    if tarefa is not None:
+        tarefa.cancel()
+
+
 @app.on_event("startup")
 async def criar_indices_turmas():
     # Índices para os novos padrões de consulta de Turmas & Atividades.
@@ -198,6 +278,14 @@ async def criar_indices_turmas():
         await atividades.create_index([("turma_id", 1), ("criado_em", -1)])
         await pipelines.create_index([("atividade_id", 1)])
         await pipelines.create_index([("turma_id", 1), ("user_id", 1)])
+        # Ranking materializado: a ordem dele, e os pipelines de UM aluno numa atividade (o que
+        # cada submissão recalcula).
+        await pipelines.create_index([("atividade_id", 1), ("user_id", 1)])
+        await ranking_atividades.criar_indices()
+        await evolucao_alunos.criar_indices()
+        await progresso_turmas.criar_indices()
+        from app.armazenamento import partes_pipeline
+        await partes_pipeline.criar_indices()
     except Exception:
         pass
 
@@ -272,14 +360,53 @@ async def semear_textos_do_tutor():
 
 @app.on_event("startup")
 def prewarm_datasets():
-    # Pre-baixa os datasets UCI para o cache em disco em background, sem bloquear
-    # o boot. Na primeira execucao baixa tudo; nos restarts seguintes e no-op.
+    # Pre-baixa os datasets UCI/OpenML para o cache em disco em background (em paralelo),
+    # sem bloquear o boot. Na primeira execucao baixa tudo; nos restarts seguintes so confere
+    # o manifesto.
     import threading
     threading.Thread(
         target=toy_datasets.prewarm_uci_cache, daemon=True, name="prewarm-uci-cache"
     ).start()
 
 
+@app.on_event("startup")
+async def aquecer_sandbox():
+    # Sobe o zygote do sandbox (pandas/sklearn já importados) em background: o primeiro
+    # treino não paga os imports e o boot não espera por eles.
+    app.state.zygote_task = asyncio.create_task(iniciar_zygote())
+
+
+@app.on_event("shutdown")
+async def desligar_sandbox():
+    await encerrar_zygote()
+
+
+@app.on_event("startup")
+async def aquecer_avaliacao():
+    # Sobe os processos da avaliação de modelos (matplotlib/yellowbrick importados) em
+    # background, pelo mesmo motivo do zygote.
+    app.state.avaliacao_task = asyncio.create_task(execucao_avaliacao.aquecer())
+
+
+@app.on_event("shutdown")
+def desligar_avaliacao():
+    execucao_avaliacao.encerrar()
+
+
+@app.on_event("shutdown")
+async def fechar_clientes_do_tutor():
+    # Os clientes HTTP dos provedores de LLM vivem enquanto a API vive (keep-alive entre
+    # mensagens); aqui as conexões do pool são fechadas.
+    await tutor_http.encerrar()
+
+
+@app.on_event("shutdown")
+async def gravar_telemetria_pendente():
+    # A telemetria é gravada em lote, em background: o que ainda está na fila vai ao Mongo
+    # antes de o worker sair.
+    await telemetria.encerrar()
+
+
 @app.get("/healthcheck")
 async def healthcheck(response: Response):
     """Saúde do serviço: responde 200 só quando o MongoDB responde ao ping.
@@ -0,0 +1,135 @@
+"""Onde a avaliação de modelos roda: pool de processos fora do event loop.
+
+Avaliar um modelo é CPU pura — `joblib.load`, `predict`, métricas e até quatro figuras do
+Yellowbrick — e, feito no event loop, travava o worker do uvicorn por segundos a cada
+modelo. Aqui cada modelo vira uma tarefa num `ProcessPoolExecutor`:
+
+- processos, e não threads: o pyplot não é thread-safe (figura corrente, rcParams globais) e
+  o GIL serializaria o render de qualquer forma;
+- `spawn`, e não `fork`: o processo da API tem threads (motor, prewarm), e um fork herdaria
+  locks presos. O custo do spawn (importar matplotlib/yellowbrick/sklearn) é pago uma vez por
+  worker no `_inicializar_worker`, e o pool vive enquanto a API vive;
+- `AVALIACAO_WORKERS=0` desliga o pool: a avaliação roda numa thread, uma de cada vez (de
+  novo o pyplot), ainda fora do event loop. É o modo dos testes.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import pickle
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Processos do pool (0 = sem pool, avaliação serial numa thread).
+WORKERS = int(os.environ.get("AVALIACAO_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Prazo de um request de avaliação inteiro; o que não terminar vira "Tempo esgotado".
+DEADLINE_SEC = float(os.environ.get("AVALIACAO_DEADLINE_SEC", "120"))
+
+_pool: Optional[ProcessPoolExecutor] = None
+_lock_pool = threading.Lock()
+# Modo sem pool: uma avaliação por vez (pyplot não é thread-safe).
+_lock_local = threading.Lock()
+
+
+def _inicializar_worker() -> None:
+    # Paga no boot do worker os imports que toda avaliação faria.
+    import app.metricas.metricas  # noqa: F401
+
+
+def _nada() -> int:
+    return os.getpid()
+
+
+def _pool_atual() -> Optional[ProcessPoolExecutor]:
+    global _pool
+    if WORKERS <= 0:
+        return None
+    with _lock_pool:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_inicializar_worker,
+            )
+        return _pool
+
+
+def _descartar(pool: ProcessPoolExecutor) -> None:
+    """Tira do ar um pool quebrado (worker morto por OOM, por exemplo); o próximo request
+    sobe outro."""
+    global _pool
+    with _lock_pool:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _rodar_local(fn: Callable, *args: Any) -> Any:
+    with _lock_local:
+        return fn(*args)
+
+
+def _rodar_serializado(tarefa: bytes) -> Any:
+    fn, args = pickle.loads(tarefa)
+    return fn(*args)
+
+
+def _serializar(fn: Callable, args: tuple) -> Optional[bytes]:
+    """A tarefa já serializada, ou None se ela não atravessa processo.
+
+    Serializar aqui, antes do `submit`, separa as duas falhas: o pool serializa numa thread
+    própria e o erro chegaria pelo resultado, misturado aos AttributeError/TypeError que a
+    própria avaliação levanta no worker. Os bytes vão para o pool como estão (copiá-los é barato),
+    então a serialização continua sendo uma só.
+    """
+    try:
+        return pickle.dumps((fn, args), protocol=pickle.HIGHEST_PROTOCOL)
+    except (pickle.PicklingError, AttributeError, TypeError) as e:
+        logger.info("avaliação: argumentos não serializáveis (%s); rodando fora do pool", e)
+        return None
+
+
+async def executar(fn: Callable, *args: Any) -> Any:
+    """Roda `fn(*args)` no pool (ou na thread serial sem pool) e devolve o resultado.
+
+    Cancelar a corrotina cancela a tarefa se ela ainda estiver na fila do pool; uma que já
+    começou termina no worker e o resultado é descartado.
+    """
+    pool = _pool_atual()
+    if pool is None:
+        return await asyncio.to_thread(_rodar_local, fn, *args)
+    tarefa = await asyncio.to_thread(_serializar, fn, args)
+    if tarefa is None:
+        # Argumento que não atravessa processo (métrica dinâmica definida fora de módulo,
+        # por exemplo): avalia este modelo aqui mesmo, fora do loop.
+        return await asyncio.to_thread(_rodar_local, fn, *args)
+    try:
+        return await asyncio.wrap_future(pool.submit(_rodar_serializado, tarefa))
+    except BrokenProcessPool:
+        _descartar(pool)
+        raise
+
+
+async def aquecer() -> None:
+    """Sobe os workers do pool no boot, para o primeiro request não pagar os imports."""
+    pool = _pool_atual()
+    if pool is None:
+        return
+    try:
+        await asyncio.gather(*(asyncio.wrap_future(pool.submit(_nada)) for _ in range(WORKERS)))
+    except Exception as e:
+        logger.warning("avaliação: falha ao aquecer o pool: %s", e)
+
+
+def encerrar() -> None:
+    global _pool
+    with _lock_pool:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
@@ -10,10 +10,17 @@ from app.schemas.schemas import AvaliacaoModelosRequest
 from app.funcoes_genericas.validacao import validar_object_id, MAX_ARQUIVO_BASE64
 from app.funcoes_genericas.funcoes_genericas import converter_numpy
 from app.mlflow_client import mlflow_enabled
+from app.armazenamento import DatasetIndisponivel, carregar_df
+from app.armazenamento.datasets import decodificar_base64_legado, ler_ref
+from app.armazenamento.figuras import gravar_figuras, ler_figuras
+from app.metricas import modelos_cache
+from app.metricas.modelos_cache import ModeloIndisponivel
 from app.security import id_usuario_atual
 from bson import ObjectId
+import asyncio
 import importlib
 import joblib
+import json
 import base64
 import io
 import os
@@ -23,10 +30,10 @@ from pathlib import Path
 import hashlib
 import sys
 import types
-from typing import Optional
+from typing import Any, Optional
 import numpy as np
 from sklearn.metrics import confusion_matrix, precision_recall_fscore_support, silhouette_score, calinski_harabasz_score, davies_bouldin_score, mean_squared_error
-from sklearn.base import is_regressor
+from sklearn.base import clone, is_regressor
 
 import matplotlib
 matplotlib.use("Agg")
@@ -113,6 +120,15 @@ def _aplicar_tema() -> None:
 
 _aplicar_tema()
 
+# Suba quando o código de desenho mudar (tamanho, título, legenda...): figuras do cache
+# renderizadas pelo código antigo deixam de casar. Paleta, cores e fonte já entram sozinhas.
+_VERSAO_DESENHO = 1
+VERSAO_TEMA = hashlib.sha256(json.dumps(
+    [_VERSAO_DESENHO, PALETA_TEMA, _RC_TEMA, CMAP_NOME, COR_TREINO, COR_TESTE, COR_LINHA,
+     _FONTE_SANS, matplotlib.__version__],
+    sort_keys=True,
+).encode()).hexdigest()[:16]
+
 router = APIRouter()
 
 AVERAGES_PERMITIDAS = {"micro", "macro", "weighted"}
@@ -192,26 +208,47 @@ def _figura_para_base64(fig) -> str:
     return base64.b64encode(buffer.read()).decode("utf-8")
 
 
-def _ler_df_de_base64(b64: Optional[str]):
-    """Lê um DataFrame de um conteúdo base64 (Excel ou CSV). Retorna None em falha."""
-    if not b64:
+async def _ler_treino_opcional(arquivo_doc: Optional[dict]):
+    """Treino da coleta quando disponível (resíduos de treino, Distância de Cook). None em falha."""
+    if not arquivo_doc:
         return None
     try:
-        raw = base64.b64decode(b64)
-    except Exception:
+        return await carregar_df(arquivo_doc.get("_id"), "treino", doc=arquivo_doc)
+    except DatasetIndisponivel:
         return None
-    try:
-        return pd.read_excel(io.BytesIO(raw), engine="openpyxl")
-    except Exception:
+
+
+async def _carregar_teste(doc: dict, arquivo_doc: Optional[dict]):
+    """Conjunto de teste do modelo: o da coleta; sem ela, a cópia guardada no próprio modelo
+    (referência Parquet nos modelos novos, base64 nos antigos)."""
+    if arquivo_doc:
         try:
-            try:
-                text = raw.decode("utf-8")
-            except UnicodeDecodeError:
-                text = raw.decode("latin-1")
-            sep = ";" if ";" in text.split("\n")[0] else ","
-            return pd.read_csv(io.StringIO(text), sep=sep)
-        except Exception:
-            return None
+            return await carregar_df(arquivo_doc.get("_id"), "teste", doc=arquivo_doc)
+        except DatasetIndisponivel as e:
+            if e.kind != "ausente":
+                raise
+
+    ref = doc.get("armazenamento_teste")
+    if ref:
+        try:
+            return await ler_ref(ref)
+        except DatasetIndisponivel as e:
+            if e.kind != "ausente":
+                raise
+
+    if "arq_teste" in doc:
+        base64_str = doc.get("arq_teste")
+    else:
+        # O documento veio sem os campos pesados (_PROJECAO_LEVE): busca só o base64.
+        base64_str = (await modelos_treinados.find_one({"_id": doc["_id"]}, {"arq_teste": 1}) or {}).get("arq_teste")
+    if not base64_str:
+        raise HTTPException(status_code=400, detail="Conteúdo do arquivo de teste ausente.")
+    if len(base64_str) > MAX_ARQUIVO_BASE64:
+        raise DatasetIndisponivel("Arquivo de teste muito grande. O limite é de 50 MB.", "grande")
+    try:
+        return await asyncio.to_thread(decodificar_base64_legado, base64_str)
+    except Exception as e:
+        raise DatasetIndisponivel(f"Erro ao processar arquivo de teste: {e}", "corrompido")
 
 
 def _logar_avaliacao_mlflow(
@@ -272,6 +309,31 @@ def _viz_fit(viz, X, y=None):
     return viz
 
 
+def _visualizacao(nome: str, base64_png: str) -> dict:
+    return {
+        "titulo": nome,
+        "grafico_id": _TITULO_PARA_SLUG.get(nome),
+        "mime": "image/png",
+        "base64": base64_png,
+    }
+
+
+def _renderizar_todas(visualizadores, em_cache: Optional[dict] = None) -> list[dict]:
+    """Renderiza cada ``(titulo, factory)``, exceto as que já vieram do cache de figuras
+    (``{slug: base64}``, ver `app/armazenamento/figuras.py`)."""
+    em_cache = em_cache or {}
+    visualizacoes = []
+    for titulo, factory in visualizadores:
+        slug = _TITULO_PARA_SLUG.get(titulo)
+        if slug in em_cache:
+            visualizacao = _visualizacao(titulo, em_cache[slug])
+        else:
+            visualizacao = _renderizar_visualizacao(titulo, factory)
+        if visualizacao:
+            visualizacoes.append(visualizacao)
+    return visualizacoes
+
+
 def _renderizar_visualizacao(nome: str, factory) -> Optional[dict]:
     try:
         _aplicar_tema()  # paleta/cores do tema antes de desenhar (cores são fixadas no draw)
@@ -284,12 +346,7 @@ def _renderizar_visualizacao(nome: str, factory) -> Optional[dict]:
                 viz.finalize()
             except Exception as e:
                 logger.debug("finalize() falhou para '%s': %s", nome, e)
-        return {
-            "titulo": nome,
-            "grafico_id": _TITULO_PARA_SLUG.get(nome),
-            "mime": "image/png",
-            "base64": _figura_para_base64(fig),
-        }
+        return _visualizacao(nome, _figura_para_base64(fig))
     except Exception as e:
         logger.warning("Falha ao gerar visualização Yellowbrick '%s': %s", nome, e)
         plt.close("all")
@@ -333,7 +390,7 @@ def _desenhar_erros_predicao(ax, y_true, y_pred, labels_calc, labels_disp) -> No
               loc="upper left", bbox_to_anchor=(1.02, 1), borderaxespad=0)
 
 
-def gerar_visualizacoes_classificacao(modelo_treinado, X_test, y_test, classes) -> list[dict]:
+def gerar_visualizacoes_classificacao(modelo_treinado, X_test, y_test, classes, em_cache: Optional[dict] = None) -> list[dict]:
     if not getattr(modelo_treinado, "_estimator_type", None):
         try:
             modelo_treinado._estimator_type = "classifier"
@@ -350,7 +407,6 @@ def gerar_visualizacoes_classificacao(modelo_treinado, X_test, y_test, classes)
         y_pred = modelo_treinado.predict(X_test)
     except Exception:
         y_pred = None
-    visualizacoes = []
 
     visualizadores = [
         ("Matriz de confusão", lambda ax: _viz_score(ConfusionMatrix(modelo_treinado, classes=classes_str, ax=ax, cmap=CMAP_NOME), X_test, y_test)),
@@ -359,20 +415,13 @@ def gerar_visualizacoes_classificacao(modelo_treinado, X_test, y_test, classes)
         ("Balanceamento das classes", lambda ax: _viz_fit(ClassBalance(labels=classes_str, ax=ax), y_test)),
     ]
 
-    for titulo, factory in visualizadores:
-        visualizacao = _renderizar_visualizacao(titulo, factory)
-        if visualizacao:
-            visualizacoes.append(visualizacao)
-
-    return visualizacoes
+    return _renderizar_todas(visualizadores, em_cache)
 
 
 CLUSTERING_METRICS = {"silhouette_score", "calinski_harabasz_score", "davies_bouldin_score"}
 
 
-def gerar_visualizacoes_clustering(modelo_treinado, X_test) -> list[dict]:
-    visualizacoes = []
-
+def gerar_visualizacoes_clustering(modelo_treinado, X_test, em_cache: Optional[dict] = None) -> list[dict]:
     n_clusters = getattr(modelo_treinado, 'n_clusters', None)
     n_unique = len(set(getattr(modelo_treinado, 'labels_', [])))
     max_k = min(10, len(X_test) // 5) if len(X_test) > 50 else max(n_unique, 3)
@@ -381,24 +430,20 @@ def gerar_visualizacoes_clustering(modelo_treinado, X_test) -> list[dict]:
     visualizadores = [
         ("Silhouette", lambda ax: _viz_fit(SilhouetteVisualizer(modelo_treinado, ax=ax), X_test)),
         ("Distância entre Clusters", lambda ax: _viz_fit(InterclusterDistance(modelo_treinado, ax=ax), X_test)),
-        ("Método do Cotovelo", lambda ax: _viz_fit(KElbowVisualizer(modelo_treinado, k=(2, max_k), ax=ax, timings=False), X_test)),
+        # O cotovelo re-ajusta o estimador para cada k: um clone, para não estragar o modelo
+        # que o cache de modelos compartilha com os próximos requests.
+        ("Método do Cotovelo", lambda ax: _viz_fit(KElbowVisualizer(clone(modelo_treinado), k=(2, max_k), ax=ax, timings=False), X_test)),
     ]
 
-    for titulo, factory in visualizadores:
-        visualizacao = _renderizar_visualizacao(titulo, factory)
-        if visualizacao:
-            visualizacoes.append(visualizacao)
-
-    return visualizacoes
+    return _renderizar_todas(visualizadores, em_cache)
 
 
 REGRESSION_METRICS = {"r2_score", "mean_squared_error", "root_mean_squared_error", "mean_absolute_error"}
 
 
-def gerar_visualizacoes_regressao(modelo_treinado, X_test, y_test, X_train=None, y_train=None) -> list[dict]:
+def gerar_visualizacoes_regressao(modelo_treinado, X_test, y_test, X_train=None, y_train=None, em_cache: Optional[dict] = None) -> list[dict]:
     if not getattr(modelo_treinado, "_estimator_type", None):
         modelo_treinado._estimator_type = "regressor"
-    visualizacoes = []
     tem_treino = X_train is not None and y_train is not None
 
     def _prediction_error(ax):
@@ -439,12 +484,7 @@ def gerar_visualizacoes_regressao(modelo_treinado, X_test, y_test, X_train=None,
     if tem_treino:
         visualizadores.append(("Distância de Cook", _cooks))
 
-    for titulo, factory in visualizadores:
-        visualizacao = _renderizar_visualizacao(titulo, factory)
-        if visualizacao:
-            visualizacoes.append(visualizacao)
-
-    return visualizacoes
+    return _renderizar_todas(visualizadores, em_cache)
 
 
 def calcular_metricas_clustering(X_test, labels) -> dict:
@@ -474,38 +514,69 @@ def _num_ou_cru(v):
         return v
 
 
-@router.post("/prever")
-async def prever(body: dict):
-    """Previsão lúdica ("Treine seu Robô"): carrega o modelo treinado e prevê UM
-    exemplo informado pelo aluno. Reusa o mesmo carregamento da avaliação; o Pipeline
-    aplica o pré-processamento sozinho (vale p/ classificador, regressor e k-means)."""
+# Leitura de modelos_treinados sem os campos pesados: os bytes do estimador só são buscados
+# quando o cache de modelos não o tem, e o `arq_teste` só quando não há teste melhor.
+_PROJECAO_LEVE = {"modelo_treinado": 0, "arq_teste": 0}
+
+# Teto de linhas de um `/prever/lote` (a tela manda uma grade de valores, não um dataset).
+MAX_LINHAS_PREVER = 10_000
+
+
+async def _bytes_do_modelo(doc: dict) -> bytes:
+    if doc.get("modelo_treinado") is not None:
+        return bytes(doc["modelo_treinado"])
+    bruto = await modelos_treinados.find_one(
+        {"_id": doc["_id"], "usuario_id": doc.get("usuario_id")}, {"modelo_treinado": 1}
+    )
+    if not bruto or bruto.get("modelo_treinado") is None:
+        raise HTTPException(status_code=404, detail="Modelo não encontrado.")
+    return bytes(bruto["modelo_treinado"])
+
+
+async def _modelo_para_prever(body: dict) -> tuple[dict, Any]:
+    """Documento (leve) e estimador de `/prever`: do cache de modelos quando já verificado e
+    desserializado; senão busca os bytes, confere o checksum e carrega fora do loop."""
     modelo_oid = validar_object_id((body or {}).get("modelo_id"), "modelo_id")
-    valores = (body or {}).get("valores") or {}
 
     # Escopo por dono: modelos_treinados não tinha campo de dono e a busca só por
     # _id permitia prever com o modelo de outro usuário (IDOR).
-    doc = await modelos_treinados.find_one({"_id": modelo_oid, "usuario_id": id_usuario_atual()})
+    doc = await modelos_treinados.find_one({"_id": modelo_oid, "usuario_id": id_usuario_atual()}, _PROJECAO_LEVE)
     if not doc:
         raise HTTPException(status_code=404, detail="Modelo não encontrado.")
 
-    atributos = doc.get("atributos") or []
-    if not atributos:
+    if not (doc.get("atributos") or []):
         raise HTTPException(status_code=400, detail="Modelo sem atributos registrados.")
 
-    # Verifica o checksum antes de desserializar (mesma proteção de avaliar_modelos):
-    # joblib.load é um unpickle; um documento adulterado no banco não deve ser carregado.
-    modelo_bytes = bytes(doc["modelo_treinado"])
-    checksum_esperado = doc.get("checksum")
-    if checksum_esperado and hashlib.sha256(modelo_bytes).hexdigest() != checksum_esperado:
-        raise HTTPException(status_code=400, detail="Modelo treinado corrompido (checksum).")
-    try:
-        modelo = joblib.load(io.BytesIO(modelo_bytes))
-    except Exception:
-        raise HTTPException(status_code=400, detail="Não foi possível carregar o modelo treinado.")
+    chave = modelos_cache.chave(doc["_id"], doc.get("checksum"))
+    modelo = modelos_cache.obter(chave)
+    if modelo is None:
+        modelo_bytes = await _bytes_do_modelo(doc)
+        try:
+            # Checksum antes de desserializar (mesma proteção de avaliar_modelos):
+            # joblib.load é um unpickle; um documento adulterado no banco não deve ser carregado.
+            modelo = await asyncio.to_thread(modelos_cache.carregar, chave, modelo_bytes, doc.get("checksum"))
+        except ModeloIndisponivel as e:
+            if e.kind == "checksum":
+                raise HTTPException(status_code=400, detail="Modelo treinado corrompido (checksum).")
+            raise HTTPException(status_code=400, detail="Não foi possível carregar o modelo treinado.")
+    return doc, modelo
+
 
-    # 1 linha na ordem dos atributos do treino (faltantes = 0)
-    linha = {col: _num_ou_cru(valores.get(col, 0)) for col in atributos}
-    df = pd.DataFrame([linha], columns=atributos)
+def _linhas_para_df(linhas: list, atributos: list) -> "pd.DataFrame":
+    # Na ordem dos atributos do treino (faltantes = 0)
+    return pd.DataFrame(
+        [{col: _num_ou_cru((valores or {}).get(col, 0)) for col in atributos} for valores in linhas],
+        columns=atributos,
+    )
+
+
+@router.post("/prever")
+async def prever(body: dict):
+    """Previsão lúdica ("Treine seu Robô"): carrega o modelo treinado e prevê UM
+    exemplo informado pelo aluno. Reusa o mesmo carregamento da avaliação; o Pipeline
+    aplica o pré-processamento sozinho (vale p/ classificador, regressor e k-means)."""
+    doc, modelo = await _modelo_para_prever(body)
+    df = _linhas_para_df([(body or {}).get("valores") or {}], doc["atributos"])
     try:
         pred = modelo.predict(df)[0]
     except Exception as e:
@@ -514,6 +585,29 @@ async def prever(body: dict):
     return converter_numpy({"predicao": pred})
 
 
+@router.post("/prever/lote")
+async def prever_lote(body: dict):
+    """Várias previsões numa chamada só (``{"modelo_id", "linhas": [{atributo: valor}]}`` →
+    ``{"predicoes": [...]}``, na ordem das linhas): um `predict` vetorizado em vez de um
+    request por exemplo — a tela pode pedir a curva inteira de um slider de uma vez."""
+    linhas = (body or {}).get("linhas")
+    if not isinstance(linhas, list) or not linhas:
+        raise HTTPException(status_code=400, detail="Envie ao menos uma linha em 'linhas'.")
+    if len(linhas) > MAX_LINHAS_PREVER:
+        raise HTTPException(status_code=400, detail=f"No máximo {MAX_LINHAS_PREVER} linhas por chamada.")
+    if not all(isinstance(linha, dict) for linha in linhas):
+        raise HTTPException(status_code=400, detail="Cada linha deve ser um objeto {atributo: valor}.")
+
+    doc, modelo = await _modelo_para_prever(body)
+    df = _linhas_para_df(linhas, doc["atributos"])
+    try:
+        preds = await asyncio.to_thread(modelo.predict, df)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Não foi possível prever: {e}")
+
+    return converter_numpy({"predicoes": list(preds)})
+
+
 _REQUIREMENTS_MODELO = (
     "scikit-learn==1.4.2\n"
     "numpy==1.26.4\n"
@@ -612,237 +706,443 @@ async def baixar_modelo_artefato(modelo_id: str):
     return StreamingResponse(buffer, media_type="application/zip", headers=headers)
 
 
-@router.post("/avaliar_modelos")
-async def avaliar_modelos(request: AvaliacaoModelosRequest):
-    logger.info(f"avaliar_modelos called with {len(request.modelos)} modelos and {len(request.metricas)} metricas")
+# ------------------------------------------------------------------ avaliação de modelos
+# A rota separa a avaliação de cada modelo em duas partes: o I/O (documento, conjunto de
+# teste) no event loop, e a CPU (`joblib.load`, `predict`, métricas, figuras) em
+# `avaliar_modelo`, que roda no pool de processos de `execucao.py`. Os modelos são
+# avaliados em paralelo, sob um prazo por request, e cada arquivo de teste é decodificado
+# uma vez por request — não uma vez por modelo.
+TEMPO_ESGOTADO = "Tempo esgotado"
+
+
+async def _resolver_metricas(metricas) -> list[dict]:
+    """Grupo e função de cada métrica pedida, resolvidos uma vez por request (são consultas ao
+    catálogo); o worker recebe tudo pronto."""
+    resolvidas = []
+    for metrica in metricas:
+        resolvidas.append({
+            "label": metrica.label,
+            "valor": metrica.valor,
+            "average": metrica.average,
+            "grupo": await _grupo_da_metrica(metrica.valor),
+            "fn": await _get_metrica_fn_dynamic(metrica.valor),
+        })
+    return resolvidas
+
+
+def _avaliar_clustering(modelo_treinado, X_test, metricas: list[dict], em_cache: dict) -> dict:
+    labels = modelo_treinado.predict(X_test)
+    visualizacoes = gerar_visualizacoes_clustering(modelo_treinado, X_test, em_cache)
+
+    valores = {}
+    clustering_vals = calcular_metricas_clustering(X_test, labels)
+    for metrica in metricas:
+        if metrica["valor"] in CLUSTERING_METRICS or metrica["grupo"] == "agrupamento":
+            valores[metrica["label"]] = clustering_vals.get(metrica["label"], "Métrica não calculada")
+        else:
+            valores[metrica["label"]] = "N/A para agrupamento"
+    return {"metricas": valores, "visualizacoes": visualizacoes}
 
-    if not request.modelos:
-        logger.warning("avaliar_modelos called with empty modelos list")
-    
-    # estrutura: {nome_metrica: {label_modelo: valor}}
-    resultados_formatados = {
-        metrica.label: {} for metrica in request.metricas
-    }
-    resultados_formatados[VISUALIZACOES_KEY] = {}
 
-    for modelo in request.modelos:
-        id_modelo = modelo.id
-        nome_modelo = modelo.label
-        logger.debug(f"Processando modelo {nome_modelo} (id {id_modelo})")
-
-        modelo_oid = validar_object_id(id_modelo, "id_modelo")
-        # Escopo por dono (IDOR): avaliar só modelos do próprio usuário.
-        doc = await modelos_treinados.find_one({"_id": modelo_oid, "usuario_id": id_usuario_atual()})
-
-        if not doc:
-            logger.warning(f"Modelo não encontrado: {id_modelo}")
-            for metrica in request.metricas:
-                resultados_formatados[metrica.label][nome_modelo] = "Modelo não encontrado"
-            continue
+def _avaliar_regressao(modelo_treinado, X_test, y_test, X_train, y_train, metricas: list[dict], em_cache: dict) -> dict:
+    y_pred = modelo_treinado.predict(X_test)
+    visualizacoes = gerar_visualizacoes_regressao(modelo_treinado, X_test, y_test, X_train, y_train, em_cache)
 
-        modelo_treinado_bytes = bytes(doc["modelo_treinado"])
-        logger.debug(f"Modelo bytes length: {len(modelo_treinado_bytes)}")
-
-        # Recupera o checksum esperado
-        checksum_esperado = doc.get("checksum")
-        if checksum_esperado:
-            checksum_atual = hashlib.sha256(modelo_treinado_bytes).hexdigest()
-            if checksum_atual != checksum_esperado:
-                logger.error(f"Checksum mismatch for model {id_modelo}")
-                raise HTTPException(status_code=400, detail="Erro de integridade: checksum do modelo não corresponde.")
-
-        # Desserializa o modelo com joblib
-        modelo_treinado = joblib.load(io.BytesIO(modelo_treinado_bytes))
-        logger.debug("Modelo deserializado com sucesso")
-
-        atributos = doc["atributos"]
-        target = doc["target"]
-        logger.debug(f"Atributos: {atributos}, Target: {target}")
-
-        # Busca o arquivo de teste pelo ID (separado do documento do modelo)
-        arquivo_id = doc.get("arquivo_id")
-        base64_str = None
-        arquivo_doc = None
-
-        if arquivo_id:
-            if ObjectId.is_valid(str(arquivo_id)):
-                arquivo_doc = await arquivos.find_one({"_id": ObjectId(str(arquivo_id))})
-                if arquivo_doc:
-                    base64_str = arquivo_doc.get("content_teste_base64")
+    valores = {}
+    for metrica in metricas:
+        try:
+            if not (metrica["valor"] in REGRESSION_METRICS or metrica["grupo"] == "regressao"):
+                valores[metrica["label"]] = "N/A para regressão"
+                continue
+
+            if metrica["valor"] == "root_mean_squared_error":
+                valores[metrica["label"]] = float(mean_squared_error(y_test, y_pred) ** 0.5)
+            elif not metrica["fn"]:
+                valores[metrica["label"]] = "Métrica não suportada"
             else:
-                logger.warning(f"arquivo_id inválido no modelo {id_modelo}: {arquivo_id}")
-        
-        # Fallback: usa o arq_teste do próprio modelo se não encontrou no arquivo
-        if not base64_str:
-            base64_str = doc.get("arq_teste")
+                valores[metrica["label"]] = float(metrica["fn"](y_test, y_pred))
+        except Exception as e:
+            logger.warning(f"Erro ao calcular métrica {metrica['label']}: {e}")
+            valores[metrica["label"]] = f"Erro: {str(e)}"
+    return {"metricas": valores, "visualizacoes": visualizacoes}
 
-        if not base64_str:
-            raise HTTPException(status_code=400, detail="Conteúdo do arquivo de teste ausente.")
 
-        if len(base64_str) > MAX_ARQUIVO_BASE64:
-            raise HTTPException(status_code=413, detail="Arquivo de teste muito grande. O limite é de 50 MB.")
+def _avaliar_classificacao(modelo_treinado, X_test, y_test, classes_doc, metricas: list[dict], em_cache: dict) -> dict:
+    y_pred = modelo_treinado.predict(X_test)
 
-        arquivo_bytes = base64.b64decode(base64_str)
+    if not classes_doc:
+        try:
+            classes_doc = [str(c) for c in modelo_treinado.classes_]
+        except AttributeError:
+            classes_doc = [str(c) for c in sorted(list(set(y_test) | set(y_pred)))]
 
+    visualizacoes = None
+    if hasattr(modelo_treinado, "classes_"):
+        visualizacoes = gerar_visualizacoes_classificacao(modelo_treinado, X_test, y_test, classes_doc, em_cache)
+
+    valores = {}
+    for metrica in metricas:
         try:
-            df_teste = pd.read_excel(io.BytesIO(arquivo_bytes), engine="openpyxl")
-        except Exception as e:
-            logger.debug(f"Falha ao ler arquivo de teste como Excel: {e}")
-            try:
-                # Tenta CSV se falhar Excel
-                text = arquivo_bytes.decode("utf-8")
-                sep = ";" in text.split("\n")[0] and ";" or ","
-                df_teste = pd.read_csv(io.StringIO(text), sep=sep)
-            except Exception as e2:
-                logger.warning(f"Falha ao ler arquivo de teste como CSV: {e2}")
-                raise HTTPException(status_code=400, detail=f"Erro ao processar arquivo de teste: {e} | {e2}")
-
-        # Valida colunas
-        colunas_necessarias = atributos.copy()
-        if target:
-            colunas_necessarias.append(target)
-        for col in colunas_necessarias:
-            if col not in df_teste.columns:
-                raise HTTPException(status_code=400, detail=f"Coluna '{col}' não encontrada no arquivo de teste.")
-
-        X_test = df_teste[atributos]
-        is_clustering = not target or target == ""
-
-        if is_clustering:
-            # Nem todo não supervisionado agrupa: o PCA transforma os dados (tem
-            # `transform`, não `predict`), então não há rótulo de cluster para medir.
-            # Sem esta guarda o `predict` abaixo estourava AttributeError → 500.
-            if not hasattr(modelo_treinado, "predict"):
-                raise HTTPException(
-                    status_code=400,
-                    detail=(
-                        f"O modelo {nome_modelo} transforma os dados em vez de agrupá-los, "
-                        "então não produz rótulos e as métricas de agrupamento não se aplicam. "
-                        "Use o modelo treinado para reduzir a dimensionalidade dos dados."
-                    ),
-                )
+            # Gate por grupo (simétrico a regressão/clustering): uma métrica de
+            # outro grupo forçada contra um classificador retorna N/A.
+            if metrica["grupo"] in ("regressao", "agrupamento"):
+                valores[metrica["label"]] = "N/A para classificação"
+                continue
 
-            # Avaliação de clustering
-            labels = modelo_treinado.predict(X_test)
+            if metrica["valor"] == "confusion_matrix":
+                # Os rótulos usados no CÁLCULO precisam ter o mesmo tipo de y
+                # (ex.: inteiros no dataset digits). classes_doc costuma vir como
+                # string (para exibição); passá-la como labels zera a matriz inteira,
+                # pois nenhum rótulo string casa com y inteiro. Por isso calculamos
+                # com os valores reais das classes (modelo/y) e só convertemos para
+                # string na hora de exibir — mesma lógica das visualizações Yellowbrick.
+                classes_modelo = getattr(modelo_treinado, "classes_", None)
+                if classes_modelo is not None and len(classes_modelo) > 0:
+                    labels_calc = list(classes_modelo)
+                else:
+                    labels_calc = sorted(set(list(y_test)) | set(list(y_pred)))
+                cm = confusion_matrix(y_test, y_pred, labels=labels_calc)
+                valores[metrica["label"]] = {
+                    "matriz": cm.tolist(),
+                    "classes": [str(c) for c in labels_calc],
+                    "total": int(len(y_test))
+                }
+                continue
 
-            resultados_formatados[VISUALIZACOES_KEY][nome_modelo] = gerar_visualizacoes_clustering(
-                modelo_treinado, X_test
-            )
+            if not metrica["fn"]:
+                valores[metrica["label"]] = "Métrica não suportada"
+                continue
 
-            clustering_vals = calcular_metricas_clustering(X_test, labels)
-            for metrica in request.metricas:
-                try:
-                    eh_agrup = metrica.valor in CLUSTERING_METRICS or (await _grupo_da_metrica(metrica.valor)) == "agrupamento"
-                    if eh_agrup:
-                        resultados_formatados[metrica.label][nome_modelo] = clustering_vals.get(
-                            metrica.label, "Métrica não calculada"
-                        )
-                    else:
-                        resultados_formatados[metrica.label][nome_modelo] = "N/A para agrupamento"
-                except Exception as e:
-                    logger.warning(f"Erro ao calcular métrica {metrica.label}: {e}")
-                    resultados_formatados[metrica.label][nome_modelo] = f"Erro: {str(e)}"
-        elif is_regressor(modelo_treinado):
-            # Avaliação de regressão
-            y_test = df_teste[target]
-            y_pred = modelo_treinado.predict(X_test)
-
-            # Carrega o conjunto de treino (quando disponível) para desenhar os resíduos
-            # de treino no ResidualsPlot e calcular a Distância de Cook.
-            X_train = y_train = None
-            df_treino = _ler_df_de_base64(arquivo_doc.get("content_treino_base64") if arquivo_doc else None)
-            if (df_treino is not None and target in df_treino.columns
-                    and all(c in df_treino.columns for c in atributos)):
-                X_train = df_treino[atributos]
-                y_train = df_treino[target]
-
-            resultados_formatados[VISUALIZACOES_KEY][nome_modelo] = gerar_visualizacoes_regressao(
-                modelo_treinado, X_test, y_test, X_train, y_train
+            valores[metrica["label"]] = calcular_metrica(
+                metrica["valor"], metrica["fn"], y_test, y_pred, metrica["average"]
             )
+        except Exception as e:
+            logger.warning(f"Erro ao calcular métrica {metrica['label']}: {e}")
+            valores[metrica["label"]] = f"Erro: {str(e)}"
+    return {"metricas": valores, "visualizacoes": visualizacoes}
 
-            for metrica in request.metricas:
-                try:
-                    eh_regr = metrica.valor in REGRESSION_METRICS or (await _grupo_da_metrica(metrica.valor)) == "regressao"
-                    if not eh_regr:
-                        resultados_formatados[metrica.label][nome_modelo] = "N/A para regressão"
-                        continue
-
-                    if metrica.valor == "root_mean_squared_error":
-                        valor_metrica = float(mean_squared_error(y_test, y_pred) ** 0.5)
-                    else:
-                        metrica_fn = await _get_metrica_fn_dynamic(metrica.valor)
-                        if not metrica_fn:
-                            resultados_formatados[metrica.label][nome_modelo] = "Métrica não suportada"
-                            continue
-                        valor_metrica = float(metrica_fn(y_test, y_pred))
 
-                    resultados_formatados[metrica.label][nome_modelo] = valor_metrica
-                except Exception as e:
-                    logger.warning(f"Erro ao calcular métrica {metrica.label}: {e}")
-                    resultados_formatados[metrica.label][nome_modelo] = f"Erro: {str(e)}"
+def avaliar_modelo(trabalho: dict) -> dict:
+    """Parte de CPU da avaliação de um modelo; roda no pool (ver `execucao.py`).
+
+    Devolve ``{"metricas": {label: valor}, "visualizacoes": [...] | None}``, ou
+    ``{"erro": (status, detalhe)}`` para o que a rota devolve como erro HTTP (uma
+    HTTPException não atravessa o processo). O estimador vem do cache de modelos DESTE
+    processo; sem ele e sem ``modelo_bytes`` no trabalho, devolve ``{"precisa_bytes": True}``
+    e o pai reenvia com os bytes.
+    """
+    checksum = trabalho.get("checksum")
+    chave = modelos_cache.chave(trabalho["id"], checksum)
+    modelo_treinado = modelos_cache.obter(chave)
+    if modelo_treinado is None:
+        if trabalho.get("modelo_bytes") is None:
+            return {"precisa_bytes": True}
+        try:
+            # O checksum é conferido antes do joblib.load: bytes adulterados nunca são desserializados.
+            modelo_treinado = modelos_cache.carregar(chave, trabalho["modelo_bytes"], checksum)
+        except ModeloIndisponivel as e:
+            if e.kind != "checksum":
+                raise
+            logger.error(f"Checksum mismatch for model {trabalho['id']}")
+            return {"erro": (400, "Erro de integridade: checksum do modelo não corresponde.")}
+
+    X_test, y_test = trabalho["X_test"], trabalho["y_test"]
+    metricas = trabalho["metricas"]
+    em_cache = trabalho.get("figuras_em_cache") or {}
+
+    if y_test is None:
+        # Nem todo não supervisionado agrupa: o PCA transforma os dados (tem
+        # `transform`, não `predict`), então não há rótulo de cluster para medir.
+        # Sem esta guarda o `predict` estourava AttributeError → 500.
+        if not hasattr(modelo_treinado, "predict"):
+            return {"erro": (
+                400,
+                f"O modelo {trabalho['label']} transforma os dados em vez de agrupá-los, "
+                "então não produz rótulos e as métricas de agrupamento não se aplicam. "
+                "Use o modelo treinado para reduzir a dimensionalidade dos dados.",
+            )}
+        return _avaliar_clustering(modelo_treinado, X_test, metricas, em_cache)
+    if is_regressor(modelo_treinado):
+        return _avaliar_regressao(
+            modelo_treinado, X_test, y_test, trabalho.get("X_train"), trabalho.get("y_train"), metricas, em_cache
+        )
+    return _avaliar_classificacao(modelo_treinado, X_test, y_test, trabalho.get("classes"), metricas, em_cache)
+
+
+def _prefixo_figuras(trabalho: dict) -> str:
+    """Endereço das figuras do modelo no cache: sha256 do modelo, dos dados que as figuras
+    desenham (teste; treino nos regressores; classes do documento) e de `VERSAO_TEMA`.
+    CPU (hash dos dataframes): chamado fora do event loop."""
+    h = hashlib.sha256()
+    h.update((trabalho.get("checksum") or hashlib.sha256(trabalho["modelo_bytes"]).hexdigest()).encode())
+    for nome in ("X_test", "y_test", "X_train", "y_train"):
+        dados = trabalho.get(nome)
+        h.update(nome.encode())
+        if dados is None:
+            continue
+        if isinstance(dados, pd.DataFrame):
+            cabecalho = [[str(c), str(t)] for c, t in dados.dtypes.items()]
         else:
-            # Avaliação de classificação
-            y_test = df_teste[target]
-            y_pred = modelo_treinado.predict(X_test)
-
-            classes_doc = doc.get("classes")
-            if not classes_doc:
-                try:
-                    classes_doc = [str(c) for c in modelo_treinado.classes_]
-                except AttributeError:
-                    classes_doc = [str(c) for c in sorted(list(set(y_test) | set(y_pred)))]
-
-            if hasattr(modelo_treinado, "classes_"):
-                resultados_formatados[VISUALIZACOES_KEY][nome_modelo] = gerar_visualizacoes_classificacao(
-                    modelo_treinado, X_test, y_test, classes_doc
-                )
+            cabecalho = [str(dados.name), str(dados.dtype)]
+        h.update(json.dumps(cabecalho).encode())
+        h.update(pd.util.hash_pandas_object(dados, index=True).values.tobytes())
+    h.update(json.dumps(trabalho.get("classes") or [], default=str).encode())
+    h.update(VERSAO_TEMA.encode())
+    return h.hexdigest()
+
+
+async def _uma_vez(cache: dict, chave, fabrica):
+    """Resultado de `fabrica()` memorizado em `cache` durante o request (só sucessos)."""
+    if chave not in cache:
+        cache[chave] = await fabrica()
+    return cache[chave]
+
+
+async def _preparar_avaliacao(modelo, usuario_id: str, metricas: list[dict], caches: dict) -> Optional[dict]:
+    """Parte de I/O da avaliação de um modelo, no event loop: documento, arquivo de teste e,
+    para regressores, o treino. Devolve o trabalho de `avaliar_modelo` (None se o modelo não
+    existe); levanta HTTPException nos erros que a rota devolve ao cliente."""
+    id_modelo = modelo.id
+    modelo_oid = validar_object_id(id_modelo, "id_modelo")
+    # Escopo por dono (IDOR): avaliar só modelos do próprio usuário.
+    doc = await modelos_treinados.find_one({"_id": modelo_oid, "usuario_id": usuario_id}, _PROJECAO_LEVE)
+    if not doc:
+        logger.warning(f"Modelo não encontrado: {id_modelo}")
+        return None
 
-            for metrica in request.metricas:
-                try:
-                    # Gate por grupo (simétrico a regressão/clustering): uma métrica de
-                    # outro grupo forçada contra um classificador retorna N/A.
-                    grupo_m = await _grupo_da_metrica(metrica.valor)
-                    if grupo_m in ("regressao", "agrupamento"):
-                        resultados_formatados[metrica.label][nome_modelo] = "N/A para classificação"
-                        continue
-
-                    if metrica.valor == "confusion_matrix":
-                        # Os rótulos usados no CÁLCULO precisam ter o mesmo tipo de y
-                        # (ex.: inteiros no dataset digits). classes_doc costuma vir como
-                        # string (para exibição); passá-la como labels zera a matriz inteira,
-                        # pois nenhum rótulo string casa com y inteiro. Por isso calculamos
-                        # com os valores reais das classes (modelo/y) e só convertemos para
-                        # string na hora de exibir — mesma lógica das visualizações Yellowbrick.
-                        classes_modelo = getattr(modelo_treinado, "classes_", None)
-                        if classes_modelo is not None and len(classes_modelo) > 0:
-                            labels_calc = list(classes_modelo)
-                        else:
-                            labels_calc = sorted(set(list(y_test)) | set(list(y_pred)))
-                        cm = confusion_matrix(y_test, y_pred, labels=labels_calc)
-                        resultados_formatados[metrica.label][nome_modelo] = {
-                            "matriz": cm.tolist(),
-                            "classes": [str(c) for c in labels_calc],
-                            "total": int(len(y_test))
-                        }
-                        continue
-
-                    metrica_fn = await _get_metrica_fn_dynamic(metrica.valor)
-                    if not metrica_fn:
-                        resultados_formatados[metrica.label][nome_modelo] = "Métrica não suportada"
-                        continue
-
-                    valor_metrica = calcular_metrica(metrica.valor, metrica_fn, y_test, y_pred, metrica.average)
-                    resultados_formatados[metrica.label][nome_modelo] = valor_metrica
-                except Exception as e:
-                    logger.warning(f"Erro ao calcular métrica {metrica.label}: {e}")
-                    resultados_formatados[metrica.label][nome_modelo] = f"Erro: {str(e)}"
+    atributos = doc["atributos"]
+    target = doc["target"]
+
+    # Busca o arquivo de teste pelo ID (separado do documento do modelo)
+    arquivo_id = doc.get("arquivo_id")
+    arquivo_doc = None
+    if arquivo_id:
+        if ObjectId.is_valid(str(arquivo_id)):
+            arquivo_doc = await _uma_vez(
+                caches["arquivos"], str(arquivo_id),
+                lambda: arquivos.find_one({"_id": ObjectId(str(arquivo_id))}),
+            )
+        else:
+            logger.warning(f"arquivo_id inválido no modelo {id_modelo}: {arquivo_id}")
 
-        # MLflow: anexa métricas + visualizações ao run que treinou esse modelo.
-        _logar_avaliacao_mlflow(
-            run_id=doc.get("mlflow_run_id"),
-            label_modelo=nome_modelo,
-            metricas_pedidas=request.metricas,
-            resultados_formatados=resultados_formatados,
+    # Modelos da mesma coleta dividem o teste: decodificado uma vez por request.
+    chave_teste = ("arquivo", str(arquivo_id)) if arquivo_doc else ("modelo", str(doc["_id"]))
+    try:
+        df_teste = await _uma_vez(caches["testes"], chave_teste, lambda: _carregar_teste(doc, arquivo_doc))
+    except DatasetIndisponivel as e:
+        if e.kind == "grande":
+            raise HTTPException(status_code=413, detail="Arquivo de teste muito grande. O limite é de 50 MB.")
+        logger.warning(f"Falha ao ler arquivo de teste: {e}")
+        raise HTTPException(status_code=400, detail=f"Erro ao processar arquivo de teste: {e}")
+
+    # Valida colunas
+    colunas_necessarias = atributos.copy()
+    if target:
+        colunas_necessarias.append(target)
+    for col in colunas_necessarias:
+        if col not in df_teste.columns:
+            raise HTTPException(status_code=400, detail=f"Coluna '{col}' não encontrada no arquivo de teste.")
+
+    # Treino (resíduos de treino no ResidualsPlot, Distância de Cook) só interessa a
+    # regressores — os supervisionados sem `classes` no documento.
+    X_train = y_train = None
+    if target and not doc.get("classes") and arquivo_doc:
+        df_treino = await _uma_vez(
+            caches["treinos"], str(arquivo_id), lambda: _ler_treino_opcional(arquivo_doc)
         )
+        if (df_treino is not None and target in df_treino.columns
+                and all(c in df_treino.columns for c in atributos)):
+            X_train = df_treino[atributos]
+            y_train = df_treino[target]
+
+    trabalho = {
+        "id": id_modelo,
+        "label": modelo.label,
+        # Com checksum, o estimador costuma estar no cache do worker: os bytes só vão se ele
+        # pedir (`precisa_bytes`). Sem checksum não há cache, então vão já.
+        "modelo_bytes": None if doc.get("checksum") else await _bytes_do_modelo(doc),
+        "checksum": doc.get("checksum"),
+        "classes": doc.get("classes"),
+        "mlflow_run_id": doc.get("mlflow_run_id"),
+        "X_test": df_teste[atributos],
+        "y_test": df_teste[target] if target else None,
+        "X_train": X_train,
+        "y_train": y_train,
+        "metricas": metricas,
+        # Só para buscar os bytes se o worker pedir; não vai para o pool.
+        "_doc": {"_id": doc["_id"], "usuario_id": doc.get("usuario_id")},
+    }
+
+    # Figuras já renderizadas para este modelo + dados + tema: o worker só desenha as que faltam.
+    trabalho["prefixo_figuras"] = await asyncio.to_thread(_prefixo_figuras, trabalho)
+    trabalho["figuras_em_cache"] = {
+        slug: base64.b64encode(png).decode("utf-8")
+        for slug, png in (await ler_figuras(trabalho["prefixo_figuras"])).items()
+    }
+    return trabalho
+
+
+def _resultado_uniforme(metricas: list[dict], valor: str) -> dict:
+    return {"metricas": {m["label"]: valor for m in metricas}, "visualizacoes": None}
+
+
+async def _avaliar_e_logar(trabalho: dict, metricas_pedidas) -> dict:
+    from app.metricas import execucao
 
+    run_id = trabalho.pop("mlflow_run_id", None)
+    doc = trabalho.pop("_doc")
+    resultado = await execucao.executar(avaliar_modelo, trabalho)
+    if resultado.get("precisa_bytes"):
+        # O processo que pegou a tarefa ainda não tem o modelo: reenvia com os bytes.
+        trabalho["modelo_bytes"] = await _bytes_do_modelo(doc)
+        resultado = await execucao.executar(avaliar_modelo, trabalho)
+    if not resultado.get("erro"):
+        em_cache = trabalho.get("figuras_em_cache") or {}
+        novas = {
+            v["grafico_id"]: base64.b64decode(v["base64"])
+            for v in resultado.get("visualizacoes") or []
+            if v.get("grafico_id") and v["grafico_id"] not in em_cache
+        }
+        await gravar_figuras(trabalho["prefixo_figuras"], novas)
+    if run_id and not resultado.get("erro"):
+        # MLflow: anexa métricas + visualizações ao run que treinou esse modelo.
+        label = trabalho["label"]
+        formatado = {k: {label: v} for k, v in resultado["metricas"].items()}
+        formatado[VISUALIZACOES_KEY] = {label: resultado.get("visualizacoes") or []}
+        await asyncio.to_thread(_logar_avaliacao_mlflow, run_id, label, metricas_pedidas, formatado)
+    return resultado
+
+
+async def _avaliar_modelos(request: AvaliacaoModelosRequest, usuario_id: str):
+    """Gera ``(label, resultado)`` por modelo, na ordem em que terminam.
+
+    O modelo seguinte é preparado enquanto os anteriores rodam no pool. O que não terminar
+    até `execucao.DEADLINE_SEC` sai com "Tempo esgotado" em todas as métricas. Erros de um
+    modelo viram ``{"erro": (status, detalhe)}`` — quem consome decide se aborta o request.
+    """
+    from app.metricas import execucao
+
+    loop = asyncio.get_running_loop()
+    limite = loop.time() + execucao.DEADLINE_SEC
+    metricas = await _resolver_metricas(request.metricas)
+    caches: dict = {"arquivos": {}, "testes": {}, "treinos": {}}
+    rodando: dict[asyncio.Future, str] = {}
+
+    def _colher(tarefa):
+        label = rodando.pop(tarefa)
+        try:
+            return label, tarefa.result()
+        except Exception as e:
+            logger.exception("Falha ao avaliar o modelo %s", label)
+            return label, {"erro": (500, f"Erro ao avaliar o modelo {label}: {e}")}
+
+    try:
+        for modelo in request.modelos:
+            logger.debug(f"Processando modelo {modelo.label} (id {modelo.id})")
+            try:
+                trabalho = await asyncio.wait_for(
+                    _preparar_avaliacao(modelo, usuario_id, metricas, caches),
+                    max(0.0, limite - loop.time()),
+                )
+            except HTTPException as e:
+                yield modelo.label, {"erro": (e.status_code, e.detail)}
+                continue
+            except asyncio.TimeoutError:
+                yield modelo.label, _resultado_uniforme(metricas, TEMPO_ESGOTADO)
+                continue
+            if trabalho is None:
+                yield modelo.label, _resultado_uniforme(metricas, "Modelo não encontrado")
+                continue
+            rodando[asyncio.ensure_future(_avaliar_e_logar(trabalho, request.metricas))] = modelo.label
+            for tarefa in [t for t in rodando if t.done()]:
+                yield _colher(tarefa)
+
+        while rodando:
+            prontas, _ = await asyncio.wait(
+                list(rodando), timeout=max(0.0, limite - loop.time()), return_when=asyncio.FIRST_COMPLETED
+            )
+            if not prontas:
+                break
+            for tarefa in prontas:
+                yield _colher(tarefa)
+
+        if rodando:
+            logger.warning(
+                "avaliar_modelos: prazo de %.0fs esgotado com %d modelo(s) em andamento",
+                execucao.DEADLINE_SEC, len(rodando),
+            )
+        for tarefa, label in list(rodando.items()):
+            tarefa.cancel()
+            rodando.pop(tarefa)
+            yield label, _resultado_uniforme(metricas, TEMPO_ESGOTADO)
+    finally:
+        # Cliente foi embora ou o request abortou num erro: nada fica rodando por ele.
+        for tarefa in rodando:
+            tarefa.cancel()
+
+
+@router.post("/avaliar_modelos")
+async def avaliar_modelos(request: AvaliacaoModelosRequest):
+    logger.info(f"avaliar_modelos called with {len(request.modelos)} modelos and {len(request.metricas)} metricas")
+
+    if not request.modelos:
+        logger.warning("avaliar_modelos called with empty modelos list")
+
+    por_modelo: dict[str, dict] = {}
+    avaliacoes = _avaliar_modelos(request, id_usuario_atual())
+    try:
+        async for label, resultado in avaliacoes:
+            if resultado.get("erro"):
+                status, detalhe = resultado["erro"]
+                raise HTTPException(status_code=status, detail=detalhe)
+            por_modelo[label] = resultado
+    finally:
+        await avaliacoes.aclose()
+
+    # estrutura: {nome_metrica: {label_modelo: valor}}, na ordem do pedido
+    resultados_formatados = {
+        metrica.label: {} for metrica in request.metricas
+    }
+    resultados_formatados[VISUALIZACOES_KEY] = {}
+    for modelo in request.modelos:
+        resultado = por_modelo.get(modelo.label)
+        if resultado is None:
+            continue
+        for label_metrica, valor in resultado["metricas"].items():
+            resultados_formatados[label_metrica][modelo.label] = valor
+        if resultado.get("visualizacoes") is not None:
+            resultados_formatados[VISUALIZACOES_KEY][modelo.label] = resultado["visualizacoes"]
     return resultados_formatados
+
+
+@router.post("/avaliar_modelos/stream")
+async def avaliar_modelos_stream(request: AvaliacaoModelosRequest):
+    """Versão streaming (SSE) da avaliação: um evento por modelo, na ordem em que terminam
+    (``{"modelo", "metricas", "visualizacoes"}`` ou ``{"modelo", "status", "error"}``), e
+    ``{"fim": true}`` no final. O erro de um modelo não interrompe os outros."""
+    # O usuário é lido aqui: o corpo do StreamingResponse roda depois do handler.
+    usuario_id = id_usuario_atual()
+
+    async def _eventos():
+        avaliacoes = _avaliar_modelos(request, usuario_id)
+        try:
+            async for label, resultado in avaliacoes:
+                if resultado.get("erro"):
+                    status, detalhe = resultado["erro"]
+                    evento = {"modelo": label, "status": status, "error": detalhe}
+                else:
+                    evento = {
+                        "modelo": label,
+                        "metricas": resultado["metricas"],
+                        "visualizacoes": resultado.get("visualizacoes"),
+                    }
+                yield f"data: {json.dumps(evento)}\n\n"
+            yield f"data: {json.dumps({'fim': True})}\n\n"
+        finally:
+            await avaliacoes.aclose()
+
+    return StreamingResponse(
+        _eventos(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,124 @@
+"""LRU, por processo, dos estimadores já verificados e desserializados.
+
+A tela "Treine seu Robô" chama `/prever` a cada mexida num slider, e cada chamada buscava o
+documento inteiro do modelo (bytes do estimador e até o `arq_teste` em base64), recalculava o
+SHA-256 e fazia o `joblib.load` de novo. Aqui o estimador desserializado fica em memória,
+com chave ``(id, checksum)``: o checksum muda se o modelo for regravado, então uma entrada
+nunca fica velha — no máximo deixa de ser usada e sai pelo LRU.
+
+Só entra no cache o que passou pela verificação do checksum (modelos antigos, sem checksum,
+são desserializados a cada uso, como antes). O teto é pela soma dos tamanhos serializados
+(``MODELOS_CACHE_MAX_MB``), uma aproximação barata do que o objeto ocupa, e vale POR
+PROCESSO: cada worker do uvicorn e cada processo do pool de avaliação tem o seu.
+
+Quem pega um estimador daqui o compartilha com os requests seguintes: não pode ajustá-lo de
+novo nem mudar seus parâmetros (ver o `clone` do Método do Cotovelo em metricas.py).
+"""
+from __future__ import annotations
+
+import hashlib
+import io
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+import joblib
+
+logger = logging.getLogger(__name__)
+
+MAX_BYTES = int(float(os.getenv("MODELOS_CACHE_MAX_MB", "64")) * 1024 * 1024)
+
+Chave = tuple[str, str]
+
+_itens: "OrderedDict[Chave, tuple[Any, int]]" = OrderedDict()
+_total = 0
+_acertos = 0
+_faltas = 0
+# O loop (via to_thread) e as threads da avaliação sem pool mexem no mesmo dicionário.
+_lock = threading.Lock()
+
+
+class ModeloIndisponivel(Exception):
+    """O estimador não pôde ser carregado.
+
+    Mesmo espírito do `DatasetIndisponivel`: quem chama decide a resposta —
+    ``checksum`` (bytes não batem com o checksum do documento: não são desserializados) ou
+    ``corrompido`` (o joblib não conseguiu carregar).
+    """
+
+    def __init__(self, message: str, kind: str = "corrompido"):
+        super().__init__(message)
+        self.kind = kind
+
+
+def chave(doc_id: Any, checksum: Optional[str]) -> Optional[Chave]:
+    """Chave do cache, ou None para modelo sem checksum (não é cacheado)."""
+    return (str(doc_id), checksum) if checksum else None
+
+
+def obter(chave_modelo: Optional[Chave]) -> Optional[Any]:
+    global _acertos, _faltas
+    if chave_modelo is None:
+        return None
+    with _lock:
+        item = _itens.get(chave_modelo)
+        if item is None:
+            _faltas += 1
+            return None
+        _itens.move_to_end(chave_modelo)
+        _acertos += 1
+        return item[0]
+
+
+def guardar(chave_modelo: Optional[Chave], modelo: Any, tamanho: int) -> None:
+    global _total
+    # Um modelo maior que o teto expulsaria todos os outros e sairia no próximo guardar.
+    if chave_modelo is None or MAX_BYTES <= 0 or tamanho > MAX_BYTES:
+        return
+    with _lock:
+        antigo = _itens.pop(chave_modelo, None)
+        if antigo is not None:
+            _total -= antigo[1]
+        _itens[chave_modelo] = (modelo, tamanho)
+        _total += tamanho
+        while _total > MAX_BYTES and _itens:
+            _, (_, tamanho_saida) = _itens.popitem(last=False)
+            _total -= tamanho_saida
+
+
+def desserializar(modelo_bytes: bytes, checksum: Optional[str]) -> Any:
+    """Confere o checksum ANTES do `joblib.load` (é um unpickle: bytes adulterados no banco
+    não são carregados) e desserializa. CPU: fora do event loop."""
+    if checksum and hashlib.sha256(modelo_bytes).hexdigest() != checksum:
+        raise ModeloIndisponivel("checksum do modelo não corresponde", "checksum")
+    try:
+        return joblib.load(io.BytesIO(modelo_bytes))
+    except Exception as e:
+        raise ModeloIndisponivel(f"não foi possível carregar o modelo: {e}", "corrompido")
+
+
+def carregar(chave_modelo: Optional[Chave], modelo_bytes: bytes, checksum: Optional[str]) -> Any:
+    """`desserializar` + `guardar`: o caminho de quem não achou o modelo no cache."""
+    modelo = desserializar(modelo_bytes, checksum)
+    guardar(chave_modelo, modelo, len(modelo_bytes))
+    return modelo
+
+
+def estatisticas() -> dict:
+    with _lock:
+        return {
+            "itens": len(_itens),
+            "bytes": _total,
+            "max_bytes": MAX_BYTES,
+            "acertos": _acertos,
+            "faltas": _faltas,
+        }
+
+
+def limpar() -> None:
+    global _total
+    with _lock:
+        _itens.clear()
+        _total = 0
@@ -0,0 +1,159 @@
+"""Cache em disco dos datasets baixados (UCI/OpenML): Feather, escrita atômica e manifesto.
+
+O cache era um `to_pickle` por dataset, escrito direto no nome final e lido com `read_pickle`
+sem conferir nada: um restart no meio da escrita deixava um pickle truncado que só falhava na
+leitura (e a leitura de pickle executa o que estiver no arquivo — não é formato para copiar
+entre máquinas). Aqui:
+
+- **Feather** (Arrow IPC, sem compressão): colunar e lido com ``memory_map`` — o arquivo é
+  mapeado em vez de copiado para um buffer, e o adult (48 mil linhas) carrega em milissegundos;
+- **escrita atômica**: temporário no mesmo diretório, ``fsync`` e ``os.replace``. O nome final
+  só existe completo;
+- **manifesto** (``manifest.json``): por arquivo, o dataset, a fonte, o sha256, o tamanho, as
+  linhas/colunas e quanto o download levou. Arquivo fora do manifesto, ou com tamanho diferente,
+  não é servido; o sha256 é conferido na primeira leitura de cada arquivo no processo (as
+  seguintes só conferem tamanho e mtime). Vários workers gravam o manifesto sob ``flock``.
+
+Copiar o diretório (arquivos + manifesto) para as máquinas do laboratório sem rede e ligar
+``DATASET_CACHE_OFFLINE`` faz os carregadores servirem só o que o manifesto garante.
+"""
+from __future__ import annotations
+
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import threading
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:   # Windows (máquina de dev): sem trava entre processos, só entre threads.
+    fcntl = None
+
+logger = logging.getLogger("uvicorn")
+
+MANIFESTO = "manifest.json"
+_TRAVA = ".manifest.lock"
+_BLOCO = 1024 * 1024
+
+# Arquivos cujo sha256 já conferiu neste processo: caminho -> (tamanho, mtime_ns).
+_conferidos: Dict[str, Tuple[int, int]] = {}
+_trava_local = threading.Lock()
+
+
+def sha256_arquivo(caminho: Path) -> str:
+    h = hashlib.sha256()
+    with open(caminho, "rb") as f:
+        for bloco in iter(lambda: f.read(_BLOCO), b""):
+            h.update(bloco)
+    return h.hexdigest()
+
+
+def ler_manifesto(raiz: Path) -> Dict[str, dict]:
+    try:
+        return json.loads((raiz / MANIFESTO).read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        # Manifesto ilegível equivale a cache vazio: tudo é baixado (ou recusado, offline) de novo.
+        logger.warning("[cache datasets] manifesto ilegível em %s: %s", raiz, e)
+        return {}
+
+
+def _gravar_atomico(destino: Path, escrever) -> None:
+    tmp = destino.with_name(f".{destino.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        with open(tmp, "wb") as f:
+            escrever(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, destino)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+@contextlib.contextmanager
+def _manifesto_travado(raiz: Path):
+    """Lê-modifica-grava do manifesto exclusivo entre threads e entre processos (entre
+    processos só onde há `fcntl`; no Windows, de desenvolvimento, roda um worker só)."""
+    with _trava_local, open(raiz / _TRAVA, "a") as trava:
+        if fcntl is not None:
+            fcntl.flock(trava, fcntl.LOCK_EX)
+        try:
+            manifesto = ler_manifesto(raiz)
+            yield manifesto
+            conteudo = json.dumps(manifesto, indent=1, sort_keys=True).encode("utf-8")
+            _gravar_atomico(raiz / MANIFESTO, lambda f: f.write(conteudo))
+        finally:
+            if fcntl is not None:
+                fcntl.flock(trava, fcntl.LOCK_UN)
+
+
+def ler(raiz: Path, arquivo: str) -> Optional[pd.DataFrame]:
+    """O dataset do `arquivo`, se o manifesto o garante íntegro; senão None."""
+    import pyarrow.feather as feather
+
+    entrada = ler_manifesto(raiz).get(arquivo)
+    caminho = raiz / arquivo
+    if entrada is None:
+        return None
+    try:
+        st = caminho.stat()
+    except FileNotFoundError:
+        return None
+    if st.st_size != entrada.get("bytes"):
+        logger.warning("[cache datasets] %s com tamanho diferente do manifesto; ignorado", arquivo)
+        return None
+    assinatura = (st.st_size, st.st_mtime_ns)
+    if _conferidos.get(str(caminho)) != assinatura:
+        if sha256_arquivo(caminho) != entrada.get("sha256"):
+            logger.warning("[cache datasets] %s não confere com o sha256 do manifesto; ignorado", arquivo)
+            return None
+        _conferidos[str(caminho)] = assinatura
+    return feather.read_table(caminho, memory_map=True).to_pandas()
+
+
+def gravar(raiz: Path, arquivo: str, df: pd.DataFrame, *, dataset: str, fonte: str,
+           download_seg: Optional[float] = None) -> dict:
+    """Grava `df` em `arquivo` (atômico) e registra no manifesto. Devolve a entrada."""
+    import pyarrow as pa
+    import pyarrow.feather as feather
+
+    raiz.mkdir(parents=True, exist_ok=True)
+    # Feather exige nome de coluna texto; o índice só é guardado se não for o padrão.
+    tabela = pa.Table.from_pandas(df.rename(columns=str))
+    _gravar_atomico(raiz / arquivo,
+                    lambda f: feather.write_feather(tabela, f, compression="uncompressed"))
+    caminho = raiz / arquivo
+    st = caminho.stat()
+    entrada = {
+        "dataset": dataset,
+        "fonte": fonte,
+        "sha256": sha256_arquivo(caminho),
+        "bytes": st.st_size,
+        "linhas": int(df.shape[0]),
+        "colunas": int(df.shape[1]),
+        "gravado_em": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "download_seg": None if download_seg is None else round(download_seg, 3),
+    }
+    _conferidos[str(caminho)] = (st.st_size, st.st_mtime_ns)
+    with _manifesto_travado(raiz) as manifesto:
+        manifesto[arquivo] = entrada
+    return entrada
+
+
+def esquecer(raiz: Path, arquivos) -> None:
+    """Tira `arquivos` do manifesto (quem chama apaga os arquivos)."""
+    arquivos = [a for a in arquivos if a]
+    if not arquivos or not (raiz / MANIFESTO).exists():
+        return
+    with _manifesto_travado(raiz) as manifesto:
+        for arquivo in arquivos:
+            manifesto.pop(arquivo, None)
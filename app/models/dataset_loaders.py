@@ -9,22 +9,29 @@ o router.
 """
 import hashlib
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Any, Optional, Tuple
+from typing import Any, Callable, Dict, Optional, Tuple
 import logging
 import os
 
 import pandas as pd
 
+from app.models import cache_datasets
 from app.models.dataset_config import DatasetConfig, DatasetType
 from app.utils.seed import get_sklearn_random_state
 
 logger = logging.getLogger("uvicorn")
 
-# Cache em disco dos datasets UCI (ucimlrepo nao faz cache proprio).
-# Fica na raiz do backend; sobrevive a restarts e ao git pull (nao versionado).
-# Sobrescrevivel via DATASET_CACHE_DIR (usado nos testes para isolar o cache).
+# Cache em disco dos datasets UCI/OpenML (ucimlrepo nao faz cache proprio), em Feather com
+# manifesto (ver `cache_datasets`). Fica na raiz do backend; sobrevive a restarts e ao git pull
+# (nao versionado). Sobrescrevivel via DATASET_CACHE_DIR (usado nos testes para isolar o cache).
 CACHE_DIR = Path(os.getenv("DATASET_CACHE_DIR") or (Path(__file__).resolve().parents[2] / "dataset_cache"))
+# Maquinas sem rede (laboratorio): so o que o manifesto garante e servido; nada e baixado.
+OFFLINE = os.getenv("DATASET_CACHE_OFFLINE", "").strip().lower() in ("1", "true", "sim")
+# Downloads simultaneos no prewarm (sao I/O de rede: threads bastam).
+PREWARM_WORKERS = max(1, int(os.getenv("DATASET_PREWARM_WORKERS", "4")))
 
 # Mapeamento de dataset ID -> UCI ID
 UCI_IDS = {
@@ -84,6 +91,10 @@ class DatasetNaoConfigurado(Exception):
     """Dataset UCI sem id mapeado em UCI_IDS."""
 
 
+class DatasetForaDoCache(Exception):
+    """Modo offline e o dataset nao esta (integro) no cache: nao ha como baixar."""
+
+
 def carregar_gerador(dataset_name, ds, n_amostras=None, n_features=None, ruido=None,
                      n_classes=None, n_clusters=None) -> Tuple[Optional[pd.DataFrame], None]:
     """Gera um dataset sintetico com os make_* do sklearn. Retorna (df, target_names)."""
@@ -191,32 +202,68 @@ def carregar_sklearn(dataset_name: str):
     return None, None
 
 
+def _do_cache_ou_baixar(dataset_name: str, fonte: str, arquivo: str, legado: Path,
+                        baixar: Callable[[], pd.DataFrame],
+                        legado_ok: Callable[[pd.DataFrame], bool] = lambda df: True) -> pd.DataFrame:
+    """Cache (Feather + manifesto) -> pickle legado (migrado) -> download.
+
+    Falha ao GRAVAR o cache nao quebra o request: o dataset ja esta em memoria.
+    """
+    df = cache_datasets.ler(CACHE_DIR, arquivo)
+    if df is not None:
+        return df
+
+    # Pickle do cache antigo, gravado por este mesmo codigo: vira Feather uma vez e sai do disco
+    # (as maquinas offline ja aquecidas nao precisam de rede para migrar).
+    download_seg = None
+    df = None
+    if legado.exists():
+        try:
+            df = pd.read_pickle(legado)
+            if not legado_ok(df):
+                df = None
+        except Exception:
+            # Cache corrompido: ignora e rebaixa abaixo.
+            df = None
+    if df is None:
+        if OFFLINE:
+            raise DatasetForaDoCache(
+                f"Dataset '{dataset_name}' indisponivel: modo offline e ele nao esta no cache local."
+            )
+        inicio = time.perf_counter()
+        df = baixar()
+        download_seg = time.perf_counter() - inicio
+
+    try:
+        cache_datasets.gravar(CACHE_DIR, arquivo, df, dataset=dataset_name, fonte=fonte,
+                              download_seg=download_seg)
+        legado.unlink(missing_ok=True)
+    except Exception as e:
+        logger.warning("[cache %s] falha ao gravar '%s' no cache: %s", fonte, dataset_name, e)
+    return df
+
+
+def _arquivo_cache_uci(dataset_name: str) -> str:
+    return f"{dataset_name}.uci.feather"
+
+
 def carregar_uci(dataset_name: str, ds: DatasetConfig = None) -> pd.DataFrame:
     """Carrega um dataset do UCI via ucimlrepo, com cache em disco."""
     uci_id = UCI_IDS.get(dataset_name)
     if uci_id is None:
         raise DatasetNaoConfigurado(f"Dataset UCI '{dataset_name}' nao configurado")
 
-    cache_path = CACHE_DIR / f"{dataset_name}.pkl"
-    if cache_path.exists():
-        try:
-            return pd.read_pickle(cache_path)
-        except Exception:
-            # Cache corrompido: ignora e rebaixa abaixo.
-            pass
+    def baixar():
+        from ucimlrepo import fetch_ucirepo
+        return fetch_ucirepo(id=uci_id).data.original
 
-    from ucimlrepo import fetch_ucirepo
-    dataset = fetch_ucirepo(id=uci_id)
-    df = dataset.data.original
+    return _do_cache_ou_baixar(dataset_name, "uci", _arquivo_cache_uci(dataset_name),
+                               CACHE_DIR / f"{dataset_name}.pkl", baixar)
 
-    try:
-        CACHE_DIR.mkdir(parents=True, exist_ok=True)
-        df.to_pickle(cache_path)
-    except Exception:
-        # Falha ao gravar cache nao deve quebrar o request.
-        pass
 
-    return df
+def _assinatura_openml(spec: dict) -> str:
+    resumo = json.dumps(spec, sort_keys=True, default=str)
+    return hashlib.sha1(resumo.encode()).hexdigest()[:8]
 
 
 def _caminho_cache_openml(dataset_name: str, spec: dict) -> Path:
@@ -231,9 +278,7 @@ def _caminho_cache_openml(dataset_name: str, spec: dict) -> Path:
        versão, recorte ou alvo passa a gerar outro arquivo, sem depender de ninguém lembrar de
        apagar o antigo no deploy.
     """
-    resumo = json.dumps(spec, sort_keys=True, default=str)
-    assinatura = hashlib.sha1(resumo.encode()).hexdigest()[:8]
-    return CACHE_DIR / f"{dataset_name}.openml.{assinatura}.pkl"
+    return CACHE_DIR / f"{dataset_name}.openml.{_assinatura_openml(spec)}.feather"
 
 
 def carregar_openml(dataset_name: str) -> pd.DataFrame:
@@ -246,37 +291,27 @@ def carregar_openml(dataset_name: str) -> pd.DataFrame:
     if spec is None:
         raise DatasetNaoConfigurado(f"Dataset OpenML '{dataset_name}' nao configurado")
 
-    cache_path = _caminho_cache_openml(dataset_name, spec)
-    if cache_path.exists():
-        try:
-            df_cache = pd.read_pickle(cache_path)
-            if spec["target"] in df_cache.columns:
-                # Tambem no CACHE HIT: limpar so na escrita nao converge. Depois de uma troca de
-                # spec, a geracao nova e gravada uma vez e dali em diante todo acesso e hit —
-                # o pickle da geracao anterior ficaria no disco ate a proxima troca. Foi o que
-                # aconteceu com o titanic: sobrou o arquivo sem assinatura, do formato antigo.
-                _limpar_geracoes_antigas(dataset_name, cache_path)
-                return df_cache
-        except Exception:
-            # Cache corrompido: ignora e rebaixa abaixo.
-            pass
-
-    from sklearn.datasets import fetch_openml
-    dados = fetch_openml(spec["nome"], version=spec["version"], as_frame=True)
-
-    # `colunas` recorta o que a plataforma oferece; `None` entrega o dataset inteiro.
-    colunas = spec.get("colunas")
-    df = (dados.data[list(colunas)] if colunas else dados.data).copy()
-    df[spec["target"]] = dados.target
-
-    try:
-        CACHE_DIR.mkdir(parents=True, exist_ok=True)
-        df.to_pickle(cache_path)
-        _limpar_geracoes_antigas(dataset_name, cache_path)
-    except Exception:
-        # Falha ao gravar cache nao deve quebrar o request.
-        pass
-
+    def baixar():
+        from sklearn.datasets import fetch_openml
+        dados = fetch_openml(spec["nome"], version=spec["version"], as_frame=True)
+
+        # `colunas` recorta o que a plataforma oferece; `None` entrega o dataset inteiro.
+        colunas = spec.get("colunas")
+        df = (dados.data[list(colunas)] if colunas else dados.data).copy()
+        df[spec["target"]] = dados.target
+        return df
+
+    atual = _caminho_cache_openml(dataset_name, spec)
+    df = _do_cache_ou_baixar(
+        dataset_name, "openml", atual.name,
+        CACHE_DIR / f"{dataset_name}.openml.{_assinatura_openml(spec)}.pkl", baixar,
+        legado_ok=lambda df: spec["target"] in df.columns,
+    )
+    # Tambem no CACHE HIT: limpar so na escrita nao converge. Depois de uma troca de spec, a
+    # geracao nova e gravada uma vez e dali em diante todo acesso e hit — o arquivo da geracao
+    # anterior ficaria no disco ate a proxima troca. Foi o que aconteceu com o titanic: sobrou
+    # o arquivo sem assinatura, do formato antigo.
+    _limpar_geracoes_antigas(dataset_name, atual)
     return df
 
 
@@ -284,46 +319,70 @@ def _limpar_geracoes_antigas(dataset_name: str, atual: Path) -> None:
     """Apaga os caches ANTERIORES deste mesmo dataset.
 
     A assinatura no nome resolve o cache velho ser servido, mas sozinha ela ACUMULA: cada mudanca
-    de spec deixa um pickle orfao no disco para sempre, e ninguem volta para limpar. Gravando a
+    de spec deixa um arquivo orfao no disco para sempre, e ninguem volta para limpar. Gravando a
     geracao nova, as anteriores saem — o cache fica com **um arquivo por dataset**, limitado por
     construcao em vez de depender de faxina manual.
 
-    Escopo estreito de proposito: so `<dataset>.openml*.pkl`, nunca o `<dataset>.pkl` do UCI nem
-    o cache de outro dataset.
+    Escopo estreito de proposito: so `<dataset>.openml*` (pickle antigo ou Feather), nunca o
+    cache do UCI nem o de outro dataset.
 
     O `*` vem ANTES do ponto porque existe um formato legado **sem** assinatura
     (`titanic.openml.pkl`, do primeiro dia): `"...openml.*.pkl"` nao casa com ele, e o orfao
     sobreviveria — foi o que o teste pegou, com o arquivo real que eu tinha deixado na VM.
     """
-    for antigo in CACHE_DIR.glob(f"{dataset_name}.openml*.pkl"):
+    removidos = []
+    for antigo in CACHE_DIR.glob(f"{dataset_name}.openml*"):
         if antigo != atual:
             try:
                 antigo.unlink()
+                removidos.append(antigo.name)
                 logger.info("[cache OpenML] geracao antiga removida: %s", antigo.name)
             except OSError:
                 pass
+    cache_datasets.esquecer(CACHE_DIR, removidos)
 
 
-def prewarm_uci_cache():
-    """Pre-baixa todos os datasets UCI para o cache em disco.
-
-    Pensado para rodar no startup do servidor: na primeira execucao baixa tudo;
-    nos restarts seguintes vira no-op rapido (cache ja em disco). Failsafe: uma
-    falha de rede em um dataset apenas registra log e segue para o proximo.
+def _prewarm_um(nome: str, baixar: Callable[[str], pd.DataFrame], arquivo: str) -> dict:
+    inicio = time.perf_counter()
+    try:
+        if cache_datasets.ler(CACHE_DIR, arquivo) is not None:
+            return {"status": "cache", "seg": round(time.perf_counter() - inicio, 3)}
+        baixar(nome)
+        status = "baixado"
+    except DatasetForaDoCache:
+        status = "ausente"
+    except Exception as exc:
+        logger.warning("[cache] falha ao pre-baixar '%s': %s", nome, exc)
+        status = "erro"
+    return {"status": status, "seg": round(time.perf_counter() - inicio, 3)}
+
+
+def prewarm_uci_cache() -> Dict[str, dict]:
+    """Pre-baixa os datasets UCI/OpenML para o cache em disco, ``DATASET_PREWARM_WORKERS`` por vez.
+
+    Pensado para rodar no startup do servidor: na primeira execucao baixa tudo (em paralelo: o
+    tempo e o do dataset mais lento, nao a soma); nos restarts seguintes so confere o manifesto.
+    Failsafe: uma falha de rede em um dataset apenas registra log e segue para os outros. Em
+    modo offline nada e baixado — o relatorio lista o que falta no cache copiado.
+
+    Devolve ``{dataset: {"status": "cache"|"baixado"|"ausente"|"erro", "seg"}}``.
     """
-    baixadores = [(nome, carregar_uci, "UCI", f"{nome}.pkl") for nome in UCI_IDS]
-    baixadores += [(nome, carregar_openml, "OpenML",
-                _caminho_cache_openml(nome, spec).name)
-               for nome, spec in OPENML_SPECS.items()]
-    for nome, baixar, rotulo, arquivo in baixadores:
-        cache_path = CACHE_DIR / arquivo
-        if cache_path.exists():
-            continue
-        try:
-            baixar(nome)
-            logger.info("[cache %s] dataset baixado para o cache: %s", rotulo, nome)
-        except Exception as exc:
-            logger.warning("[cache %s] falha ao pre-baixar '%s': %s", rotulo, nome, exc)
+    tarefas = [(nome, carregar_uci, _arquivo_cache_uci(nome)) for nome in UCI_IDS]
+    tarefas += [(nome, lambda n: carregar_openml(n), _caminho_cache_openml(nome, spec).name)
+                for nome, spec in OPENML_SPECS.items()]
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=PREWARM_WORKERS, thread_name_prefix="prewarm") as pool:
+        resultados = dict(zip(
+            (nome for nome, _, _ in tarefas),
+            pool.map(lambda t: _prewarm_um(*t), tarefas),
+        ))
+    contagem: Dict[str, int] = {}
+    for r in resultados.values():
+        contagem[r["status"]] = contagem.get(r["status"], 0) + 1
+    logger.info("[cache] prewarm em %.1f s: %s%s", time.perf_counter() - inicio,
+                ", ".join(f"{n} {s}" for s, n in sorted(contagem.items())),
+                " (offline)" if OFFLINE else "")
+    return resultados
 
 
 def carregar_com_rotulos(
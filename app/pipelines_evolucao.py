@@ -11,7 +11,10 @@ Agrupa por `(dataset, alvo)` — a identidade já persistida em `resultadoColeta
 atravessa atividades e projetos livres, porque o aluno normalmente volta à mesma base em
 momentos diferentes do semestre.
 
-Só agrega o que já está gravado em `db.pipelines`: nada é retreinado nem recalculado.
+Só agrega o que já está gravado em `db.pipelines`: nada é retreinado nem recalculado. Cada
+pipeline vira um **registro de tentativa** compacto (`registro_da_tentativa`), com os valores das
+métricas já reduzidos entre os modelos; é o que o índice `evolucao_alunos`
+(`app/evolucao_alunos.py`) guarda, e `montar_das_tentativas` monta a trajetória a partir dele.
 """
 from __future__ import annotations
 
@@ -22,7 +25,6 @@ from app.metricas.resultado import (
     baseline_trivial,
     chaves_metrica,
     ordem_da_metrica,
-    valor_metrica,
 )
 
 
@@ -96,45 +98,106 @@ def _mudancas(anterior: Dict[str, Any], atual: Dict[str, Any]) -> List[str]:
     return mudancas
 
 
-async def montar_evolucao(docs: List[dict],
-                          criterio_por_atividade: Dict[str, dict] | None = None) -> List[Dict[str, Any]]:
-    """Agrupa os pipelines por base e devolve a trajetória de cada uma (mais antiga → recente).
+def _metricas(resultados: dict) -> List[Dict[str, Any]]:
+    """Cada métrica avaliada, com o maior e o menor valor escalar entre os modelos.
+
+    Guardar os dois resolve a métrica de qualquer critério depois (maior ou menor é melhor) sem
+    voltar ao pipeline. Lista, e não dict por rótulo: rótulo de métrica não é nome de campo seguro.
+    Mesma regra de `valor_metrica`: texto e bool não contam como valor.
+    """
+    saida = []
+    for chave, por_modelo in (resultados or {}).items():
+        if chave.startswith("_") or not isinstance(por_modelo, dict) or not por_modelo:
+            continue
+        valores = [v for v in por_modelo.values()
+                   if isinstance(v, (int, float)) and not isinstance(v, bool)]
+        saida.append({"chave": chave,
+                      "max": max(valores) if valores else None,
+                      "min": min(valores) if valores else None})
+    return saida
+
+
+def registro_da_tentativa(doc: dict) -> Optional[Dict[str, Any]]:
+    """O que a evolução precisa de um pipeline, já calculado. `None` para rascunho sem base."""
+    coleta = doc.get("resultadoColetaDado") or {}
+    chave = chave_da_base(coleta)
+    if not chave:
+        return None
+    resultados = doc.get("resultadosDasAvaliacoes") or {}
+    return {
+        "pipeline_id": str(doc["_id"]),
+        "nome": doc.get("nome"),
+        "data": doc.get("dataCriacao") or doc.get("dataModificacao"),
+        "atividade_id": doc.get("atividade_id"),
+        "dataset": chave[0],
+        "alvo": chave[1],
+        "tarefa": tarefa_do_pipeline(coleta),
+        "metricas": _metricas(resultados),
+        "baseline_acuracia": baseline_trivial(resultados, "accuracy_score"),
+        **_resumo_do_pipeline(doc),
+    }
+
+
+def identidade_da_base(registro: dict) -> tuple:
+    """Agrupamento das tentativas: nome normalizado do dataset + alvo."""
+    return normalizar_nome_base(registro["dataset"]), registro["alvo"]
+
+
+def _valor(registro: dict, chaves: list, ordem: str):
+    # Primeira chave avaliada vence, como em `valor_metrica`.
+    for chave in chaves:
+        m = next((m for m in registro.get("metricas") or [] if m.get("chave") == chave), None)
+        if m:
+            return m["max"] if ordem != "asc" else m["min"]
+    return None
+
+
+def _baseline(registro: dict, metrica: str) -> Optional[float]:
+    if metrica == "accuracy_score":
+        return registro.get("baseline_acuracia")
+    return baseline_trivial({}, metrica)
+
+
+async def montar_das_tentativas(registros: List[dict],
+                                criterio_por_atividade: Dict[str, dict] | None = None) -> List[Dict[str, Any]]:
+    """Agrupa os registros por base e devolve a trajetória de cada uma (mais antiga → recente).
 
     `criterio_por_atividade` traz o `criterio` das atividades de turma: dentro de uma
     atividade vale a métrica que o professor escolheu; fora dela, a métrica padrão da tarefa.
+    Lido na hora, e não gravado no registro, porque o professor pode trocar o critério.
     """
     criterio_por_atividade = criterio_por_atividade or {}
     grupos: Dict[tuple, List[dict]] = {}
-    for doc in docs:
-        chave = chave_da_base(doc.get("resultadoColetaDado"))
-        if chave:
-            grupos.setdefault(chave, []).append(doc)
+    for registro in registros:
+        grupos.setdefault(identidade_da_base(registro), []).append(registro)
 
+    chaves_por_metrica: Dict[str, list] = {}
     bases = []
-    for (dataset, alvo), pipelines_da_base in grupos.items():
+    for registros_da_base in grupos.values():
         # Mais antigo → mais recente: a trajetória só faz sentido em ordem cronológica.
-        ordenados = sorted(pipelines_da_base, key=lambda d: d.get("dataCriacao") or d.get("dataModificacao"))
-        tarefa = tarefa_do_pipeline((ordenados[-1].get("resultadoColetaDado") or {}))
+        ordenados = sorted(registros_da_base, key=lambda r: r["data"])
+        tarefa = ordenados[-1]["tarefa"]
 
-        criterio = next((criterio_por_atividade[d["atividade_id"]]
-                         for d in reversed(ordenados)
-                         if d.get("atividade_id") in criterio_por_atividade), None)
+        criterio = next((criterio_por_atividade[r["atividade_id"]]
+                         for r in reversed(ordenados)
+                         if r.get("atividade_id") in criterio_por_atividade), None)
         metrica = (criterio or {}).get("metrica") or METRICA_PADRAO_POR_TAREFA.get(tarefa, "accuracy_score")
         ordem = (criterio or {}).get("ordem") or ordem_da_metrica(metrica)
-        chaves = await chaves_metrica(metrica)
+        if metrica not in chaves_por_metrica:
+            chaves_por_metrica[metrica] = await chaves_metrica(metrica)
+        chaves = chaves_por_metrica[metrica]
 
         tentativas, baseline = [], None
         anterior_resumo = None
-        for doc in ordenados:
-            resultados = doc.get("resultadosDasAvaliacoes") or {}
-            valor = valor_metrica(resultados, chaves, ordem)
+        for registro in ordenados:
+            valor = _valor(registro, chaves, ordem)
             if baseline is None:
-                baseline = baseline_trivial(resultados, metrica)
-            resumo = _resumo_do_pipeline(doc)
+                baseline = _baseline(registro, metrica)
+            resumo = {k: registro.get(k) for k in ("modelos", "pre_processamento", "divisao_treino")}
             tentativas.append({
-                "pipeline_id": str(doc["_id"]),
-                "nome": doc.get("nome"),
-                "data": doc.get("dataCriacao") or doc.get("dataModificacao"),
+                "pipeline_id": registro["pipeline_id"],
+                "nome": registro.get("nome"),
+                "data": registro["data"],
                 "valor": valor,
                 "mudancas": _mudancas(anterior_resumo, resumo) if anterior_resumo else [],
                 **resumo,
@@ -154,8 +217,9 @@ async def montar_evolucao(docs: List[dict],
             melhor_anterior = max(anteriores) if ordem != "asc" else min(anteriores)
 
         bases.append({
-            "dataset": dataset,
-            "alvo": alvo,
+            # O nome como o aluno o viu por último ("Iris" ou "Iris.xlsx").
+            "dataset": ordenados[-1]["dataset"],
+            "alvo": ordenados[-1]["alvo"],
             "tarefa": tarefa,
             "metrica": metrica,
             "ordem": ordem,
@@ -172,3 +236,10 @@ async def montar_evolucao(docs: List[dict],
 
     bases.sort(key=lambda b: b["tentativas"][-1]["data"] or "", reverse=True)
     return bases
+
+
+async def montar_evolucao(docs: List[dict],
+                          criterio_por_atividade: Dict[str, dict] | None = None) -> List[Dict[str, Any]]:
+    """`montar_das_tentativas` direto dos pipelines (sem passar pelo índice)."""
+    registros = [r for r in map(registro_da_tentativa, docs) if r]
+    return await montar_das_tentativas(registros, criterio_por_atividade)
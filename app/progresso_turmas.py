@@ -0,0 +1,143 @@
+"""Retrato do progresso das turmas (`progresso_turmas`), servido com a hora em que foi gerado.
+
+`GET /turmas/{id}/progresso` rodava, a cada abertura do painel, uma agregação nos pipelines da
+turma, outra nas submissões de desafio, outra na telemetria de chat, a contagem das atividades e
+a busca dos nomes — em sequência. Agora há **um documento por turma × aluno** com a linha pronta
+(``submissoes``, ``desafios``, ``melhor_nota_desafio``, ``chats``, ``ultimo_acesso``, nome e
+e-mail), e um documento-marca por turma (``_id: turma_id``) com ``versao`` e ``gerado_em``.
+
+Manutenção incremental:
+
+- **submissões** (pipeline salvo/editado/excluído com ``turma_id``, desafio de montagem
+  submetido) chamam `desatualizar`, que apaga SÓ a linha daquele aluno naquela turma; a próxima
+  leitura recalcula as linhas que faltam, com as consultas escopadas a esses alunos;
+- **chat**: `contar_chats` se registra no escritor da telemetria (`telemetria.ao_gravar`) e
+  recebe os eventos de cada lote gravado; as linhas do aluno em todas as turmas ganham ``$inc``.
+
+Sem marca, com `VERSAO` nova ou com a marca mais velha que ``PROGRESSO_TURMA_MAX_IDADE_SEC`` a
+turma inteira é recalculada. O limite de idade corrige o que o incremental não vê: eventos de
+chat que expiram pelo TTL da telemetria, nome ou e-mail do aluno alterados, e uma falha no meio
+de um `contar_chats`. O cálculo em si fica na rota (`app/routers/turmas.py`); aqui fica só o
+armazenamento.
+"""
+from __future__ import annotations
+
+import logging
+import os
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, Optional, Tuple
+
+from app import telemetria
+
+logger = logging.getLogger(__name__)
+
+VERSAO = 1
+MAX_IDADE_SEC = float(os.getenv("PROGRESSO_TURMA_MAX_IDADE_SEC", "3600"))
+
+
+def _colecao():
+    # Import tardio (como em ranking_atividades.py): o módulo continua importável sem MONGO_URL.
+    from app import database
+    return database.progresso_turmas
+
+
+def _id(turma_id: str, aluno_id: str) -> str:
+    return f"{turma_id}:{aluno_id}"
+
+
+def _utc(dt: datetime) -> datetime:
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+async def ler(turma_id: str) -> Optional[Tuple[Dict[str, dict], datetime]]:
+    """``({aluno_id: linha}, gerado_em)`` do retrato da turma, ou `None` se é preciso refazê-lo."""
+    docs = await _colecao().find({"turma_id": turma_id}).to_list(length=None)
+    marca = next((d for d in docs if d["_id"] == turma_id), None)
+    if not marca or marca.get("versao") != VERSAO or not marca.get("gerado_em"):
+        return None
+    gerado_em = _utc(marca["gerado_em"])
+    if datetime.now(timezone.utc) - gerado_em > timedelta(seconds=MAX_IDADE_SEC):
+        return None
+    return {d["aluno_id"]: d for d in docs if d["_id"] != turma_id}, gerado_em
+
+
+async def gravar(turma_id: str, linhas: Dict[str, dict], *,
+                 completo: bool) -> Optional[datetime]:
+    """Grava as linhas calculadas. `completo` (a turma inteira) também troca a marca e apaga as
+    linhas de quem saiu da turma; devolve o novo ``gerado_em`` (None se não é completo).
+
+    Não levanta: quem pediu o cálculo já tem o que mostrar.
+    """
+    from pymongo import ReplaceOne
+
+    agora = datetime.now(timezone.utc)
+    operacoes = [
+        ReplaceOne({"_id": _id(turma_id, aluno)},
+                   {**linha, "_id": _id(turma_id, aluno), "turma_id": turma_id, "aluno_id": aluno,
+                    "atualizado_em": agora},
+                   upsert=True)
+        for aluno, linha in linhas.items()
+    ]
+    try:
+        colecao = _colecao()
+        if operacoes:
+            await colecao.bulk_write(operacoes, ordered=False)
+        if completo:
+            manter = [_id(turma_id, a) for a in linhas] + [turma_id]
+            await colecao.delete_many({"turma_id": turma_id, "_id": {"$nin": manter}})
+            await colecao.replace_one(
+                {"_id": turma_id},
+                {"_id": turma_id, "turma_id": turma_id, "versao": VERSAO, "gerado_em": agora},
+                upsert=True)
+    except Exception as e:
+        logger.warning("Progresso da turma %s não gravado: %s", turma_id, e)
+    return agora if completo else None
+
+
+async def desatualizar(turma_id: Optional[str], aluno_id: Optional[str]) -> None:
+    """Uma submissão do aluno na turma mudou: a linha dele é recalculada na próxima leitura.
+
+    Nunca levanta; numa falha a turma perde a marca e é recalculada inteira.
+    """
+    if not turma_id or not aluno_id:
+        return
+    colecao = _colecao()
+    try:
+        await colecao.delete_one({"_id": _id(turma_id, aluno_id)})
+    except Exception as e:
+        logger.warning("Progresso da turma %s não desatualizado (%s); será recalculado", turma_id, e)
+        try:
+            await colecao.delete_one({"_id": turma_id})
+        except Exception:
+            pass
+
+
+@telemetria.ao_gravar
+async def contar_chats(docs: Iterable[dict]) -> None:
+    """Soma os eventos de chat de um lote gravado às linhas dos alunos (em todas as turmas)."""
+    por_aluno = Counter(d.get("usuario_id") for d in docs
+                        if d.get("tipo") == "chat" and d.get("usuario_id"))
+    if not por_aluno:
+        return
+    agora = datetime.now(timezone.utc)
+    try:
+        colecao = _colecao()
+        for aluno, n in por_aluno.items():
+            await colecao.update_many({"aluno_id": aluno},
+                                      {"$inc": {"chats": n}, "$set": {"atualizado_em": agora}})
+    except Exception as e:
+        # A contagem volta a bater no próximo recálculo completo (MAX_IDADE_SEC).
+        logger.warning("Chats não somados ao progresso das turmas: %s", e)
+
+
+async def esquecer(turma_id: str) -> None:
+    """Apaga o retrato de uma turma excluída."""
+    await _colecao().delete_many({"turma_id": turma_id})
+
+
+async def criar_indices() -> None:
+    """Leitura por turma e o ``$inc`` dos chats por aluno (create_index é idempotente)."""
+    colecao = _colecao()
+    await colecao.create_index("turma_id")
+    await colecao.create_index("aluno_id")
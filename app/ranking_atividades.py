@@ -0,0 +1,212 @@
+"""Ranking materializado das atividades de pipeline (`ranking_atividades`).
+
+`GET /turmas/{id}/atividades/{id}/ranking` lia TODOS os pipelines da atividade, calculava o valor
+da métrica de cada um em Python, reduzia ao melhor por aluno e buscava os nomes numa segunda
+consulta — a cada atualização da tela que o professor projeta em aula. Agora o ranking é uma
+coleção com **um documento por atividade × aluno**:
+
+- ``valor`` (melhor valor da métrica do critério), ``pipeline_id``/``pipeline_nome`` da submissão
+  que o obteve, ``tentativas`` (submissões do aluno na atividade) e ``aluno_nome``;
+- ``tem_valor`` e ``chave`` (``valor``, ou ``-valor`` quando menor é melhor): a ordem do ranking
+  vira um índice só, e a leitura é uma consulta paginada com ``sort``/``skip``/``limit``.
+
+Manutenção incremental: salvar, atualizar ou excluir um pipeline de atividade
+(`app/routers/pipelines.py`) chama `registrar_submissao`, que recalcula SÓ aquele aluno a partir
+dos pipelines dele na atividade (índice ``atividade_id + user_id``). Recalcular em vez de
+`$max` é o que mantém o ranking certo quando a submissão é editada para pior ou excluída.
+
+A atividade guarda ``ranking_versao`` quando o ranking dela está materializado. Sem a marca
+(atividade antiga, critério trocado pelo professor, falha ao registrar uma submissão) a próxima
+leitura reconstrói a atividade inteira; `reconstruir_todas` (``scripts/deploy/reconstruir_ranking.py``)
+faz o backfill de uma vez.
+
+Submissão durante uma reconstrução (o professor atualiza o ranking enquanto a turma submete): a
+reconstrução pode ter lido os pipelines antes da submissão. Por isso `registrar_submissao` grava
+a linha do aluno mesmo sem a marca, e a reconstrução só substitui (ou apaga) linhas com
+``atualizado_em`` anterior ao início dela — a linha mais nova, do registro, fica. Desafios de montagem têm ranking próprio (`submissoes_montagem`).
+"""
+from __future__ import annotations
+
+import logging
+from datetime import datetime, timezone
+from typing import Iterable, List, Optional, Tuple
+
+from bson import ObjectId
+
+from app import diretorio_usuarios
+from app.metricas.resultado import chaves_metrica, valor_metrica
+
+logger = logging.getLogger(__name__)
+
+# Entra na marca da atividade: mudar o formato do documento ou a regra de "melhor" é subir a
+# versão, e cada atividade é reconstruída na primeira leitura.
+VERSAO = 1
+_PROJECAO = {"resultadosDasAvaliacoes": 1, "user_id": 1, "nome": 1}
+_ORDEM = [("tem_valor", -1), ("chave", -1), ("aluno_id", 1)]
+
+
+def _colecoes():
+    # Import tardio (como em telemetria_rollup.py): o módulo continua importável sem MONGO_URL.
+    from app import database
+    return database.ranking_atividades, database.pipelines, database.atividades
+
+
+def _criterio(atividade: dict) -> Tuple[str, str]:
+    criterio = atividade.get("criterio") or {}
+    return criterio.get("metrica", "accuracy_score"), criterio.get("ordem", "desc")
+
+
+def _id(atividade_id: str, aluno_id: str) -> str:
+    return f"{atividade_id}:{aluno_id}"
+
+
+def _melhor(pipes: Iterable[dict], chaves: list, ordem: str) -> Optional[dict]:
+    """Melhor submissão de UM aluno (a primeira, se nenhuma tem valor) e quantas são."""
+    melhor, tentativas = None, 0
+    for p in pipes:
+        tentativas += 1
+        valor = valor_metrica(p.get("resultadosDasAvaliacoes"), chaves, ordem)
+        if melhor is None or (valor is not None and (
+                melhor["valor"] is None
+                or (valor > melhor["valor"] if ordem != "asc" else valor < melhor["valor"]))):
+            melhor = {"pipeline_id": str(p["_id"]), "pipeline_nome": p.get("nome"), "valor": valor}
+    if melhor is None:
+        return None
+    return {**melhor, "tentativas": tentativas}
+
+
+def _documento(atividade_id: str, aluno_id: str, linha: dict, aluno_nome: str,
+               metrica: str, ordem: str) -> dict:
+    valor = linha["valor"]
+    return {
+        "_id": _id(atividade_id, aluno_id),
+        "atividade_id": atividade_id,
+        "aluno_id": aluno_id,
+        "aluno_nome": aluno_nome,
+        **linha,
+        "tem_valor": valor is not None,
+        "chave": None if valor is None else (-valor if ordem == "asc" else valor),
+        "metrica": metrica,
+        "ordem": ordem,
+        "atualizado_em": datetime.now(timezone.utc),
+    }
+
+
+def _nome(u: Optional[dict]) -> str:
+    # Mesmo fallback do `_nome_usuario` das turmas.
+    u = u or {}
+    return u.get("nome_usuario") or u.get("nome") or "—"
+
+
+async def _nomes(ids: List[str]) -> dict:
+    return await diretorio_usuarios.buscar(ids)
+
+
+async def reconstruir(atividade: dict) -> int:
+    """Refaz o ranking da atividade a partir dos pipelines e marca a versão. Devolve os alunos."""
+    from pymongo import ReplaceOne
+    from pymongo.errors import BulkWriteError
+
+    ranking, pipelines, atividades = _colecoes()
+    atividade_id = str(atividade["_id"])
+    metrica, ordem = _criterio(atividade)
+    chaves = await chaves_metrica(metrica)
+    inicio = datetime.now(timezone.utc)
+    # Linha gravada por `registrar_submissao` depois deste instante é mais nova que esta leitura.
+    anterior = {"$not": {"$gt": inicio}}
+
+    por_aluno: dict = {}
+    async for p in pipelines.find({"atividade_id": atividade_id}, _PROJECAO):
+        por_aluno.setdefault(p.get("user_id"), []).append(p)
+    linhas = {aluno: _melhor(pipes, chaves, ordem) for aluno, pipes in por_aluno.items()}
+    nomes = await _nomes(list(linhas))
+
+    docs = [_documento(atividade_id, aluno, linha, _nome(nomes.get(aluno)), metrica, ordem)
+            for aluno, linha in linhas.items()]
+    if docs:
+        try:
+            await ranking.bulk_write(
+                [ReplaceOne({"_id": d["_id"], "atualizado_em": anterior}, d, upsert=True) for d in docs],
+                ordered=False)
+        except BulkWriteError as e:
+            # Chave duplicada = a linha existe e é mais nova (o filtro não casou, o upsert colidiu).
+            if any(erro.get("code") != 11000 for erro in e.details.get("writeErrors", [])):
+                raise
+    await ranking.delete_many({"atividade_id": atividade_id, "aluno_id": {"$nin": list(linhas)},
+                               "atualizado_em": anterior})
+    await atividades.update_one({"_id": atividade["_id"]}, {"$set": {"ranking_versao": VERSAO}})
+    return len(docs)
+
+
+async def registrar_submissao(atividade_id: Optional[str], aluno_id: Optional[str]) -> None:
+    """Recalcula a linha do aluno depois que um pipeline dele na atividade mudou.
+
+    Grava mesmo com a atividade sem marca: uma reconstrução em andamento pode não ter visto esta
+    submissão, e não sobrescreve a linha gravada aqui.
+
+    Nunca levanta: o pipeline já foi gravado. Numa falha, a atividade perde a marca e a próxima
+    leitura do ranking reconstrói tudo.
+    """
+    if not atividade_id or not aluno_id:
+        return
+    ranking, pipelines, atividades = _colecoes()
+    try:
+        aoid = ObjectId(atividade_id)
+    except Exception:
+        return
+    try:
+        atividade = await atividades.find_one({"_id": aoid}, {"criterio": 1})
+        if not atividade:
+            return
+        metrica, ordem = _criterio(atividade)
+        chaves = await chaves_metrica(metrica)
+        pipes = await pipelines.find({"atividade_id": atividade_id, "user_id": aluno_id},
+                                     _PROJECAO).to_list(length=None)
+        linha = _melhor(pipes, chaves, ordem)
+        if linha is None:
+            await ranking.delete_one({"_id": _id(atividade_id, aluno_id)})
+            return
+        nomes = await _nomes([aluno_id])
+        doc = _documento(atividade_id, aluno_id, linha, _nome(nomes.get(aluno_id)), metrica, ordem)
+        await ranking.replace_one({"_id": doc["_id"]}, doc, upsert=True)
+    except Exception as e:
+        logger.warning("Ranking da atividade %s não atualizado (%s); será reconstruído", atividade_id, e)
+        try:
+            await atividades.update_one({"_id": aoid}, {"$unset": {"ranking_versao": ""}})
+        except Exception:
+            pass
+
+
+async def pagina(atividade: dict, limite: int, pular: int = 0) -> Tuple[List[dict], int]:
+    """Linhas do ranking na ordem (com valor primeiro, melhor antes) e o total de alunos."""
+    ranking, _, _ = _colecoes()
+    if atividade.get("ranking_versao") != VERSAO:
+        await reconstruir(atividade)
+    atividade_id = str(atividade["_id"])
+    cur = ranking.find({"atividade_id": atividade_id}).sort(_ORDEM).skip(pular).limit(limite)
+    linhas = await cur.to_list(length=limite)
+    total = await ranking.count_documents({"atividade_id": atividade_id})
+    return linhas, total
+
+
+async def esquecer(atividade_ids: List[str]) -> None:
+    """Apaga o ranking de atividades excluídas."""
+    ranking, _, _ = _colecoes()
+    if atividade_ids:
+        await ranking.delete_many({"atividade_id": {"$in": list(atividade_ids)}})
+
+
+async def reconstruir_todas() -> Tuple[int, int]:
+    """Backfill: reconstrói toda atividade de pipeline. Devolve (atividades, linhas)."""
+    _, _, atividades = _colecoes()
+    n_atividades = n_linhas = 0
+    async for a in atividades.find({"tipo": {"$ne": "montagem"}}, {"criterio": 1}):
+        n_linhas += await reconstruir(a)
+        n_atividades += 1
+    return n_atividades, n_linhas
+
+
+async def criar_indices() -> None:
+    """A ordem do ranking (startup da API; create_index é idempotente)."""
+    ranking, _, _ = _colecoes()
+    await ranking.create_index([("atividade_id", 1), *_ORDEM])
@@ -18,6 +18,7 @@ from fastapi import APIRouter, Depends, HTTPException, Query
 
 from app.database import mlflow_runs, pipelines, atividades, turmas, colecao_usuario
 from app.funcoes_genericas.funcoes_genericas import serialize_doc
+from app.funcoes_genericas.paginacao import contar, filtro_da_pagina, proximo_cursor
 from app.mlflow_client import get_run_summary, mlflow_enabled
 from app.security import get_usuario_atual, exigir_admin_ou_professor
 
@@ -125,10 +126,16 @@ async def listar_runs(
     data_fim: Optional[str] = Query(None),
     skip: int = Query(0, ge=0),
     limit: int = Query(50, ge=1, le=200),
+    incluir_total: bool = Query(True),
+    total_aproximado: bool = Query(False),
+    cursor: Optional[str] = Query(None),
     _: dict = Depends(exigir_admin_ou_professor),
 ):
     """Lista runs (artefatos) associadas a usuários, com filtro por usuário, modelo,
-    papel do usuário e data."""
+    papel do usuário e data. Paginação por `cursor` ou `skip`, e total como em
+    `/atividades` (ver `app/funcoes_genericas/paginacao.py`)."""
+    if cursor and skip:
+        raise HTTPException(status_code=400, detail="Use `cursor` ou `skip`, não os dois.")
     filtro: dict[str, Any] = {}
     if usuario_id:
         filtro["usuario_id"] = usuario_id
@@ -142,17 +149,22 @@ async def listar_runs(
     if faixa:
         filtro["criado_em"] = faixa
 
-    total = await mlflow_runs.count_documents(filtro)
-    cursor = mlflow_runs.find(filtro).sort("criado_em", -1).skip(skip).limit(limit)
+    total, limitado = None, False
+    if incluir_total:
+        total, limitado = await contar(mlflow_runs, filtro, aproximado=total_aproximado)
+    docs = [doc async for doc in mlflow_runs.find(filtro_da_pagina(filtro, "criado_em", cursor))
+            .sort("criado_em", -1).skip(skip).limit(limit + 1)]
+    pagina, proximo = proximo_cursor(docs, "criado_em", limit, cursor)
     itens = []
-    async for doc in cursor:
+    for doc in pagina:
         d = serialize_doc(doc)
         ce = d.get("criado_em")
         if isinstance(ce, datetime):
             d["criado_em"] = ce.isoformat()
         d["run_id"] = d.get("mlflow_run_id")
         itens.append(d)
-    return {"total": total, "skip": skip, "limit": limit, "itens": itens}
+    return {"total": total, "total_limitado": limitado, "skip": skip, "limit": limit,
+            "itens": itens, "proximo_cursor": proximo}
 
 
 @router.get("/{run_id}")
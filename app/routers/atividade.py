@@ -5,22 +5,23 @@ ações do pipeline, navegação, chamadas HTTP, erros e o uso do chatbot. Inclu
 duração das ações ("tempo preso") para diagnosticar onde os alunos travam.
 
 O padrão de gravação é fire-and-forget (espelha `registrar_log_admin` em
-`app/routers/admin.py`): nunca pode quebrar a operação principal. O usuário é
+`app/routers/admin.py`): nunca pode quebrar a operação principal. Os documentos
+vão para o escritor em lote de `app/telemetria.py`, que grava fora do request. O usuário é
 sempre derivado do JWT no servidor — o corpo enviado pelo front nunca é confiado
 como identidade.
 """
 import json
 import logging
 import os
-import time
-from collections import defaultdict
 from datetime import datetime, timezone
 from typing import Any, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, Query
 
+from app import limite_taxa, telemetria, telemetria_rollup
 from app.database import atividade_usuario, turmas
 from app.funcoes_genericas.funcoes_genericas import converter_numpy, serialize_doc
+from app.funcoes_genericas.paginacao import contar, filtro_da_pagina, proximo_cursor
 from app.schemas.atividade import EventoAtividade, EventoLote, MAX_EVENTOS_LOTE
 from app.security import get_usuario_atual, exigir_admin_ou_professor
 
@@ -43,22 +44,15 @@ _MAX_DETALHES_CHARS = 20000
 _MAX_STR_LEAF = 2000
 
 # Rate limit da ingestão de telemetria (defesa contra abuso/pico). Conta eventos por
-# usuário numa janela deslizante; excesso → 429 (o front não re-tenta erros 4xx).
+# usuário numa janela deslizante, compartilhada entre os workers (app/limite_taxa.py);
+# excesso → 429 (o front não re-tenta erros 4xx).
 _RATE_MAX = int(os.getenv("ATIVIDADE_RATE_MAX", "600"))
 _RATE_WINDOW = int(os.getenv("ATIVIDADE_RATE_WINDOW", "60"))
-_rate: dict[str, list[float]] = defaultdict(list)
 
 
-def _checar_rate(user_id: str, n_eventos: int) -> bool:
-    agora = time.time()
-    janela = agora - _RATE_WINDOW
-    bucket = [t for t in _rate[user_id] if t > janela]
-    if len(bucket) + n_eventos > _RATE_MAX:
-        _rate[user_id] = bucket
-        return False
-    bucket.extend([agora] * max(1, n_eventos))
-    _rate[user_id] = bucket
-    return True
+async def _checar_rate(user_id: str, n_eventos: int) -> bool:
+    return await limite_taxa.permitir("telemetria", user_id, maximo=_RATE_MAX,
+                                      janela=_RATE_WINDOW, custo=n_eventos)
 
 
 def _podar(obj: Any) -> Any:
@@ -135,29 +129,33 @@ async def registrar_atividade(
     origem: str = "backend",
     timestamp_cliente: Optional[str] = None,
 ) -> None:
-    """Grava um evento de atividade. Fire-and-forget: erros são apenas logados."""
+    """Enfileira um evento de atividade. Fire-and-forget: erros são apenas logados."""
     try:
         doc = _doc_atividade(
             usuario, tipo, acao,
             detalhes=detalhes, pipeline_id=pipeline_id, duracao_ms=duracao_ms,
             status=status, erro=erro, origem=origem, timestamp_cliente=timestamp_cliente,
         )
-        await atividade_usuario.insert_one(doc)
+        await telemetria.registrar([doc])
     except Exception as e:  # pragma: no cover - defensivo
         logger.warning("Falha ao registrar atividade: %s", e)
 
 
 @router.post("/lote")
 async def registrar_lote(lote: EventoLote, usuario: dict = Depends(get_usuario_atual)):
-    """Recebe um lote de eventos do front e grava todos num único insert_many."""
+    """Recebe um lote de eventos do front e o entrega inteiro ao escritor de telemetria.
+
+    `gravados` é quantos foram aceitos: com a fila cheia (Mongo lento), o excedente é descartado.
+    """
     eventos = lote.eventos or []
     if len(eventos) > MAX_EVENTOS_LOTE:
         raise HTTPException(
             status_code=413,
             detail=f"Lote acima do limite de {MAX_EVENTOS_LOTE} eventos.",
         )
-    if eventos and not _checar_rate(str((usuario or {}).get("_id") or ""), len(eventos)):
+    if eventos and not await _checar_rate(str((usuario or {}).get("_id") or ""), len(eventos)):
         raise HTTPException(status_code=429, detail="Limite de telemetria atingido. Tente mais tarde.")
+    aceitos = 0
     if eventos:
         docs = [
             _doc_atividade(
@@ -167,17 +165,14 @@ async def registrar_lote(lote: EventoLote, usuario: dict = Depends(get_usuario_a
             )
             for ev in eventos
         ]
-        try:
-            await atividade_usuario.insert_many(docs)
-        except Exception as e:  # pragma: no cover - defensivo
-            logger.warning("Falha ao registrar lote de atividades: %s", e)
-    return {"gravados": len(eventos)}
+        aceitos = await telemetria.registrar(docs)
+    return {"gravados": aceitos}
 
 
 @router.post("")
 async def registrar_unico(evento: EventoAtividade, usuario: dict = Depends(get_usuario_atual)):
     """Conveniência para gravar um evento único."""
-    if not _checar_rate(str((usuario or {}).get("_id") or ""), 1):
+    if not await _checar_rate(str((usuario or {}).get("_id") or ""), 1):
         raise HTTPException(status_code=429, detail="Limite de telemetria atingido. Tente mais tarde.")
     await registrar_atividade(
         usuario,
@@ -228,12 +223,21 @@ async def listar_atividades(
     skip: int = Query(0, ge=0),
     limit: int = Query(50, ge=1, le=200),
     incluir_total: bool = Query(True),
+    total_aproximado: bool = Query(False),
+    cursor: Optional[str] = Query(None),
     usuario: dict = Depends(exigir_admin_ou_professor),
 ):
     """Lista atividades com filtros e paginação (admin/professor).
 
     `incluir_total=false` pula a contagem — o front pede o total só ao (re)filtrar e
-    o reaproveita ao paginar, evitando um scan de contagem a cada página."""
+    o reaproveita ao paginar, evitando um scan de contagem a cada página.
+    `total_aproximado=true` conta só até um teto (`total_limitado` diz se passou dele).
+
+    Paginação: `cursor` (o `proximo_cursor` da página anterior) é a forma barata em qualquer
+    profundidade (ver `app/funcoes_genericas/paginacao.py`); `skip` continua aceito para os
+    clientes antigos, mas não junto com `cursor`."""
+    if cursor and skip:
+        raise HTTPException(status_code=400, detail="Use `cursor` ou `skip`, não os dois.")
     filtro: dict[str, Any] = {}
     # LGPD (menores): sem escopo, qualquer professor lia a telemetria (incl. prévias
     # de chat) de QUALQUER usuário por usuario_id. O professor só vê alunos das SUAS
@@ -256,24 +260,23 @@ async def listar_atividades(
     if faixa:
         filtro["timestamp"] = faixa
 
-    total = None
+    total, limitado = None, False
     if incluir_total:
-        # Sem filtro, usa a contagem estimada (metadados, O(1)); com filtro, conta o subconjunto.
-        total = (
-            await atividade_usuario.count_documents(filtro)
-            if filtro
-            else await atividade_usuario.estimated_document_count()
-        )
+        total, limitado = await contar(atividade_usuario, filtro, aproximado=total_aproximado)
 
-    cursor = atividade_usuario.find(filtro).sort("timestamp", -1).skip(skip).limit(limit)
+    # Um a mais que a página: é como se sabe se existe a próxima (ver `proximo_cursor`).
+    docs = [doc async for doc in atividade_usuario.find(filtro_da_pagina(filtro, "timestamp", cursor))
+            .sort("timestamp", -1).skip(skip).limit(limit + 1)]
+    pagina, proximo = proximo_cursor(docs, "timestamp", limit, cursor)
     itens = []
-    async for doc in cursor:
+    for doc in pagina:
         d = serialize_doc(doc)
         ts = d.get("timestamp")
         if isinstance(ts, datetime):
             d["timestamp"] = ts.isoformat()
         itens.append(d)
-    return {"total": total, "skip": skip, "limit": limit, "itens": itens}
+    return {"total": total, "total_limitado": limitado, "skip": skip, "limit": limit,
+            "itens": itens, "proximo_cursor": proximo}
 
 
 @router.get("/resumo")
@@ -282,25 +285,26 @@ async def resumo_atividades(
     data_fim: Optional[str] = Query(None),
     _: dict = Depends(exigir_admin_ou_professor),
 ):
-    """Agregações para os cards da tela admin, em um único passe via $facet."""
-    match: dict[str, Any] = {}
-    faixa = _faixa_tempo(_parse_data(data_inicio), _parse_data(data_fim))
-    if faixa:
-        match["timestamp"] = faixa
+    """Agregações para os cards da tela admin, em um único passe via $facet.
 
-    pipeline: list = []
-    if match:
-        pipeline.append({"$match": match})
+    As horas já resumidas vêm de `atividade_rollup` (ver `app/telemetria_rollup.py`); só o
+    resto é lido evento a evento. Por isso os grupos SOMAM `total`/`erros` em vez de contar."""
+    pipeline = await telemetria_rollup.estagios(
+        inicio=_parse_data(data_inicio), fim=_parse_data(data_fim))
     pipeline.append({
         "$facet": {
-            "por_tipo": [{"$group": {"_id": "$tipo", "total": {"$sum": 1}}}, {"$sort": {"total": -1}}],
+            "por_tipo": [{"$group": {"_id": "$tipo", "total": {"$sum": "$total"}}}, {"$sort": {"total": -1}}],
             "por_acao": [
-                {"$group": {"_id": "$acao", "total": {"$sum": 1}, "duracao_media_ms": {"$avg": "$duracao_ms"}}},
+                {"$group": {"_id": "$acao", "total": {"$sum": "$total"},
+                            "n_dur": {"$sum": "$n_dur"}, "soma_dur": {"$sum": "$soma_dur"}}},
                 {"$sort": {"total": -1}},
                 {"$limit": 20},
+                # = $avg de duracao_ms (que ignora os eventos sem duração)
+                {"$addFields": {"duracao_media_ms": {"$cond": [
+                    {"$gt": ["$n_dur", 0]}, {"$divide": ["$soma_dur", "$n_dur"]}, None]}}},
             ],
-            "total": [{"$count": "n"}],
-            "total_erros": [{"$match": {"status": "erro"}}, {"$count": "n"}],
+            "total": [{"$group": {"_id": None, "n": {"$sum": "$total"}}}],
+            "total_erros": [{"$group": {"_id": None, "n": {"$sum": "$erros"}}}],
             "usuarios": [{"$group": {"_id": "$usuario_id"}}, {"$count": "n"}],
         }
     })
@@ -333,21 +337,20 @@ async def tempo_preso(
 ):
     """Ranking de ações por duração média ("onde os alunos travam") + taxa de erro.
 
-    Considera só eventos com `duracao_ms` (ações cronometradas: treino, chat, etapas)."""
-    match: dict[str, Any] = {"duracao_ms": {"$ne": None}}
-    faixa = _faixa_tempo(_parse_data(data_inicio), _parse_data(data_fim))
-    if faixa:
-        match["timestamp"] = faixa
-
-    pipeline = [
-        {"$match": match},
+    Considera só eventos com `duracao_ms` (ações cronometradas: treino, chat, etapas). Lê as
+    horas resumidas do rollup, como o `resumo`."""
+    pipeline = await telemetria_rollup.estagios(
+        inicio=_parse_data(data_inicio), fim=_parse_data(data_fim))
+    pipeline += [
+        {"$match": {"n_dur": {"$gt": 0}}},
         {"$group": {
             "_id": "$acao",
-            "total": {"$sum": 1},
-            "duracao_media_ms": {"$avg": "$duracao_ms"},
-            "duracao_max_ms": {"$max": "$duracao_ms"},
-            "erros": {"$sum": {"$cond": [{"$eq": ["$status", "erro"]}, 1, 0]}},
+            "total": {"$sum": "$n_dur"},
+            "soma_dur": {"$sum": "$soma_dur"},
+            "duracao_max_ms": {"$max": "$max_dur"},
+            "erros": {"$sum": "$erros_dur"},
         }},
+        {"$addFields": {"duracao_media_ms": {"$divide": ["$soma_dur", "$total"]}}},
         {"$sort": {"duracao_media_ms": -1}},
         {"$limit": 20},
     ]
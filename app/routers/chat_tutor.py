@@ -9,17 +9,17 @@ graficos, codigo Python gerado) e responde de forma pedagogica, em PT-BR, para a
 """
 import hashlib
 import json
+import re
 import logging
 import asyncio
 import os
 import time
-from collections import defaultdict
 from datetime import datetime, timezone
 from typing import Optional
 
 import httpx
 from bson import ObjectId
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from fastapi.responses import StreamingResponse
 
 from app.conteudo.kb_tutor_chat import (
@@ -29,8 +29,11 @@ from app.conteudo.kb_tutor_chat import (
     hash_prompt,
 )
 from app.conteudo.system_prompt_seed import ORIGEM_ADMIN, ORIGEM_VERSIONADO
+from app import limite_taxa, tutor_cache, tutor_http
 from app import tutor_provedores as prov
 from app.database import historico_chat, configuracoes_tutor, tutor_audit, turmas
+from app.funcoes_genericas import perfil_dados
+from app.funcoes_genericas.paginacao import filtro_da_pagina, proximo_cursor
 from app.routers.atividade import registrar_atividade
 from app.security import get_usuario_atual, exigir_admin_ou_professor
 from app.tutor_kb import NIVEL_AVANCADO, bloco_kb, nivel_do_contexto
@@ -54,25 +57,19 @@ router = APIRouter(prefix="/tutor", tags=["Tutor"])
 
 
 # ============================================================
-# RATE LIMITING (in-memory, por usuario)
+# RATE LIMITING (por usuario, compartilhado entre workers: ver app/limite_taxa.py)
 # ============================================================
 RATE_LIMIT_MAX = int(os.getenv("CHAT_RATE_LIMIT_MAX", "20"))  # requests
 RATE_LIMIT_WINDOW = int(os.getenv("CHAT_RATE_LIMIT_WINDOW", "60"))  # segundos
 
-_rate_limits: dict[str, list[float]] = defaultdict(list)
 
-
-def _check_rate_limit(user_id: str):
-    agora = time.time()
-    window_start = agora - RATE_LIMIT_WINDOW
-    # Remove timestamps fora da janela
-    _rate_limits[user_id] = [t for t in _rate_limits[user_id] if t > window_start]
-    if len(_rate_limits[user_id]) >= RATE_LIMIT_MAX:
+async def _check_rate_limit(user_id: str):
+    if not await limite_taxa.permitir("chat", user_id, maximo=RATE_LIMIT_MAX, janela=RATE_LIMIT_WINDOW):
         raise HTTPException(
             status_code=429,
             detail=f"Limite de {RATE_LIMIT_MAX} mensagens por {RATE_LIMIT_WINDOW}s atingido. Aguarde e tente novamente.",
         )
-    _rate_limits[user_id].append(agora)
+
 
 def _ultima_msg_usuario(request: "ChatTutorRequest") -> str:
     for m in reversed(request.mensagens):
@@ -87,7 +84,7 @@ def _preview(texto: Optional[str], n: int = 240) -> str:
 
 
 def _resumo_chat(mensagem: str, resposta: str, modelo: str, contexto, *, stream: bool = False,
-                 finish_reason: Optional[str] = None) -> dict:
+                 finish_reason: Optional[str] = None, cache: Optional[str] = None) -> dict:
     """Resumo compacto para a telemetria do chat.
 
     Guarda apenas preview + tamanho da pergunta/resposta e um descritor leve do
@@ -103,7 +100,7 @@ def _resumo_chat(mensagem: str, resposta: str, modelo: str, contexto, *, stream:
         resumo_ctx = {"chaves": sorted(contexto.keys())}
         if campos:
             resumo_ctx["campos"] = campos
-    return {
+    resumo = {
         "mensagem_preview": _preview(mensagem),
         "mensagem_tamanho": len(mensagem or ""),
         "resposta_preview": _preview(resposta),
@@ -115,6 +112,10 @@ def _resumo_chat(mensagem: str, resposta: str, modelo: str, contexto, *, stream:
         # ninguém percebe que o tutor foi cortado — só o aluno, que fica sem o final.
         "truncada_no_teto": finish_reason == "length",
     }
+    if cache:
+        # Respondida pelo `tutor_cache` (exato/semelhante): não houve chamada ao provedor.
+        resumo["cache"] = cache
+    return resumo
 
 
 # base_url/chave/modelo de cada provedor vivem em `app/tutor_provedores.py` (CATALOGO).
@@ -130,6 +131,8 @@ MAX_TOKENS_RESPOSTA_AVANCADO = int(os.getenv("CHAT_MAX_TOKENS_AVANCADO", "3072")
 # Temperatura NÃO é configurável de propósito: subir aqui não compra profundidade, compra
 # invenção — e o público é de estudantes que não têm como conferir um default inventado.
 TEMPERATURA = 0.4
+# Respostas vindas do cache saem em eventos SSE de algumas palavras (ver `_stream_do_cache`).
+_PALAVRAS_POR_EVENTO = 4
 
 
 def max_tokens_resposta(contexto) -> int:
@@ -157,9 +160,9 @@ async def _buscar_modelos(provedor: dict) -> list[dict]:
     Ordenar aqui (e não na tela) mantém a mesma ordem no seletor e em qualquer outro consumidor.
     """
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            resp = await client.get(f"{provedor['base_url']}/models",
-                                    headers=prov.cabecalhos(provedor))
+        client = await tutor_http.cliente(provedor["base_url"])
+        resp = await client.get(f"{provedor['base_url']}/models",
+                                headers=prov.cabecalhos(provedor), timeout=30.0)
     except httpx.TimeoutException:
         raise HTTPException(status_code=504, detail="Timeout ao listar modelos.")
     except httpx.HTTPError:
@@ -365,6 +368,7 @@ _SAUDE_TTL = 1800  # 30 min: evita re-testar a cada abertura da tela
 # Orçamento do teste. Ver a docstring de `_testar_modelo`: com 16 tokens, modelo que "pensa"
 # devolve 200 sem texto nenhum e viraria chip vermelho sem merecer.
 MAX_TOKENS_SAUDE = 128
+TIMEOUT_SAUDE = 15.0
 _saude_cache: dict = {
     "resultados": {},        # { model_id: {"responde": bool, "latencia_ms"?: int, "erro"?: str} }
     "atualizado_em": 0.0,
@@ -385,7 +389,7 @@ async def _testar_modelo(client: httpx.AsyncClient, provedor: dict, model_id: st
     - **`nvidia/llama-3.1-nemoguard-8b-content-safety`**, um CLASSIFICADOR, também dava 200 —
       "responde" no chip, e o aluno recebia `{"User Safety": "safe"}` como aula.
 
-    Exigir texto dentro do timeout do cliente de saúde corrige o primeiro caso — o que enche a
+    Exigir texto dentro do `TIMEOUT_SAUDE` corrige o primeiro caso — o que enche a
     lista de reserva de modelo inútil. O segundo (o classificador) nada além de ler a resposta
     corrigiria.
 
@@ -408,6 +412,7 @@ async def _testar_modelo(client: httpx.AsyncClient, provedor: dict, model_id: st
             f"{provedor['base_url']}/chat/completions",
             headers=prov.cabecalhos(provedor),
             json=payload,
+            timeout=TIMEOUT_SAUDE,
         )
         if resp.status_code == 200:
             # 200 com conteúdo vazio não é resposta: alguns provedores devolvem `choices` sem
@@ -440,13 +445,14 @@ async def _rodar_health_check(provedor: dict, modelos: list[str]):
     _saude_cache["total"] = len(modelos)
     _saude_cache["concluidos"] = 0
     try:
-        async with httpx.AsyncClient(timeout=15.0) as client:
-            async def worker(mid: str):
-                async with sem:
-                    res = await _testar_modelo(client, provedor, mid)
-                _saude_cache["resultados"][mid] = res
-                _saude_cache["concluidos"] += 1
-            await asyncio.gather(*(worker(m) for m in modelos), return_exceptions=True)
+        client = await tutor_http.cliente(provedor["base_url"])
+
+        async def worker(mid: str):
+            async with sem:
+                res = await _testar_modelo(client, provedor, mid)
+            _saude_cache["resultados"][mid] = res
+            _saude_cache["concluidos"] += 1
+        await asyncio.gather(*(worker(m) for m in modelos), return_exceptions=True)
     finally:
         _saude_cache["atualizado_em"] = time.time()
         _saude_cache["em_andamento"] = False
@@ -483,8 +489,8 @@ async def saude_modelos(usuario=Depends(exigir_admin_ou_professor), forcar: bool
     _exigir_chave(provedor)
 
     if modelo:
-        async with httpx.AsyncClient(timeout=15.0) as client:
-            _saude_cache["resultados"][modelo] = await _testar_modelo(client, provedor, modelo)
+        client = await tutor_http.cliente(provedor["base_url"])
+        _saude_cache["resultados"][modelo] = await _testar_modelo(client, provedor, modelo)
         return {
             "resultados": _saude_cache["resultados"],
             "atualizado_em": _saude_cache["atualizado_em"],
@@ -516,6 +522,19 @@ async def saude_modelos(usuario=Depends(exigir_admin_ou_professor), forcar: bool
     }
 
 
+@router.get("/conexoes")
+async def metricas_conexoes(usuario=Depends(exigir_admin_ou_professor)):
+    """Pool de conexões com os provedores (por `base_url`): quantos requests reaproveitaram
+    conexão aberta, quantos saíram em HTTP/2 e o tempo até o primeiro token do stream."""
+    return tutor_http.estatisticas()
+
+
+@router.get("/cache")
+async def metricas_cache(usuario=Depends(exigir_admin_ou_professor)):
+    """Cache de respostas do tutor (neste worker): tamanho, acertos exatos/semelhantes e faltas."""
+    return tutor_cache.estatisticas()
+
+
 async def _auditar_prompt(usuario: dict, operacao: str, tamanho: int, *,
                           texto_anterior: str = "", hash_anterior: Optional[str] = None,
                           hash_novo: Optional[str] = None,
@@ -650,6 +669,7 @@ async def definir_system_prompt(body: DefinirSystemPromptRequest,
          "$inc": {"versao": 1}},
         upsert=True,
     )
+    tutor_cache.invalidar()
     await _auditar_prompt(
         usuario,
         "restaurou_padrao" if restaurando else "editou",
@@ -880,10 +900,38 @@ def _contexto_seguro(contexto, usuario) -> dict:
     return base
 
 
+async def _com_perfil_dos_dados(contexto: dict, usuario) -> dict:
+    """Anexa o perfil da coleta (`perfil_dados`, calculado na ingestão) quando o contexto cita
+    `id_coleta`: o tutor explica nulos, escalas e categorias sem o cliente mandar os dados — e
+    sem o servidor reler o dataset. Só a coleta do próprio usuário; falha = contexto como veio."""
+    id_coleta = contexto.get("id_coleta")
+    if not isinstance(id_coleta, str) or not ObjectId.is_valid(id_coleta):
+        return contexto
+    try:
+        from app import database
+        doc = await database.arquivos.find_one(
+            {"_id": ObjectId(id_coleta), "usuario_id": str((usuario or {}).get("_id") or "")},
+            {"perfil": 1},
+        )
+    except Exception:
+        return contexto
+    resumo = perfil_dados.resumo_para_tutor((doc or {}).get("perfil"))
+    if resumo:
+        contexto = {**contexto, "perfil_dos_dados": resumo}
+    return contexto
+
+
 async def _montar_system(contexto) -> str:
     """System prompt + contexto do pipeline + base de conhecimento do catálogo."""
+    return (await _montar_system_e_partes(contexto))[0]
+
+
+async def _montar_system_e_partes(contexto) -> tuple[str, str, str]:
+    """`_montar_system`, devolvendo também o prompt vigente e o bloco da KB: são eles que
+    identificam a resposta no cache (`tutor_cache.chave`)."""
+    prompt = await _system_prompt_vigente()
     partes = [
-        await _system_prompt_vigente(),
+        prompt,
         # Defesa contra injeção de prompt: o CONTEXTO e a BASE DE CONHECIMENTO abaixo
         # vêm parcialmente de dados que o cliente controla (contexto do pipeline) e de
         # conteúdo de catálogo editável por professor. São DADOS para raciocinar, não
@@ -899,14 +947,14 @@ async def _montar_system(contexto) -> str:
         kb = ""
     if kb:
         partes.append("=== BASE DE CONHECIMENTO (catálogo verificado) ===\n" + kb)
-    return "\n\n".join(partes)
+    return "\n\n".join(partes), prompt, kb
 
 
 @router.post("/chat")
 async def chat_tutor(request: ChatTutorRequest, usuario: dict = Depends(get_usuario_atual)):
     # Rate limit: usa o id do usuário autenticado como identificador
     user_id = str(usuario.get("_id") or "anonymous")
-    _check_rate_limit(user_id)
+    await _check_rate_limit(user_id)
 
     provedor = await prov.provedor_vigente()
     _exigir_chave(provedor, "O tutor por chat não está configurado no servidor")
@@ -917,15 +965,17 @@ async def chat_tutor(request: ChatTutorRequest, usuario: dict = Depends(get_usua
         )
     modelo = provedor["modelo"]
 
-    mensagens = [
-        {"role": "system", "content": await _montar_system(_contexto_seguro(request.contexto, usuario))},
-    ]
+    contexto = await _com_perfil_dos_dados(_contexto_seguro(request.contexto, usuario), usuario)
+    system, prompt, kb = await _montar_system_e_partes(contexto)
+    mensagens = [{"role": "system", "content": system}]
     for m in request.mensagens:
         if m.role in ("user", "assistant") and m.content:
             mensagens.append({"role": m.role, "content": m.content})
 
     if len(mensagens) == 1:
         raise HTTPException(status_code=400, detail="Envie ao menos uma mensagem do usuário.")
+    chave_cache = tutor_cache.chave(mensagens[1:], prompt=prompt, kb=kb, contexto=contexto,
+                                   pipeline=_montar_contexto(contexto))
 
     payload_base = {
         "messages": mensagens,
@@ -937,71 +987,78 @@ async def chat_tutor(request: ChatTutorRequest, usuario: dict = Depends(get_usua
     inicio = time.perf_counter()
 
     async def _logar(status: str, resposta: str = "", erro: Optional[str] = None,
-                     finish_reason: Optional[str] = None):
+                     finish_reason: Optional[str] = None, cache: Optional[str] = None):
         await registrar_atividade(
             usuario,
             "chat",
             "resposta_tutor",
             detalhes=_resumo_chat(_ultima_msg_usuario(request), resposta, modelo, request.contexto,
-                                  finish_reason=finish_reason),
+                                  finish_reason=finish_reason, cache=cache),
             duracao_ms=int((time.perf_counter() - inicio) * 1000),
             status=status,
             erro=erro,
         )
 
+    acerto = tutor_cache.buscar(chave_cache)
+    if acerto:
+        modelo = acerto["modelo"]
+        await _logar("sucesso", resposta=acerto["resposta"], cache=acerto["tipo"])
+        return {"resposta": acerto["resposta"], "modelo": modelo, "cache": acerto["tipo"]}
+
     cadeia = cadeia_de_modelos(provedor)
     chaves = cadeia_de_chaves(provedor)
     resp = None
     ultimo_erro = "sem modelos configurados"
     i_chave = 0     # não volta para trás: chave que falhou não melhora no modelo seguinte
-    async with httpx.AsyncClient(timeout=60.0) as client:
-        for candidato in cadeia:
-            trocar_de_modelo = False
-            while True:
-                chave = chaves[i_chave]
-                try:
-                    r = await client.post(
-                        f"{provedor['base_url']}/chat/completions",
-                        headers=prov.cabecalhos(provedor, chave),
-                        json={**payload_base, "model": candidato},
-                    )
-                except httpx.TimeoutException:
-                    _marcar_ruim(provedor["base_url"], candidato)
-                    ultimo_erro = "timeout"
-                    trocar_de_modelo = True
-                    break
-                except httpx.HTTPError as e:
-                    logger.warning("Falha de rede ao chamar o provedor de LLM: %s", type(e).__name__)
-                    _marcar_ruim(provedor["base_url"], candidato)
-                    ultimo_erro = f"rede: {type(e).__name__}"
-                    trocar_de_modelo = True
-                    break
-
-                if r.status_code == 200:
-                    resp, modelo = r, candidato
-                    break
-
-                ultimo_erro = f"http {r.status_code}"
-                # Nao propagar corpo bruto do provedor (pode conter detalhes sensiveis) — nem a
-                # chave: o log diz o ÍNDICE dela, nunca o valor.
-                logger.warning("Modelo %s (chave #%d) respondeu %s",
-                               candidato, i_chave + 1, r.status_code)
-                if _e_erro_de_chave(r.status_code, r.text) and i_chave + 1 < len(chaves):
-                    # É da CHAVE (429 = limite por chave; 401/403 = revogada): mesmo modelo,
-                    # próxima chave. Trocar de modelo aqui não resolveria nada.
-                    _marcar_chave_ruim(provedor["base_url"], chave)
-                    i_chave += 1
-                    continue
-                if _vale_tentar_outro(r.status_code):
-                    _marcar_ruim(provedor["base_url"], candidato)
-                    trocar_de_modelo = True
-                else:
-                    resp = r     # nem chave nem modelo resolvem: para e devolve o erro
+    client = await tutor_http.cliente(provedor["base_url"])
+    for candidato in cadeia:
+        trocar_de_modelo = False
+        while True:
+            chave = chaves[i_chave]
+            try:
+                r = await client.post(
+                    f"{provedor['base_url']}/chat/completions",
+                    headers=prov.cabecalhos(provedor, chave),
+                    json={**payload_base, "model": candidato},
+                    timeout=60.0,
+                )
+            except httpx.TimeoutException:
+                _marcar_ruim(provedor["base_url"], candidato)
+                ultimo_erro = "timeout"
+                trocar_de_modelo = True
+                break
+            except httpx.HTTPError as e:
+                logger.warning("Falha de rede ao chamar o provedor de LLM: %s", type(e).__name__)
+                _marcar_ruim(provedor["base_url"], candidato)
+                ultimo_erro = f"rede: {type(e).__name__}"
+                trocar_de_modelo = True
                 break
 
-            if resp is not None or not trocar_de_modelo:
+            if r.status_code == 200:
+                resp, modelo = r, candidato
                 break
 
+            ultimo_erro = f"http {r.status_code}"
+            # Nao propagar corpo bruto do provedor (pode conter detalhes sensiveis) — nem a
+            # chave: o log diz o ÍNDICE dela, nunca o valor.
+            logger.warning("Modelo %s (chave #%d) respondeu %s",
+                           candidato, i_chave + 1, r.status_code)
+            if _e_erro_de_chave(r.status_code, r.text) and i_chave + 1 < len(chaves):
+                # É da CHAVE (429 = limite por chave; 401/403 = revogada): mesmo modelo,
+                # próxima chave. Trocar de modelo aqui não resolveria nada.
+                _marcar_chave_ruim(provedor["base_url"], chave)
+                i_chave += 1
+                continue
+            if _vale_tentar_outro(r.status_code):
+                _marcar_ruim(provedor["base_url"], candidato)
+                trocar_de_modelo = True
+            else:
+                resp = r     # nem chave nem modelo resolvem: para e devolve o erro
+            break
+
+        if resp is not None or not trocar_de_modelo:
+            break
+
     if resp is None:
         await _logar("erro", erro=f"cadeia esgotada ({ultimo_erro})")
         raise HTTPException(
@@ -1029,19 +1086,23 @@ async def chat_tutor(request: ChatTutorRequest, usuario: dict = Depends(get_usua
     if finish_reason == "length":
         logger.warning("Resposta do tutor cortada no teto de tokens (modelo=%s, %d chars)",
                        modelo, len(resposta))
+    else:
+        tutor_cache.guardar(chave_cache, resposta, modelo)
     await _logar("sucesso", resposta=resposta, finish_reason=finish_reason)
     # `modelo` é o que de fato respondeu — pode não ser o configurado, se a cadeia caiu.
     return {"resposta": resposta, "modelo": modelo}
 
 
 async def _stream_llm(provedor: dict, payload: dict, *, cadeia: list, usuario=None,
-                      modelo="", request=None, chaves: Optional[list] = None):
+                      modelo="", request=None, chaves: Optional[list] = None,
+                      chave_cache: Optional[tuple] = None):
     """Gera tokens SSE a partir do streaming do provedor ativo.
 
     `payload` NÃO traz "model": ele é escolhido aqui, percorrendo `cadeia`.
 
     Acumula a resposta para registrar a atividade (fire-and-forget) ao final,
-    com sucesso (resposta completa) ou erro (motivo)."""
+    com sucesso (resposta completa) ou erro (motivo). Resposta completa e não cortada
+    no teto vai para o `tutor_cache` em `chave_cache`."""
     acumulado: list[str] = []
     status_final = "sucesso"
     erro_final: Optional[str] = None
@@ -1058,88 +1119,93 @@ async def _stream_llm(provedor: dict, payload: dict, *, cadeia: list, usuario=No
         # MODELO. Com uma chave só, tudo se comporta como antes.
         chaves = [c for c in (chaves or []) if c] or [provedor.get("api_key") or ""]
         i_chave = 0
-        async with httpx.AsyncClient(timeout=120.0) as client:
-            for candidato in cadeia:
-                if emitiu:
-                    break
-                trocar_de_modelo = False
-                while True:
-                  chave = chaves[i_chave]
-                  try:
-                    async with client.stream(
-                        "POST",
-                        f"{provedor['base_url']}/chat/completions",
-                        headers=prov.cabecalhos(provedor, chave),
-                        json={**payload, "model": candidato},
-                    ) as resp:
-                        if resp.status_code != 200:
-                            # Nunca logar a chave: só o índice dela.
-                            logger.warning("Stream do modelo %s (chave #%d) respondeu %s",
-                                           candidato, i_chave + 1, resp.status_code)
-                            status_final, erro_final = "erro", f"http {resp.status_code}"
-                            # A resposta é streaming: para consultar o corpo do ERRO (só para
-                            # distinguir chave inválida de payload ruim) é preciso lê-la aqui.
-                            # Não vai para log nenhum.
-                            corpo_erro = (await resp.aread()).decode("utf-8", "ignore")[:500]
-                            if (_e_erro_de_chave(resp.status_code, corpo_erro)
-                                    and i_chave + 1 < len(chaves)):
-                                _marcar_chave_ruim(provedor["base_url"], chave)
-                                i_chave += 1
-                                continue  # MESMO modelo, próxima chave
-                            if _vale_tentar_outro(resp.status_code):
-                                _marcar_ruim(provedor["base_url"], candidato)
-                                trocar_de_modelo = True
-                                break     # próximo modelo
-                            yield f"data: {json.dumps({'error': 'O tutor retornou um erro.'})}\n\n"
-                            return
-
-                        if candidato != modelo:
-                            logger.warning(
-                                "Modelo configurado (%s) indisponível; stream por %s", modelo, candidato
-                            )
-                            modelo = candidato
-                        # A partir daqui não há volta: os tokens começam a sair.
-                        emitiu = True
-                        status_final, erro_final = "sucesso", None
-
-                        async for line in resp.aiter_lines():
-                            if not line.startswith("data: "):
-                                continue
-                            data_str = line[6:]
-                            if data_str.strip() == "[DONE]":
-                                completou = True
-                                yield "data: [DONE]\n\n"
-                                return
-                            try:
-                                chunk = json.loads(data_str)
-                                finish_reason = chunk["choices"][0].get("finish_reason") or finish_reason
-                                delta = chunk["choices"][0].get("delta", {})
-                                token = delta.get("content", "")
-                                if token:
-                                    acumulado.append(token)
-                                    yield f"data: {json.dumps({'token': token})}\n\n"
-                            except (json.JSONDecodeError, KeyError, IndexError):
-                                continue
-                        completou = True  # o stream terminou sem [DONE] explícito
-                        return
-                  except httpx.TimeoutException:
-                    status_final, erro_final = "erro", "timeout"
-                    if emitiu:
-                        yield f"data: {json.dumps({'error': 'O tutor demorou demais para responder.'})}\n\n"
-                        return
-                    _marcar_ruim(provedor["base_url"], candidato)
-                    trocar_de_modelo = True
-                    break
-                  except httpx.HTTPError as e:
-                    status_final, erro_final = "erro", f"rede: {type(e).__name__}"
-                    if emitiu:
-                        yield f"data: {json.dumps({'error': 'Não consegui falar com o tutor agora.'})}\n\n"
+        client = await tutor_http.cliente(provedor["base_url"])
+        for candidato in cadeia:
+            if emitiu:
+                break
+            trocar_de_modelo = False
+            while True:
+              chave = chaves[i_chave]
+              try:
+                async with client.stream(
+                    "POST",
+                    f"{provedor['base_url']}/chat/completions",
+                    headers=prov.cabecalhos(provedor, chave),
+                    json={**payload, "model": candidato},
+                    timeout=120.0,
+                ) as resp:
+                    if resp.status_code != 200:
+                        # Nunca logar a chave: só o índice dela.
+                        logger.warning("Stream do modelo %s (chave #%d) respondeu %s",
+                                       candidato, i_chave + 1, resp.status_code)
+                        status_final, erro_final = "erro", f"http {resp.status_code}"
+                        # A resposta é streaming: para consultar o corpo do ERRO (só para
+                        # distinguir chave inválida de payload ruim) é preciso lê-la aqui.
+                        # Não vai para log nenhum.
+                        corpo_erro = (await resp.aread()).decode("utf-8", "ignore")[:500]
+                        if (_e_erro_de_chave(resp.status_code, corpo_erro)
+                                and i_chave + 1 < len(chaves)):
+                            _marcar_chave_ruim(provedor["base_url"], chave)
+                            i_chave += 1
+                            continue  # MESMO modelo, próxima chave
+                        if _vale_tentar_outro(resp.status_code):
+                            _marcar_ruim(provedor["base_url"], candidato)
+                            trocar_de_modelo = True
+                            break     # próximo modelo
+                        yield f"data: {json.dumps({'error': 'O tutor retornou um erro.'})}\n\n"
                         return
-                    _marcar_ruim(provedor["base_url"], candidato)
-                    trocar_de_modelo = True
-                    break
-                if not trocar_de_modelo:
-                    break   # erro que nem chave nem modelo resolvem: a cadeia para aqui
+
+                    if candidato != modelo:
+                        logger.warning(
+                            "Modelo configurado (%s) indisponível; stream por %s", modelo, candidato
+                        )
+                        modelo = candidato
+                    # A partir daqui não há volta: os tokens começam a sair.
+                    emitiu = True
+                    status_final, erro_final = "sucesso", None
+
+                    async for line in resp.aiter_lines():
+                        if not line.startswith("data: "):
+                            continue
+                        data_str = line[6:]
+                        if data_str.strip() == "[DONE]":
+                            completou = True
+                            yield "data: [DONE]\n\n"
+                            return
+                        try:
+                            chunk = json.loads(data_str)
+                            finish_reason = chunk["choices"][0].get("finish_reason") or finish_reason
+                            delta = chunk["choices"][0].get("delta", {})
+                            token = delta.get("content", "")
+                            if token:
+                                if not acumulado:
+                                    # Desde o início do gerador: inclui as trocas de modelo
+                                    # e de chave, que o aluno também esperou.
+                                    tutor_http.registrar_ttft(provedor["base_url"], inicio)
+                                acumulado.append(token)
+                                yield f"data: {json.dumps({'token': token})}\n\n"
+                        except (json.JSONDecodeError, KeyError, IndexError):
+                            continue
+                    completou = True  # o stream terminou sem [DONE] explícito
+                    return
+              except httpx.TimeoutException:
+                status_final, erro_final = "erro", "timeout"
+                if emitiu:
+                    yield f"data: {json.dumps({'error': 'O tutor demorou demais para responder.'})}\n\n"
+                    return
+                _marcar_ruim(provedor["base_url"], candidato)
+                trocar_de_modelo = True
+                break
+              except httpx.HTTPError as e:
+                status_final, erro_final = "erro", f"rede: {type(e).__name__}"
+                if emitiu:
+                    yield f"data: {json.dumps({'error': 'Não consegui falar com o tutor agora.'})}\n\n"
+                    return
+                _marcar_ruim(provedor["base_url"], candidato)
+                trocar_de_modelo = True
+                break
+            if not trocar_de_modelo:
+                break   # erro que nem chave nem modelo resolvem: a cadeia para aqui
 
         # Nenhum modelo da cadeia respondeu.
         if not emitiu:
@@ -1148,6 +1214,8 @@ async def _stream_llm(provedor: dict, payload: dict, *, cadeia: list, usuario=No
         # Cliente desconectou no meio do stream (GeneratorExit): não foi sucesso.
         if status_final == "sucesso" and not completou:
             status_final, erro_final = "interrompido", "cliente desconectou"
+        if status_final == "sucesso" and finish_reason != "length":
+            tutor_cache.guardar(chave_cache, "".join(acumulado), modelo)
         if usuario is not None:
             try:
                 await registrar_atividade(
@@ -1170,11 +1238,49 @@ async def _stream_llm(provedor: dict, payload: dict, *, cadeia: list, usuario=No
                 pass
 
 
+async def _stream_do_cache(acerto: dict, *, usuario=None, request=None):
+    """Reenvia uma resposta do `tutor_cache` no mesmo formato SSE do `_stream_llm`.
+
+    Em pedaços de algumas palavras, e não num evento só: o front renderiza o markdown à medida
+    que os tokens chegam, e uma resposta inteira de uma vez é indistinguível de um travamento
+    seguido de um salto."""
+    inicio = time.perf_counter()
+    resposta = acerto["resposta"]
+    completou = False
+    try:
+        pedacos = re.findall(r"\S+\s*|\s+", resposta)
+        for i in range(0, len(pedacos), _PALAVRAS_POR_EVENTO):
+            yield f"data: {json.dumps({'token': ''.join(pedacos[i:i + _PALAVRAS_POR_EVENTO])})}\n\n"
+        completou = True
+        yield "data: [DONE]\n\n"
+    finally:
+        if usuario is not None:
+            try:
+                await registrar_atividade(
+                    usuario,
+                    "chat",
+                    "resposta_tutor",
+                    detalhes=_resumo_chat(
+                        _ultima_msg_usuario(request) if request else "",
+                        resposta,
+                        acerto["modelo"],
+                        getattr(request, "contexto", None),
+                        stream=True,
+                        cache=acerto["tipo"],
+                    ),
+                    duracao_ms=int((time.perf_counter() - inicio) * 1000),
+                    status="sucesso" if completou else "interrompido",
+                    erro=None if completou else "cliente desconectou",
+                )
+            except Exception:  # pragma: no cover - teardown defensivo
+                pass
+
+
 @router.post("/chat/stream")
 async def chat_tutor_stream(request: ChatTutorRequest, usuario: dict = Depends(get_usuario_atual)):
     """Versao streaming (SSE) do chat tutor."""
     user_id = str(usuario.get("_id") or "anonymous")
-    _check_rate_limit(user_id)
+    await _check_rate_limit(user_id)
 
     provedor = await prov.provedor_vigente()
     _exigir_chave(provedor, "O tutor por chat não está configurado no servidor")
@@ -1185,15 +1291,17 @@ async def chat_tutor_stream(request: ChatTutorRequest, usuario: dict = Depends(g
         )
     modelo = provedor["modelo"]
 
-    mensagens = [
-        {"role": "system", "content": await _montar_system(_contexto_seguro(request.contexto, usuario))},
-    ]
+    contexto = await _com_perfil_dos_dados(_contexto_seguro(request.contexto, usuario), usuario)
+    system, prompt, kb = await _montar_system_e_partes(contexto)
+    mensagens = [{"role": "system", "content": system}]
     for m in request.mensagens:
         if m.role in ("user", "assistant") and m.content:
             mensagens.append({"role": m.role, "content": m.content})
 
     if len(mensagens) == 1:
         raise HTTPException(status_code=400, detail="Envie ao menos uma mensagem do usuário.")
+    chave_cache = tutor_cache.chave(mensagens[1:], prompt=prompt, kb=kb, contexto=contexto,
+                                   pipeline=_montar_contexto(contexto))
 
     payload = {
         "messages": mensagens,
@@ -1202,10 +1310,15 @@ async def chat_tutor_stream(request: ChatTutorRequest, usuario: dict = Depends(g
         "stream": True,
     }
 
+    acerto = tutor_cache.buscar(chave_cache)
+    if acerto:
+        gerador = _stream_do_cache(acerto, usuario=usuario, request=request)
+    else:
+        gerador = _stream_llm(provedor, payload, cadeia=cadeia_de_modelos(provedor),
+                              chaves=cadeia_de_chaves(provedor), usuario=usuario, modelo=modelo,
+                              request=request, chave_cache=chave_cache)
     return StreamingResponse(
-        _stream_llm(provedor, payload, cadeia=cadeia_de_modelos(provedor),
-                    chaves=cadeia_de_chaves(provedor),
-                    usuario=usuario, modelo=modelo, request=request),
+        gerador,
         media_type="text/event-stream",
         headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
@@ -1223,19 +1336,33 @@ def _serializar_hist(doc: dict) -> dict:
     return doc
 
 
+async def _pagina_de_historico(filtro: dict, limit: int, cursor: Optional[str],
+                               response: Response) -> list:
+    """Uma página de conversas, mais recentes primeiro. A lista continua sendo o corpo (é o que
+    o front já consome); o cursor da próxima página vai no cabeçalho `X-Proximo-Cursor`.
+
+    Ordena por `atualizado_em`, que muda quando a conversa continua: uma conversa retomada
+    entre duas páginas sobe para o topo e não reaparece na seguinte."""
+    docs = [d async for d in historico_chat.find(filtro_da_pagina(filtro, "atualizado_em", cursor))
+            .sort("atualizado_em", -1).limit(limit + 1)]
+    pagina, proximo = proximo_cursor(docs, "atualizado_em", limit, cursor)
+    if proximo:
+        response.headers["X-Proximo-Cursor"] = proximo
+    return [ChatHistoricoListItem(**_serializar_hist(d)) for d in pagina]
+
+
 @router.get("/chat/historico", response_model=list[ChatHistoricoListItem])
 async def listar_historico(
+    response: Response,
     pipeline_id: Optional[str] = Query(None),
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = Query(None),
     usuario=Depends(get_usuario_atual),
 ):
     filtro = {"usuario_id": str(usuario["_id"])}
     if pipeline_id:
         filtro["pipeline_id"] = pipeline_id
-    cursor = historico_chat.find(filtro).sort("atualizado_em", -1).limit(50)
-    resultados = []
-    async for doc in cursor:
-        resultados.append(ChatHistoricoListItem(**_serializar_hist(doc)))
-    return resultados
+    return await _pagina_de_historico(filtro, limit, cursor, response)
 
 
 @router.get("/chat/historico/{chat_id}", response_model=ChatHistoricoResponse)
@@ -1261,7 +1388,10 @@ async def _autorizar_ver_aluno(usuario: dict, aluno_id: str) -> None:
 
 
 @router.get("/chat/aluno/{aluno_id}/historico", response_model=list[ChatHistoricoListItem])
-async def listar_historico_aluno(aluno_id: str, usuario=Depends(exigir_admin_ou_professor)):
+async def listar_historico_aluno(aluno_id: str, response: Response,
+                                 limit: int = Query(50, ge=1, le=200),
+                                 cursor: Optional[str] = Query(None),
+                                 usuario=Depends(exigir_admin_ou_professor)):
     """Professor/admin lê as conversas de um aluno. LGPD (menores): acesso gated por
     papel + vínculo de turma e registrado na auditoria; use com parcimônia."""
     if not ObjectId.is_valid(aluno_id):
@@ -1269,8 +1399,7 @@ async def listar_historico_aluno(aluno_id: str, usuario=Depends(exigir_admin_ou_
     await _autorizar_ver_aluno(usuario, aluno_id)
     await registrar_atividade(usuario, "auditoria", "leu_chats_aluno",
                               detalhes={"aluno_id": aluno_id})
-    cursor = historico_chat.find({"usuario_id": aluno_id}).sort("atualizado_em", -1).limit(50)
-    return [ChatHistoricoListItem(**_serializar_hist(d)) async for d in cursor]
+    return await _pagina_de_historico({"usuario_id": aluno_id}, limit, cursor, response)
 
 
 @router.get("/chat/aluno/{aluno_id}/historico/{chat_id}", response_model=ChatHistoricoResponse)
@@ -8,7 +8,7 @@ if os.getenv("RENDER") is None:
     load_dotenv()
 
 from app.schemas.usuarios import UserActivate
-from app.security import get_senha_hash
+from app.security import get_senha_hash, invalidar_usuario
 from app.database import colecao_usuario
 
 router = APIRouter(prefix="/convite", tags=["Convite"])
@@ -85,5 +85,6 @@ async def ativar_conta(token: str, dados: UserActivate):
             }
         }
     )
+    invalidar_usuario(user["_id"], email=user.get("email"))
     
     return {"mensagem": "Conta ativada com sucesso", "email": user["email"]}
@@ -76,8 +76,10 @@ router = APIRouter()
 def _emitir_token(email: str) -> str:
     """Assina um JWT com a validade padrão. Fonte única da regra de expiração — o `/renovar`
     precisa emitir exatamente como o login."""
-    expira = datetime.now(timezone.utc) + timedelta(minutes=TOKEN_EXPIRE_MINUTES)
-    return jwt.encode({"sub": email, "exp": expira}, SECRET_KEY, algorithm=ALGORITHM)
+    agora = datetime.now(timezone.utc)
+    expira = agora + timedelta(minutes=TOKEN_EXPIRE_MINUTES)
+    # `iat` também identifica a sessão no cache do usuário autenticado (app.security).
+    return jwt.encode({"sub": email, "iat": agora, "exp": expira}, SECRET_KEY, algorithm=ALGORITHM)
 
 
 @router.post("/login/renovar")
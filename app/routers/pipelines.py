@@ -4,8 +4,10 @@ from typing import List, Optional
 from bson import ObjectId
 from fastapi import APIRouter, Depends, HTTPException, Query
 
+from app import evolucao_alunos, progresso_turmas, ranking_atividades
+from app.armazenamento import partes_pipeline
 from app.database import pipelines, turmas, atividades
-from app.pipelines_evolucao import montar_evolucao, normalizar_nome_base
+from app.pipelines_evolucao import montar_das_tentativas, normalizar_nome_base
 from app.schemas.pipelines import PipelineCreate, PipelineUpdate
 from app.security import get_usuario_atual, id_usuario_atual
 from app.funcoes_genericas.validacao import validar_object_id
@@ -72,6 +74,10 @@ def _pipeline_doc(p: dict) -> dict:
         "professor_id": p.get("professor_id"),
         "atividade_id": p.get("atividade_id"),
         "turma_id": p.get("turma_id"),
+        # Campos que vieram RESUMIDOS neste documento (listagem/galeria); o valor completo sai
+        # de `GET /pipelines/{id}` ou de `GET /pipelines/{id}/partes/{campo}`.
+        "partes": {c: {"bytes": r.get("bytes")} for c, r in (p.get("partes") or {}).items()
+                   if isinstance(r, dict)},
     }
 
 
@@ -109,8 +115,14 @@ async def criar_pipeline(
         "dataCriacao": agora,
         "dataModificacao": agora,
     }
-    result = await pipelines.insert_one(doc)
+    # O _id nasce aqui: as partes pesadas são gravadas antes, já apontando para ele.
+    oid = ObjectId()
+    inline, partes = await partes_pipeline.separar(oid, doc)
+    result = await pipelines.insert_one({**doc, **inline, "_id": oid, "partes": partes})
     doc["_id"] = result.inserted_id
+    await ranking_atividades.registrar_submissao(atividade_id, user_id)
+    await progresso_turmas.desatualizar(turma_id, user_id)
+    await evolucao_alunos.registrar(user_id, doc["_id"], doc)
     return _pipeline_doc(doc)
 
 
@@ -122,6 +134,7 @@ async def listar_pipelines(
 ):
     user_id = str(current_user["_id"])
     skip = (pagina - 1) * limite
+    # Documentos com os campos pesados resumidos (ver `partes_pipeline`).
     cursor = (
         pipelines.find({"user_id": user_id})
         .sort("dataModificacao", -1)
@@ -147,27 +160,22 @@ async def evolucao_do_aluno(
     duplicada nas duas pontas (foi o que fez o bloco de evolução não casar em 2026-07-26).
 
     Só lê os próprios pipelines — professor não vê os de aluno por aqui (para isso existe o
-    ranking da atividade, escopado à turma). Projeção enxuta: `resultadoColetaDado` inteiro
-    pode ser enorme, mas precisamos dele para identificar a base, então trazemos apenas os
-    campos de identidade e divisão.
+    ranking da atividade, escopado à turma). Lê o índice do aluno (`app/evolucao_alunos.py`): uma
+    consulta, com as tentativas já resumidas. Na primeira vez (índice ainda não montado) lê os
+    pipelines com a projeção enxuta e monta o índice com eles.
     """
     user_id = str(current_user["_id"])
-    projecao = {
-        "nome": 1, "dataCriacao": 1, "dataModificacao": 1, "atividade_id": 1,
-        "modeloSelecionado": 1, "modelosSelecionados": 1, "preProcessamentoConfig": 1,
-        "resultadosDasAvaliacoes": 1,
-        "resultadoColetaDado.datasetId": 1, "resultadoColetaDado.nomeDataset": 1,
-        "resultadoColetaDado.treino.nomeArquivo": 1, "resultadoColetaDado.target": 1,
-        "resultadoColetaDado.preverCategoria": 1, "resultadoColetaDado.dadosRotulados": 1,
-        "resultadoColetaDado.porcentagemTreino": 1,
-    }
-    cursor = pipelines.find({"user_id": user_id}, projecao).sort("dataCriacao", -1).limit(limite)
-    docs = await cursor.to_list(length=limite)
+    registros = await evolucao_alunos.ler(user_id)
+    if registros is None:
+        geracao = await evolucao_alunos.iniciar(user_id)
+        docs = await pipelines.find({"user_id": user_id}, evolucao_alunos.PROJECAO).to_list(length=None)
+        registros = await evolucao_alunos.reconstruir(user_id, docs, geracao)
+    registros = evolucao_alunos.recentes(registros, limite)
 
     # Dentro de uma atividade vale a métrica escolhida pelo professor; fora dela, a padrão
     # da tarefa. Uma consulta só para todas as atividades citadas.
     criterios: dict = {}
-    ids = {d.get("atividade_id") for d in docs if d.get("atividade_id")}
+    ids = {r.get("atividade_id") for r in registros if r.get("atividade_id")}
     oids = []
     for aid in ids:
         try:
@@ -182,7 +190,7 @@ async def evolucao_do_aluno(
         except Exception:
             criterios = {}
 
-    bases = await montar_evolucao(docs, criterios)
+    bases = await montar_das_tentativas(registros, criterios)
     if dataset or alvo:
         # Compara por nome normalizado: o mesmo dataset chega como "Iris" ou "Iris.xlsx"
         # dependendo da porta de entrada (ver `normalizar_nome_base`).
@@ -298,7 +306,9 @@ async def copiar_pipeline(
             raise HTTPException(status_code=404, detail="Pipeline original não encontrado")
 
     agora = datetime.now(timezone.utc)
-    novo_doc = original.copy()
+    # A cópia tem partes próprias: excluir um dos dois não pode levar as do outro.
+    novo_doc = dict(await partes_pipeline.completar(original))
+    novo_doc.pop("partes", None)
     del novo_doc["_id"]
     novo_doc["user_id"] = user_id
     novo_doc["nome"] = f"Cópia de {original.get('nome')}"
@@ -313,8 +323,11 @@ async def copiar_pipeline(
     for campo in ("atividade_id", "turma_id", "professor_id"):
         novo_doc.pop(campo, None)
 
-    result = await pipelines.insert_one(novo_doc)
+    novo_oid = ObjectId()
+    inline, partes = await partes_pipeline.separar(novo_oid, novo_doc)
+    result = await pipelines.insert_one({**novo_doc, **inline, "_id": novo_oid, "partes": partes})
     novo_doc["_id"] = result.inserted_id
+    await evolucao_alunos.registrar(user_id, novo_doc["_id"], novo_doc)
     return _pipeline_doc(novo_doc)
 
 
@@ -332,7 +345,32 @@ async def obter_pipeline(
     doc = await pipelines.find_one({"_id": oid, "user_id": user_id})
     if not doc:
         raise HTTPException(status_code=404, detail="Pipeline não encontrado")
-    return _pipeline_doc(doc)
+    return _pipeline_doc(await partes_pipeline.completar(doc))
+
+
+@router.get("/{pipeline_id}/partes/{campo}")
+async def obter_parte_pipeline(
+    pipeline_id: str,
+    campo: str,
+    current_user: dict = Depends(get_usuario_atual),
+):
+    """Valor completo de um campo pesado, para a tela que o abre (a listagem traz o resumo).
+
+    Mesma visibilidade da galeria e da cópia (`_pode_ver`).
+    """
+    user_id = str(current_user["_id"])
+    oid = validar_object_id(pipeline_id, "pipeline_id")
+    if campo not in partes_pipeline.CAMPOS:
+        raise HTTPException(status_code=404, detail="Campo desconhecido")
+    doc = await pipelines.find_one(
+        {"_id": oid}, {campo: 1, "partes": 1, "user_id": 1, "is_public": 1,
+                       "turma_id": 1, "atividade_id": 1})
+    if not doc:
+        raise HTTPException(status_code=404, detail="Pipeline não encontrado")
+    if not (doc.get("user_id") == user_id or doc.get("is_public", False)):
+        if not _pode_ver(doc, user_id, await _turmas_do_usuario(user_id)):
+            raise HTTPException(status_code=404, detail="Pipeline não encontrado")
+    return {"campo": campo, "valor": await partes_pipeline.ler_parte(doc, campo)}
 
 
 @router.put("/{pipeline_id}")
@@ -354,6 +392,18 @@ async def atualizar_pipeline(
     # is_public só por professor/admin (senão remove a flag do update, sem falhar).
     if "is_public" in update and update["is_public"] and not _pode_publicar(current_user):
         update["is_public"] = False
+    pesados = [c for c in partes_pipeline.CAMPOS if c in update]
+    anterior = None
+    if pesados or "atividade_id" in update or "turma_id" in update:
+        # A submissão pode estar saindo de outra atividade ou turma (o ranking e o progresso de
+        # lá também mudam), e as partes regravadas substituem as anteriores. Também é a checagem
+        # de dono antes de gravar qualquer parte.
+        anterior = await pipelines.find_one({"_id": oid, "user_id": user_id},
+                                            {"atividade_id": 1, "turma_id": 1, "partes": 1})
+        if anterior is None:
+            raise HTTPException(status_code=404, detail="Pipeline não encontrado")
+    atividade_anterior = (anterior or {}).get("atividade_id") if "atividade_id" in update else None
+    turma_anterior = (anterior or {}).get("turma_id")
     # Vínculo com atividade/turma validado contra a participação do usuário.
     if "atividade_id" in update or "turma_id" in update:
         atividade_id, turma_id = await _validar_vinculo_atividade(
@@ -364,14 +414,25 @@ async def atualizar_pipeline(
 
     update["dataModificacao"] = datetime.now(timezone.utc)
 
-    result = await pipelines.update_one(
-        {"_id": oid, "user_id": user_id},
-        {"$set": update},
-    )
+    operacao = {"$set": update}
+    if pesados:
+        inline, partes = await partes_pipeline.separar(oid, update)
+        definir, remover = partes_pipeline.campos_de_atualizacao(inline, partes)
+        operacao = {"$set": {**update, **definir}, **({"$unset": remover} if remover else {})}
+    result = await pipelines.update_one({"_id": oid, "user_id": user_id}, operacao)
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Pipeline não encontrado")
-
-    doc = await pipelines.find_one({"_id": oid})
+    if pesados:
+        await partes_pipeline.apagar(partes_pipeline.substituidas(anterior.get("partes"), pesados))
+
+    doc = await partes_pipeline.completar(await pipelines.find_one({"_id": oid}))
+    await ranking_atividades.registrar_submissao(doc.get("atividade_id"), user_id)
+    if atividade_anterior and atividade_anterior != doc.get("atividade_id"):
+        await ranking_atividades.registrar_submissao(atividade_anterior, user_id)
+    await progresso_turmas.desatualizar(doc.get("turma_id"), user_id)
+    if turma_anterior and turma_anterior != doc.get("turma_id"):
+        await progresso_turmas.desatualizar(turma_anterior, user_id)
+    await evolucao_alunos.registrar(user_id, oid, doc)
     return _pipeline_doc(doc)
 
 
@@ -386,8 +447,16 @@ async def excluir_pipeline(
     except Exception:
         raise HTTPException(status_code=400, detail="ID de pipeline inválido")
 
+    # Lidos antes: excluir uma submissão tira (ou rebaixa) o aluno do ranking, e as partes
+    # pesadas saem junto.
+    alvo = await pipelines.find_one({"_id": oid, "user_id": user_id},
+                                    {"atividade_id": 1, "turma_id": 1, "partes": 1})
     result = await pipelines.delete_one({"_id": oid, "user_id": user_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Pipeline não encontrado")
+    await partes_pipeline.apagar_do_pipeline(alvo)
+    await ranking_atividades.registrar_submissao((alvo or {}).get("atividade_id"), user_id)
+    await progresso_turmas.desatualizar((alvo or {}).get("turma_id"), user_id)
+    await evolucao_alunos.registrar(user_id, oid, None)
 
     return {"mensagem": "Pipeline excluído com sucesso"}
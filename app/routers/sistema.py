@@ -1,9 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException
 from typing import List
 from datetime import datetime
+from app import telemetria
 from app.database import erros_sistema
 from app.schemas.sistema import ErrorLogCreate, ErrorLogResponse
-from app.security import get_usuario_atual
+from app.sandbox import metricas_fila
+from app.security import exigir_admin_ou_professor, get_usuario_atual
 
 router = APIRouter(tags=["Sistema"])
 
@@ -35,3 +37,11 @@ async def get_logs_backend(current_user: dict = Depends(get_usuario_atual)):
         raise HTTPException(status_code=403, detail="Acesso negado.")
     from app.logging_config import get_last_logs
     return get_last_logs(200)
+
+
+@router.get("/filas")
+async def metricas_filas(usuario=Depends(exigir_admin_ou_professor)):
+    """Filas deste worker. A do sandbox: profundidade e espera mostram saturação do treino antes
+    de os alunos reclamarem; a da telemetria mostra o Mongo ficando para trás. Fora do
+    /healthcheck, que é público (probe do deploy)."""
+    return {"sandbox": metricas_fila(), "telemetria": telemetria.estatisticas()}
@@ -1,3 +1,4 @@
+import asyncio
 from fastapi import APIRouter, Depends, HTTPException, Query
 from typing import Optional
 import logging
@@ -7,18 +8,20 @@ from app.models.dataset_config import (
     DatasetType, get_all_datasets, get_dataset_config
 )
 from app.models.dataset_loaders import (
-    DatasetNaoConfigurado, carregar_com_rotulos, carregar_gerador, carregar_sklearn,
+    DatasetForaDoCache, DatasetNaoConfigurado, carregar_com_rotulos, carregar_gerador, carregar_sklearn,
     carregar_uci,
     # Reexportado: o startup em app/main.py chama toy_datasets.prewarm_uci_cache.
     prewarm_uci_cache,
 )
-from app.coleta_dados.configuracao_treinamento import aviso_estratificacao, dividir_dataframe
+from app.coleta_dados.configuracao_treinamento import aviso_estratificacao, dividir_indices
 from app.schemas.schemas import ReDivisaoColetaRequest
 from app.utils.seed import seed_everything, get_seed, get_sklearn_random_state
 from app.database import arquivos, configuracoes_treinamento
 from app.security import exigir_admin_ou_professor, get_usuario_atual
 from app.desafios.base_dados import perfil_do_dataset
-from app.funcoes_genericas.funcoes_genericas import converter_numpy, df_para_base64
+from app.funcoes_genericas.funcoes_genericas import converter_numpy
+from app.funcoes_genericas.perfil_dados import perfilar
+from app.armazenamento import datasets_exemplo, reter_refs, salvar_divisao
 
 logger = logging.getLogger("uvicorn")
 
@@ -79,6 +82,85 @@ async def perfil_desafio_dataset(
     return perfil
 
 
+def _preparar_dataframes(dataset_name: str, ds, parametros: dict):
+    """Parte CPU do preparo (carregar, rotular, dividir, perfilar) — roda fora do event loop."""
+    # Despacho por `fonte` vive SÓ no `carregar_com_rotulos`. Aqui havia uma segunda lista de
+    # fontes, e quando o Titanic virou `openml` ela não foi atualizada: `df` ficava `None` e
+    # este endpoint — o que a tela chama para abrir o dataset — devolvia 500, com o carregador
+    # novo funcionando e os testes de unidade verdes.
+    df, target_names = carregar_com_rotulos(dataset_name, ds, **parametros)
+
+    if df is None:
+        raise HTTPException(status_code=500, detail="Erro ao carregar dataset")
+
+    # Substituir target numerico por labels de texto se disponivel
+    # O target real no dataframe e sempre "target" para sklearn datasets
+    target_col = "target" if "target" in df.columns else ds.target
+
+    # Só em CLASSIFICAÇÃO: em regressão o `target_names` do sklearn é o nome da coluna, não
+    # uma lista de rótulos. No california_housing (`target_names == ['MedHouseVal']`) o
+    # `else str(x)` transformava a coluna contínua inteira em texto — a tela então deduzia
+    # "Exploratório" para um dataset de regressão, e o script exportado (que usa o alvo
+    # numérico) media outra coisa.
+    e_classificacao = ds.tipo == DatasetType.CLASSIFICATION
+    if target_names is not None and target_col in df.columns and e_classificacao:
+        if df[target_col].dtype in ['int64', 'float64']:
+            # Mapear inteiros para labels de texto
+            df[target_col] = df[target_col].apply(lambda x: target_names[int(x)] if int(x) < len(target_names) else str(x))
+
+    # Divisão REAL de treino/teste. Antes o treino recebia o dataframe inteiro e o teste
+    # a cauda de 25% — o teste era um subconjunto do treino (vazamento) e, sem embaralhar,
+    # a cauda de um dataset ordenado por classe (iris, wine) só tinha uma categoria.
+    # Classificação estratifica por padrão; `dividir_indices` cai numa divisão simples
+    # se alguma categoria tiver exemplos de menos.
+    idx_treino, idx_teste, estratificou = dividir_indices(
+        df,
+        ReDivisaoColetaRequest(test_size=TEST_SIZE_PADRAO, shuffle=True,
+                               stratify=e_classificacao, target=target_col),
+    )
+    return df, idx_treino, idx_teste, target_col, estratificou, perfilar(df)
+
+
+async def _preparar(dataset_name: str, ds, parametros: dict) -> dict:
+    """Dataset pronto para virar coleta: partes gravadas e tudo que a resposta precisa, em JSON.
+
+    É o que `datasets_exemplo` guarda por assinatura (a mesma entrada serve a turma inteira).
+    """
+    df, idx_treino, idx_teste, target_col, estratificou, perfil = await asyncio.to_thread(
+        _preparar_dataframes, dataset_name, ds, parametros
+    )
+
+    colunas = list(df.columns)
+    colunas_detalhes = [
+        {"nome_coluna": col, "tipo_coluna": "Número" if df[col].dtype in ['int64', 'float64'] else "Texto"}
+        for col in colunas
+    ]
+    tipo_target = None
+    if target_col and target_col in df.columns:
+        tipo_target = "Número" if df[target_col].dtype in ['int64', 'float64'] else "Texto"
+
+    # Persistir para que o pipeline de treinamento encontre os IDs: o completo em Parquet e
+    # treino/teste como posições sobre ele (app.armazenamento), referenciados por 'arquivos'.
+    armazenamento = await salvar_divisao(df, idx_treino, idx_teste)
+
+    # `converter_numpy` já aqui: a entrada vai para o JSON do cache, e a prévia precisa sair
+    # sem NaN (ver o comentário do `return` do endpoint).
+    return converter_numpy({
+        "armazenamento": armazenamento,
+        "colunas": colunas,
+        "colunas_detalhes": colunas_detalhes,
+        # Dados para preview (limitar a 50 linhas)
+        "dados": df.head(50).to_dict(orient='records'),
+        "target": target_col,
+        "tipo_target": tipo_target,
+        "estratificou": estratificou,
+        "num_linhas_total": len(df),
+        "num_linhas_treino": len(idx_treino),
+        "num_linhas_teste": len(idx_teste),
+        "perfil": perfil,
+    })
+
+
 @router.get("/{dataset_name}")
 async def carregar_dataset(
     dataset_name: str,
@@ -100,69 +182,30 @@ async def carregar_dataset(
         seed_everything(seed)
 
     try:
-        # Despacho por `fonte` vive SÓ no `carregar_com_rotulos`. Aqui havia uma segunda lista de
-        # fontes, e quando o Titanic virou `openml` ela não foi atualizada: `df` ficava `None` e
-        # este endpoint — o que a tela chama para abrir o dataset — devolvia 500, com o carregador
-        # novo funcionando e os testes de unidade verdes.
-        df, target_names = carregar_com_rotulos(
-            dataset_name, ds,
-            n_amostras=n_amostras, n_features=n_features, ruido=ruido,
-            n_classes=n_classes, n_clusters=n_clusters,
-        )
-
-        if df is None:
-            raise HTTPException(status_code=500, detail="Erro ao carregar dataset")
-        
-        # Substituir target numerico por labels de texto se disponivel
-        # O target real no dataframe e sempre "target" para sklearn datasets
-        target_col = "target" if "target" in df.columns else ds.target
-        
-        # Só em CLASSIFICAÇÃO: em regressão o `target_names` do sklearn é o nome da coluna, não
-        # uma lista de rótulos. No california_housing (`target_names == ['MedHouseVal']`) o
-        # `else str(x)` transformava a coluna contínua inteira em texto — a tela então deduzia
-        # "Exploratório" para um dataset de regressão, e o script exportado (que usa o alvo
-        # numérico) media outra coisa.
-        e_classificacao_alvo = ds.tipo == DatasetType.CLASSIFICATION
-        if target_names is not None and target_col in df.columns and e_classificacao_alvo:
-            if df[target_col].dtype in ['int64', 'float64']:
-                # Mapear inteiros para labels de texto
-                df[target_col] = df[target_col].apply(lambda x: target_names[int(x)] if int(x) < len(target_names) else str(x))
-        
-        # Preparar dados
-        colunas = list(df.columns)
-        colunas_detalhes = []
-        for col in colunas:
-            tipo_col = "Número" if df[col].dtype in ['int64', 'float64'] else "Texto"
-            colunas_detalhes.append({
-                "nome_coluna": col,
-                "tipo_coluna": tipo_col
-            })
-
-        # Dados para preview (limitar a 50 linhas)
-        dados = df.head(50).to_dict(orient='records')
-
-        # Informacoes do target
-        tipo_target = None
-        if target_col and target_col in df.columns:
-            tipo_target = "Número" if df[target_col].dtype in ['int64', 'float64'] else "Texto"
-
-        # Persistir no MongoDB para que o pipeline de treinamento encontre os IDs
-        # - Salva o dataframe completo em 'arquivos' (content_treino_base64/content_teste_base64)
-        # - Salva configuração inicial em 'configuracoes_treinamento'
-        # Divisão REAL de treino/teste. Antes o treino recebia o dataframe inteiro e o teste
-        # a cauda de 25% — o teste era um subconjunto do treino (vazamento) e, sem embaralhar,
-        # a cauda de um dataset ordenado por classe (iris, wine) só tinha uma categoria.
-        # Classificação estratifica por padrão; `dividir_dataframe` cai numa divisão simples
-        # se alguma categoria tiver exemplos de menos.
+        parametros = dict(n_amostras=n_amostras, n_features=n_features, ruido=ruido,
+                          n_classes=n_classes, n_clusters=n_clusters)
+        if ds.fonte == "gerador" and get_seed() is None:
+            # Sem semente o gerador sorteia outro dataset a cada chamada: não há o que
+            # compartilhar, e cada aluno segue recebendo o seu (a referência da gravação é dele).
+            preparado = await _preparar(dataset_name, ds, parametros)
+        else:
+            chave = datasets_exemplo.chave(
+                dataset=dataset_name, seed=get_seed(), test_size=TEST_SIZE_PADRAO,
+                # Os parâmetros do gerador só mudam o dataset sintético: nos outros a turma
+                # toda cai na mesma entrada, mande a tela o que mandar.
+                **(parametros if ds.fonte == "gerador" else {}),
+            )
+            preparado = await datasets_exemplo.obter(
+                chave, lambda: _preparar(dataset_name, ds, parametros)
+            )
+            if datasets_exemplo.MAX_ENTRADAS > 0:
+                # A gravação é do cache; cada coleta que aponta para as mesmas partes soma a sua.
+                await reter_refs(preparado["armazenamento"].values())
+        colunas = preparado["colunas"]
+        target_col = preparado["target"]
+        tipo_target = preparado["tipo_target"]
+        estratificou = preparado["estratificou"]
         e_classificacao = ds.tipo == DatasetType.CLASSIFICATION
-        df_treino, df_teste, estratificou = dividir_dataframe(
-            df,
-            ReDivisaoColetaRequest(test_size=TEST_SIZE_PADRAO, shuffle=True,
-                                   stratify=e_classificacao, target=target_col),
-        )
-        content_completo_b64 = df_para_base64(df)
-        content_treino_b64 = df_para_base64(df_treino)
-        content_teste_b64 = df_para_base64(df_teste)
 
         atributos_iniciais = {c: True for c in colunas}
         if target_col and target_col in colunas:
@@ -171,19 +214,18 @@ async def carregar_dataset(
         doc_arquivo = {
             "arquivo_nome_treino": f"{ds.nome}.xlsx",
             "arquivo_nome_teste": f"{ds.nome}_teste.xlsx",
-            # `content_completo_base64` é o que a redivisão relê ao mudar a proporção/alvo —
-            # sem ele, redividir usaria o treino já dividido e o dataset encolheria a cada vez.
-            "content_completo_base64": content_completo_b64,
-            "content_treino_base64": content_treino_b64,
-            "content_teste_base64": content_teste_b64,
+            # O `completo` é o que a redivisão relê ao mudar a proporção/alvo — sem ele,
+            # redividir usaria o treino já dividido e o dataset encolheria a cada vez.
+            "armazenamento": preparado["armazenamento"],
             "fonte": "toy_dataset",
             "dataset_nome": ds.nome,
-            "num_linhas_total": len(df),
-            "num_linhas_treino": len(df_treino),
-            "num_linhas_teste": len(df_teste),
+            "num_linhas_total": preparado["num_linhas_total"],
+            "num_linhas_treino": preparado["num_linhas_treino"],
+            "num_linhas_teste": preparado["num_linhas_teste"],
             "num_colunas": len(colunas),
             "atributos": atributos_iniciais,
-            "colunas_detalhes": colunas_detalhes,
+            "colunas_detalhes": preparado["colunas_detalhes"],
+            "perfil": preparado["perfil"],
             "usuario_id": str(current_user.get("_id", "")),
         }
         result_arquivo = await arquivos.insert_one(doc_arquivo)
@@ -218,9 +260,9 @@ async def carregar_dataset(
             "nome_dataset": ds.nome,
             "fonte": ds.fonte,
             "colunas": colunas,
-            "colunas_detalhes": colunas_detalhes,
-            "dados": dados,
-            "total_dados": len(df),
+            "colunas_detalhes": preparado["colunas_detalhes"],
+            "dados": preparado["dados"],
+            "total_dados": preparado["num_linhas_total"],
             "target": target_col,
             "tipo_target": tipo_target,
             "prever_categoria": ds.tipo == DatasetType.CLASSIFICATION,
@@ -229,8 +271,8 @@ async def carregar_dataset(
             "test_size": TEST_SIZE_PADRAO,
             # Tamanhos REAIS dos dois conjuntos. Sem eles a tela exibia o dataset inteiro
             # como treino e "Teste: 0" — a divisão que o servidor fez ficava invisível.
-            "num_linhas_treino": len(df_treino),
-            "num_linhas_teste": len(df_teste),
+            "num_linhas_treino": preparado["num_linhas_treino"],
+            "num_linhas_teste": preparado["num_linhas_teste"],
             "aviso_estratificacao": aviso_estratificacao(e_classificacao, estratificou),
             "n_amostras": ds.n_amostras,
             "n_features": ds.n_features,
@@ -250,6 +292,9 @@ async def carregar_dataset(
         # Antes o próprio carregador levantava HTTPException(400); a exceção do módulo
         # extraído preserva esse status (o except genérico abaixo devolveria 500).
         raise HTTPException(status_code=400, detail=str(e))
+    except DatasetForaDoCache as e:
+        # Máquina offline sem o arquivo no cache copiado: indisponível aqui, não erro interno.
+        raise HTTPException(status_code=503, detail=str(e))
     except ImportError as e:
         raise HTTPException(status_code=500, detail=f"Biblioteca não instalada: {str(e)}")
     except Exception as e:
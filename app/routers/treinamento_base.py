@@ -1,4 +1,3 @@
-import base64
 import hashlib
 import importlib
 import inspect
@@ -8,16 +7,18 @@ from typing import Callable, Dict, Any, List, Optional
 import bson.json_util as bson
 from fastapi import APIRouter, HTTPException
 from app.deps import pd
-from app.sandbox import SandboxError, executar_treinamento
+from app.sandbox import SandboxError, executar_treinamento_async
+from app.armazenamento import DatasetIndisponivel, carregar_df, contar_linhas, reter_refs
 import joblib
 from app.mlflow_client import log_run, log_bytes_artifact, log_sklearn_model, mlflow_enabled
 from app.routers.artefatos import registrar_run_usuario
-from app.security import usuario_atual_ctx, id_usuario_atual
+from app.security import usuario_atual_ctx, id_usuario_atual, requisicao_atual_ctx
 from app.schemas.schemas import DatasetRequest
 from app.database import configuracoes_treinamento, arquivos, opcoes_modelos, modelos_treinados, opcoes_pre_processamento
 from app.utils.seed import random_state_efetivo
 from app.funcoes_genericas.funcoes_genericas import converter_numpy
-from app.funcoes_genericas.validacao import validar_object_id, MAX_ARQUIVO_BASE64
+from app.funcoes_genericas import perfil_dados
+from app.funcoes_genericas.validacao import validar_object_id
 from app.pre_processamento import (
     PRE_PROCESSAMENTO_CATALOGO,
     catalogo_com_overrides,
@@ -168,26 +169,13 @@ async def treinar_modelo_generico(
     pre_proc_specs = montar_specs_pre_processamento(pre_proc_itens, pre_proc_catalogo)
     imputer_presente = tem_imputer(pre_proc_itens, pre_proc_catalogo)
     
-    conteudo_base64 = arquivo_doc.get("content_treino_base64")
-    if not conteudo_base64:
-        raise HTTPException(status_code=400, detail="Conteúdo do arquivo ausente ou mal formatado.")
-
-    if len(conteudo_base64) > MAX_ARQUIVO_BASE64:
-        raise HTTPException(status_code=413, detail="Arquivo de treino muito grande. O limite é de 50 MB.")
-
     try:
-        conteudo_bytes = base64.b64decode(conteudo_base64)
-        # Tenta Excel primeiro, depois CSV
-        try:
-            df = pd.read_excel(BytesIO(conteudo_bytes), engine="openpyxl")
-        except Exception:
-            try:
-                text = conteudo_bytes.decode("utf-8")
-            except UnicodeDecodeError:
-                text = conteudo_bytes.decode("latin-1")
-            sep = ";" in text.split("\n")[0] and ";" or ","
-            df = pd.read_csv(pd.io.common.StringIO(text), sep=sep)
-    except Exception as e:
+        df = await carregar_df(arquivo_oid, "treino", doc=arquivo_doc)
+    except DatasetIndisponivel as e:
+        if e.kind == "grande":
+            raise HTTPException(status_code=413, detail="Arquivo de treino muito grande. O limite é de 50 MB.")
+        if e.kind == "ausente":
+            raise HTTPException(status_code=400, detail="Conteúdo do arquivo ausente ou mal formatado.")
         raise HTTPException(status_code=400, detail=f"Erro ao processar o arquivo: {str(e)}")
     
     # Validar colunas
@@ -213,11 +201,14 @@ async def treinar_modelo_generico(
     # Coluna de texto chegando ao estimador: sem alvo (modo exploratório) TODAS as
     # colunas marcadas viram atributos, inclusive as categóricas, e o sklearn quebra
     # com "could not convert string to float". Só é problema se ninguém a codificar.
+    # O perfil guardado na ingestão (`perfil_dados`) já sabe o dtype de cada coluna; coleta
+    # antiga, sem perfil, cai na checagem no dataframe.
     codificadas = colunas_codificadas(pre_proc_itens, pre_proc_catalogo)
-    nao_numericas = [
-        c for c in X_train.columns
-        if not pd.api.types.is_numeric_dtype(X_train[c]) and c not in codificadas
-    ]
+    perfil = arquivo_doc.get("perfil")
+    numericas = perfil_dados.numericas(perfil, X_train.columns)
+    if numericas is None:
+        numericas = [c for c in X_train.columns if pd.api.types.is_numeric_dtype(X_train[c])]
+    nao_numericas = [c for c in X_train.columns if c not in numericas and c not in codificadas]
     if nao_numericas:
         nomes = ", ".join(f"'{c}'" for c in nao_numericas)
         plural = "s" if len(nao_numericas) > 1 else ""
@@ -232,7 +223,9 @@ async def treinar_modelo_generico(
 
     # Verificar valores ausentes — liberado quando há um imputer no pipeline,
     # que justamente preenche esses valores durante o fit.
-    if not imputer_presente and X_train.isnull().any().any():
+    # Sem nulos no completo = sem nulos no treino: só varre quando o perfil não garante.
+    if (not imputer_presente and not perfil_dados.sem_nulos(perfil, X_train.columns)
+            and X_train.isnull().any().any()):
         raise HTTPException(
             status_code=400,
             detail="Os dados de treino contêm valores ausentes. Adicione um SimpleImputer ao pré-processamento ou preencha os valores vazios antes de treinar."
@@ -241,7 +234,7 @@ async def treinar_modelo_generico(
     # Para modelos supervisionados, verificar target
     if not is_clustering:
         y_train = df[target]
-        if y_train.isnull().any():
+        if not perfil_dados.sem_nulos(perfil, [target]) and y_train.isnull().any():
             raise HTTPException(
                 status_code=400,
                 detail="Os dados de treino contêm valores ausentes no target. Remova ou preencha os valores vazios antes de treinar."
@@ -264,13 +257,17 @@ async def treinar_modelo_generico(
             tags=mlflow_tags,
         ) as mlflow_run_id:
 
-            train_result = executar_treinamento(
+            # Assíncrono: o fit leva até SANDBOX_MAX_WALL_SEC e, com o subprocess.run de
+            # antes, congelava o worker inteiro (healthcheck e chat inclusive) nesse tempo.
+            requisicao = requisicao_atual_ctx.get()
+            train_result = await executar_treinamento_async(
                 class_path=class_path,
                 hiperparametros=hiperparametros,
                 X_train=X_train,
                 y_train=None if is_clustering else y_train,
                 is_clustering=is_clustering,
                 pre_processamento=pre_proc_specs,
+                desconectado=requisicao.is_disconnected if requisicao is not None else None,
             )
 
             modelo_bytes = train_result.model_bytes
@@ -300,9 +297,15 @@ async def treinar_modelo_generico(
                 except Exception as e:
                     logger.warning(f"log do modelo sklearn no MLflow falhou: {e}")
 
+            # Teste para avaliar mesmo sem a coleta: nas coletas novas, a MESMA referência da
+            # coleta (sem cópia), retida em nome do modelo — redividir a coleta não a apaga.
+            # Nas antigas ainda não migradas, o base64.
+            ref_teste = (arquivo_doc.get("armazenamento") or {}).get("teste")
+            await reter_refs([ref_teste])
             result = await modelos_treinados.insert_one({
                 "arquivo_id": request.arquivo_id,
                 "arq_teste": arquivo_doc.get("content_teste_base64"),
+                "armazenamento_teste": ref_teste,
                 "hiperparametros": hiperparametros,
                 "atributos": atributos,
                 "target": target,
@@ -331,8 +334,16 @@ async def treinar_modelo_generico(
 
     except SandboxError as e:
         logger.warning(f"treinar_modelo_generico bloqueado pelo sandbox ({e.kind}): {e}")
-        # timeout/memória são erros de uso (input ruim), não erros internos
-        status = 400 if e.kind in ("timeout", "memory", "config") else 500
+        # timeout/memória são erros de uso (input ruim), não erros internos. Fila cheia é
+        # sobrecarga passageira (503); "cancelado" só acontece sem ninguém para ler a resposta.
+        if e.kind in ("timeout", "memory", "config"):
+            status = 400
+        elif e.kind == "ocupado":
+            status = 503
+        elif e.kind == "cancelado":
+            status = 499
+        else:
+            status = 500
         raise HTTPException(status_code=status, detail=f"Erro no treinamento: {e}")
     except Exception as e:
         logger.exception(f"treinar_modelo_generico falhou: {e}")
@@ -340,21 +351,10 @@ async def treinar_modelo_generico(
     
     # Calcular total de amostras de teste se disponível
     total_amostras_teste = 0
-    conteudo_teste_base64 = arquivo_doc.get("content_teste_base64")
-    if conteudo_teste_base64:
-        try:
-            teste_bytes = base64.b64decode(conteudo_teste_base64)
-            try:
-                df_teste = pd.read_excel(BytesIO(teste_bytes), engine="openpyxl")
-            except Exception:
-                try:
-                    text_teste = teste_bytes.decode("utf-8")
-                except UnicodeDecodeError:
-                    text_teste = teste_bytes.decode("latin-1")
-                sep_teste = ";" in text_teste.split("\n")[0] and ";" or ","
-                df_teste = pd.read_csv(pd.io.common.StringIO(text_teste), sep=sep_teste)
-            total_amostras_teste = len(df_teste)
-        except Exception as e:
+    try:
+        total_amostras_teste = await contar_linhas(arquivo_doc, "teste")
+    except DatasetIndisponivel as e:
+        if e.kind != "ausente":
             logger.warning(f"Erro ao contar amostras de teste: {e}")
     
     # Valores padrão dos hiperparâmetros (display) — mesma fonte usada no treino.
@@ -9,13 +9,15 @@
 Escritas de professor: `exigir_admin_ou_professor`. O router é montado com o
 `auth_dependency` global (todo mundo autenticado).
 """
+import asyncio
 import os
 import secrets
 from datetime import datetime, timezone
 
 from bson import ObjectId
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 
+from app import diretorio_usuarios, progresso_turmas, ranking_atividades, telemetria_rollup
 from app.database import (
     turmas, atividades, pipelines, colecao_usuario, atividade_usuario,
     submissoes_montagem,
@@ -66,19 +68,9 @@ def _nome_usuario(u: dict | None) -> str:
 
 
 async def _mapa_usuarios(ids: list) -> dict:
-    """Busca vários usuários por id em UMA query (evita N+1). Retorna {id_str: doc}."""
-    oids = []
-    for aid in ids or []:
-        try:
-            oids.append(ObjectId(aid))
-        except Exception:
-            continue
-    if not oids:
-        return {}
-    mapa = {}
-    async for u in colecao_usuario.find({"_id": {"$in": oids}}):
-        mapa[str(u["_id"])] = u
-    return mapa
+    """Nome, e-mail e papel de vários usuários por id — {id_str: entrada} do diretório
+    (`app.diretorio_usuarios`): projetado, em lote e com cache; no máximo um ``$in``."""
+    return await diretorio_usuarios.buscar(ids)
 
 
 # Leitura dos resultados vive em `app/metricas/resultado.py` (compartilhada com a evolução
@@ -283,7 +275,7 @@ async def obter_turma(turma_id: str, usuario: dict = Depends(get_usuario_atual))
     if is_admin or t.get("professor_id") == str(usuario["_id"]):
         usuarios = await _mapa_usuarios(t.get("alunos", []))
         doc["alunos_detalhe"] = [
-            {"id": aid, "nome": (usuarios.get(aid) or {}).get("nome_usuario") or (usuarios.get(aid) or {}).get("nome"),
+            {"id": aid, "nome": (usuarios.get(aid) or {}).get("nome"),
              "email": (usuarios.get(aid) or {}).get("email")}
             for aid in t.get("alunos", [])
         ]
@@ -302,7 +294,10 @@ async def atualizar_turma(turma_id: str, body: TurmaUpdate, usuario: dict = Depe
 @router.delete("/{turma_id}")
 async def excluir_turma(turma_id: str, usuario: dict = Depends(exigir_admin_ou_professor)):
     t = await _turma_do_professor(turma_id, usuario)
+    ids = [str(a["_id"]) async for a in atividades.find({"turma_id": str(t["_id"])}, {"_id": 1})]
     await atividades.delete_many({"turma_id": str(t["_id"])})
+    await ranking_atividades.esquecer(ids)
+    await progresso_turmas.esquecer(str(t["_id"]))
     await turmas.delete_one({"_id": t["_id"]})
     return {"mensagem": "Turma excluída."}
 
@@ -380,7 +375,11 @@ async def atualizar_atividade(turma_id: str, atividade_id: str, body: AtividadeU
     if body.gabarito is not None:
         campos["gabarito"] = _gabarito_com_dataset(body.gabarito)
     if campos:
-        await atividades.update_one({"_id": aoid, "turma_id": turma_id}, {"$set": campos})
+        operacao = {"$set": campos}
+        if "criterio" in campos:
+            # Outra métrica (ou ordem) muda o "melhor" de cada aluno: a próxima leitura reconstrói.
+            operacao["$unset"] = {"ranking_versao": ""}
+        await atividades.update_one({"_id": aoid, "turma_id": turma_id}, operacao)
     # Releitura escopada à mesma turma da atualização: sem o filtro por turma_id o
     # professor podia informar a PRÓPRIA turma e o atividade_id de OUTRA turma e
     # receber o gabarito dela (a atualização era no-op, mas a releitura vazava).
@@ -394,7 +393,9 @@ async def atualizar_atividade(turma_id: str, atividade_id: str, body: AtividadeU
 async def excluir_atividade(turma_id: str, atividade_id: str, usuario: dict = Depends(exigir_admin_ou_professor)):
     await _turma_do_professor(turma_id, usuario)
     aoid = validar_object_id(atividade_id, "atividade_id")
-    await atividades.delete_one({"_id": aoid, "turma_id": turma_id})
+    r = await atividades.delete_one({"_id": aoid, "turma_id": turma_id})
+    if r.deleted_count:
+        await ranking_atividades.esquecer([atividade_id])
     return {"mensagem": "Atividade excluída."}
 
 
@@ -530,6 +531,7 @@ async def submeter_montagem(turma_id: str, atividade_id: str, body: SubmeterMont
         "criado_em": datetime.now(timezone.utc),
     }
     r = await submissoes_montagem.insert_one(doc)
+    await progresso_turmas.desatualizar(turma_id, user_id)
     return converter_numpy({
         "id": str(r.inserted_id),
         "tentativa": tentativa,
@@ -539,7 +541,15 @@ async def submeter_montagem(turma_id: str, atividade_id: str, body: SubmeterMont
 
 
 @router.get("/{turma_id}/atividades/{atividade_id}/ranking")
-async def ranking_atividade(turma_id: str, atividade_id: str, usuario: dict = Depends(exigir_admin_ou_professor)):
+async def ranking_atividade(turma_id: str, atividade_id: str,
+                            limite: int = Query(100, ge=1, le=500),
+                            pagina: int = Query(1, ge=1),
+                            usuario: dict = Depends(exigir_admin_ou_professor)):
+    """Melhor submissão por aluno, na ordem do critério (quem não tem valor vai no fim).
+
+    Lido do ranking materializado (`app/ranking_atividades.py`), mantido a cada submissão:
+    uma consulta indexada por página, sem varrer os pipelines da atividade.
+    """
     await _turma_do_professor(turma_id, usuario)
     aoid = validar_object_id(atividade_id, "atividade_id")
     a = await atividades.find_one({"_id": aoid, "turma_id": turma_id})
@@ -548,35 +558,22 @@ async def ranking_atividade(turma_id: str, atividade_id: str, usuario: dict = De
     if (a.get("tipo") or TIPO_PIPELINE) == TIPO_MONTAGEM:
         return await _ranking_montagem(atividade_id)
     criterio = a.get("criterio") or {}
-    metrica = criterio.get("metrica", "accuracy_score")
-    ordem = criterio.get("ordem", "desc")
-    chaves = await _chaves_metrica(metrica)
-
-    # projeção: não trazer resultadoColetaDado (pode ser enorme) — só o necessário.
-    proj = {"resultadosDasAvaliacoes": 1, "user_id": 1, "nome": 1}
-    # melhor submissão POR ALUNO (evita linhas duplicadas quando o aluno salva várias vezes).
-    melhor: dict = {}
-    async for p in pipelines.find({"atividade_id": atividade_id}, proj):
-        aluno_id = p.get("user_id")
-        valor = _valor_metrica(p.get("resultadosDasAvaliacoes"), chaves, ordem)
-        atual = melhor.get(aluno_id)
-        linha = {"aluno_id": aluno_id, "pipeline_id": str(p["_id"]),
-                 "pipeline_nome": p.get("nome"), "valor": valor}
-        if atual is None:
-            melhor[aluno_id] = linha
-        elif valor is not None and (atual["valor"] is None or
-                                    (valor > atual["valor"] if ordem != "asc" else valor < atual["valor"])):
-            melhor[aluno_id] = linha
-
-    usuarios = await _mapa_usuarios(list(melhor.keys()))
-    linhas = []
-    for aluno_id, l in melhor.items():
-        l["aluno_nome"] = _nome_usuario(usuarios.get(aluno_id))
-        linhas.append(l)
-    com_valor = [l for l in linhas if l["valor"] is not None]
-    com_valor.sort(key=lambda l: l["valor"], reverse=(ordem != "asc"))
-    sem_valor = [l for l in linhas if l["valor"] is None]
-    return converter_numpy({"metrica": metrica, "ordem": ordem, "ranking": com_valor + sem_valor})
+    pular = (pagina - 1) * limite
+    docs, total = await ranking_atividades.pagina(a, limite, pular)
+    ranking = [
+        {"posicao": pular + i + 1, "aluno_id": d.get("aluno_id"), "aluno_nome": d.get("aluno_nome"),
+         "pipeline_id": d.get("pipeline_id"), "pipeline_nome": d.get("pipeline_nome"),
+         "valor": d.get("valor"), "tentativas": d.get("tentativas", 0)}
+        for i, d in enumerate(docs)
+    ]
+    return converter_numpy({
+        "metrica": criterio.get("metrica", "accuracy_score"),
+        "ordem": criterio.get("ordem", "desc"),
+        "total": total,
+        "pagina": pagina,
+        "limite": limite,
+        "ranking": ranking,
+    })
 
 
 async def _ranking_montagem(atividade_id: str) -> dict:
@@ -617,15 +614,9 @@ async def _ranking_montagem(atividade_id: str) -> dict:
     })
 
 
-@router.get("/{turma_id}/progresso")
-async def progresso_turma(turma_id: str, usuario: dict = Depends(exigir_admin_ou_professor)):
-    t = await _turma_do_professor(turma_id, usuario)
-    tid = str(t["_id"])
-    alunos = t.get("alunos", [])
-    total_atividades = await atividades.count_documents({"turma_id": tid})
-
-    usuarios = await _mapa_usuarios(alunos)
-
+# Os três agregados abaixo devolvem None quando a consulta falha: a tela mostra zeros, mas o
+# retrato não é gravado com eles (`_calcular_progresso`).
+async def _pipelines_por_aluno(tid: str, alunos: list) -> dict | None:
     # Submissões e último acesso ESCOPADOS À TURMA (via pipelines desta turma), 1 agregação.
     # submissoes = nº de atividades DISTINTAS submetidas (não conta re-salvamentos).
     por_aluno: dict = {}
@@ -642,8 +633,11 @@ async def progresso_turma(turma_id: str, usuario: dict = Depends(exigir_admin_ou
                 "ultimo_acesso": row.get("ultimo"),
             }
     except Exception:
-        por_aluno = {}
+        return None
+    return por_aluno
+
 
+async def _desafios_por_aluno(tid: str, alunos: list) -> dict | None:
     # Desafios entram em coluna PRÓPRIA: `submissoes` continua significando pipelines
     # submetidos (é o número que o professor já lia nesta tela).
     desafios_por_aluno: dict = {}
@@ -662,37 +656,96 @@ async def progresso_turma(turma_id: str, usuario: dict = Depends(exigir_admin_ou
                 "ultimo_acesso": row.get("ultimo"),
             }
     except Exception:
-        desafios_por_aluno = {}
+        return None
+    return desafios_por_aluno
 
-    # Uso do tutor (chat) por aluno da turma, 1 agregação. É o total do aluno (a
-    # telemetria não guarda turma no evento); serve como sinal de engajamento.
+
+async def _chats_por_aluno(alunos: list, desde) -> dict | None:
+    # Uso do tutor (chat) por aluno da turma, 1 agregação. A telemetria não guarda turma no
+    # evento: o recorte da turma é pelos alunos e pelo período, desde a criação da turma. As
+    # horas já resumidas vêm do rollup da telemetria (somando `total`), o resto dos eventos brutos.
     chats_por_aluno: dict = {}
     try:
-        cur = atividade_usuario.aggregate([
-            {"$match": {"usuario_id": {"$in": alunos}, "tipo": "chat"}},
-            {"$group": {"_id": "$usuario_id", "chats": {"$sum": 1}}},
+        estagios = await telemetria_rollup.estagios({"usuario_id": {"$in": alunos}, "tipo": "chat"},
+                                                    inicio=desde)
+        cur = atividade_usuario.aggregate(estagios + [
+            {"$group": {"_id": "$usuario_id", "chats": {"$sum": "$total"}}},
         ])
         for row in await cur.to_list(length=None):
             chats_por_aluno[row["_id"]] = row.get("chats", 0)
     except Exception:
-        chats_por_aluno = {}
+        return None
+    return chats_por_aluno
 
-    linhas = []
+
+async def _calcular_progresso(t: dict, alunos: list) -> tuple[dict, bool]:
+    """Linhas do progresso de `alunos` na turma `t`: as consultas só desses alunos, em paralelo.
+
+    Devolve também se TODAS as consultas responderam. Com alguma falha as linhas saem com zeros
+    onde faltou dado — servem a esta leitura, mas não ao retrato: gravadas, os zeros ficariam
+    até a idade máxima, e `contar_chats` somaria sobre a base errada.
+    """
+    tid = str(t["_id"])
+    usuarios, por_aluno, desafios_por_aluno, chats_por_aluno = await asyncio.gather(
+        _mapa_usuarios(alunos),
+        _pipelines_por_aluno(tid, alunos),
+        _desafios_por_aluno(tid, alunos),
+        _chats_por_aluno(alunos, t.get("criado_em")),
+    )
+    completas = None not in (por_aluno, desafios_por_aluno, chats_por_aluno)
+    por_aluno, desafios_por_aluno, chats_por_aluno = (
+        por_aluno or {}, desafios_por_aluno or {}, chats_por_aluno or {})
+    linhas = {}
     for aid in alunos:
         u = usuarios.get(aid)
         agg = por_aluno.get(aid, {})
         desafio = desafios_por_aluno.get(aid, {})
         # Último acesso é o mais recente entre pipeline salvo e desafio submetido.
         acessos = [d for d in (agg.get("ultimo_acesso"), desafio.get("ultimo_acesso")) if d]
-        linhas.append({
-            "aluno_id": aid,
+        linhas[aid] = {
             "aluno_nome": _nome_usuario(u),
             "email": (u or {}).get("email"),
             "submissoes": agg.get("submissoes", 0),
             "desafios": desafio.get("submissoes", 0),
             "melhor_nota_desafio": desafio.get("melhor_nota"),
-            "total_atividades": total_atividades,
             "chats": chats_por_aluno.get(aid, 0),
             "ultimo_acesso": max(acessos) if acessos else None,
-        })
-    return converter_numpy({"turma": _turma_doc(t), "total_atividades": total_atividades, "alunos": linhas})
+        }
+    return linhas, completas
+
+
+@router.get("/{turma_id}/progresso")
+async def progresso_turma(turma_id: str, usuario: dict = Depends(exigir_admin_ou_professor)):
+    """Uma linha por aluno, lida do retrato da turma (`app/progresso_turmas.py`).
+
+    Só são calculadas as linhas que faltam no retrato (aluno novo, submissão desde a última
+    leitura) — ou a turma inteira quando o retrato não existe ou passou da idade máxima.
+    `atualizado_em` é quando o retrato foi gerado por inteiro; depois disso ele só recebeu os
+    eventos incrementais.
+    """
+    t = await _turma_do_professor(turma_id, usuario)
+    tid = str(t["_id"])
+    alunos = t.get("alunos", [])
+    retrato, total_atividades = await asyncio.gather(
+        progresso_turmas.ler(tid),
+        atividades.count_documents({"turma_id": tid}),
+    )
+
+    linhas_por_aluno, gerado_em = retrato or ({}, None)
+    faltam = [a for a in alunos if a not in linhas_por_aluno]
+    if faltam:
+        novas, completas = await _calcular_progresso(t, faltam)
+        if completas:
+            gerado = await progresso_turmas.gravar(tid, novas, completo=retrato is None)
+            gerado_em = gerado or gerado_em
+        linhas_por_aluno = {**linhas_por_aluno, **novas}
+
+    campos = ("aluno_nome", "email", "submissoes", "desafios", "melhor_nota_desafio", "chats",
+              "ultimo_acesso")
+    linhas = []
+    for aid in alunos:
+        linha = linhas_por_aluno[aid]
+        linhas.append({"aluno_id": aid, **{c: linha.get(c) for c in campos},
+                       "total_atividades": total_atividades})
+    return converter_numpy({"turma": _turma_doc(t), "total_atividades": total_atividades,
+                            "atualizado_em": gerado_em, "alunos": linhas})
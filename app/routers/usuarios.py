@@ -17,7 +17,7 @@ if os.getenv("RENDER") is None:
 from app.schemas.usuarios import (
     PreferenciasUsuario, UserCreate, UserInvite, UserInviteResponse, UserOut,
 )
-from app.security import get_senha_hash, get_usuario_atual
+from app.security import get_senha_hash, get_usuario_atual, invalidar_usuario
 from app.database import colecao_usuario, verificadores_professor
 from app.funcoes_genericas.validacao import validar_object_id
 
@@ -237,6 +237,7 @@ async def salvar_preferencias(body: PreferenciasUsuario,
         {"_id": usuario["_id"]},
         {"$set": {"nivel_tutor": body.nivel_tutor}},
     )
+    invalidar_usuario(usuario["_id"])
     return {"nivel_tutor": body.nivel_tutor}
 
 
@@ -280,6 +281,7 @@ async def alterar_status_usuario(user_id: str, novo_status: str, current_user=De
 
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Usuário não encontrado")
+    invalidar_usuario(user_oid)
 
     return {"mensagem": f"Status alterado para {novo_status}"}
 
@@ -326,5 +328,6 @@ async def excluir_usuario(user_id: str, current_user=Depends(get_usuario_atual))
 
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Usuário não encontrado")
+    invalidar_usuario(user_oid)
 
     return {"mensagem": "Usuário excluído com sucesso"}
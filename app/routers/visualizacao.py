@@ -11,8 +11,10 @@ import pandas as pd
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 
+from app.armazenamento import DatasetIndisponivel, carregar_df
 from app.database import arquivos, configuracoes_treinamento
-from app.funcoes_genericas.validacao import validar_object_id, MAX_ARQUIVO_BASE64
+from app.funcoes_genericas import perfil_dados
+from app.funcoes_genericas.validacao import validar_object_id
 from app.security import id_usuario_atual
 
 logger = logging.getLogger(__name__)
@@ -46,25 +48,13 @@ async def gerar_pairplot(request: PairplotRequest):
         raise HTTPException(status_code=404, detail="Configuração não encontrada.")
     
     # Ler dados do arquivo
-    conteudo_base64 = arquivo_doc.get("content_treino_base64")
-    if not conteudo_base64:
-        raise HTTPException(status_code=400, detail="Conteúdo do arquivo ausente.")
-    
-    if len(conteudo_base64) > MAX_ARQUIVO_BASE64:
-        raise HTTPException(status_code=413, detail="Arquivo muito grande.")
-    
     try:
-        conteudo_bytes = base64.b64decode(conteudo_base64)
-        try:
-            df = pd.read_excel(io.BytesIO(conteudo_bytes), engine="openpyxl")
-        except Exception:
-            try:
-                text = conteudo_bytes.decode("utf-8")
-            except UnicodeDecodeError:
-                text = conteudo_bytes.decode("latin-1")
-            sep = ";" in text.split("\n")[0] and ";" or ","
-            df = pd.read_csv(io.StringIO(text), sep=sep)
-    except Exception as e:
+        df = await carregar_df(arquivo_oid, "treino", doc=arquivo_doc)
+    except DatasetIndisponivel as e:
+        if e.kind == "grande":
+            raise HTTPException(status_code=413, detail="Arquivo muito grande.")
+        if e.kind == "ausente":
+            raise HTTPException(status_code=400, detail="Conteúdo do arquivo ausente.")
         raise HTTPException(status_code=400, detail=f"Erro ao processar arquivo: {str(e)}")
     
     # Determinar colunas para visualizar
@@ -76,8 +66,12 @@ async def gerar_pairplot(request: PairplotRequest):
     else:
         colunas_viz = [c for c in atributos if c in df.columns]
 
-    # Pairplot exige colunas numéricas para diag_kind="kde"; filtra categóricas.
-    colunas_viz = [c for c in colunas_viz if pd.api.types.is_numeric_dtype(df[c])]
+    # Pairplot exige colunas numéricas para diag_kind="kde"; filtra categóricas. O perfil da
+    # ingestão já diz quais são; coleta antiga, sem perfil, olha o dtype no dataframe.
+    numericas = perfil_dados.numericas(arquivo_doc.get("perfil"), colunas_viz)
+    if numericas is None:
+        numericas = [c for c in colunas_viz if pd.api.types.is_numeric_dtype(df[c])]
+    colunas_viz = numericas
 
     if not colunas_viz:
         raise HTTPException(status_code=400, detail="Nenhuma coluna numérica válida para visualizar.")
@@ -92,7 +86,9 @@ async def gerar_pairplot(request: PairplotRequest):
         hue = None
     if not hue and target and target in df.columns:
         # Usar target como hue apenas se for categórico (poucos valores únicos)
-        if df[target].nunique() <= 20:
+        info_alvo = perfil_dados.coluna(arquivo_doc.get("perfil"), target)
+        distintos = info_alvo["distintos"] if info_alvo else df[target].nunique()
+        if distintos <= 20:
             hue = target
     
     # Preparar dados para o pairplot: inclui coluna hue no subset para seaborn
@@ -2,6 +2,18 @@ from app.sandbox.runner import (
     SandboxError,
     TrainResult,
     executar_treinamento,
+    executar_treinamento_async,
+    encerrar_zygote,
+    iniciar_zygote,
+    metricas_fila,
 )
 
-__all__ = ["SandboxError", "TrainResult", "executar_treinamento"]
+__all__ = [
+    "SandboxError",
+    "TrainResult",
+    "executar_treinamento",
+    "executar_treinamento_async",
+    "encerrar_zygote",
+    "iniciar_zygote",
+    "metricas_fila",
+]
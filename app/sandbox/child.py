@@ -147,12 +147,10 @@ def main(workdir: str) -> int:
 
     try:
         import joblib
-        import pandas as pd
 
-        X_train = pd.read_pickle(work / "X_train.pkl")
-        y_train = None
-        if not spec["is_clustering"]:
-            y_train = pd.read_pickle(work / "y_train.pkl")
+        from app.sandbox.transferencia import ler_dados
+
+        X_train, y_train = ler_dados(work, spec)
 
         modelo = _montar_modelo(spec)
         if spec["is_clustering"]:
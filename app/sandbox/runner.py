@@ -3,22 +3,39 @@
 O processo pai (FastAPI) só prepara dados/spec e lê os artefatos produzidos pelo
 filho. Falhas do filho (timeout, estouro de RAM, exceção do scikit-learn) não
 derrubam o worker — viram `SandboxError` no pai.
+
+Os handlers usam `executar_treinamento_async`: o filho roda como subprocesso do
+asyncio, então o event loop segue atendendo (healthcheck, chat em streaming) durante
+o fit. Uma fila FIFO por worker limita quantos filhos rodam ao mesmo tempo — cada um
+pode ocupar `SANDBOX_MAX_RAM_MB` — e mede profundidade e espera. A versão síncrona
+`executar_treinamento` continua para scripts e testes fora do loop.
+
+Quando o SO tem `fork`, o filho sai de um zygote já aquecido (ver `zygote.py`) em vez de
+um `python -m app.sandbox.child` novo; se o zygote não sobe, volta ao processo novo.
 """
 from __future__ import annotations
 
+import asyncio
 import json
 import logging
 import os
 import shutil
 import subprocess
 import sys
-import tempfile
-from dataclasses import dataclass
+import time
+import weakref
+from collections import deque
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Any, Optional
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Optional
+
+if TYPE_CHECKING:
+    from app.sandbox.zygote import Zygote
 
 import pandas as pd
 
+from app.sandbox.transferencia import gravar_dados, novo_workdir
+
 logger = logging.getLogger(__name__)
 
 
@@ -32,6 +49,17 @@ def _env_int(name: str, default: int) -> int:
 DEFAULT_MAX_RAM_MB = _env_int("SANDBOX_MAX_RAM_MB", 2048)
 DEFAULT_MAX_CPU_SEC = _env_int("SANDBOX_MAX_CPU_SEC", 60)
 DEFAULT_MAX_WALL_SEC = _env_int("SANDBOX_MAX_WALL_SEC", 120)
+# Filhos simultâneos por worker e quantos pedidos podem esperar atrás deles (0 = sem teto).
+MAX_CONCURRENT = _env_int("SANDBOX_MAX_CONCURRENT", 2)
+MAX_QUEUE = _env_int("SANDBOX_MAX_QUEUE", 16)
+# De quanto em quanto tempo o treino assíncrono pergunta se o cliente ainda está lá.
+INTERVALO_DESCONEXAO_SEC = 0.5
+# Zygote (fork de um processo com sklearn já importado). SANDBOX_ZYGOTE=0 desliga; o zygote
+# é trocado por um novo a cada SANDBOX_ZYGOTE_MAX_JOBS treinos.
+ZYGOTE_ATIVO = os.environ.get("SANDBOX_ZYGOTE", "1").strip() not in ("0", "false", "") and hasattr(os, "fork")
+ZYGOTE_MAX_JOBS = _env_int("SANDBOX_ZYGOTE_MAX_JOBS", 200)
+# Depois de uma falha ao subir o zygote, quanto tempo usar só o processo novo.
+ZYGOTE_ESPERA_APOS_FALHA_SEC = 60
 
 _REPO_ROOT = Path(__file__).resolve().parents[2]
 
@@ -50,6 +78,165 @@ class TrainResult:
     classes: list
     params: dict[str, Any]
     model_repr: str
+    # Tempos do job: modo ("zygote"/"processo"), fila_ms e execucao_ms.
+    tempos: dict[str, Any] = field(default_factory=dict)
+
+
+class FilaSandbox:
+    """Vagas de execução do sandbox, entregues em ordem de chegada.
+
+    `asyncio.Semaphore` não serve: ele se prende ao loop do primeiro uso e não expõe
+    quantos estão esperando. Aqui a vaga é passada direto do filho que termina para o
+    primeiro da fila (`sair`), então ninguém fura a fila entre um e outro.
+    """
+
+    def __init__(self, limite: int, max_fila: int = 0):
+        self.limite = max(1, limite)
+        self.max_fila = max(0, max_fila)
+        self._ativos = 0
+        self._espera: deque[asyncio.Future] = deque()
+        self._atendidos = 0
+        self._recusados = 0
+        self._espera_total = 0.0
+        self._espera_max = 0.0
+        self._execucoes: dict[str, list] = {}
+
+    async def entrar(self) -> float:
+        """Aguarda a vez e devolve quantos segundos esperou. `SandboxError("ocupado")`
+        quando a fila já está cheia."""
+        inicio = time.monotonic()
+        if self._ativos < self.limite and not self._espera:
+            self._ativos += 1
+        else:
+            if self.max_fila and len(self._espera) >= self.max_fila:
+                self._recusados += 1
+                raise SandboxError(
+                    "Servidor ocupado com outros treinamentos. Tente novamente em instantes.",
+                    "ocupado",
+                )
+            vez = asyncio.get_running_loop().create_future()
+            self._espera.append(vez)
+            try:
+                await vez
+            except asyncio.CancelledError:
+                if vez.done() and not vez.cancelled():
+                    # A vaga chegou junto com o cancelamento: repassa para o próximo.
+                    self.sair()
+                else:
+                    try:
+                        self._espera.remove(vez)
+                    except ValueError:
+                        pass
+                raise
+        espera = time.monotonic() - inicio
+        self._atendidos += 1
+        self._espera_total += espera
+        self._espera_max = max(self._espera_max, espera)
+        return espera
+
+    def sair(self) -> None:
+        while self._espera:
+            vez = self._espera.popleft()
+            if not vez.done():
+                vez.set_result(None)  # a vaga passa adiante; _ativos não muda
+                return
+        self._ativos = max(0, self._ativos - 1)
+
+    def registrar_execucao(self, modo: str, ms: float) -> None:
+        total = self._execucoes.setdefault(modo, [0, 0.0])
+        total[0] += 1
+        total[1] += ms
+
+    def metricas(self) -> dict[str, Any]:
+        return {
+            "limite": self.limite,
+            "em_execucao": self._ativos,
+            "na_fila": sum(1 for v in self._espera if not v.done()),
+            "max_fila": self.max_fila,
+            "atendidos": self._atendidos,
+            "recusados": self._recusados,
+            "espera_media_ms": round(1000 * self._espera_total / self._atendidos, 1) if self._atendidos else 0.0,
+            "espera_max_ms": round(1000 * self._espera_max, 1),
+            "execucao": {
+                modo: {"jobs": n, "media_ms": round(ms / n, 1)}
+                for modo, (n, ms) in self._execucoes.items()
+            },
+        }
+
+
+_fila = FilaSandbox(MAX_CONCURRENT, MAX_QUEUE)
+
+
+def metricas_fila() -> dict[str, Any]:
+    """Profundidade da fila e tempos de espera do sandbox neste worker."""
+    return _fila.metricas()
+
+
+def _preparar_workdir(
+    workdir: Path,
+    *,
+    class_path: str,
+    hiperparametros: dict[str, Any],
+    X_train: pd.DataFrame,
+    y_train: Optional[pd.Series],
+    is_clustering: bool,
+    pre_processamento: Optional[list[dict[str, Any]]],
+    max_ram_mb: int,
+    max_cpu_sec: int,
+) -> tuple[list[str], dict[str, str]]:
+    """Grava dados + spec para o filho e devolve ``(cmd, env)`` do subprocesso."""
+    if not is_clustering and y_train is None:
+        raise SandboxError(
+            "y_train obrigatório para treino supervisionado.", "config"
+        )
+    formato = gravar_dados(workdir, X_train, None if is_clustering else y_train)
+
+    spec = {
+        **formato,
+        "class_path": class_path,
+        "hiperparametros": hiperparametros,
+        "is_clustering": is_clustering,
+        "pre_processamento": pre_processamento or [],
+        "max_ram_mb": max_ram_mb,
+        "max_cpu_sec": max_cpu_sec,
+    }
+    (workdir / "spec.json").write_text(json.dumps(spec, default=str))
+
+    cmd = [sys.executable, "-m", "app.sandbox.child", str(workdir)]
+    env = os.environ.copy()
+    # Garante que o filho encontre o pacote `app` mesmo se uvicorn alterou cwd.
+    env["PYTHONPATH"] = str(_REPO_ROOT) + os.pathsep + env.get("PYTHONPATH", "")
+    return cmd, env
+
+
+def _coletar_resultado(workdir: Path, returncode: Optional[int], stderr: bytes) -> TrainResult:
+    """Lê o que o filho deixou no workdir (ou explica por que não deixou)."""
+    result_path = workdir / "result.json"
+    if not result_path.exists():
+        stderr_tail = (stderr or b"").decode("utf-8", errors="replace")[-2000:]
+        raise SandboxError(
+            f"Subprocesso terminou sem produzir result.json "
+            f"(exit={returncode}). stderr: {stderr_tail}",
+            "crash",
+        )
+
+    result = json.loads(result_path.read_text())
+    if not result.get("ok"):
+        raise SandboxError(
+            result.get("error", "erro desconhecido no subprocesso"),
+            result.get("error_type", "exception"),
+        )
+
+    model_path = workdir / "model.joblib"
+    if not model_path.exists():
+        raise SandboxError("Modelo não foi gerado pelo subprocesso.", "crash")
+
+    return TrainResult(
+        model_bytes=model_path.read_bytes(),
+        classes=result.get("classes", []),
+        params=result.get("params", {}),
+        model_repr=result.get("model_repr", ""),
+    )
 
 
 def executar_treinamento(
@@ -64,31 +251,24 @@ def executar_treinamento(
     max_cpu_sec: int = DEFAULT_MAX_CPU_SEC,
     max_wall_sec: int = DEFAULT_MAX_WALL_SEC,
 ) -> TrainResult:
-    """Roda o fit em subprocesso isolado e devolve modelo serializado + metadados."""
-    workdir = Path(tempfile.mkdtemp(prefix="iana_sandbox_"))
-    try:
-        X_train.to_pickle(workdir / "X_train.pkl")
-        if not is_clustering:
-            if y_train is None:
-                raise SandboxError(
-                    "y_train obrigatório para treino supervisionado.", "config"
-                )
-            y_train.to_pickle(workdir / "y_train.pkl")
-
-        spec = {
-            "class_path": class_path,
-            "hiperparametros": hiperparametros,
-            "is_clustering": is_clustering,
-            "pre_processamento": pre_processamento or [],
-            "max_ram_mb": max_ram_mb,
-            "max_cpu_sec": max_cpu_sec,
-        }
-        (workdir / "spec.json").write_text(json.dumps(spec, default=str))
+    """Roda o fit em subprocesso isolado e devolve modelo serializado + metadados.
 
-        cmd = [sys.executable, "-m", "app.sandbox.child", str(workdir)]
-        env = os.environ.copy()
-        # Garante que o filho encontre o pacote `app` mesmo se uvicorn alterou cwd.
-        env["PYTHONPATH"] = str(_REPO_ROOT) + os.pathsep + env.get("PYTHONPATH", "")
+    Bloqueia a thread chamadora; dentro de um handler async use
+    :func:`executar_treinamento_async`."""
+    workdir = novo_workdir(X_train, y_train)
+    try:
+        cmd, env = _preparar_workdir(
+            workdir,
+            class_path=class_path,
+            hiperparametros=hiperparametros,
+            X_train=X_train,
+            y_train=y_train,
+            is_clustering=is_clustering,
+            pre_processamento=pre_processamento,
+            max_ram_mb=max_ram_mb,
+            max_cpu_sec=max_cpu_sec,
+        )
+        inicio = time.monotonic()
         try:
             proc = subprocess.run(
                 cmd,
@@ -102,32 +282,170 @@ def executar_treinamento(
                 f"Treinamento excedeu o tempo limite de {max_wall_sec}s.",
                 "timeout",
             )
+        resultado = _coletar_resultado(workdir, proc.returncode, proc.stderr)
+        resultado.tempos = {"modo": "processo", "execucao_ms": round(1000 * (time.monotonic() - inicio), 1)}
+        return resultado
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+_zygotes: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Zygote]" = weakref.WeakKeyDictionary()
+_zygote_falhou_em = 0.0
+
+
+async def _zygote_do_loop() -> Optional["Zygote"]:
+    """Zygote pronto deste event loop (os pipes são do loop que o criou), subindo ou
+    trocando-o quando preciso. None quando desligado ou indisponível."""
+    global _zygote_falhou_em
+    if not ZYGOTE_ATIVO or time.monotonic() - _zygote_falhou_em < ZYGOTE_ESPERA_APOS_FALHA_SEC:
+        return None
+    # Import tardio: `python -m app.sandbox.zygote` importa este pacote antes de rodar o
+    # módulo como __main__, e tê-lo já em sys.modules faria o runpy reclamar.
+    from app.sandbox.zygote import Zygote
+
+    loop = asyncio.get_running_loop()
+    zygote = _zygotes.get(loop)
+    if zygote is None or not zygote.disponivel:
+        if zygote is not None:
+            zygote.aposentar()
+        zygote = _zygotes[loop] = Zygote(max_jobs=ZYGOTE_MAX_JOBS)
+    try:
+        await zygote.garantir_iniciado()
+    except Exception as e:
+        logger.warning("sandbox: zygote indisponível, usando processo novo por treino: %s", e)
+        _zygote_falhou_em = time.monotonic()
+        _zygotes.pop(loop, None)
+        return None
+    return zygote
+
+
+async def iniciar_zygote() -> None:
+    """Sobe o zygote no startup, para o primeiro treino não pagar os imports."""
+    await _zygote_do_loop()
+
+
+async def encerrar_zygote() -> None:
+    zygote = _zygotes.pop(asyncio.get_running_loop(), None)
+    if zygote is not None:
+        await zygote.encerrar()
+
+
+async def _encerrar(proc: asyncio.subprocess.Process) -> None:
+    if proc.returncode is None:
+        try:
+            proc.kill()
+        except ProcessLookupError:
+            pass
+        await proc.wait()
+
+
+async def _rodar_em_processo_novo(
+    cmd: list[str], env: dict[str, str], max_wall_sec: int
+) -> tuple[Optional[int], bytes]:
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        cwd=str(_REPO_ROOT),
+        env=env,
+    )
+    try:
+        _stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=max_wall_sec)
+    except (asyncio.TimeoutError, asyncio.CancelledError):
+        # Timeout, ou cliente foi embora (ou o servidor está desligando): o fit não serve
+        # a ninguém.
+        await _encerrar(proc)
+        raise
+    return proc.returncode, stderr
 
-        result_path = workdir / "result.json"
-        if not result_path.exists():
-            stderr_tail = proc.stderr.decode("utf-8", errors="replace")[-2000:]
-            raise SandboxError(
-                f"Subprocesso terminou sem produzir result.json "
-                f"(exit={proc.returncode}). stderr: {stderr_tail}",
-                "crash",
-            )
 
-        result = json.loads(result_path.read_text())
-        if not result.get("ok"):
+async def _executar_na_vez(
+    *, max_wall_sec: int, fila: FilaSandbox, **kwargs: Any
+) -> TrainResult:
+    espera = await fila.entrar()
+    if espera >= 1:
+        logger.info("sandbox: treino esperou %.1fs na fila (%s)", espera, fila.metricas())
+    workdir: Optional[Path] = None
+    try:
+        # Dentro do try: qualquer falha daqui em diante tem de devolver a vaga da fila.
+        workdir = novo_workdir(kwargs.get("X_train"), kwargs.get("y_train"))
+        # Serializar um dataset grande também é CPU: fora do loop.
+        cmd, env = await asyncio.to_thread(_preparar_workdir, workdir, **kwargs)
+        inicio = time.monotonic()
+        zygote = await _zygote_do_loop()
+        try:
+            if zygote is not None:
+                modo = "zygote"
+                returncode, _ms = await zygote.executar(workdir, max_wall_sec)
+                log = workdir / "stderr.log"
+                stderr = log.read_bytes() if log.exists() else b""
+            else:
+                modo = "processo"
+                returncode, stderr = await _rodar_em_processo_novo(cmd, env, max_wall_sec)
+        except asyncio.TimeoutError:
             raise SandboxError(
-                result.get("error", "erro desconhecido no subprocesso"),
-                result.get("error_type", "exception"),
+                f"Treinamento excedeu o tempo limite de {max_wall_sec}s.",
+                "timeout",
             )
+        except RuntimeError as e:
+            raise SandboxError(str(e), "crash")
+        execucao_ms = round(1000 * (time.monotonic() - inicio), 1)
+        resultado = await asyncio.to_thread(_coletar_resultado, workdir, returncode, stderr)
+        resultado.tempos = {"modo": modo, "fila_ms": round(1000 * espera, 1), "execucao_ms": execucao_ms}
+        fila.registrar_execucao(modo, execucao_ms)
+        logger.info("sandbox: treino %s", resultado.tempos)
+        return resultado
+    finally:
+        fila.sair()
+        if workdir is not None:
+            shutil.rmtree(workdir, ignore_errors=True)
 
-        model_path = workdir / "model.joblib"
-        if not model_path.exists():
-            raise SandboxError("Modelo não foi gerado pelo subprocesso.", "crash")
 
-        return TrainResult(
-            model_bytes=model_path.read_bytes(),
-            classes=result.get("classes", []),
-            params=result.get("params", {}),
-            model_repr=result.get("model_repr", ""),
+async def executar_treinamento_async(
+    *,
+    class_path: str,
+    hiperparametros: dict[str, Any],
+    X_train: pd.DataFrame,
+    y_train: Optional[pd.Series],
+    is_clustering: bool,
+    pre_processamento: Optional[list[dict[str, Any]]] = None,
+    max_ram_mb: int = DEFAULT_MAX_RAM_MB,
+    max_cpu_sec: int = DEFAULT_MAX_CPU_SEC,
+    max_wall_sec: int = DEFAULT_MAX_WALL_SEC,
+    desconectado: Optional[Callable[[], Awaitable[bool]]] = None,
+    fila: Optional[FilaSandbox] = None,
+) -> TrainResult:
+    """Mesmo contrato de :func:`executar_treinamento`, sem bloquear o event loop.
+
+    Espera a vez na fila do worker (o tempo de fila não conta para `max_wall_sec`).
+    Com `desconectado` (ex.: ``request.is_disconnected``), o pedido que perdeu o cliente
+    sai da fila ou tem o filho morto, e vira ``SandboxError(kind="cancelado")``.
+    """
+    tarefa = asyncio.ensure_future(
+        _executar_na_vez(
+            max_wall_sec=max_wall_sec,
+            fila=fila or _fila,
+            class_path=class_path,
+            hiperparametros=hiperparametros,
+            X_train=X_train,
+            y_train=y_train,
+            is_clustering=is_clustering,
+            pre_processamento=pre_processamento,
+            max_ram_mb=max_ram_mb,
+            max_cpu_sec=max_cpu_sec,
         )
-    finally:
-        shutil.rmtree(workdir, ignore_errors=True)
+    )
+    try:
+        if desconectado is None:
+            return await tarefa
+        while True:
+            feitas, _ = await asyncio.wait({tarefa}, timeout=INTERVALO_DESCONEXAO_SEC)
+            if feitas:
+                return tarefa.result()
+            if await desconectado():
+                tarefa.cancel()
+                await asyncio.gather(tarefa, return_exceptions=True)
+                raise SandboxError("Cliente desconectou; treinamento cancelado.", "cancelado")
+    except asyncio.CancelledError:
+        tarefa.cancel()
+        raise
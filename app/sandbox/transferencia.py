@@ -0,0 +1,164 @@
+"""Passagem de X/y do processo da API para o filho do sandbox.
+
+Dois formatos, escolhidos no pai e anotados no spec (`formato_dados`):
+
+- ``arrow`` (padrão): Arrow IPC sem compressão. O filho mapeia o arquivo (copy-on-write) e
+  monta o DataFrame apontando para as páginas dele — colunas numéricas sem nulos não são
+  copiadas. Com o workdir em tmpfs (`/dev/shm`), essas páginas já são memória: não há disco
+  no caminho do request.
+- ``pickle``: o protocolo antigo (`to_pickle`/`read_pickle`). Fica como fallback para o que o
+  Arrow não representa (coluna `object` com tipos misturados, por exemplo) e como opção
+  explícita (`SANDBOX_TRANSFER=pickle`).
+
+O modelo volta como `model.joblib` no mesmo workdir; com tmpfs, ler os bytes é só uma cópia
+de memória — e uma cópia é inevitável, porque o Mongo guarda `bytes`.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+FORMATOS = ("arrow", "pickle")
+FORMATO_PADRAO = os.environ.get("SANDBOX_TRANSFER", "arrow").strip().lower()
+if FORMATO_PADRAO not in FORMATOS:
+    FORMATO_PADRAO = "arrow"
+
+_TMPFS = "/dev/shm"
+# Base dos workdirs: SANDBOX_WORKDIR_DIR, senão /dev/shm quando existe e é gravável.
+WORKDIR_BASE: Optional[str] = os.environ.get("SANDBOX_WORKDIR_DIR") or (
+    _TMPFS if os.path.isdir(_TMPFS) and os.access(_TMPFS, os.W_OK) else None
+)
+# Folga exigida no tmpfs além do tamanho estimado dos dados (modelo, spec, stderr).
+_FOLGA_BYTES = 64 * 1024 * 1024
+
+_COLUNA_ALVO = "__alvo__"
+
+
+def _tamanho(dados) -> int:
+    # DataFrame.memory_usage devolve uma Series por coluna; Series.memory_usage, um int.
+    uso = dados.memory_usage(index=True, deep=False)
+    return int(uso.sum()) if hasattr(uso, "sum") else int(uso)
+
+
+def novo_workdir(*dfs: Any) -> Path:
+    """Cria o workdir do job, no tmpfs quando os dados cabem com folga.
+
+    O /dev/shm de um container costuma ter só 64 MB: sem a checagem, um dataset grande
+    estouraria o tmpfs no meio da escrita. Nesse caso o workdir vai para o temp padrão.
+    """
+    base = WORKDIR_BASE
+    if base:
+        estimado = sum(_tamanho(df) for df in dfs if df is not None)
+        try:
+            if shutil.disk_usage(base).free < 2 * estimado + _FOLGA_BYTES:
+                base = None
+        except OSError:
+            base = None
+    return Path(tempfile.mkdtemp(prefix="iana_sandbox_", dir=base))
+
+
+# ------------------------------------------------------------------ escrita (pai)
+def _gravar_arrow(df, caminho: Path) -> None:
+    import pyarrow as pa
+
+    if len({type(c) for c in df.columns}) > 1:
+        # O Arrow converteria os nomes para texto e o filho veria outras colunas.
+        raise ValueError("nomes de coluna de tipos misturados")
+    tabela = pa.Table.from_pandas(df, preserve_index=True)
+    with pa.OSFile(str(caminho), "wb") as destino:
+        with pa.ipc.new_file(destino, tabela.schema) as escritor:
+            escritor.write_table(tabela)
+
+
+def gravar_dados(workdir: Path, X, y=None, formato: Optional[str] = None) -> dict[str, Any]:
+    """Grava X (e y) no workdir e devolve os campos do spec que dizem ao filho como ler."""
+    formato = formato or FORMATO_PADRAO
+    if formato == "arrow":
+        try:
+            _gravar_arrow(X, workdir / "X_train.arrow")
+            if y is not None:
+                _gravar_arrow(y.rename(_COLUNA_ALVO).to_frame(), workdir / "y_train.arrow")
+            return {"formato_dados": "arrow", "y_nome": None if y is None else y.name}
+        except Exception as e:
+            # Arrow não representa tudo que o pandas aceita; o pickle representa.
+            logger.info("sandbox: dados sem representação Arrow (%s); usando pickle", e)
+            for nome in ("X_train.arrow", "y_train.arrow"):
+                (workdir / nome).unlink(missing_ok=True)
+
+    X.to_pickle(workdir / "X_train.pkl")
+    if y is not None:
+        y.to_pickle(workdir / "y_train.pkl")
+    return {"formato_dados": "pickle"}
+
+
+# ------------------------------------------------------------------ leitura (filho)
+def _visao_gravavel(mapa, endereco_base: int, coluna):
+    """Array numpy gravável sobre os bytes da coluna no mapeamento, ou None se não der.
+
+    Só colunas numéricas de um pedaço, sem nulos (bool é empacotado em bits; nulos pedem
+    máscara): exatamente as que o Arrow entregaria sem cópia, só que somente leitura.
+    """
+    import numpy as np
+    import pyarrow as pa
+
+    if coluna.num_chunks != 1 or coluna.null_count:
+        return None
+    if not (pa.types.is_integer(coluna.type) or pa.types.is_floating(coluna.type)):
+        return None
+    pedaco = coluna.chunk(0)
+    dtype = np.dtype(pedaco.type.to_pandas_dtype())
+    dados = pedaco.buffers()[1]
+    deslocamento = dados.address - endereco_base + pedaco.offset * dtype.itemsize
+    return np.frombuffer(mapa, dtype=dtype, count=len(pedaco), offset=deslocamento)
+
+
+def _ler_arrow(caminho: Path):
+    import mmap
+
+    import pandas as pd
+    import pyarrow as pa
+
+    # Mapeamento copy-on-write: as colunas apontam para as páginas do arquivo e só a página
+    # que alguém escrever vira cópia privada. O `to_pandas` sem cópia do Arrow devolve arrays
+    # somente leitura, e há estimador/transformer que pede `setflags(write=True)` no X.
+    with open(caminho, "rb") as arquivo:
+        mapa = mmap.mmap(arquivo.fileno(), 0, access=mmap.ACCESS_COPY)
+    buffer = pa.py_buffer(mapa)
+    tabela = pa.ipc.open_file(pa.BufferReader(buffer)).read_all()
+    # split_blocks evita consolidar colunas num bloco 2-D novo (que seria uma cópia).
+    df = tabela.to_pandas(split_blocks=True)
+
+    # O from_pandas põe as colunas de dados primeiro (o índice, quando gravado, vai no fim).
+    colunas = {}
+    for i in range(df.shape[1]):
+        visao = _visao_gravavel(mapa, buffer.address, tabela.column(i))
+        if visao is not None and visao.dtype == df.dtypes.iloc[i]:
+            colunas[i] = visao
+        else:
+            colunas[i] = df.iloc[:, i]  # o to_pandas já copiou (texto, nulos, bool...)
+    saida = pd.DataFrame(colunas, index=df.index, copy=False)
+    saida.columns = df.columns
+    return saida
+
+
+def ler_dados(workdir: Path, spec: dict):
+    """Devolve ``(X, y)`` no formato que o pai anotou no spec; y é None em clustering."""
+    if spec.get("formato_dados", "pickle") == "arrow":
+        X = _ler_arrow(workdir / "X_train.arrow")
+        y = None
+        caminho_y = workdir / "y_train.arrow"
+        if caminho_y.exists():
+            y = _ler_arrow(caminho_y)[_COLUNA_ALVO].rename(spec.get("y_nome"))
+        return X, y
+
+    import pandas as pd
+
+    X = pd.read_pickle(workdir / "X_train.pkl")
+    caminho_y = workdir / "y_train.pkl"
+    return X, (pd.read_pickle(caminho_y) if caminho_y.exists() else None)
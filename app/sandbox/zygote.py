@@ -0,0 +1,316 @@
+"""Zygote do sandbox: processo que já importou pandas/sklearn e faz fork de um filho por treino.
+
+Sem ele, cada treino paga `python -m app.sandbox.child` do zero — reimportar pandas, sklearn,
+joblib e o catálogo custa mais que o fit dos datasets de exemplo. O zygote importa tudo uma
+vez e, a cada pedido, faz `fork()`: o filho nasce com os módulos prontos (copy-on-write),
+aplica `_apply_limits` e roda o mesmo `child.main` — allowlist de `_instanciar` incluída.
+
+Por que um fork por treino e não workers reaproveitados: RLIMIT_CPU conta a CPU de toda a vida
+do processo, então um worker reutilizado herdaria o consumo dos treinos anteriores; e um
+estouro de RLIMIT_AS deixaria o processo num estado em que não dá para confiar. Descartar o
+filho a cada treino mantém o isolamento de antes; quem é reciclado é o zygote (a cada
+`max_jobs` forks, ou quando morre).
+
+Protocolo (uma linha JSON por mensagem):
+- pai → zygote, stdin: ``{"id": n, "workdir": "..."}``;
+- zygote → pai, stdout: ``{"evento": "pronto"}``, ``{"evento": "iniciado", "id", "pid"}`` e
+  ``{"evento": "fim", "id", "exit", "ms"}``.
+EOF no stdin (pai saiu ou aposentou o zygote) encerra o zygote depois dos filhos em curso.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import select
+import signal
+import sys
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+_REPO_ROOT = Path(__file__).resolve().parents[2]
+
+# Quanto o pai espera o zygote terminar os imports antes de desistir dele.
+TIMEOUT_INICIO_SEC = 60
+
+
+# ------------------------------------------------------------------ lado do zygote
+def _preimportar() -> None:
+    """O que todo treino importaria: pandas/joblib/pyarrow, as famílias de estimadores do
+    catálogo e o próprio catálogo (allowlist)."""
+    import joblib  # noqa: F401
+    import numpy  # noqa: F401
+    import pandas  # noqa: F401
+    import pyarrow
+    import pyarrow.ipc  # noqa: F401  (leitura dos dados, ver transferencia.py)
+    from sklearn import (  # noqa: F401
+        cluster,
+        compose,
+        decomposition,
+        discriminant_analysis,
+        ensemble,
+        impute,
+        linear_model,
+        naive_bayes,
+        neighbors,
+        neural_network,
+        pipeline,
+        preprocessing,
+        svm,
+        tree,
+    )
+
+    from app.pre_processamento import catalogo  # noqa: F401
+    from app.sandbox import child  # noqa: F401
+
+    # A primeira conversão Arrow → pandas carrega o resto do pyarrow.pandas_compat (~40 ms);
+    # feita aqui, os filhos já nascem com ela paga.
+    pyarrow.table({"x": [0.0]}).to_pandas()
+
+
+def _enviar(msg: dict) -> None:
+    # os.write direto: sem o lock do sys.stdout, que um fork no meio de um print herdaria preso.
+    os.write(1, (json.dumps(msg) + "\n").encode())
+
+
+def _filho(workdir: str) -> None:
+    """Corpo do processo após o fork. Nunca retorna."""
+    codigo = 70
+    try:
+        # O filho não fala o protocolo: solta stdin/stdout do zygote e manda a saída dele para
+        # o workdir, de onde o pai lê o stderr quando o treino quebra.
+        log = os.open(os.path.join(workdir, "stderr.log"), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        nulo = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(nulo, 0)
+        os.dup2(log, 1)
+        os.dup2(log, 2)
+        sys.stdout = open(1, "w", closefd=False)
+        sys.stderr = open(2, "w", closefd=False)
+
+        from app.sandbox.child import main as rodar
+
+        codigo = rodar(workdir)
+    except BaseException:
+        import traceback
+
+        traceback.print_exc()
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(codigo)
+
+
+def _colher(vivos: dict[int, tuple[Any, float]]) -> None:
+    while vivos:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            return
+        if pid == 0:
+            return
+        job_id, inicio = vivos.pop(pid, (None, time.monotonic()))
+        _enviar({
+            "evento": "fim",
+            "id": job_id,
+            "exit": os.waitstatus_to_exitcode(status),
+            "ms": round(1000 * (time.monotonic() - inicio), 1),
+        })
+
+
+def main() -> int:
+    inicio = time.monotonic()
+    _preimportar()
+    _enviar({"evento": "pronto", "pid": os.getpid(), "import_ms": round(1000 * (time.monotonic() - inicio), 1)})
+
+    # Laço de uma thread só (select + waitpid não bloqueante): fork com outras threads
+    # vivas herdaria locks presos.
+    vivos: dict[int, tuple[Any, float]] = {}
+    buffer = b""
+    aberto = True
+    while aberto or vivos:
+        if aberto:
+            prontos, _, _ = select.select([0], [], [], 0.05)
+            if prontos:
+                bloco = os.read(0, 65536)
+                if not bloco:
+                    aberto = False
+                buffer += bloco
+                while b"\n" in buffer:
+                    linha, buffer = buffer.split(b"\n", 1)
+                    if not linha.strip():
+                        continue
+                    job = json.loads(linha)
+                    pid = os.fork()
+                    if pid == 0:
+                        _filho(job["workdir"])
+                    vivos[pid] = (job.get("id"), time.monotonic())
+                    _enviar({"evento": "iniciado", "id": job.get("id"), "pid": pid})
+        else:
+            time.sleep(0.05)
+        _colher(vivos)
+    return 0
+
+
+# ------------------------------------------------------------------ lado do pai (FastAPI)
+@dataclass
+class _Pedido:
+    iniciado: asyncio.Future
+    fim: asyncio.Future
+    pid: Optional[int] = None
+    matar: bool = False
+
+
+@dataclass
+class Zygote:
+    """Cliente de um processo zygote, preso ao event loop que o iniciou."""
+
+    max_jobs: int = 200
+    jobs: int = 0
+    import_ms: float = 0.0
+    _proc: Optional[asyncio.subprocess.Process] = None
+    _inicio: Optional[asyncio.Future] = None
+    _leitor: Optional[asyncio.Task] = None
+    _pendentes: dict[int, _Pedido] = field(default_factory=dict)
+    _aposentado: bool = False
+
+    @property
+    def disponivel(self) -> bool:
+        """Aceita treinos novos: vivo, não aposentado e abaixo de `max_jobs`."""
+        if self._aposentado or self.jobs >= self.max_jobs:
+            return False
+        if self._inicio is not None and self._inicio.done():
+            return (
+                self._inicio.exception() is None
+                and self._proc is not None
+                and self._proc.returncode is None
+            )
+        return True
+
+    async def garantir_iniciado(self) -> None:
+        # Quem chega durante a inicialização espera a mesma tarefa (não sobe dois zygotes).
+        if self._inicio is None:
+            self._inicio = asyncio.ensure_future(self._iniciar())
+        await asyncio.shield(self._inicio)
+
+    async def _iniciar(self) -> None:
+        env = os.environ.copy()
+        env["PYTHONPATH"] = str(_REPO_ROOT) + os.pathsep + env.get("PYTHONPATH", "")
+        self._proc = await asyncio.create_subprocess_exec(
+            sys.executable, "-m", "app.sandbox.zygote",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            cwd=str(_REPO_ROOT),
+            env=env,
+        )
+        try:
+            linha = await asyncio.wait_for(self._proc.stdout.readline(), TIMEOUT_INICIO_SEC)
+            msg = json.loads(linha) if linha else {}
+            if msg.get("evento") != "pronto":
+                raise RuntimeError(f"zygote não ficou pronto: {linha[:200]!r}")
+        except BaseException:
+            await self._matar_processo()
+            raise
+        self.import_ms = float(msg.get("import_ms") or 0.0)
+        self._leitor = asyncio.ensure_future(self._ler())
+        logger.info("sandbox: zygote pid=%s pronto (imports em %.0f ms)", msg.get("pid"), self.import_ms)
+
+    async def _ler(self) -> None:
+        assert self._proc is not None and self._proc.stdout is not None
+        while True:
+            linha = await self._proc.stdout.readline()
+            if not linha:
+                break
+            try:
+                msg = json.loads(linha)
+            except ValueError:
+                continue
+            pedido = self._pendentes.get(msg.get("id"))
+            if pedido is None:
+                continue
+            if msg.get("evento") == "iniciado":
+                pedido.pid = msg.get("pid")
+                if not pedido.iniciado.done():
+                    pedido.iniciado.set_result(pedido.pid)
+                if pedido.matar:
+                    self._matar_filho(pedido)
+            elif msg.get("evento") == "fim":
+                self._pendentes.pop(msg.get("id"), None)
+                if not pedido.fim.done():
+                    pedido.fim.set_result((msg.get("exit"), float(msg.get("ms") or 0.0)))
+                self._fechar_se_ocioso()
+        # O zygote morreu (ou foi aposentado): quem ainda esperava recebe o erro.
+        for pedido in self._pendentes.values():
+            if not pedido.fim.done():
+                pedido.fim.set_exception(RuntimeError("zygote do sandbox encerrou no meio do treino"))
+        self._pendentes.clear()
+
+    async def executar(self, workdir: Path, timeout: float) -> tuple[Optional[int], float]:
+        """Roda `child.main(workdir)` num fork. Devolve ``(exit, ms)``; `asyncio.TimeoutError`
+        depois de `timeout` s (o filho já foi morto)."""
+        await self.garantir_iniciado()
+        assert self._proc is not None and self._proc.stdin is not None
+        self.jobs += 1
+        job_id = self.jobs
+        loop = asyncio.get_running_loop()
+        pedido = _Pedido(iniciado=loop.create_future(), fim=loop.create_future())
+        self._pendentes[job_id] = pedido
+        self._proc.stdin.write((json.dumps({"id": job_id, "workdir": str(workdir)}) + "\n").encode())
+        await self._proc.stdin.drain()
+        try:
+            return await asyncio.wait_for(asyncio.shield(pedido.fim), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            # Timeout ou cliente que foi embora: o zygote colhe o filho e manda o "fim".
+            pedido.matar = True
+            self._matar_filho(pedido)
+            raise
+
+    @staticmethod
+    def _matar_filho(pedido: _Pedido) -> None:
+        if pedido.pid and not pedido.fim.done():
+            try:
+                os.kill(pedido.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+    def aposentar(self) -> None:
+        """Para de aceitar treinos; o processo sai quando os que estão rodando terminarem."""
+        self._aposentado = True
+        self._fechar_se_ocioso()
+
+    def _fechar_se_ocioso(self) -> None:
+        if (self._aposentado or self.jobs >= self.max_jobs) and not self._pendentes:
+            if self._proc is not None and self._proc.stdin is not None and not self._proc.stdin.is_closing():
+                self._proc.stdin.close()
+
+    async def encerrar(self) -> None:
+        self.aposentar()
+        for pedido in list(self._pendentes.values()):
+            self._matar_filho(pedido)
+        if self._proc is not None and self._proc.stdin is not None and not self._proc.stdin.is_closing():
+            self._proc.stdin.close()
+        if self._proc is not None:
+            try:
+                await asyncio.wait_for(self._proc.wait(), 5)
+            except asyncio.TimeoutError:
+                await self._matar_processo()
+        if self._leitor is not None:
+            await asyncio.gather(self._leitor, return_exceptions=True)
+
+    async def _matar_processo(self) -> None:
+        if self._proc is not None and self._proc.returncode is None:
+            try:
+                self._proc.kill()
+            except ProcessLookupError:
+                pass
+            await self._proc.wait()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
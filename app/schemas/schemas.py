@@ -62,6 +62,18 @@ class ReDivisaoColetaRequest(BaseModel):
     stratify: Optional[bool] = None
     target: Optional[str] = None
 
+class SessaoUploadCsvRequest(BaseModel):
+    """Abertura de um upload de CSV em partes: os mesmos campos do `POST /coleta_dados/csv`."""
+    filename: str
+    tipo: str = "treino"
+    test_size: Optional[float] = 0.2
+    shuffle: bool = True
+    stratify: bool = False
+    stratify_column: Optional[str] = None
+    id_coleta: Optional[str] = None
+    separador: str = "virgula"
+    encoding: str = "utf-8"
+
 class KnnRequestById(BaseModel):
     id_coleta: str
     hiperparametros: Optional[Dict[str, Any]] = Field(default_factory=dict)
@@ -1,10 +1,12 @@
 import os
+import time
+from collections import OrderedDict
 from contextvars import ContextVar
 from typing import Optional
 
 import jwt
 from dotenv import load_dotenv
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from jwt import PyJWTError
 from passlib.context import CryptContext
@@ -13,6 +15,7 @@ from passlib.context import CryptContext
 import passlib.handlers.bcrypt
 passlib.handlers.bcrypt.detect_wrap_bug = lambda ident: False
 
+from app import diretorio_usuarios
 from app.database import colecao_usuario
 
 # Carrega o .env apenas em ambiente local
@@ -64,6 +67,35 @@ def verificar_senha(
 # =========================
 # USUÁRIO AUTENTICADO
 # =========================
+# Toda rota autenticada fazia um `find_one` em `usuarios` — o documento inteiro, com o hash da
+# senha — e o front do tutor dispara várias por interação (chat, telemetria, preferências).
+# O documento validado fica em cache por worker, chaveado por (sub, iat) do token: um login
+# novo sempre relê o banco. As rotas que mudam o usuário (status, exclusão, preferências,
+# ativação) chamam `invalidar_usuario`, que só alcança o worker que atendeu; nos outros a
+# mudança vale em até ``USUARIO_CACHE_TTL_SEC`` — é a janela de revogação (0 desliga o cache).
+USUARIO_CACHE_TTL_SEC = float(os.getenv("USUARIO_CACHE_TTL_SEC", "30"))
+USUARIO_CACHE_MAX_ITENS = int(os.getenv("USUARIO_CACHE_MAX_ITENS", "10000"))
+# Nenhuma rota lê estes campos do usuário autenticado (login e convite buscam o próprio doc).
+_PROJECAO_USUARIO = {"senha": 0, "token_convite": 0}
+_usuarios_em_cache: "OrderedDict[tuple, tuple]" = OrderedDict()   # (sub, iat) -> (expira, doc)
+
+
+def invalidar_usuario(usuario_id=None, email: Optional[str] = None) -> None:
+    """Tira do cache deste worker as entradas do usuário (por `_id` e/ou e-mail), inclusive do
+    diretório de nomes (`app.diretorio_usuarios`)."""
+    if usuario_id is not None:
+        diretorio_usuarios.invalidar(usuario_id)
+    for chave, (_, doc) in list(_usuarios_em_cache.items()):
+        if (email is not None and chave[0] == email) or \
+                (usuario_id is not None and str(doc.get("_id")) == str(usuario_id)):
+            del _usuarios_em_cache[chave]
+
+
+def limpar_cache_usuarios() -> None:
+    """Esvazia o cache (testes)."""
+    _usuarios_em_cache.clear()
+
+
 async def get_usuario_atual(
     token: str = Depends(oauth2_scheme)
 ):
@@ -88,13 +120,28 @@ async def get_usuario_atual(
     except PyJWTError:
         raise credentials_exception
 
+    # Tokens emitidos antes do `iat` caem todos em (sub, None): o doc é o mesmo de qualquer forma.
+    chave = (email, payload.get("iat"))
+    agora = time.monotonic()
+    em_cache = _usuarios_em_cache.get(chave)
+    if em_cache is not None and em_cache[0] > agora:
+        _usuarios_em_cache.move_to_end(chave)
+        # Cópia rasa: um handler que troca `_id` por str não estraga a entrada dos outros.
+        return dict(em_cache[1])
+
     user_doc = await colecao_usuario.find_one(
-        {"email": email}
+        {"email": email}, _PROJECAO_USUARIO
     )
 
     if user_doc is None:
         raise credentials_exception
 
+    if USUARIO_CACHE_TTL_SEC > 0 and USUARIO_CACHE_MAX_ITENS > 0:
+        _usuarios_em_cache[chave] = (agora + USUARIO_CACHE_TTL_SEC, dict(user_doc))
+        _usuarios_em_cache.move_to_end(chave)
+        while len(_usuarios_em_cache) > USUARIO_CACHE_MAX_ITENS:
+            _usuarios_em_cache.popitem(last=False)
+
     return user_doc
 
 
@@ -106,11 +153,15 @@ async def get_usuario_atual(
 # propagar `Depends` em todos eles. Starlette roda cada request em seu próprio
 # contexto, então o valor é isolado por requisição.
 usuario_atual_ctx: ContextVar[Optional[dict]] = ContextVar("usuario_atual", default=None)
+# O Request vai junto pelo mesmo motivo: o treino precisa saber se o cliente desconectou
+# (para matar o subprocesso do sandbox) e os routers de modelo não recebem o Request.
+requisicao_atual_ctx: ContextVar[Optional[Request]] = ContextVar("requisicao_atual", default=None)
 
 
-async def definir_usuario_atual(usuario: dict = Depends(get_usuario_atual)) -> dict:
+async def definir_usuario_atual(request: Request, usuario: dict = Depends(get_usuario_atual)) -> dict:
     """Autentica (como get_usuario_atual) e ainda publica o usuário no ContextVar."""
     usuario_atual_ctx.set(usuario)
+    requisicao_atual_ctx.set(request)
     return usuario
 
 
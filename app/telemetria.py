@@ -0,0 +1,187 @@
+"""Escritor em lote da telemetria (`atividade_usuario`), fora do caminho do request.
+
+`registrar_atividade` fazia um `insert_one` aguardado por evento, dentro do handler: o chat, o
+treino e as auditorias esperavam o Mongo para responder ao aluno — e esta é a coleção de maior
+volume de escrita do sistema. Aqui os documentos entram numa fila do processo e uma tarefa em
+background os grava:
+
+- **em lote**: um `insert_many(ordered=False)` a cada ``TELEMETRIA_LOTE_MAX`` documentos ou a
+  cada ``TELEMETRIA_INTERVALO_SEC``, o que vier primeiro. ``ordered=False`` deixa um documento
+  ruim falhar sozinho, sem levar o resto do lote;
+- **com teto**: a fila guarda no máximo ``TELEMETRIA_MAX_FILA`` documentos. Com o Mongo lento, o
+  gravador fica para trás (uma escrita em voo por vez) e, passado o teto, eventos novos são
+  descartados e contados — telemetria nunca vira fila sem fim na memória nem trava o request;
+- **escoada no desligamento**: o shutdown da API grava o que restou (``encerrar``), com prazo.
+
+O timestamp de cada evento é o da criação do documento, não o da gravação. Os contadores
+(``estatisticas``) saem em `GET /sistema/filas` (admin e professor). Quem precisa dos eventos
+já gravados (o retrato do progresso das turmas soma os chats) se registra com `ao_gravar` e
+recebe, depois de cada lote, só os documentos que o Mongo aceitou.
+
+``TELEMETRIA_ESCRITA=direta`` grava na hora, no próprio request (o comportamento antigo, em um
+`insert_many` só) — é o modo dos testes, que olham a coleção mockada logo após a chamada.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from itertools import islice
+from typing import Awaitable, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+MODO = os.getenv("TELEMETRIA_ESCRITA", "fila").strip().lower()
+MAX_FILA = int(os.getenv("TELEMETRIA_MAX_FILA", "20000"))
+LOTE_MAX = int(os.getenv("TELEMETRIA_LOTE_MAX", "500"))
+INTERVALO_SEC = float(os.getenv("TELEMETRIA_INTERVALO_SEC", "1"))
+PRAZO_ENCERRAR_SEC = 10.0
+# Um aviso de descarte por intervalo, não um por evento: com o Mongo fora seriam milhares.
+_AVISO_A_CADA_SEC = 60.0
+
+_fila: deque = deque()
+_contagem = {"enfileirados": 0, "gravados": 0, "descartados": 0, "falhas": 0, "lotes": 0}
+_tarefa: Optional[asyncio.Task] = None
+_sinal: Optional[asyncio.Event] = None
+_ultimo_aviso = 0.0
+_ao_gravar: List[Callable[[List[dict]], Awaitable[None]]] = []
+
+
+def _colecao():
+    # Import tardio (como em limite_taxa.py): o módulo continua importável sem MONGO_URL.
+    from app import database
+    return database.atividade_usuario
+
+
+def ao_gravar(fn: Callable[[List[dict]], Awaitable[None]]):
+    """Registra `fn(docs)`, aguardada depois de cada lote com os eventos que foram gravados."""
+    if fn not in _ao_gravar:
+        _ao_gravar.append(fn)
+    return fn
+
+
+async def _gravar(docs: List[dict]) -> None:
+    gravados = docs
+    try:
+        await _colecao().insert_many(docs, ordered=False)
+    except Exception as e:
+        # Com ordered=False, um BulkWriteError ainda grava o resto: conta só o que falhou.
+        erros = (getattr(e, "details", None) or {}).get("writeErrors") or []
+        falhos = {erro.get("index") for erro in erros}
+        gravados = [d for i, d in enumerate(docs) if i not in falhos] if erros else []
+        _contagem["falhas"] += len(docs) - len(gravados)
+        logger.warning("Falha ao gravar %d evento(s) de atividade: %s", len(docs) - len(gravados), e)
+    finally:
+        _contagem["lotes"] += 1
+    _contagem["gravados"] += len(gravados)
+    if not gravados:
+        return
+    # Fora do request, como o resto, e fora do `try` do insert: quem ouve recebe só o que foi
+    # gravado, e a falha de um ouvinte não conta como falha de gravação.
+    for fn in list(_ao_gravar):
+        try:
+            await fn(gravados)
+        except Exception as e:
+            logger.warning("Telemetria: %s falhou após o lote: %s", getattr(fn, "__name__", fn), e)
+
+
+async def _descarregar() -> None:
+    while _fila:
+        # Sai da fila só depois de gravado: um cancelamento no meio (shutdown) não perde o lote.
+        lote = list(islice(_fila, LOTE_MAX))
+        await _gravar(lote)
+        for _ in lote:
+            _fila.popleft()
+
+
+async def _laco(sinal: asyncio.Event) -> None:
+    while True:
+        try:
+            await asyncio.wait_for(sinal.wait(), INTERVALO_SEC)
+        except asyncio.TimeoutError:
+            pass
+        sinal.clear()
+        await _descarregar()
+
+
+def _garantir_gravador() -> asyncio.Event:
+    """Sobe a tarefa de gravação no event loop corrente (uma por loop; os testes trocam de loop)."""
+    global _tarefa, _sinal
+    loop = asyncio.get_running_loop()
+    if _tarefa is None or _tarefa.done() or _tarefa.get_loop() is not loop:
+        _sinal = asyncio.Event()
+        _tarefa = loop.create_task(_laco(_sinal))
+    return _sinal
+
+
+def _avisar_descarte() -> None:
+    global _ultimo_aviso
+    agora = time.monotonic()
+    if agora - _ultimo_aviso >= _AVISO_A_CADA_SEC:
+        _ultimo_aviso = agora
+        logger.warning("Fila de telemetria cheia (%d): descartando eventos (%d até agora)",
+                       MAX_FILA, _contagem["descartados"])
+
+
+async def registrar(docs: List[dict]) -> int:
+    """Entrega documentos de atividade para gravação. Devolve quantos foram aceitos.
+
+    Nunca levanta: telemetria é fire-and-forget. No modo ``fila`` só enfileira (não espera o
+    Mongo); o que não cabe no teto da fila é descartado e contado.
+    """
+    if not docs:
+        return 0
+    if MODO == "direta":
+        _contagem["enfileirados"] += len(docs)
+        await _gravar(list(docs))
+        return len(docs)
+
+    cabem = max(0, MAX_FILA - len(_fila))
+    aceitos = list(docs[:cabem])
+    if len(aceitos) < len(docs):
+        _contagem["descartados"] += len(docs) - len(aceitos)
+        _avisar_descarte()
+    if not aceitos:
+        return 0
+    _fila.extend(aceitos)
+    _contagem["enfileirados"] += len(aceitos)
+    sinal = _garantir_gravador()
+    if len(_fila) >= LOTE_MAX:
+        sinal.set()
+    return len(aceitos)
+
+
+async def encerrar() -> None:
+    """Para o gravador e grava o que restou na fila (shutdown da API), em até PRAZO_ENCERRAR_SEC."""
+    global _tarefa
+    if _tarefa is not None and not _tarefa.done():
+        _tarefa.cancel()
+        try:
+            await _tarefa
+        except (asyncio.CancelledError, Exception):
+            pass
+    _tarefa = None
+    try:
+        await asyncio.wait_for(_descarregar(), PRAZO_ENCERRAR_SEC)
+    except asyncio.TimeoutError:
+        logger.warning("Telemetria: %d evento(s) não gravados no desligamento", len(_fila))
+
+
+def estatisticas() -> dict:
+    return {"modo": MODO, "fila": len(_fila), "max_fila": MAX_FILA, **_contagem}
+
+
+def limpar() -> None:
+    """Esvazia a fila e zera os contadores, sem gravar (testes)."""
+    global _tarefa, _sinal
+    if _tarefa is not None and not _tarefa.done():
+        try:
+            _tarefa.cancel()
+        except RuntimeError:   # loop do teste anterior já fechado
+            pass
+    _tarefa = _sinal = None
+    _fila.clear()
+    for k in _contagem:
+        _contagem[k] = 0
@@ -0,0 +1,204 @@
+"""Agregados por hora da telemetria, para os painéis não varrerem `atividade_usuario` inteira.
+
+`/atividades/resumo`, `/atividades/tempo-preso` e o progresso da turma agregavam a coleção bruta
+(até 90 dias, sob o TTL) a cada abertura do painel — segundos de scan, e crescendo com o uso. Um
+compactador periódico resume a coleção em `atividade_rollup`: um documento por
+**hora × tipo × ação × usuário**, com
+
+- ``total`` e ``erros`` (status "erro");
+- ``n_dur``, ``soma_dur`` e ``max_dur`` dos eventos cronometrados (``duracao_ms`` presente),
+  e ``erros_dur`` — os erros entre eles, que é o que o `tempo-preso` conta.
+
+A **marca d'água** (documento ``_id: "marca_dagua"`` na mesma coleção) diz até que hora tudo já
+foi resumido. Na leitura, `estagios` monta o começo do pipeline: eventos brutos só das bordas do
+período (horas incompletas) e do que é posterior à marca, unidos (`$unionWith`) às horas
+resumidas — todos no mesmo formato (`_UNIFICADO`), então o resto do pipeline não sabe de onde
+veio cada linha. Sem marca (compactador ainda não rodou, ou desligado) é o scan bruto de antes.
+
+O compactador refaz sempre a última hora já resumida (eventos que chegaram atrasados) e só
+resume horas fechadas há ``_ATRASO`` — o escritor em lote (`app/telemetria.py`) ainda pode
+estar com eventos dela na fila. O `$merge` substitui o documento da hora inteira, então rodar
+duas vezes (dois workers, ou um reinício no meio) não conta nada em dobro.
+
+Exige MongoDB 4.4+ (`$merge`, `$unionWith`). ``TELEMETRIA_ROLLUP_INTERVALO_SEC=0`` desliga.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+INTERVALO_SEC = float(os.getenv("TELEMETRIA_ROLLUP_INTERVALO_SEC", "300"))
+_COLECAO = "atividade_rollup"
+_MARCA = "marca_dagua"
+_ATRASO = timedelta(minutes=2)
+# A primeira compactação (90 dias de histórico) vai em passos de um dia: cada um avança a marca,
+# então um reinício no meio continua de onde parou.
+_PASSO = timedelta(days=1)
+_HORA = timedelta(hours=1)
+
+# Evento bruto no formato de um documento de rollup (uma linha = um evento).
+_UNIFICADO = {
+    "tipo": 1,
+    "acao": 1,
+    "usuario_id": 1,
+    "total": {"$literal": 1},
+    "erros": {"$cond": [{"$eq": ["$status", "erro"]}, 1, 0]},
+    # `$gt` com null: número passa; null e campo ausente, não (é o `$ne: None` do filtro antigo).
+    "n_dur": {"$cond": [{"$gt": ["$duracao_ms", None]}, 1, 0]},
+    "soma_dur": {"$ifNull": ["$duracao_ms", 0]},
+    "max_dur": "$duracao_ms",
+    "erros_dur": {"$cond": [{"$and": [{"$eq": ["$status", "erro"]},
+                                      {"$gt": ["$duracao_ms", None]}]}, 1, 0]},
+}
+_HORA_DO_EVENTO = {"$dateFromParts": {
+    "year": {"$year": "$timestamp"}, "month": {"$month": "$timestamp"},
+    "day": {"$dayOfMonth": "$timestamp"}, "hour": {"$hour": "$timestamp"},
+}}
+
+
+def _colecoes():
+    # Import tardio (como em telemetria.py): o módulo continua importável sem MONGO_URL.
+    from app import database
+    return database.atividade_usuario, database.atividade_rollup
+
+
+def _utc(dt: datetime) -> datetime:
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def _piso_hora(dt: datetime) -> datetime:
+    return _utc(dt).replace(minute=0, second=0, microsecond=0)
+
+
+def _teto_hora(dt: datetime) -> datetime:
+    piso = _piso_hora(dt)
+    return piso if piso == _utc(dt) else piso + _HORA
+
+
+async def marca_dagua() -> Optional[datetime]:
+    """Até que hora (exclusive) a telemetria já está resumida; None se nunca foi."""
+    _, rollup = _colecoes()
+    doc = await rollup.find_one({"_id": _MARCA})
+    return _utc(doc["ate"]) if doc and doc.get("ate") else None
+
+
+def faixas(inicio: Optional[datetime], fim: Optional[datetime],
+           marca: Optional[datetime]) -> tuple[Optional[dict], Optional[dict]]:
+    """Divide ``[inicio, fim]`` em (filtro dos eventos brutos, filtro das horas resumidas).
+
+    Só vai para o rollup a hora inteira dentro do período e anterior à marca; o resto (bordas e
+    o que é posterior à marca) fica com os brutos. Um filtro None quer dizer "nada daquele lado"
+    — exceto o bruto sem rollup, em que None é "sem restrição de tempo", como antes.
+    """
+    sem_rollup = None
+    if inicio or fim:
+        sem_rollup = {"timestamp": {**({"$gte": inicio} if inicio else {}),
+                                    **({"$lte": fim} if fim else {})}}
+    if marca is None:
+        return sem_rollup, None
+    h_ini = _teto_hora(inicio) if inicio else None
+    h_fim = min(marca, _piso_hora(fim)) if fim else marca
+    if h_ini is not None and h_fim <= h_ini:
+        return sem_rollup, None
+
+    bordas = []
+    if inicio and _utc(inicio) < h_ini:
+        bordas.append({"timestamp": {"$gte": inicio, "$lt": h_ini}})
+    bordas.append({"timestamp": {"$gte": h_fim, **({"$lte": fim} if fim else {})}})
+    bruto = bordas[0] if len(bordas) == 1 else {"$or": bordas}
+    horas = {"hora": {**({"$gte": h_ini} if h_ini else {}), "$lt": h_fim}}
+    return bruto, horas
+
+
+async def estagios(filtro: Optional[dict] = None, *, inicio: Optional[datetime] = None,
+                   fim: Optional[datetime] = None) -> list:
+    """Começo do pipeline (rodado em `atividade_usuario`) com linhas no formato `_UNIFICADO`.
+
+    `filtro` vale para os dois lados: só campos que o rollup também tem (tipo, acao, usuario_id).
+    Somar ``total``/``erros``/``n_dur``/``soma_dur`` e tirar o máximo de ``max_dur`` dá o mesmo
+    que a agregação sobre os eventos brutos.
+    """
+    filtro = dict(filtro or {})
+    bruto, horas = faixas(inicio, fim, await marca_dagua())
+    estagios_ = [{"$match": {**filtro, **(bruto or {})}}, {"$project": _UNIFICADO}]
+    if horas is not None:
+        estagios_.append({"$unionWith": {"coll": _COLECAO,
+                                         "pipeline": [{"$match": {**filtro, **horas}}]}})
+    return estagios_
+
+
+# ------------------------------------------------------------------ compactador
+
+async def _resumir(de: datetime, ate: datetime) -> None:
+    bruto, _ = _colecoes()
+    pipeline = [
+        {"$match": {"timestamp": {"$gte": de, "$lt": ate}}},
+        {"$project": {**_UNIFICADO, "hora": _HORA_DO_EVENTO}},
+        {"$group": {
+            "_id": {"hora": "$hora", "tipo": "$tipo", "acao": "$acao", "usuario_id": "$usuario_id"},
+            "total": {"$sum": "$total"},
+            "erros": {"$sum": "$erros"},
+            "n_dur": {"$sum": "$n_dur"},
+            "soma_dur": {"$sum": "$soma_dur"},
+            "max_dur": {"$max": "$max_dur"},
+            "erros_dur": {"$sum": "$erros_dur"},
+        }},
+        {"$addFields": {"hora": "$_id.hora", "tipo": "$_id.tipo", "acao": "$_id.acao",
+                        "usuario_id": "$_id.usuario_id"}},
+        {"$merge": {"into": _COLECAO, "on": "_id", "whenMatched": "replace",
+                    "whenNotMatched": "insert"}},
+    ]
+    async for _ in bruto.aggregate(pipeline):
+        pass
+
+
+async def compactar(agora: Optional[datetime] = None) -> int:
+    """Resume as horas fechadas desde a marca d'água e a avança. Devolve quantas horas resumiu."""
+    bruto, rollup = _colecoes()
+    ate = _piso_hora((agora or datetime.now(timezone.utc)) - _ATRASO)
+    marca = await marca_dagua()
+    if marca is not None:
+        de = marca - _HORA
+    else:
+        primeiro = await bruto.find_one({}, {"timestamp": 1}, sort=[("timestamp", 1)])
+        de = _piso_hora(primeiro["timestamp"]) if primeiro and primeiro.get("timestamp") else ate
+
+    horas = 0
+    while de < ate:
+        passo_ate = min(de + _PASSO, ate)
+        await _resumir(de, passo_ate)
+        # `$max`: dois workers compactando ao mesmo tempo nunca fazem a marca voltar.
+        await rollup.update_one({"_id": _MARCA}, {"$max": {"ate": passo_ate}}, upsert=True)
+        horas += int((passo_ate - de) / _HORA)
+        de = passo_ate
+    if marca is None and horas == 0:
+        await rollup.update_one({"_id": _MARCA}, {"$max": {"ate": ate}}, upsert=True)
+    return horas
+
+
+async def executar() -> None:
+    """Laço do compactador (startup da API). Falha de uma rodada só é logada: as leituras
+    continuam corretas, só caem mais para os brutos até a próxima."""
+    if INTERVALO_SEC <= 0:
+        return
+    while True:
+        try:
+            await compactar()
+        except Exception as e:
+            logger.warning("Compactação da telemetria falhou: %s", e)
+        await asyncio.sleep(INTERVALO_SEC)
+
+
+async def criar_indices(ttl_dias: int) -> None:
+    """Índices do rollup; o TTL acompanha a retenção dos eventos brutos (mesma privacidade)."""
+    _, rollup = _colecoes()
+    if ttl_dias > 0:
+        await rollup.create_index("hora", expireAfterSeconds=ttl_dias * 86400)
+    else:
+        await rollup.create_index("hora")
+    await rollup.create_index([("usuario_id", 1), ("tipo", 1), ("hora", 1)])
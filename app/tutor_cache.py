@@ -0,0 +1,174 @@
+"""Cache de respostas do tutor: a mesma pergunta, no mesmo cenário, não vai de novo ao LLM.
+
+Numa turma, trinta alunos perguntam "o que é overfitting?" com a mesma instrução de sistema e a
+mesma base de conhecimento — e cada pergunta era uma chamada ao provedor (paga, ou contada no
+limite do nível gratuito). A resposta é identificada por:
+
+- a **versão da instrução de sistema** (`hash_prompt` do texto vigente): o admin editou, a
+  chave mudou — em todos os workers, sem aviso nenhum entre eles;
+- o **hash do bloco da KB** (`bloco_kb`): muda com os itens do catálogo em uso e com o nível;
+- o **nível** (`nivel_do_contexto`) e o **papel** de quem pergunta (o prompt trata professor e
+  aluno de jeitos diferentes);
+- o **hash do contexto do pipeline** como entra no prompt (`_montar_contexto` da rota): métricas,
+  hiperparâmetros e o perfil dos dados (com valores reais das colunas) são do aluno. Fora da
+  chave, a resposta a "meu modelo está bom?" de um aluno era servida ao colega — com os dados do
+  primeiro e errada para o segundo;
+- a **pergunta normalizada** (caixa, acentos, pontuação e espaços não contam).
+
+A resposta só é reaproveitada entre alunos com o mesmo contexto (nenhum pipeline carregado, o
+mesmo ponto de partida da atividade) ou pelo mesmo aluno que repete a pergunta. Só entra no
+cache a **primeira pergunta da conversa** e só pergunta curta (``_MAX_PERGUNTA``): com
+histórico, a resposta depende do que veio antes.
+
+Dois níveis de busca:
+
+- **exato**, pela chave acima;
+- **semelhante** (opcional, ``TUTOR_CACHE_SIMILARIDADE`` > 0): n-gramas de caracteres num
+  `HashingVectorizer` do scikit-learn, comparados por cosseno com as perguntas guardadas no mesmo
+  cenário. Roda offline e sem índice para re-treinar: o hashing não tem vocabulário, então cada
+  pergunta nova é só mais uma linha. Desligado por padrão: n-grama de caractere não entende
+  sentido — "o que é underfitting?" tem cosseno 0,73 com "o que é overfitting?", quase o mesmo
+  de "o que significa overfitting" (0,77). O limiar é decisão de quem opera.
+
+Em memória, por processo, com TTL (``TUTOR_CACHE_TTL_SEC``) e LRU (``TUTOR_CACHE_MAX_ITENS``;
+0 desliga). Só entram respostas completas: erro, stream interrompido e resposta cortada no teto
+de tokens não são guardados.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.conteudo.kb_tutor_chat import hash_prompt
+from app.tutor_kb import nivel_do_contexto
+
+MAX_ITENS = int(os.getenv("TUTOR_CACHE_MAX_ITENS", "1000"))
+TTL_SEC = float(os.getenv("TUTOR_CACHE_TTL_SEC", str(6 * 3600)))
+# Cosseno mínimo para o nível "semelhante" (0 = desligado; 1 = só a mesma pergunta).
+SIMILARIDADE = float(os.getenv("TUTOR_CACHE_SIMILARIDADE", "0"))
+_MAX_PERGUNTA = 300
+
+Chave = Tuple[str, str]   # (cenário, pergunta normalizada)
+
+_itens: "OrderedDict[Chave, Dict[str, Any]]" = OrderedDict()
+_contagem = {"exato": 0, "semelhante": 0, "faltas": 0, "guardadas": 0}
+_vetorizador = None
+
+
+def normalizar(pergunta: str) -> str:
+    """Minúsculas, sem acento, sem pontuação, espaços colapsados."""
+    sem_acento = unicodedata.normalize("NFKD", pergunta or "").encode("ascii", "ignore").decode()
+    return " ".join(re.sub(r"[^\w\s]", " ", sem_acento.lower()).split())
+
+
+def _hash(texto: str) -> str:
+    return hashlib.sha256((texto or "").encode("utf-8")).hexdigest()[:16]
+
+
+def chave(mensagens: List[dict], *, prompt: str, kb: str, contexto: Any,
+          pipeline: str) -> Optional[Chave]:
+    """Chave do cache para a conversa, ou None quando ela não é cacheável.
+
+    `mensagens` são as da conversa, sem a de sistema (``{"role", "content"}``); `pipeline` é o
+    bloco "CONTEXTO DO PIPELINE" exatamente como vai no prompt.
+    """
+    if MAX_ITENS <= 0 or len(mensagens) != 1 or mensagens[0].get("role") != "user":
+        return None
+    pergunta = normalizar(mensagens[0].get("content") or "")
+    if not pergunta or len(pergunta) > _MAX_PERGUNTA:
+        return None
+    papel = contexto.get("papel_do_usuario") if isinstance(contexto, dict) else None
+    cenario = "|".join([
+        hash_prompt(prompt),
+        _hash(kb),
+        nivel_do_contexto(contexto),
+        str(papel or "aluno"),
+        _hash(pipeline),
+    ])
+    return cenario, pergunta
+
+
+def _vetor(pergunta: str):
+    global _vetorizador
+    if _vetorizador is None:
+        from sklearn.feature_extraction.text import HashingVectorizer
+
+        _vetorizador = HashingVectorizer(analyzer="char_wb", ngram_range=(3, 5),
+                                         n_features=2 ** 18, alternate_sign=False, norm="l2")
+    return _vetorizador.transform([pergunta])
+
+
+def _expirar(agora: float) -> None:
+    for k in [k for k, item in _itens.items() if item["expira_em"] <= agora]:
+        del _itens[k]
+
+
+def _mais_parecida(chave_cache: Chave) -> Optional[Chave]:
+    import scipy.sparse as sp
+
+    cenario, pergunta = chave_cache
+    candidatas = [k for k, item in _itens.items() if k[0] == cenario and item.get("vetor") is not None]
+    if not candidatas:
+        return None
+    matriz = sp.vstack([_itens[k]["vetor"] for k in candidatas])
+    notas = (matriz @ _vetor(pergunta).T).toarray().ravel()
+    melhor = int(notas.argmax())
+    return candidatas[melhor] if notas[melhor] >= SIMILARIDADE else None
+
+
+def buscar(chave_cache: Optional[Chave]) -> Optional[dict]:
+    """``{"resposta", "modelo", "tipo"}`` (tipo ``exato`` ou ``semelhante``), ou None."""
+    if chave_cache is None:
+        return None
+    _expirar(time.time())
+    tipo, achada = "exato", chave_cache if chave_cache in _itens else None
+    if achada is None and 0 < SIMILARIDADE < 1:
+        tipo, achada = "semelhante", _mais_parecida(chave_cache)
+    if achada is None:
+        _contagem["faltas"] += 1
+        return None
+    _itens.move_to_end(achada)
+    _contagem[tipo] += 1
+    item = _itens[achada]
+    return {"resposta": item["resposta"], "modelo": item["modelo"], "tipo": tipo}
+
+
+def guardar(chave_cache: Optional[Chave], resposta: str, modelo: str) -> None:
+    if chave_cache is None or not (resposta or "").strip() or MAX_ITENS <= 0:
+        return
+    _itens[chave_cache] = {
+        "resposta": resposta,
+        "modelo": modelo,
+        "expira_em": time.time() + TTL_SEC,
+        "vetor": _vetor(chave_cache[1]) if 0 < SIMILARIDADE < 1 else None,
+    }
+    _itens.move_to_end(chave_cache)
+    _contagem["guardadas"] += 1
+    while len(_itens) > MAX_ITENS:
+        _itens.popitem(last=False)
+
+
+def invalidar() -> None:
+    """Esquece todas as respostas (o admin mudou a instrução de sistema).
+
+    A chave já carrega a versão do prompt, então isto não é o que garante a invalidação: é o
+    que libera a memória das respostas que nunca mais seriam encontradas.
+    """
+    _itens.clear()
+
+
+def estatisticas() -> dict:
+    return {"itens": len(_itens), "max_itens": MAX_ITENS, "ttl_sec": TTL_SEC,
+            "similaridade": SIMILARIDADE, **_contagem}
+
+
+def limpar() -> None:
+    """`invalidar` + zera os contadores (testes)."""
+    _itens.clear()
+    for k in _contagem:
+        _contagem[k] = 0
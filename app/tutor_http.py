@@ -0,0 +1,161 @@
+"""Clientes HTTP do tutor: um `httpx.AsyncClient` por `base_url` de provedor, vivo enquanto a API vive.
+
+Cada mensagem do aluno abria um cliente novo — e, com ele, TCP + TLS novos até o provedor antes do
+primeiro token. Com um cliente por provedor (a `base_url` que `tutor_provedores.provedor_vigente`
+resolve), as conexões ficam no pool (keep-alive) e a segunda mensagem já sai por uma conexão
+aberta. A chave do provedor NÃO entra no cliente: vai nos cabeçalhos de cada chamada, porque a
+rotação de chaves troca de chave no meio da cadeia sem trocar de servidor.
+
+Configuração (`.env`):
+
+- ``TUTOR_HTTP_MAX_CONEXOES`` / ``TUTOR_HTTP_MAX_KEEPALIVE``: teto de conexões por provedor e
+  quantas ficam abertas ociosas (o teste de saúde dispara 8 em paralelo);
+- ``TUTOR_HTTP_KEEPALIVE_SEC``: quanto tempo uma conexão ociosa espera pelo próximo request;
+- ``TUTOR_HTTP2``: ``auto`` (padrão) liga HTTP/2 só se o pacote ``h2`` estiver instalado;
+  ``1`` exige (e o cliente cai para HTTP/1.1 com aviso se ele faltar); ``0`` desliga.
+
+O timeout continua sendo de cada chamada (listar modelos, teste de saúde, chat e stream têm
+prazos diferentes) e é passado no request, não no cliente.
+
+Métricas, por provedor (`estatisticas`): requests, conexões novas (o resto reaproveitou uma do
+pool), respostas em HTTP/2 e o tempo até o primeiro token do stream (`registrar_ttft`).
+"""
+from __future__ import annotations
+
+import importlib.util
+import logging
+import os
+import time
+from collections import deque
+from typing import Dict, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+MAX_CONEXOES = int(os.getenv("TUTOR_HTTP_MAX_CONEXOES", "20"))
+MAX_KEEPALIVE = int(os.getenv("TUTOR_HTTP_MAX_KEEPALIVE", "10"))
+KEEPALIVE_SEC = float(os.getenv("TUTOR_HTTP_KEEPALIVE_SEC", "60"))
+HTTP2 = os.getenv("TUTOR_HTTP2", "auto").strip().lower()
+# Prazo de quem não passa `timeout` na chamada; as chamadas do tutor sempre passam.
+TIMEOUT_PADRAO = 60.0
+# Quantos TTFTs entram na mediana/p95 de cada provedor.
+_JANELA_TTFT = 200
+
+_clientes: Dict[str, httpx.AsyncClient] = {}
+_metricas: Dict[str, dict] = {}
+
+
+def _normalizar(base_url: str) -> str:
+    return (base_url or "").rstrip("/")
+
+
+def _usar_http2() -> bool:
+    tem_h2 = importlib.util.find_spec("h2") is not None
+    if HTTP2 in ("0", "false", "nao", "não", "off"):
+        return False
+    if HTTP2 in ("1", "true", "sim", "on") and not tem_h2:
+        logger.warning("TUTOR_HTTP2 ligado, mas o pacote h2 não está instalado: usando HTTP/1.1")
+    return tem_h2
+
+
+def _metricas_de(base_url: str) -> dict:
+    if base_url not in _metricas:
+        _metricas[base_url] = {
+            "requests": 0,
+            "conexoes_novas": 0,
+            "respostas_http2": 0,
+            "ttft_ms": deque(maxlen=_JANELA_TTFT),
+        }
+    return _metricas[base_url]
+
+
+def _ganchos(base_url: str) -> dict:
+    """Event hooks que alimentam as métricas. A conexão nova é vista pelo `trace` do httpcore:
+    o evento `connect_tcp` só acontece quando o pool não tinha conexão para reaproveitar."""
+    metricas = _metricas_de(base_url)
+
+    async def _trace(evento: str, _info: dict) -> None:
+        if evento == "connection.connect_tcp.started":
+            metricas["conexoes_novas"] += 1
+
+    async def _no_request(request: httpx.Request) -> None:
+        metricas["requests"] += 1
+        request.extensions["trace"] = _trace
+
+    async def _na_resposta(response: httpx.Response) -> None:
+        if response.http_version == "HTTP/2":
+            metricas["respostas_http2"] += 1
+
+    return {"request": [_no_request], "response": [_na_resposta]}
+
+
+async def cliente(base_url: str) -> httpx.AsyncClient:
+    """O cliente compartilhado do provedor em `base_url` (criado na primeira chamada).
+
+    Não feche o cliente devolvido: ele é do processo e sai em `encerrar()`.
+    """
+    base_url = _normalizar(base_url)
+    existente = _clientes.get(base_url)
+    if existente is not None:
+        return existente
+    novo = httpx.AsyncClient(
+        timeout=TIMEOUT_PADRAO,
+        limits=httpx.Limits(
+            max_connections=MAX_CONEXOES,
+            max_keepalive_connections=MAX_KEEPALIVE,
+            keepalive_expiry=KEEPALIVE_SEC,
+        ),
+        http2=_usar_http2(),
+        event_hooks=_ganchos(base_url),
+    )
+    novo = await novo.__aenter__()
+    # Duas mensagens simultâneas podem criar o cliente ao mesmo tempo: fica o primeiro.
+    if base_url in _clientes:
+        await novo.__aexit__(None, None, None)
+        return _clientes[base_url]
+    _clientes[base_url] = novo
+    return novo
+
+
+def registrar_ttft(base_url: str, inicio: float) -> None:
+    """Anota o tempo entre `inicio` (`time.perf_counter()` antes do request) e o primeiro token."""
+    _metricas_de(_normalizar(base_url))["ttft_ms"].append((time.perf_counter() - inicio) * 1000)
+
+
+def _percentil(ordenados: list, fracao: float) -> Optional[float]:
+    if not ordenados:
+        return None
+    return round(ordenados[min(len(ordenados) - 1, int(fracao * len(ordenados)))], 1)
+
+
+def estatisticas() -> dict:
+    """Métricas por `base_url`; `reuso` é a fração de requests que não abriram conexão."""
+    saida = {}
+    for base_url, m in _metricas.items():
+        ttft = sorted(m["ttft_ms"])
+        saida[base_url] = {
+            "requests": m["requests"],
+            "conexoes_novas": m["conexoes_novas"],
+            "reuso": (round(1 - m["conexoes_novas"] / m["requests"], 3) if m["requests"] else None),
+            "respostas_http2": m["respostas_http2"],
+            "ttft_ms": {"n": len(ttft), "p50": _percentil(ttft, 0.5), "p95": _percentil(ttft, 0.95)},
+        }
+    return saida
+
+
+async def encerrar() -> None:
+    """Fecha as conexões de todos os provedores (shutdown da API)."""
+    clientes = list(_clientes.values())
+    _clientes.clear()
+    for c in clientes:
+        try:
+            await c.__aexit__(None, None, None)
+        except Exception as e:  # pragma: no cover - shutdown defensivo
+            logger.warning("tutor: falha ao fechar cliente HTTP: %s", e)
+
+
+def limpar() -> None:
+    """Esquece clientes e métricas sem fechar nada (testes: cada um tem seu event loop)."""
+    _clientes.clear()
+    _metricas.clear()
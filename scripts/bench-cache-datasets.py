@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""Compara o cache antigo dos datasets UCI/OpenML com o atual, e o prewarm serial com o paralelo.
+
+- ``pickle``: o cache antigo — `to_pickle` direto no nome final, `read_pickle` sem conferência;
+- ``feather``: o atual (`app.models.cache_datasets`) — escrita atômica com sha256 no manifesto,
+  leitura com ``memory_map``. A primeira leitura no processo confere o sha256 (``1ª leitura``);
+  as seguintes só conferem tamanho e mtime (``leitura``).
+
+O dataframe imita o adult (48 mil linhas, numéricas e categóricas em texto); ``--linhas`` muda
+o tamanho. O prewarm usa downloads de mentira (``--latencia`` segundos cada, nenhuma rede) para
+os datasets configurados, com 1 worker (o laço antigo) e com ``DATASET_PREWARM_WORKERS``.
+
+Uso:  python scripts/bench-cache-datasets.py [--linhas 48842] [--repeticoes 5] [--latencia 0.5]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+_AQUI = os.path.dirname(os.path.abspath(__file__))
+BACKEND = os.path.dirname(_AQUI)
+sys.path.insert(0, BACKEND)
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+from app.models import cache_datasets, dataset_loaders as dl  # noqa: E402
+
+
+def gerar_df(linhas: int) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({f"num{i}": rng.normal(size=linhas).round(3) for i in range(6)})
+    for i, n in enumerate((8, 16, 7, 14, 6, 5, 2, 41)):
+        df[f"cat{i}"] = rng.choice([f"valor_{j}" for j in range(n)], size=linhas)
+    df["income"] = rng.choice(["<=50K", ">50K"], size=linhas)
+    return df
+
+
+def cronometrar(funcao, repeticoes: int) -> float:
+    tempos = []
+    for _ in range(repeticoes):
+        t0 = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - t0)
+    return statistics.median(tempos)
+
+
+def medir_formatos(df: pd.DataFrame, repeticoes: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        raiz = Path(tmp)
+        pkl = raiz / "adult.pkl"
+        escrita_pkl = cronometrar(lambda: df.to_pickle(pkl), repeticoes)
+        leitura_pkl = cronometrar(lambda: pd.read_pickle(pkl), repeticoes)
+
+        arquivo = "adult.uci.feather"
+        escrita_fea = cronometrar(
+            lambda: cache_datasets.gravar(raiz, arquivo, df, dataset="adult", fonte="uci"), repeticoes)
+        primeiras = []
+        for _ in range(repeticoes):
+            cache_datasets._conferidos.clear()
+            t0 = time.perf_counter()
+            cache_datasets.ler(raiz, arquivo)
+            primeiras.append(time.perf_counter() - t0)
+        leitura_fea = cronometrar(lambda: cache_datasets.ler(raiz, arquivo), repeticoes)
+
+        print(f"{len(df)} linhas x {df.shape[1]} colunas")
+        print(f"{'formato':<8} {'MB':>6} {'escrita (ms)':>13} {'1ª leitura (ms)':>16} {'leitura (ms)':>13}")
+        print(f"{'pickle':<8} {pkl.stat().st_size / 2**20:>6.1f} {escrita_pkl * 1e3:>13.1f} "
+              f"{leitura_pkl * 1e3:>16.1f} {leitura_pkl * 1e3:>13.1f}")
+        print(f"{'feather':<8} {(raiz / arquivo).stat().st_size / 2**20:>6.1f} {escrita_fea * 1e3:>13.1f} "
+              f"{statistics.median(primeiras) * 1e3:>16.1f} {leitura_fea * 1e3:>13.1f}")
+
+
+def medir_prewarm(latencia: float) -> None:
+    df = gerar_df(1000)
+
+    def baixar(nome, ds=None):
+        time.sleep(latencia)
+        cache_datasets.gravar(dl.CACHE_DIR, dl._arquivo_cache_uci(nome), df, dataset=nome, fonte="uci")
+
+    dl.carregar_uci = baixar
+    dl.OPENML_SPECS = {}
+    print(f"\nprewarm de {len(dl.UCI_IDS)} datasets, {latencia:.2f} s de download cada")
+    for workers in (1, dl.PREWARM_WORKERS):
+        with tempfile.TemporaryDirectory() as tmp:
+            dl.CACHE_DIR = Path(tmp)
+            dl.PREWARM_WORKERS = workers
+            t0 = time.perf_counter()
+            dl.prewarm_uci_cache()
+            frio = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            dl.prewarm_uci_cache()
+            quente = time.perf_counter() - t0
+        print(f"  {workers} worker(s): {frio:.2f} s sem cache, {quente * 1e3:.0f} ms com o cache pronto")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--linhas", type=int, default=48842)
+    ap.add_argument("--repeticoes", type=int, default=5)
+    ap.add_argument("--latencia", type=float, default=0.5)
+    args = ap.parse_args()
+
+    medir_formatos(gerar_df(args.linhas), args.repeticoes)
+    medir_prewarm(args.latencia)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""Compara a memória e o tempo da ingestão por URL, antes e depois do download em spool.
+
+- ``antigo``: ``content += chunk`` em `bytes`, `decode` do arquivo inteiro, `read_csv` de um
+  `StringIO` e as três partes (completo/treino/teste) vivas ao mesmo tempo;
+- ``spool``: o atual — `SpooledTemporaryFile`, `parse_conteudo_df` lendo direto do arquivo,
+  download liberado antes da divisão e treino/teste materializados um de cada vez.
+
+Cada modo roda num processo NOVO (o pico de RSS, ``ru_maxrss``, não desce depois de subir) com
+o mesmo CSV gerado, entregue em pedaços de 64 KB como o `aiter_bytes` do httpx. Não toca rede
+nem Mongo: a gravação das partes é trocada por um `to_parquet` num buffer descartado. Importar
+o router exige as variáveis da API (``MONGO_URL``, ``SECRET_KEY``...); faltando, o script usa
+valores de mentira — nenhuma conexão é aberta.
+
+Uso:  python scripts/bench-ingestao-url.py [--mb 50] [--colunas 12]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+_AQUI = os.path.dirname(os.path.abspath(__file__))
+BACKEND = os.path.dirname(_AQUI)
+sys.path.insert(0, BACKEND)
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+_PEDACO = 64 * 1024
+
+_INGESTAO = """
+import io, json, resource, sys, time
+import pandas as pd
+from sklearn.model_selection import train_test_split
+
+caminho, modo, pedaco = sys.argv[1], sys.argv[2], int(sys.argv[3])
+
+def pedacos():
+    with open(caminho, "rb") as f:
+        while True:
+            b = f.read(pedaco)
+            if not b:
+                return
+            yield b
+
+def gravar(df):
+    df.to_parquet(io.BytesIO())
+
+if modo == "spool":   # import antes da linha de base: o custo dele não é da ingestão
+    import tempfile
+    import numpy as np
+    from app.coleta_dados.coleta_dados_url import _SPOOL_EM_MEMORIA, parse_conteudo_df
+
+base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+t0 = time.perf_counter()
+if modo == "antigo":
+    content = b""
+    for chunk in pedacos():
+        content += chunk
+    text = content.decode("utf-8")
+    df = pd.read_csv(io.StringIO(text), sep=",")
+    treino, teste = train_test_split(df, test_size=0.2, shuffle=True, random_state=42)
+    for parte in (df, treino, teste):
+        gravar(parte)
+else:
+    with tempfile.SpooledTemporaryFile(max_size=_SPOOL_EM_MEMORIA) as baixado:
+        for chunk in pedacos():
+            baixado.write(chunk)
+        df = parse_conteudo_df(baixado, "http://x/dados.csv", "text/csv")
+    idx_treino, idx_teste = train_test_split(np.arange(len(df)), test_size=0.2, shuffle=True,
+                                             random_state=42)
+    gravar(df)
+    for idx in (idx_treino, idx_teste):
+        parte = df.iloc[idx]
+        gravar(parte)
+        del parte
+seg = time.perf_counter() - t0
+pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({"seg": seg, "pico_mb": pico / 1024, "delta_mb": (pico - base) / 1024, "linhas": len(df)}))
+"""
+
+
+def gerar_csv(destino: str, mb: float, colunas: int) -> None:
+    rng = np.random.default_rng(0)
+    n = 20000
+    bloco = pd.DataFrame({f"x{i}": rng.normal(size=n).round(6) for i in range(colunas - 2)})
+    bloco["categoria"] = rng.choice(["alfa", "beta", "gama", "delta"], size=n)
+    bloco["contagem"] = rng.integers(0, 1000, size=n)
+    with open(destino, "w", encoding="utf-8") as f:
+        bloco.to_csv(f, index=False)
+        while f.tell() < mb * 1024 * 1024:
+            bloco.to_csv(f, index=False, header=False)
+
+
+def medir(caminho: str, modo: str) -> dict:
+    env = {"MONGO_URL": "mongodb://localhost:27017", "MONGO_DB": "bench",
+           "SECRET_KEY": "bench-ingestao-url", **os.environ}
+    saida = subprocess.run([sys.executable, "-c", _INGESTAO, caminho, modo, str(_PEDACO)],
+                           cwd=BACKEND, env=env, capture_output=True, text=True)
+    if saida.returncode != 0:
+        sys.exit(f"{modo}: falhou\n{saida.stderr}")
+    return json.loads(saida.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--mb", type=float, default=50)
+    ap.add_argument("--colunas", type=int, default=12)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        caminho = os.path.join(tmp, "dados.csv")
+        gerar_csv(caminho, args.mb, args.colunas)
+        tamanho = os.path.getsize(caminho) / 1024 / 1024
+        print(f"CSV: {tamanho:.1f} MB, {args.colunas} colunas")
+        print(f"{'modo':<8} {'linhas':>9} {'tempo (s)':>10} {'pico RSS (MB)':>14} {'acima do import (MB)':>21}")
+        for modo in ("antigo", "spool"):
+            r = medir(caminho, modo)
+            print(f"{modo:<8} {r['linhas']:>9} {r['seg']:>10.2f} {r['pico_mb']:>14.0f} {r['delta_mb']:>21.0f}")
+
+
+if __name__ == "__main__":
+    main()
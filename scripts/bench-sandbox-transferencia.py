@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""Compara os protocolos de passagem de dados para o filho do sandbox.
+
+- ``pickle/disco``: o protocolo antigo — `to_pickle` num tempdir comum, `read_pickle` no filho;
+- ``arrow/tmpfs``: o atual — Arrow IPC em /dev/shm, lido pelo filho com memory map.
+
+Para cada tamanho mede a escrita no pai, a leitura num processo NOVO (como o filho) e a
+memória PRIVADA que a leitura custou a ele (RssAnon). O RSS total engana aqui: as páginas do
+arquivo em tmpfs mapeadas pelo Arrow contam no RSS, mas são a mesma memória física do
+arquivo — não uma segunda cópia, como o DataFrame desempacotado do pickle. Com ``--e2e``
+mede também o `executar_treinamento` inteiro com um `DummyClassifier` (fit trivial: o tempo é
+quase todo passagem de dados e subida do processo).
+
+Uso:  python scripts/bench-sandbox-transferencia.py [--linhas 1000,10000,100000,1000000]
+                                                    [--colunas 20] [--repeticoes 3] [--e2e]
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+_AQUI = os.path.dirname(os.path.abspath(__file__))
+BACKEND = os.path.dirname(_AQUI)
+sys.path.insert(0, BACKEND)
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+from app.sandbox import executar_treinamento, transferencia  # noqa: E402
+
+MODOS = {
+    # nome: (formato, base do workdir)
+    "pickle/disco": ("pickle", None),
+    "arrow/tmpfs": ("arrow", transferencia.WORKDIR_BASE),
+}
+
+# Leitura num processo novo: é o que o filho faz, sem o cache de objetos do pai.
+_LEITOR = """
+import json, sys, time
+from pathlib import Path
+import pyarrow as pa, pyarrow.ipc, pandas
+from app.sandbox.transferencia import ler_dados
+
+# Como no zygote: imports e a primeira conversão Arrow -> pandas já pagos antes do treino.
+pa.table({"x": [0.0]}).to_pandas()
+
+def anon_mb():
+    for linha in open("/proc/self/status"):
+        if linha.startswith("RssAnon:"):
+            return int(linha.split()[1]) / 1024
+    return 0.0
+
+work = Path(sys.argv[1]); spec = json.loads(sys.argv[2])
+antes = anon_mb()
+t = time.perf_counter(); X, y = ler_dados(work, spec); float(X.sum().sum())
+print(json.dumps({"s": time.perf_counter() - t, "priv_mb": anon_mb() - antes}))
+"""
+
+
+def _dados(linhas, colunas):
+    # Colunas contíguas, como as de `df[atributos]` no treino (um array 2-D em ordem de linha
+    # daria colunas com stride e penalizaria o Arrow com uma cópia que o treino real não faz).
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame({f"f{i}": rng.normal(size=linhas) for i in range(colunas)})
+    y = pd.Series(rng.integers(0, 2, size=linhas), name="target")
+    return X, y
+
+
+def _medir(X, y, formato, base, repeticoes):
+    escrita, leitura, privada = [], [], []
+    for _ in range(repeticoes):
+        work = Path(tempfile.mkdtemp(prefix="bench_sandbox_", dir=base))
+        try:
+            t = time.perf_counter()
+            spec = transferencia.gravar_dados(work, X, y, formato=formato)
+            escrita.append(time.perf_counter() - t)
+            saida = subprocess.run(
+                [sys.executable, "-c", _LEITOR, str(work), json.dumps(spec, default=str)],
+                capture_output=True, text=True, check=True, cwd=BACKEND,
+            )
+            medida = json.loads(saida.stdout.strip().splitlines()[-1])
+            leitura.append(medida["s"])
+            privada.append(medida["priv_mb"])
+        finally:
+            shutil.rmtree(work, ignore_errors=True)
+    return statistics.median(escrita), statistics.median(leitura), max(privada)
+
+
+def _e2e(X, y, formato, repeticoes):
+    transferencia.FORMATO_PADRAO = formato
+    base_original = transferencia.WORKDIR_BASE
+    if formato == "pickle":
+        transferencia.WORKDIR_BASE = None
+    try:
+        tempos = []
+        for _ in range(repeticoes):
+            t = time.perf_counter()
+            executar_treinamento(
+                class_path="sklearn.dummy.DummyClassifier", hiperparametros={},
+                X_train=X, y_train=y, is_clustering=False,
+            )
+            tempos.append(time.perf_counter() - t)
+        return statistics.median(tempos)
+    finally:
+        transferencia.WORKDIR_BASE = base_original
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--linhas", default="1000,10000,100000,1000000")
+    ap.add_argument("--colunas", type=int, default=20)
+    ap.add_argument("--repeticoes", type=int, default=3)
+    ap.add_argument("--e2e", action="store_true", help="mede também o executar_treinamento inteiro")
+    args = ap.parse_args()
+
+    if not transferencia.WORKDIR_BASE:
+        print("aviso: sem tmpfs gravável; 'arrow/tmpfs' vai usar o temp padrão\n")
+
+    cab = f"{'linhas':>9}  {'modo':<13}{'MB':>8}{'escrita s':>11}{'leitura s':>11}{'privada filho MB':>18}"
+    if args.e2e:
+        cab += f"{'treino s':>10}"
+    print(cab)
+    for linhas in [int(n) for n in args.linhas.split(",")]:
+        X, y = _dados(linhas, args.colunas)
+        mb = (X.memory_usage().sum() + y.memory_usage()) / 2**20
+        for nome, (formato, base) in MODOS.items():
+            escrita, leitura, privada = _medir(X, y, formato, base, args.repeticoes)
+            linha = f"{linhas:>9}  {nome:<13}{mb:>8.1f}{escrita:>11.3f}{leitura:>11.3f}{privada:>18.0f}"
+            if args.e2e:
+                linha += f"{_e2e(X, y, formato, args.repeticoes):>10.2f}"
+            print(linha, flush=True)
+
+
+if __name__ == "__main__":
+    main()
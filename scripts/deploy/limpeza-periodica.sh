@@ -76,7 +76,7 @@ fi
 # conferência: se passar de uma geração por dataset, algo regrediu.
 CACHE_DS="$(cd "$(dirname "${BASH_SOURCE[0]}")/../.." && pwd)/dataset_cache"
 if [ -d "$CACHE_DS" ]; then
-  dup=$(ls "$CACHE_DS" 2>/dev/null | sed -n 's/^\(.*\)\.openml.*\.pkl$/\1/p' | sort | uniq -d | wc -l)
+  dup=$(ls "$CACHE_DS" 2>/dev/null | sed -n 's/^\(.*\)\.openml.*\.\(pkl\|feather\)$/\1/p' | sort | uniq -d | wc -l)
   echo "  dataset_cache: $(du -sh "$CACHE_DS" | cut -f1)$([ "$dup" -gt 0 ] && echo "  ATENÇÃO: $dup dataset(s) com mais de uma geração")"
 fi
 
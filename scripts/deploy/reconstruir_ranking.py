@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""Reconstrói o ranking materializado (`ranking_atividades`) a partir dos pipelines salvos.
+
+O ranking é mantido a cada submissão e, para uma atividade sem a marca `ranking_versao`, é
+reconstruído na primeira leitura. Este script faz tudo de uma vez: backfill no deploy que
+introduz a coleção (para a primeira aula não pagar a reconstrução de cada atividade), ou depois
+de corrigir dados de pipelines direto no banco. Idempotente: cada atividade é refeita inteira.
+
+Uso:
+    MONGO_URL=... MONGO_DB=... python scripts/deploy/reconstruir_ranking.py [--atividade ID]
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+_AQUI = os.path.dirname(os.path.abspath(__file__))
+BACKEND = os.path.dirname(os.path.dirname(_AQUI))
+sys.path.insert(0, BACKEND)
+
+
+async def main(atividade_id) -> int:
+    if not os.getenv("MONGO_URL") or not os.getenv("MONGO_DB"):
+        print("Defina MONGO_URL e MONGO_DB.", file=sys.stderr)
+        return 2
+    from bson import ObjectId
+    from app import database, ranking_atividades
+
+    await ranking_atividades.criar_indices()
+    if atividade_id:
+        a = await database.atividades.find_one({"_id": ObjectId(atividade_id)}, {"criterio": 1})
+        if not a:
+            print(f"Atividade {atividade_id} não encontrada.", file=sys.stderr)
+            return 1
+        print(f"{atividade_id}: {await ranking_atividades.reconstruir(a)} alunos no ranking.")
+        return 0
+    n_atividades, n_linhas = await ranking_atividades.reconstruir_todas()
+    print(f"{n_atividades} atividades reconstruídas, {n_linhas} linhas de ranking.")
+    return 0
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--atividade", help="Só esta atividade (id).")
+    sys.exit(asyncio.run(main(ap.parse_args().atividade)))
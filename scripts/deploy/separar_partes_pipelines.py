@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""Migra os pipelines antigos para o formato resumo + partes (`app/armazenamento/partes_pipeline.py`).
+
+Pipelines gravados antes da separação têm `resultadoColetaDado`, `resultadoTreinamento` e
+`resultadosDasAvaliacoes` inteiros no documento. Eles continuam legíveis como estão; migrar é o
+que deixa a listagem e a galeria leves. Para cada pipeline sem ``partes``, grava as partes
+pesadas e troca os campos pelo resumo — o mesmo caminho do `POST /pipelines/`.
+
+Relata o tamanho (BSON) dos documentos antes e depois, no total e no pior caso, e o que uma
+página da listagem (200) pesaria. Com ``--orfaos``, apaga também as partes que nenhum pipeline
+referencia (escrita interrompida, exclusão que falhou) criadas há mais de uma hora.
+
+Uso:
+    MONGO_URL=... MONGO_DB=... python scripts/deploy/separar_partes_pipelines.py [--apply] [--orfaos]
+Sem --apply é um dry-run (só mede). Idempotente: pipelines com ``partes`` são pulados.
+"""
+import argparse
+import asyncio
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+_AQUI = os.path.dirname(os.path.abspath(__file__))
+BACKEND = os.path.dirname(os.path.dirname(_AQUI))
+sys.path.insert(0, BACKEND)
+
+PAGINA_LISTAGEM = 200
+
+
+def _mb(n: float) -> str:
+    return f"{n / 1024 / 1024:.2f} MB"
+
+
+async def _orfaos(database, partes_pipeline, apply: bool) -> int:
+    limite = datetime.now(timezone.utc) - timedelta(hours=1)
+    orfaos = []
+    async for parte in database.pipelines_partes.find({"criado_em": {"$lt": limite}},
+                                                       {"pipeline_id": 1, "campo": 1}):
+        dono = await database.pipelines.find_one({"_id": parte["pipeline_id"]}, {"partes": 1})
+        ref = ((dono or {}).get("partes") or {}).get(parte.get("campo")) or {}
+        if ref.get("id") != parte["_id"]:
+            orfaos.append(parte["_id"])
+    if apply:
+        await partes_pipeline.apagar(orfaos)
+    return len(orfaos)
+
+
+async def main(apply: bool, orfaos: bool) -> int:
+    if not os.getenv("MONGO_URL") or not os.getenv("MONGO_DB"):
+        print("Defina MONGO_URL e MONGO_DB.", file=sys.stderr)
+        return 2
+    from app import database
+    from app.armazenamento import partes_pipeline
+
+    n = separados = 0
+    antes_total = depois_total = 0
+    antes_max = depois_max = 0
+    async for doc in database.pipelines.find({"partes": {"$exists": False}}):
+        n += 1
+        antes = partes_pipeline.tamanho(doc)
+        campos = {c: doc[c] for c in partes_pipeline.CAMPOS if c in doc}
+        resumo = {c: partes_pipeline.resumir(v) for c, v in campos.items()}
+        depois = partes_pipeline.tamanho({**doc, **resumo})
+        antes_total += antes
+        depois_total += depois
+        antes_max = max(antes_max, antes)
+        depois_max = max(depois_max, depois)
+        if not apply:
+            continue
+        inline, partes = await partes_pipeline.separar(doc["_id"], campos)
+        r = await database.pipelines.update_one(
+            {"_id": doc["_id"], "partes": {"$exists": False}},
+            {"$set": {**inline, "partes": partes}},
+        )
+        if r.modified_count == 0:
+            # Alguém regravou o pipeline no meio: as partes novas dele valem, as daqui não.
+            await partes_pipeline.apagar(p["id"] for p in partes.values())
+        elif partes:
+            separados += 1
+
+    if n:
+        media_antes, media_depois = antes_total / n, depois_total / n
+        print(f"{n} pipelines no formato antigo.")
+        print(f"  documentos: {_mb(antes_total)} -> {_mb(depois_total)} "
+              f"({100 * (1 - depois_total / max(antes_total, 1)):.0f}% a menos no documento)")
+        print(f"  maior documento: {antes_max / 1024:.1f} KB -> {depois_max / 1024:.1f} KB")
+        print(f"  página da listagem ({PAGINA_LISTAGEM}, pela média): "
+              f"{_mb(media_antes * PAGINA_LISTAGEM)} -> {_mb(media_depois * PAGINA_LISTAGEM)}")
+    else:
+        print("Nenhum pipeline no formato antigo.")
+    if apply:
+        print(f"{separados} pipelines com partes separadas.")
+        await partes_pipeline.criar_indices()
+    if orfaos:
+        verbo = "apagadas" if apply else "seriam apagadas"
+        print(f"Partes órfãs {verbo}: {await _orfaos(database, partes_pipeline, apply)}.")
+    if not apply:
+        print("Dry-run: rode com --apply para migrar.")
+    return 0
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--apply", action="store_true", help="Grava as mudanças (senão é dry-run).")
+    ap.add_argument("--orfaos", action="store_true", help="Também apaga partes sem referência.")
+    args = ap.parse_args()
+    sys.exit(asyncio.run(main(args.apply, args.orfaos)))
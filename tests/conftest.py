@@ -1,3 +1,4 @@
+import copy
 import os
 import tempfile
 import pytest
@@ -22,11 +23,91 @@ os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
 os.environ.setdefault("MONGO_DB", "test_db")
 # Isola o cache de datasets em um diretorio temporario para nao ler/gravar o cache real.
 os.environ.setdefault("DATASET_CACHE_DIR", tempfile.mkdtemp(prefix="dataset_cache_test_"))
+# Partes das coletas (Parquet) vao para disco temporario: o GridFS exigiria um Mongo real.
+os.environ.setdefault("DATASET_STORE", "disco")
+os.environ.setdefault("DATASET_STORE_DIR", tempfile.mkdtemp(prefix="dataset_store_test_"))
+# Referências dos blobs contadas no processo: a coleção do registro exigiria um Mongo real.
+os.environ.setdefault("DATASET_BLOBS_REGISTRO", "memoria")
+# Cada teste tem seu event loop e o zygote do sandbox é por loop: sobe-lo em todo teste de
+# treino só deixaria processos para trás. Os testes do zygote o ligam explicitamente.
+os.environ.setdefault("SANDBOX_ZYGOTE", "0")
+# Avaliação de modelos sem pool de processos (thread serial): os testes que trocam funções
+# de metricas.py com monkeypatch continuam valendo. O teste do pool o liga explicitamente.
+os.environ.setdefault("AVALIACAO_WORKERS", "0")
+# Limite de taxa só no contador local: o Mongo dos testes é mockado por coleção.
+os.environ.setdefault("LIMITE_TAXA_STORE", "memoria")
+# Sem cache do usuário autenticado: vários testes trocam o `find_one` de `usuarios` no meio
+# (aluno -> professor) com o mesmo token. Os testes do cache o ligam explicitamente.
+os.environ.setdefault("USUARIO_CACHE_TTL_SEC", "0")
+# Telemetria gravada na hora: os testes olham a coleção mockada logo depois da chamada.
+os.environ.setdefault("TELEMETRIA_ESCRITA", "direta")
 
 TEST_USER_ID = ObjectId()
 TEST_USER_EMAIL = "test@test.com"
 
 
+@pytest.fixture(autouse=True)
+def clientes_do_tutor_isolados():
+    """O cliente HTTP do tutor é por processo (keep-alive entre mensagens). Nos testes, cada
+    um tem seu event loop e seu `httpx.AsyncClient` falso: o registro começa vazio em todos."""
+    from app import tutor_http
+    tutor_http.limpar()
+    yield
+    tutor_http.limpar()
+
+
+@pytest.fixture(autouse=True)
+def limite_de_taxa_isolado():
+    """Todos os testes usam o mesmo usuário: o limite de um teste não pode vazar para o próximo."""
+    from app import limite_taxa
+    limite_taxa.limpar()
+    yield
+
+
+@pytest.fixture(autouse=True)
+def cache_de_usuarios_isolado():
+    """Alguns testes ligam o cache do usuário autenticado: a entrada não passa para o próximo.
+    O diretório de nomes também é esvaziado."""
+    from app import diretorio_usuarios
+    from app.security import limpar_cache_usuarios
+    limpar_cache_usuarios()
+    diretorio_usuarios.limpar()
+    yield
+    limpar_cache_usuarios()
+    diretorio_usuarios.limpar()
+
+
+@pytest.fixture(autouse=True)
+def datasets_exemplo_isolados():
+    """Vários testes trocam os carregadores com monkeypatch: um dataset de exemplo preparado num
+    teste (em memória ou no disco) não pode ser servido ao seguinte — nem as contagens de
+    referência dos blobs passar de um teste para o outro."""
+    from app.armazenamento import blobs, datasets_exemplo
+    datasets_exemplo.limpar(disco=True)
+    blobs.limpar()
+    yield
+    datasets_exemplo.limpar(disco=True)
+
+
+@pytest.fixture(autouse=True)
+def telemetria_isolada():
+    """A fila da telemetria é do processo: eventos de um teste não são gravados no seguinte."""
+    from app import telemetria
+    telemetria.limpar()
+    yield
+    telemetria.limpar()
+
+
+@pytest.fixture(autouse=True)
+def cache_do_tutor_isolado():
+    """Respostas do tutor ficam em cache por processo: uma pergunta repetida entre testes não
+    pode chegar respondida pelo cache a quem está testando a chamada ao provedor."""
+    from app import tutor_cache
+    tutor_cache.limpar()
+    yield
+    tutor_cache.limpar()
+
+
 @pytest.fixture
 def mock_user():
     return {
@@ -91,6 +172,173 @@ def _make_mock_collection():
     return col
 
 
+class CursorMemoria:
+    """Cursor assíncrono sobre uma lista: ``sort``/``skip``/``limit``, ``to_list`` e ``async for``."""
+
+    def __init__(self, docs):
+        self._docs = list(docs)
+
+    def sort(self, campos, direcao=None):
+        if isinstance(campos, str):
+            campos = [(campos, direcao or 1)]
+        # Estável: ordena da última chave para a primeira. None antes de valor, como no Mongo.
+        for campo, dir_ in reversed(campos):
+            self._docs.sort(key=lambda d: (d.get(campo) is not None, d.get(campo) or 0),
+                            reverse=dir_ < 0)
+        return self
+
+    def skip(self, n):
+        self._docs = self._docs[n:]
+        return self
+
+    def limit(self, n):
+        self._docs = self._docs[:n]
+        return self
+
+    async def to_list(self, length=None):
+        return list(self._docs)
+
+    def __aiter__(self):
+        self._it = iter(self._docs)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._it)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+def _cumpre(valor, cond):
+    if not isinstance(cond, dict):
+        return valor == cond
+    if "$in" in cond and valor not in cond["$in"]:
+        return False
+    if "$nin" in cond and valor in cond["$nin"]:
+        return False
+    if "$gt" in cond and (valor is None or not valor > cond["$gt"]):
+        return False
+    if "$lt" in cond and (valor is None or not valor < cond["$lt"]):
+        return False
+    if "$not" in cond and _cumpre(valor, cond["$not"]):
+        return False
+    return True
+
+
+def casa_filtro(doc, filtro):
+    """Filtro Mongo sobre um documento: igualdade, ``$in``/``$nin``/``$gt``/``$lt``/``$not``, ``$or``."""
+    for campo, cond in (filtro or {}).items():
+        if campo == "$or":
+            if not any(casa_filtro(doc, f) for f in cond):
+                return False
+        elif not _cumpre(doc.get(campo), cond):
+            return False
+    return True
+
+
+class ColecaoMemoria:
+    """Coleção Mongo em memória para os módulos que gravam de verdade (sessões de upload,
+    ranking materializado): ``docs`` é ``{_id: documento}``, à vista dos testes.
+
+    Cobre o que esses módulos usam — filtros de `casa_filtro`, ``$set`` (com caminho de um
+    ponto), ``$unset`` e ``$inc``, projeção de inclusão, ``ReplaceOne`` em `bulk_write`. Um
+    upsert cujo filtro não casa com o documento de mesmo ``_id`` colide, como no Mongo.
+    """
+
+    def __init__(self, docs=()):
+        self.docs = {d["_id"]: copy.deepcopy(d) for d in docs}
+
+    def _achados(self, filtro):
+        return [d for d in self.docs.values() if casa_filtro(d, filtro)]
+
+    @staticmethod
+    def _aplicar(doc, update):
+        for caminho, valor in update.get("$set", {}).items():
+            alvo, *resto = caminho.split(".")
+            if resto:
+                doc.setdefault(alvo, {})[resto[0]] = copy.deepcopy(valor)
+            else:
+                doc[alvo] = copy.deepcopy(valor)
+        for campo in update.get("$unset", {}):
+            doc.pop(campo, None)
+        for campo, n in update.get("$inc", {}).items():
+            doc[campo] = doc.get(campo, 0) + n
+
+    def find(self, filtro=None, projecao=None):
+        docs = copy.deepcopy(self._achados(filtro))
+        if projecao:
+            campos = {c.split(".")[0] for c, v in projecao.items() if v}
+            docs = [{k: v for k, v in d.items() if k == "_id" or k in campos} for d in docs]
+        return CursorMemoria(docs)
+
+    async def find_one(self, filtro=None, projecao=None):
+        return next(iter(self.find(filtro, projecao)._docs), None)
+
+    async def count_documents(self, filtro):
+        return len(self._achados(filtro))
+
+    async def insert_one(self, doc):
+        doc = copy.deepcopy(doc)
+        doc.setdefault("_id", ObjectId())
+        self.docs[doc["_id"]] = doc
+        return MagicMock(inserted_id=doc["_id"])
+
+    async def replace_one(self, filtro, doc, upsert=False):
+        from pymongo.errors import DuplicateKeyError
+
+        atual = self.docs.get(filtro["_id"])
+        if atual is not None and not casa_filtro(atual, filtro):
+            if upsert:
+                raise DuplicateKeyError(f"_id {filtro['_id']!r}")
+            return
+        if atual is not None or upsert:
+            self.docs[filtro["_id"]] = copy.deepcopy(doc)
+
+    async def bulk_write(self, operacoes, ordered=True):
+        from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+        erros = []
+        for i, op in enumerate(operacoes):
+            try:
+                await self.replace_one(op._filter, op._doc, upsert=op._upsert)
+            except DuplicateKeyError:
+                erros.append({"index": i, "code": 11000})
+        if erros:
+            raise BulkWriteError({"writeErrors": erros})
+
+    async def find_one_and_update(self, filtro, update, upsert=False, return_document=False):
+        doc = next(iter(self._achados(filtro)), None)
+        if doc is None:
+            if not upsert:
+                return None
+            doc = {k: v for k, v in filtro.items() if not k.startswith("$") and not isinstance(v, dict)}
+            doc.setdefault("_id", ObjectId())
+            self.docs[doc["_id"]] = doc
+        antes = copy.deepcopy(doc)
+        self._aplicar(doc, update)
+        # `ReturnDocument.AFTER` é True.
+        return copy.deepcopy(doc) if return_document else antes
+
+    async def update_one(self, filtro, update, upsert=False):
+        await self.find_one_and_update(filtro, update, upsert=upsert)
+
+    async def update_many(self, filtro, update):
+        for doc in self._achados(filtro):
+            self._aplicar(doc, update)
+
+    async def delete_one(self, filtro):
+        doc = next(iter(self._achados(filtro)), None)
+        if doc is not None:
+            del self.docs[doc["_id"]]
+        return MagicMock(deleted_count=int(doc is not None))
+
+    async def delete_many(self, filtro):
+        achados = self._achados(filtro)
+        for doc in achados:
+            del self.docs[doc["_id"]]
+        return MagicMock(deleted_count=len(achados))
+
+
 @pytest_asyncio.fixture
 async def client():
     from app.main import app
@@ -109,10 +357,18 @@ def mock_db(mock_user):
     mock_verif = _make_mock_collection()
     mock_pipeline = _make_mock_collection()
     mock_atividade = _make_mock_collection()
+    mock_rollup = _make_mock_collection()
     mock_mlflow_runs = _make_mock_collection()
     mock_erros = _make_mock_collection()
     mock_graficos = _make_mock_collection()
     mock_turmas = _make_mock_collection()
+    mock_partes = _make_mock_collection()
+    mock_evolucao = _make_mock_collection()
+    mock_progresso = _make_mock_collection()
+    for col in (mock_evolucao, mock_progresso):
+        for metodo in ("bulk_write", "replace_one", "update_many", "delete_many",
+                       "find_one_and_update"):
+            setattr(col, metodo, AsyncMock())
 
     # By default, return the test user for auth lookups
     mock_user_col.find_one = AsyncMock(return_value=mock_user)
@@ -168,6 +424,17 @@ def mock_db(mock_user):
         # um `from app.database import X` no topo exige patch com o nome LOCAL, senão o teste fala com
         # o Mongo real e a suíte pendura no timeout de conexão.
         patch("app.routers.pipelines.turmas", mock_turmas),
+        # O ranking materializado (`app/ranking_atividades.py`) resolve as coleções pelo módulo
+        # `app.database` na hora do uso, e é chamado por toda escrita de pipeline de atividade.
+        patch("app.database.atividades", _make_mock_collection()),
+        patch("app.database.ranking_atividades", _make_mock_collection()),
+        # Idem para as partes pesadas dos pipelines (`app/armazenamento/partes_pipeline.py`).
+        patch("app.database.pipelines_partes", mock_partes),
+        # E para o índice da evolução (`app/evolucao_alunos.py`): sem marca, a rota lê os pipelines.
+        patch("app.database.evolucao_alunos", mock_evolucao),
+        # E para o retrato do progresso das turmas (`app/progresso_turmas.py`): sem marca, a rota
+        # calcula a turma inteira com as coleções acima.
+        patch("app.database.progresso_turmas", mock_progresso),
         patch("app.routers.treinamento_base.arquivos", mock_arquivos),
         patch("app.routers.treinamento_base.configuracoes_treinamento", mock_config),
         patch("app.routers.treinamento_base.opcoes_modelos", mock_modelos),
@@ -185,6 +452,8 @@ def mock_db(mock_user):
         patch("app.routers.chat_tutor.historico_chat", _make_mock_collection()),
         patch("app.database.atividade_usuario", mock_atividade),
         patch("app.routers.atividade.atividade_usuario", mock_atividade),
+        # Sem marca d'água no rollup: os painéis leem os eventos brutos (o mock acima).
+        patch("app.database.atividade_rollup", mock_rollup),
         # `atividade.py` importa `turmas` no topo, e é ela que `_alunos_do_professor` usa para
         # escopar a telemetria por turma (LGPD). Sem o patch com o nome LOCAL, todo teste do ramo
         # do PROFESSOR fala com o Mongo real — mesmo padrão que deixou os dois 500 do treino
@@ -210,9 +479,13 @@ def mock_db(mock_user):
         "verificadores": mock_verif,
         "pipelines": mock_pipeline,
         "atividade": mock_atividade,
+        "atividade_rollup": mock_rollup,
         "mlflow_runs": mock_mlflow_runs,
         "graficos": mock_graficos,
         "turmas": mock_turmas,
+        "pipelines_partes": mock_partes,
+        "evolucao_alunos": mock_evolucao,
+        "progresso_turmas": mock_progresso,
     }
 
     for p in patches:
@@ -0,0 +1,156 @@
+"""Armazenamento das partes das coletas em Parquet (`app.armazenamento.datasets`).
+
+O conftest aponta `DATASET_STORE` para o disco temporário, então os testes exercitam o
+backend de disco de verdade; o Mongo continua mockado.
+"""
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from bson import ObjectId
+
+from app.armazenamento import (
+    DatasetIndisponivel, blobs, carregar_df, coletar_orfaos, contar_linhas, salvar_divisao, salvar_partes,
+)
+from app.armazenamento.datasets import apagar_refs, backend, ler_ref, salvar_df
+from app.funcoes_genericas.funcoes_genericas import df_para_base64
+
+
+def _df():
+    return pd.DataFrame({"x": [1, 2, 3], "y": [0.5, 1.5, 2.5], "classe": ["A", "B", "A"]})
+
+
+class TestSalvarELer:
+    @pytest.mark.asyncio
+    async def test_ida_e_volta_preserva_valores_e_tipos(self):
+        df = _df()
+        ref = await salvar_df(df)
+        assert ref["formato"] == "parquet" and ref["num_linhas"] == 3
+        lido = await ler_ref(ref)
+        pd.testing.assert_frame_equal(lido, df)
+
+    @pytest.mark.asyncio
+    async def test_coluna_com_tipos_misturados_nao_quebra_o_parquet(self):
+        """Planilhas reais trazem colunas com número e texto misturados; o Arrow recusaria."""
+        df = pd.DataFrame({"misto": [1, "dois", 3.0], "ok": [1, 2, 3]})
+        lido = await ler_ref(await salvar_df(df))
+        assert list(lido["misto"]) == ["1", "dois", "3.0"]
+        assert list(lido["ok"]) == [1, 2, 3]
+
+    @pytest.mark.asyncio
+    async def test_apagar_refs_solta_e_a_coleta_remove_o_blob(self):
+        refs = await salvar_partes({"treino": _df(), "teste": _df()})
+        await apagar_refs(refs.values())
+        assert await coletar_orfaos(timedelta(0)) == 1   # treino e teste eram o mesmo conteúdo
+        with pytest.raises(DatasetIndisponivel) as exc:
+            await ler_ref(refs["treino"])
+        assert exc.value.kind in ("ausente", "corrompido")
+
+    @pytest.mark.asyncio
+    async def test_blob_antigo_compartilhado_nao_e_apagado(self):
+        """Referências uuid dos datasets de exemplo, de antes do registro por conteúdo."""
+        be = backend()
+        ref = {"backend": be.nome, "chave": await be.gravar(b"x"), "compartilhado": True}
+        await apagar_refs([ref])
+        assert await be.ler(ref["chave"]) == b"x"
+
+
+class TestBlobsPorConteudo:
+    @pytest.mark.asyncio
+    async def test_mesmo_conteudo_e_um_blob_so_com_referencias_contadas(self):
+        a, b = await salvar_df(_df()), await salvar_df(_df())
+        assert a["chave"] == b["chave"] and a["chave"].startswith(a["hash"])
+        assert blobs.registro().entradas[a["chave"]]["refs"] == 2
+
+        await apagar_refs([a])
+        assert await coletar_orfaos(timedelta(0)) == 0   # `b` ainda aponta para ele
+        pd.testing.assert_frame_equal(await ler_ref(b), _df())
+
+        await apagar_refs([b])
+        assert await coletar_orfaos(timedelta(hours=1)) == 0   # dentro da carência
+        assert await coletar_orfaos(timedelta(0)) == 1
+
+    @pytest.mark.asyncio
+    async def test_regravar_conteudo_coletado_volta_a_gravar_os_bytes(self):
+        ref = await salvar_df(_df())
+        await apagar_refs([ref])
+        await coletar_orfaos(timedelta(0))
+        de_novo = await salvar_df(_df())
+        pd.testing.assert_frame_equal(await ler_ref(de_novo), _df())
+
+    @pytest.mark.asyncio
+    async def test_divisao_e_posicoes_sobre_o_completo(self):
+        df = pd.DataFrame({"x": range(10), "classe": list("ABABABABAB")})
+        refs = await salvar_divisao(df, np.array([7, 2, 5]), np.array([0, 9]))
+        treino = refs["treino"]
+        assert treino["base"] == refs["completo"] and treino["num_linhas"] == 3
+        assert treino["bytes"] < refs["completo"]["bytes"]
+        pd.testing.assert_frame_equal(await ler_ref(treino), df.iloc[[7, 2, 5]].reset_index(drop=True))
+        # A divisão segura o completo: soltar só a coleta do completo não o apaga.
+        assert blobs.registro().entradas[refs["completo"]["chave"]]["refs"] == 3
+        await apagar_refs([refs["completo"], refs["teste"]])
+        assert await coletar_orfaos(timedelta(0)) == 1   # só as posições do teste
+        assert list((await ler_ref(treino))["x"]) == [7, 2, 5]
+
+    @pytest.mark.asyncio
+    async def test_partes_da_mesma_coleta_leem_o_completo_uma_vez(self, monkeypatch):
+        from app.armazenamento import datasets
+        refs = await salvar_divisao(_df(), [0, 1], [2])
+        doc = {"_id": ObjectId(), "armazenamento": refs}
+        lidos = []
+        original = datasets.desserializar_df
+        monkeypatch.setattr(datasets, "desserializar_df", lambda d: lidos.append(1) or original(d))
+        bases = {}
+        treino = await carregar_df(None, "treino", doc=doc, bases=bases)
+        teste = await carregar_df(None, "teste", doc=doc, bases=bases)
+        assert (len(treino), len(teste), len(lidos)) == (2, 1, 1)
+
+
+class TestCarregarDf:
+    @pytest.mark.asyncio
+    async def test_le_pela_referencia_sem_tocar_no_base64(self):
+        refs = await salvar_partes({"treino": _df()})
+        doc = {"_id": ObjectId(), "armazenamento": refs, "content_treino_base64": "lixo"}
+        lido = await carregar_df(doc["_id"], "treino", doc=doc)
+        assert len(lido) == 3
+
+    @pytest.mark.asyncio
+    async def test_base64_antigo_e_migrado_na_primeira_leitura(self, mock_db):
+        doc = {"_id": ObjectId(), "content_teste_base64": df_para_base64(_df())}
+        arq_m = MagicMock(update_one=AsyncMock(return_value=MagicMock(modified_count=1)))
+        with patch("app.database.arquivos", arq_m):
+            lido = await carregar_df(doc["_id"], "teste", doc=doc)
+
+        assert list(lido["classe"]) == ["A", "B", "A"]
+        update = arq_m.update_one.await_args[0][1]
+        assert update["$unset"] == {"content_teste_base64": ""}
+        ref = update["$set"]["armazenamento.teste"]
+        assert doc["armazenamento"]["teste"] == ref     # a próxima leitura já usa o Parquet
+        assert len(await ler_ref(ref)) == 3
+
+    @pytest.mark.asyncio
+    async def test_completo_antigo_cai_no_treino(self, mock_db):
+        """Coletas antigas de XLSX não guardavam o completo — a redivisão relia o treino."""
+        doc = {"_id": ObjectId(), "content_treino_base64": df_para_base64(_df())}
+        with patch("app.database.arquivos", MagicMock(update_one=AsyncMock())):
+            assert len(await carregar_df(doc["_id"], "completo", doc=doc)) == 3
+
+    @pytest.mark.asyncio
+    async def test_sem_conteudo_levanta_ausente(self):
+        with pytest.raises(DatasetIndisponivel) as exc:
+            await carregar_df(ObjectId(), "teste", doc={"_id": ObjectId()})
+        assert exc.value.kind == "ausente"
+
+    @pytest.mark.asyncio
+    async def test_base64_acima_do_limite_levanta_grande(self):
+        doc = {"_id": ObjectId(), "content_treino_base64": "A" * (50 * 1024 * 1024 + 1)}
+        with pytest.raises(DatasetIndisponivel) as exc:
+            await carregar_df(doc["_id"], "treino", doc=doc)
+        assert exc.value.kind == "grande"
+
+    @pytest.mark.asyncio
+    async def test_contar_linhas_usa_o_metadado_da_referencia(self):
+        doc = {"armazenamento": {"teste": {"backend": "disco", "chave": "inexistente", "num_linhas": 7}}}
+        assert await contar_linhas(doc, "teste") == 7
@@ -0,0 +1,134 @@
+"""Cache endereçado por conteúdo das figuras da avaliação (`app.armazenamento.figuras`).
+
+Backend de disco num diretório temporário por teste; o Mongo continua mockado.
+"""
+import os
+import time
+from unittest.mock import AsyncMock
+
+import pytest
+
+from app.armazenamento import figuras
+from tests.test_metricas_avaliacao import _doc_modelo, _payload, _treinar_knn
+
+PREFIXO = "ab" * 32
+
+
+@pytest.fixture
+def cache_em_disco(tmp_path, monkeypatch):
+    monkeypatch.setattr(figuras, "STORE", "disco")
+    monkeypatch.setattr(figuras, "CACHE_DIR", tmp_path)
+    monkeypatch.setattr(figuras, "_caches", {})
+    monkeypatch.setattr(figuras, "_contas", {})
+    return tmp_path
+
+
+class TestCacheDeFiguras:
+    @pytest.mark.asyncio
+    async def test_ida_e_volta_por_prefixo(self, cache_em_disco):
+        await figuras.gravar_figuras(PREFIXO, {"silhouette": b"png-1", "metodo_cotovelo": b"png-2"})
+        await figuras.gravar_figuras("cd" * 32, {"silhouette": b"outro"})
+        assert await figuras.ler_figuras(PREFIXO) == {"silhouette": b"png-1", "metodo_cotovelo": b"png-2"}
+
+    @pytest.mark.asyncio
+    async def test_chave_fora_do_formato_nao_chega_ao_disco(self, cache_em_disco):
+        await figuras.gravar_figuras("../fora", {"silhouette": b"x"})
+        await figuras.gravar_figuras(PREFIXO, {"../../etc": b"x"})
+        assert list(cache_em_disco.iterdir()) == []
+        assert await figuras.ler_figuras("../fora") == {}
+
+    @pytest.mark.asyncio
+    async def test_poda_remove_as_usadas_ha_mais_tempo(self, cache_em_disco, monkeypatch):
+        monkeypatch.setattr(figuras, "MAX_BYTES", 250)
+        antiga, usada, nova = "01" * 32, "02" * 32, "03" * 32
+        await figuras.gravar_figuras(antiga, {"silhouette": b"a" * 100})
+        await figuras.gravar_figuras(usada, {"silhouette": b"b" * 100})
+        passado = time.time() - 60
+        for caminho in cache_em_disco.glob("*.png"):
+            os.utime(caminho, (passado, passado))
+        # Ler conta como uso: `usada` passa a ser a mais recente das duas.
+        assert await figuras.ler_figuras(usada)
+
+        await figuras.gravar_figuras(nova, {"silhouette": b"c" * 100})
+
+        assert await figuras.ler_figuras(antiga) == {}
+        assert await figuras.ler_figuras(usada) == {"silhouette": b"b" * 100}
+        assert await figuras.ler_figuras(nova) == {"silhouette": b"c" * 100}
+
+    @pytest.mark.asyncio
+    async def test_gravacao_abaixo_do_teto_nao_varre_o_cache(self, cache_em_disco, monkeypatch):
+        monkeypatch.setattr(figuras, "MAX_BYTES", 250)
+        varreduras = []
+        podar = figuras._CacheDisco._podar
+        monkeypatch.setattr(
+            figuras._CacheDisco, "_podar", lambda self, m: varreduras.append(m) or podar(self, m)
+        )
+        await figuras.gravar_figuras("01" * 32, {"silhouette": b"a" * 100})
+        await figuras.gravar_figuras("02" * 32, {"silhouette": b"b" * 100})
+        # Só a primeira mede (conta vazia); a segunda soma 200 <= 250 e segue.
+        assert len(varreduras) == 1
+
+        await figuras.gravar_figuras("03" * 32, {"silhouette": b"c" * 100})
+        assert len(varreduras) == 2  # a conta passou do teto: mede e poda
+        assert sum(p.stat().st_size for p in cache_em_disco.glob("*.png")) <= 250
+
+    @pytest.mark.asyncio
+    async def test_teto_zero_desliga_o_cache(self, cache_em_disco, monkeypatch):
+        monkeypatch.setattr(figuras, "MAX_BYTES", 0)
+        await figuras.gravar_figuras(PREFIXO, {"silhouette": b"png"})
+        assert await figuras.ler_figuras(PREFIXO) == {}
+
+
+class TestAvaliacaoUsaOCache:
+    @staticmethod
+    def _contar_renders(monkeypatch):
+        from app.metricas import metricas as metricas_mod
+
+        renders = []
+        original = metricas_mod._renderizar_visualizacao
+
+        def _contando(nome, factory):
+            renders.append(nome)
+            return original(nome, factory)
+
+        monkeypatch.setattr(metricas_mod, "_renderizar_visualizacao", _contando)
+        return renders
+
+    @pytest.mark.asyncio
+    async def test_reabrir_a_avaliacao_nao_renderiza_de_novo(
+        self, client, mock_db, auth_headers, cache_em_disco, monkeypatch
+    ):
+        renders = self._contar_renders(monkeypatch)
+        df, _, model_bytes = _treinar_knn()
+        doc = _doc_modelo(model_bytes, df)
+        mock_db["modelos"].find_one = AsyncMock(return_value=doc)
+
+        primeira = await client.post("/classificador/avaliar_modelos", headers=auth_headers, json=_payload(doc["_id"]))
+        feitos = len(renders)
+        segunda = await client.post("/classificador/avaliar_modelos", headers=auth_headers, json=_payload(doc["_id"]))
+
+        assert primeira.status_code == segunda.status_code == 200
+        assert feitos >= 3 and len(renders) == feitos
+        assert segunda.json()["_visualizacoes"] == primeira.json()["_visualizacoes"]
+
+    @pytest.mark.asyncio
+    async def test_tema_ou_dados_novos_renderizam_de_novo(
+        self, client, mock_db, auth_headers, cache_em_disco, monkeypatch
+    ):
+        from app.metricas import metricas as metricas_mod
+
+        renders = self._contar_renders(monkeypatch)
+        df, _, model_bytes = _treinar_knn()
+        doc = _doc_modelo(model_bytes, df)
+        mock_db["modelos"].find_one = AsyncMock(return_value=doc)
+        await client.post("/classificador/avaliar_modelos", headers=auth_headers, json=_payload(doc["_id"]))
+        feitos = len(renders)
+
+        monkeypatch.setattr(metricas_mod, "VERSAO_TEMA", "tema-novo")
+        await client.post("/classificador/avaliar_modelos", headers=auth_headers, json=_payload(doc["_id"]))
+        assert len(renders) == 2 * feitos
+
+        outro_teste = df.iloc[::-1].reset_index(drop=True)
+        mock_db["modelos"].find_one = AsyncMock(return_value=_doc_modelo(model_bytes, outro_teste))
+        await client.post("/classificador/avaliar_modelos", headers=auth_headers, json=_payload(doc["_id"]))
+        assert len(renders) == 3 * feitos
@@ -80,7 +80,7 @@ class TestRegistrarAtividade:
         assert resp.status_code == 200
         assert resp.json()["gravados"] == 1
         # usuário derivado do JWT, não do corpo
-        doc = mock_db["atividade"].insert_one.call_args.args[0]
+        doc = mock_db["atividade"].insert_many.call_args.args[0][0]
         assert doc["usuario_email"] == "test@test.com"
         assert doc["origem"] == "frontend"
 
@@ -89,7 +89,8 @@ class TestRateLimit:
     @pytest.mark.asyncio
     async def test_excesso_retorna_429(self, client, mock_db, auth_headers, monkeypatch):
         import app.routers.atividade as mod
-        mod._rate.clear()
+        from app import limite_taxa
+        limite_taxa.limpar()
         monkeypatch.setattr(mod, "_RATE_MAX", 2, raising=False)
         body = {"eventos": [{"tipo": "ui", "acao": "a"}, {"tipo": "ui", "acao": "b"}, {"tipo": "ui", "acao": "c"}]}
         resp = await client.post("/atividades/lote", headers=auth_headers, json=body)
@@ -99,7 +100,8 @@ class TestRateLimit:
     @pytest.mark.asyncio
     async def test_dentro_do_limite_grava(self, client, mock_db, auth_headers, monkeypatch):
         import app.routers.atividade as mod
-        mod._rate.clear()
+        from app import limite_taxa
+        limite_taxa.limpar()
         monkeypatch.setattr(mod, "_RATE_MAX", 10, raising=False)
         body = {"eventos": [{"tipo": "ui", "acao": "a"}, {"tipo": "ui", "acao": "b"}]}
         resp = await client.post("/atividades/lote", headers=auth_headers, json=body)
@@ -136,7 +138,7 @@ class TestValidacaoSchema:
             json={"tipo": "ui", "acao": "x", "timestamp_cliente": "não-iso"},
         )
         assert resp.status_code == 200
-        doc = mock_db["atividade"].insert_one.call_args.args[0]
+        doc = mock_db["atividade"].insert_many.call_args.args[0][0]
         assert doc["timestamp_cliente"] is None
 
 
@@ -279,8 +281,8 @@ class TestChatRegistraAtividade:
                 json={"mensagens": [{"role": "user", "content": "oi"}]},
             )
         assert resp.status_code == 200
-        assert mock_db["atividade"].insert_one.called
-        doc = mock_db["atividade"].insert_one.call_args.args[0]
+        assert mock_db["atividade"].insert_many.called
+        doc = mock_db["atividade"].insert_many.call_args.args[0][0]
         assert doc["tipo"] == "chat"
         assert doc["status"] == "sucesso"
         # payload compacto: preview/tamanho, não o conteúdo completo
@@ -298,13 +300,13 @@ class TestChatRegistraAtividade:
                 json={"mensagens": [{"role": "user", "content": "oi"}]},
             )
         assert resp.status_code == 502
-        doc = mock_db["atividade"].insert_one.call_args.args[0]
+        doc = mock_db["atividade"].insert_many.call_args.args[0][0]
         assert doc["status"] == "erro"
 
     @pytest.mark.asyncio
     async def test_falha_ao_registrar_nao_quebra_chat(self, client, mock_db, auth_headers, monkeypatch):
         monkeypatch.setenv("NVIDIA_API_KEY", "chave-de-teste")
-        mock_db["atividade"].insert_one = AsyncMock(side_effect=RuntimeError("db down"))
+        mock_db["atividade"].insert_many = AsyncMock(side_effect=RuntimeError("db down"))
         body = {"choices": [{"message": {"content": "ok"}}]}
         with patch("app.routers.chat_tutor.httpx.AsyncClient", _mock_async_client(200, body)):
             resp = await client.post(
@@ -0,0 +1,122 @@
+"""Cache em disco dos datasets UCI/OpenML (`app.models.cache_datasets`) e o prewarm paralelo."""
+import threading
+
+import pandas as pd
+import pytest
+
+from app.models import cache_datasets
+from app.models import dataset_loaders as dl
+
+
+def _df():
+    return pd.DataFrame({"a": [1.5, 2.5, None], "b": ["x", "y", "z"], "alvo": [0, 1, 0]})
+
+
+@pytest.fixture
+def cache_tmp(tmp_path, monkeypatch):
+    monkeypatch.setattr(dl, "CACHE_DIR", tmp_path)
+    monkeypatch.setattr(dl, "OFFLINE", False)
+    return tmp_path
+
+
+@pytest.fixture
+def uci_falso(monkeypatch):
+    """`fetch_ucirepo` contado, sem rede."""
+    import ucimlrepo
+    chamadas = []
+
+    def fetch(id):
+        import types
+        chamadas.append(id)
+        return types.SimpleNamespace(data=types.SimpleNamespace(original=_df()))
+
+    monkeypatch.setattr(ucimlrepo, "fetch_ucirepo", fetch)
+    return chamadas
+
+
+class TestManifesto:
+    def test_ida_e_volta_registra_no_manifesto(self, tmp_path):
+        entrada = cache_datasets.gravar(tmp_path, "x.uci.feather", _df(), dataset="x", fonte="uci",
+                                        download_seg=1.23456)
+
+        pd.testing.assert_frame_equal(cache_datasets.ler(tmp_path, "x.uci.feather"), _df())
+        manifesto = cache_datasets.ler_manifesto(tmp_path)
+        assert manifesto["x.uci.feather"] == entrada
+        assert (entrada["linhas"], entrada["colunas"], entrada["download_seg"]) == (3, 3, 1.235)
+        assert entrada["sha256"] == cache_datasets.sha256_arquivo(tmp_path / "x.uci.feather")
+        assert not list(tmp_path.glob("*.tmp"))
+
+    def test_arquivo_fora_do_manifesto_nao_e_servido(self, tmp_path):
+        cache_datasets.gravar(tmp_path, "x.uci.feather", _df(), dataset="x", fonte="uci")
+        cache_datasets.esquecer(tmp_path, ["x.uci.feather"])
+        assert cache_datasets.ler(tmp_path, "x.uci.feather") is None
+
+    def test_conteudo_alterado_com_o_mesmo_tamanho_e_recusado(self, tmp_path):
+        cache_datasets.gravar(tmp_path, "x.uci.feather", _df(), dataset="x", fonte="uci")
+        caminho = tmp_path / "x.uci.feather"
+        dados = bytearray(caminho.read_bytes())
+        dados[len(dados) // 2] ^= 0xFF
+        caminho.write_bytes(bytes(dados))
+        assert cache_datasets.ler(tmp_path, "x.uci.feather") is None
+
+    def test_sem_fcntl_grava_so_com_a_trava_entre_threads(self, tmp_path, monkeypatch):
+        # Windows: o módulo importa sem `fcntl` e o manifesto continua sendo gravado.
+        monkeypatch.setattr(cache_datasets, "fcntl", None)
+        cache_datasets.gravar(tmp_path, "x.uci.feather", _df(), dataset="x", fonte="uci")
+        pd.testing.assert_frame_equal(cache_datasets.ler(tmp_path, "x.uci.feather"), _df())
+
+
+class TestCarregadores:
+    def test_arquivo_truncado_e_baixado_de_novo(self, cache_tmp, uci_falso):
+        dl.carregar_uci("abalone")
+        arquivo = cache_tmp / dl._arquivo_cache_uci("abalone")
+        arquivo.write_bytes(arquivo.read_bytes()[:100])   # restart no meio de uma cópia
+
+        df = dl.carregar_uci("abalone")
+
+        assert len(uci_falso) == 2
+        pd.testing.assert_frame_equal(df, _df())
+        assert dl.carregar_uci("abalone") is not None and len(uci_falso) == 2   # íntegro de novo
+
+    def test_pickle_legado_vira_feather_sem_baixar(self, cache_tmp, uci_falso):
+        _df().to_pickle(cache_tmp / "abalone.pkl")
+
+        df = dl.carregar_uci("abalone")
+
+        assert uci_falso == []
+        pd.testing.assert_frame_equal(df, _df())
+        assert not (cache_tmp / "abalone.pkl").exists()
+        assert cache_datasets.ler_manifesto(cache_tmp)[dl._arquivo_cache_uci("abalone")]["fonte"] == "uci"
+
+    def test_offline_serve_do_manifesto_e_recusa_o_que_falta(self, cache_tmp, uci_falso, monkeypatch):
+        dl.carregar_uci("abalone")
+        monkeypatch.setattr(dl, "OFFLINE", True)
+
+        assert dl.carregar_uci("abalone") is not None
+        with pytest.raises(dl.DatasetForaDoCache):
+            dl.carregar_uci("mushroom")
+        assert len(uci_falso) == 1
+
+
+class TestPrewarm:
+    def test_baixa_em_paralelo_e_resume(self, cache_tmp, monkeypatch):
+        monkeypatch.setattr(dl, "UCI_IDS", {"a": 1, "b": 2, "c": 3})
+        monkeypatch.setattr(dl, "OPENML_SPECS", {})
+        monkeypatch.setattr(dl, "PREWARM_WORKERS", 3)
+        # Só passa se os três downloads estiverem em andamento ao mesmo tempo.
+        juntos = threading.Barrier(3, timeout=5)
+
+        def baixar(nome, ds=None):
+            juntos.wait()
+            if nome == "c":
+                raise ConnectionError("sem rede")
+            cache_datasets.gravar(cache_tmp, dl._arquivo_cache_uci(nome), _df(), dataset=nome, fonte="uci")
+
+        monkeypatch.setattr(dl, "carregar_uci", baixar)
+
+        resultado = dl.prewarm_uci_cache()
+
+        assert {n: r["status"] for n, r in resultado.items()} == {"a": "baixado", "b": "baixado", "c": "erro"}
+        # no restart, o que já está no manifesto só é conferido
+        monkeypatch.setattr(dl, "UCI_IDS", {"a": 1})
+        assert dl.prewarm_uci_cache()["a"]["status"] == "cache"
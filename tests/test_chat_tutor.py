@@ -329,7 +329,8 @@ class TestCadeiaDeFallback:
         # E o limitador de taxa TAMBÉM não: são 20 pedidos por minuto POR USUÁRIO, e todos os
         # testes de chat usam o mesmo. Com a suíte cheia, o 21º recebia 429 do nosso próprio
         # limitador e o teste falhava por um motivo que não tinha nada a ver com o que ele mede.
-        chat_tutor._rate_limits.clear()
+        from app import limite_taxa
+        limite_taxa.limpar()
 
     @pytest.mark.asyncio
     async def test_cai_para_o_proximo_quando_o_modelo_nao_esta_liberado(
@@ -492,7 +493,8 @@ class TestListaDeReservaConfigurada:
     def setup_method(self):
         from app.routers import chat_tutor
         chat_tutor._modelos_ruins.clear()   # o cache de 10 min não pode vazar entre testes
-        chat_tutor._rate_limits.clear()
+        from app import limite_taxa
+        limite_taxa.limpar()
 
     @pytest.mark.asyncio
     async def test_a_cadeia_obedece_a_lista_do_banco_e_nao_a_do_catalogo(
@@ -760,7 +762,8 @@ class TestStreamLlm:
     def setup_method(self):
         from app.routers import chat_tutor
         chat_tutor._modelos_ruins.clear()   # o cache de 10 min não pode vazar entre testes
-        chat_tutor._rate_limits.clear()
+        from app import limite_taxa
+        limite_taxa.limpar()
 
     @pytest.mark.asyncio
     async def test_404_no_escolhido_deixa_o_proximo_responder(self):
@@ -941,7 +944,8 @@ class TestRotacaoDeChave:
     def setup_method(self):
         from app.routers import chat_tutor
         chat_tutor._modelos_ruins.clear()   # o cache de 10 min não pode vazar entre testes
-        chat_tutor._rate_limits.clear()
+        from app import limite_taxa
+        limite_taxa.limpar()
         chat_tutor._chaves_ruins.clear()
 
     @pytest.mark.asyncio
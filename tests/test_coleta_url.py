@@ -51,3 +51,62 @@ async def test_endpoint_rejeita_url_interna(client, mock_db, auth_headers):
             headers=auth_headers,
         )
     assert resp.status_code == 400
+
+
+# ------------------------------------------------------------------ download em spool e parse
+
+from io import BytesIO  # noqa: E402
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+from app.coleta_dados import coleta_dados_url  # noqa: E402
+from app.coleta_dados.configuracao_treinamento import dividir_dataframe, dividir_indices  # noqa: E402
+from app.schemas.schemas import ReDivisaoColetaRequest  # noqa: E402
+
+
+@pytest.mark.parametrize("inicio, url, ct, esperado", [
+    (b"PK\x03\x04...", "https://x/baixar?id=1", "application/octet-stream", ("excel", "")),
+    (b"\xd0\xcf\x11\xe0...", "https://x/dados", "", ("excel", "")),
+    (b'\xef\xbb\xbf  [{"a": 1}]', "https://x/api", "text/plain", ("json", "")),
+    (b"a;b;c\n1;2;3\n", "https://x/dados.csv", "text/csv", ("csv", ";")),
+    (b"a,b\n1,2\n", "https://x/dados.txt", "text/plain", ("csv", ",")),
+    (b"a\tb\n1\t2\n", "https://x/dados.tsv", "", ("csv", "\t")),
+])
+def test_formato_pelos_primeiros_bytes(inicio, url, ct, esperado):
+    assert coleta_dados_url.detectar_formato(inicio, url, ct) == esperado
+
+
+def test_parse_direto_do_arquivo_com_fallback_latin1():
+    arquivo = BytesIO("nome;cidade\nJoão;São Paulo\nAna;Belém\n".encode("latin-1"))
+    df = coleta_dados_url.parse_conteudo_df(arquivo, "https://x/dados.csv", "text/csv")
+    assert list(df.columns) == ["nome", "cidade"]
+    assert df["cidade"].tolist() == ["São Paulo", "Belém"]
+
+
+class _Resposta:
+    def __init__(self, pedacos):
+        self._pedacos = pedacos
+
+    async def aiter_bytes(self):
+        for p in self._pedacos:
+            yield p
+
+
+@pytest.mark.asyncio
+async def test_download_para_no_limite_de_tamanho(monkeypatch):
+    monkeypatch.setattr(coleta_dados_url, "MAX_BYTES", 10)
+    destino = BytesIO()
+    with pytest.raises(HTTPException) as e:
+        await coleta_dados_url._baixar(_Resposta([b"12345", b"67890", b"x"]), destino)
+    assert e.value.status_code == 413
+    assert destino.getvalue() == b"1234567890"   # nada além do teto chega ao spool
+
+
+def test_indices_dao_a_mesma_divisao_que_o_dataframe():
+    df = pd.DataFrame({"x": np.arange(40), "y": ["a", "b"] * 20})
+    pedido = ReDivisaoColetaRequest(test_size=0.25, shuffle=True, stratify=True, target="y")
+    treino, teste, estratificou = dividir_dataframe(df, pedido)
+    idx_treino, idx_teste, estratificou_idx = dividir_indices(df, pedido)
+    assert estratificou and estratificou_idx
+    assert df.iloc[idx_treino].equals(treino) and df.iloc[idx_teste].equals(teste)
@@ -338,7 +338,8 @@ class TestCacheDoOpenml:
         spec = dl.OPENML_SPECS["titanic"]
         # geracao VIGENTE ja em cache (entao nao havera escrita)
         atual = dl._caminho_cache_openml("titanic", spec)
-        pd.DataFrame({"pclass": [1], "survived": ["1"]}).to_pickle(atual)
+        dl.cache_datasets.gravar(tmp_path, atual.name, pd.DataFrame({"pclass": [1], "survived": ["1"]}),
+                                 dataset="titanic", fonte="openml")
         # e um orfao de formato antigo
         orfao = tmp_path / "titanic.openml.pkl"
         orfao.write_bytes(b"x")
@@ -579,7 +579,7 @@ class TestProgressoComDesafios:
              patch("app.routers.turmas.atividades", ativ_m), \
              patch("app.routers.turmas.pipelines", pipes), \
              patch("app.routers.turmas.submissoes_montagem", subm), \
-             patch("app.routers.turmas.colecao_usuario", user_m), \
+             patch("app.database.colecao_usuario", user_m), \
              patch("app.routers.turmas.atividade_usuario",
                    MagicMock(aggregate=MagicMock(return_value=MagicMock(
                        to_list=AsyncMock(return_value=[]))))):
@@ -616,7 +616,7 @@ class TestRankingMontagem:
         with patch("app.routers.turmas.turmas", MagicMock(find_one=AsyncMock(return_value=turma))), \
              patch("app.routers.turmas.atividades", MagicMock(find_one=AsyncMock(return_value=atividade))), \
              patch("app.routers.turmas.submissoes_montagem", subm), \
-             patch("app.routers.turmas.colecao_usuario", user_m):
+             patch("app.database.colecao_usuario", user_m):
             r = await client.get(
                 f"/turmas/{turma['_id']}/atividades/{atividade['_id']}/ranking",
                 headers=auth_headers)
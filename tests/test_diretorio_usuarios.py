@@ -0,0 +1,69 @@
+"""Diretório de nomes dos usuários (`app.diretorio_usuarios`): projeção, lote e cache."""
+import asyncio
+
+import pytest
+from unittest.mock import MagicMock, patch
+from bson import ObjectId
+
+from app import diretorio_usuarios
+from app.security import invalidar_usuario
+from tests.conftest import ColecaoMemoria
+
+
+@pytest.fixture
+def usuarios():
+    colecao = ColecaoMemoria([{"_id": ObjectId(), "nome_usuario": f"Aluno {n}", "email": f"a{n}@x.com",
+                               "role": "aluno", "senha": "hash"} for n in range(3)])
+    colecao.find = MagicMock(side_effect=colecao.find)   # conta as consultas
+    with patch("app.database.colecao_usuario", colecao):
+        yield [str(i) for i in colecao.docs], colecao
+
+
+@pytest.mark.asyncio
+class TestDiretorio:
+    async def test_pedidos_simultaneos_viram_uma_consulta_projetada(self, usuarios):
+        ids, colecao = usuarios
+        a, b = await asyncio.gather(diretorio_usuarios.buscar(ids[:2]),
+                                    diretorio_usuarios.buscar(ids[1:] + ["nao-e-id"]))
+
+        colecao.find.assert_called_once()
+        filtro, projecao = colecao.find.call_args.args
+        assert sorted(map(str, filtro["_id"]["$in"])) == sorted(ids)
+        assert "senha" not in projecao
+        assert a[ids[0]] == {"nome": "Aluno 0", "email": "a0@x.com", "role": "aluno"}
+        assert set(b) == set(ids[1:])
+
+    async def test_segunda_leitura_vem_do_cache_e_so_busca_o_que_falta(self, usuarios):
+        ids, colecao = usuarios
+        await diretorio_usuarios.buscar(ids[:2])
+        colecao.find.reset_mock()
+
+        assert set(await diretorio_usuarios.buscar(ids)) == set(ids)
+        (filtro, _), _ = colecao.find.call_args
+        assert filtro["_id"]["$in"] == [ObjectId(ids[2])]
+
+        colecao.find.reset_mock()
+        await diretorio_usuarios.buscar(ids)
+        colecao.find.assert_not_called()
+
+    async def test_invalidar_usuario_tira_do_diretorio(self, usuarios):
+        ids, colecao = usuarios
+        await diretorio_usuarios.buscar(ids)
+        invalidar_usuario(usuario_id=ids[0])
+        colecao.find.reset_mock()
+
+        await diretorio_usuarios.buscar(ids)
+        (filtro, _), _ = colecao.find.call_args
+        assert filtro["_id"]["$in"] == [ObjectId(ids[0])]
+
+    async def test_inexistente_nao_entra_no_cache_e_erro_chega_a_quem_espera(self, usuarios):
+        ids, colecao = usuarios
+        ausente = str(ObjectId())
+        assert await diretorio_usuarios.buscar([ausente]) == {}
+        await diretorio_usuarios.buscar([ausente])
+        assert colecao.find.call_count == 2
+
+        colecao.find.side_effect = RuntimeError("mongo fora")
+        with pytest.raises(RuntimeError):
+            await asyncio.gather(diretorio_usuarios.buscar(ids), diretorio_usuarios.buscar(ids))
+        assert diretorio_usuarios._em_voo == {}
@@ -7,14 +7,12 @@ Três níveis, como pedido:
 - **integração**: carregar dataset → redividir duas vezes sem o dataset encolher, com o
   aviso e o valor efetivo chegando ao cliente.
 """
-import base64
-import io
-
 import pandas as pd
 import pytest
 from unittest.mock import AsyncMock, MagicMock, patch
 from bson import ObjectId
 
+from app.armazenamento.datasets import ler_ref
 from app.coleta_dados.configuracao_treinamento import (
     AVISO_SEM_ESTRATIFICACAO, aviso_estratificacao, dividir_dataframe,
 )
@@ -26,8 +24,8 @@ def _df(n_a=15, n_b=5, coluna="classe"):
     return pd.DataFrame({"x": range(n_a + n_b), coluna: ["A"] * n_a + ["B"] * n_b})
 
 
-def _ler(b64: str) -> pd.DataFrame:
-    return pd.read_excel(io.BytesIO(base64.b64decode(b64)))
+async def _ler(ref: dict) -> pd.DataFrame:
+    return await ler_ref(ref)
 
 
 def _pedido(**kw):
@@ -108,14 +106,14 @@ class TestVazamentoDatasetExemplo:
         assert r.status_code == 200
 
         doc = arq_m.insert_one.await_args[0][0]
-        completo, treino, teste = (_ler(doc["content_completo_base64"]),
-                                   _ler(doc["content_treino_base64"]),
-                                   _ler(doc["content_teste_base64"]))
+        completo, treino, teste = (await _ler(doc["armazenamento"]["completo"]),
+                                   await _ler(doc["armazenamento"]["treino"]),
+                                   await _ler(doc["armazenamento"]["teste"]))
 
         assert len(completo) == 150
         assert len(treino) + len(teste) == 150          # antes: 150 + 37
         assert len(treino) < len(completo)               # antes o treino era o dataframe todo
-        # disjunção por conteúdo (não há índice depois do to_excel/read_excel)
+        # disjunção por conteúdo (o merge ignora o índice)
         assert len(pd.merge(treino, teste, how="inner")) == 0
         # proporção de classes preservada nos dois lados (estratificado)
         for parte in (treino, teste):
@@ -129,7 +127,7 @@ class TestVazamentoDatasetExemplo:
 
     @pytest.mark.asyncio
     async def test_guarda_o_conteudo_completo_para_a_redivisao(self, client, mock_db, auth_headers):
-        """Sem `content_completo_base64`, a redivisão releria o treino já dividido e o
+        """Sem a parte `completo` guardada, a redivisão releria o treino já dividido e o
         dataset encolheria a cada mudança de proporção."""
         arq_m = MagicMock(insert_one=AsyncMock(return_value=MagicMock(inserted_id=ObjectId())))
         cfg_m = MagicMock(insert_one=AsyncMock(return_value=MagicMock(inserted_id=ObjectId())))
@@ -138,7 +136,7 @@ class TestVazamentoDatasetExemplo:
             await client.get("/toy_datasets/iris", headers=auth_headers)
 
         doc = arq_m.insert_one.await_args[0][0]
-        assert len(_ler(doc["content_completo_base64"])) == 150
+        assert len(await _ler(doc["armazenamento"]["completo"])) == 150
         cfg = cfg_m.insert_one.await_args[0][0]
         assert cfg["shuffle"] is True and cfg["stratify"] is True
 
@@ -154,7 +152,7 @@ class TestVazamentoDatasetExemplo:
         if r.status_code == 404:
             pytest.skip("dataset de regressão indisponível neste ambiente")
         doc = arq_m.insert_one.await_args[0][0]
-        treino, teste = _ler(doc["content_treino_base64"]), _ler(doc["content_teste_base64"])
+        treino, teste = await _ler(doc["armazenamento"]["treino"]), await _ler(doc["armazenamento"]["teste"])
         assert len(pd.merge(treino, teste, how="inner")) == 0
         assert r.json()["stratify"] is False
 
@@ -174,8 +172,8 @@ class TestVazamentoDatasetExemplo:
         assert corpo["num_linhas_treino"] + corpo["num_linhas_teste"] == corpo["total_dados"] == 150
         # e batem com o que foi realmente gravado
         doc = arq_m.insert_one.await_args[0][0]
-        assert corpo["num_linhas_treino"] == doc["num_linhas_treino"] == len(_ler(doc["content_treino_base64"]))
-        assert corpo["num_linhas_teste"] == doc["num_linhas_teste"] == len(_ler(doc["content_teste_base64"]))
+        assert corpo["num_linhas_treino"] == doc["num_linhas_treino"] == len(await _ler(doc["armazenamento"]["treino"]))
+        assert corpo["num_linhas_teste"] == doc["num_linhas_teste"] == len(await _ler(doc["armazenamento"]["teste"]))
 
 
 # ------------------------------------------------------------------ integração
@@ -215,7 +213,7 @@ class TestIntegracaoRedivisao:
                 assert corpo["num_linhas_treino"] + corpo["num_linhas_teste"] == 80
                 assert corpo["stratify"] is True          # padrão da classificação
             # o que foi gravado continua somando o total (não releu um treino já dividido)
-            assert len(_ler(gravado["content_treino_base64"])) + len(_ler(gravado["content_teste_base64"])) == 80
+            assert len(await _ler(gravado["armazenamento.treino"])) + len(await _ler(gravado["armazenamento.teste"])) == 80
 
     @pytest.mark.asyncio
     async def test_avisa_e_desliga_quando_nao_da_para_estratificar(self, client, mock_db, auth_headers):
@@ -138,7 +138,7 @@ class TestMetricas:
 
         modelos_map = {knn_id: _make_doc(knn, knn_id), dt_id: _make_doc(dt, dt_id)}
 
-        async def find_modelo(query):
+        async def find_modelo(query, *args, **kwargs):
             return modelos_map.get(query["_id"])
 
         mock_db["modelos"].find_one = AsyncMock(side_effect=find_modelo)
@@ -275,3 +275,19 @@ class TestHealthcheck:
             response = await client.get("/healthcheck")
         assert response.status_code == 503
         assert "não respondeu" in response.json()["detalhe"]
+
+    @pytest.mark.asyncio
+    async def test_metricas_das_filas_so_para_professor(self, client, mock_db, auth_headers):
+        """O /healthcheck é público (probe do deploy): as filas do worker ficam fora dele."""
+        with patch("app.main.client") as mock_client:
+            mock_client.admin.command = AsyncMock(return_value=True)
+            response = await client.get("/healthcheck")
+        assert response.json() == {"status": "ok"}
+
+        assert (await client.get("/sistema/filas", headers=auth_headers)).status_code == 403
+        mock_db["usuarios"].find_one = AsyncMock(return_value={
+            "_id": ObjectId(), "nome_usuario": "prof", "email": "p@p.com", "role": "professor"})
+        response = await client.get("/sistema/filas", headers=auth_headers)
+        assert response.status_code == 200
+        assert "em_execucao" in response.json()["sandbox"]
+        assert "fila" in response.json()["telemetria"]
@@ -0,0 +1,211 @@
+"""Índice da evolução do aluno (`app.evolucao_alunos`): o que a rota lê e quem o mantém."""
+import copy
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from app import evolucao_alunos
+from app.pipelines_evolucao import montar_das_tentativas, montar_evolucao
+from tests.test_pipelines_evolucao import AsyncCursor, _pipeline
+
+ALUNO = "aluno-1"
+
+
+def _casa(doc, filtro):
+    for campo, cond in filtro.items():
+        if campo == "tentativas.pipeline_id":
+            if cond not in [t["pipeline_id"] for t in doc.get("tentativas") or []]:
+                return False
+        elif isinstance(cond, dict) and "$nin" in cond:
+            if doc.get(campo) in cond["$nin"]:
+                return False
+        elif isinstance(cond, dict) and "$size" in cond:
+            if "tentativas" not in doc or len(doc["tentativas"]) != cond["$size"]:
+                return False
+        elif doc.get(campo) != cond:
+            return False
+    return True
+
+
+class IndiceMemoria:
+    """O suficiente do Mongo para o índice: `_id` composto, `$pull`, `$push` com `$sort`."""
+
+    def __init__(self):
+        self.docs = []
+
+    def _achar(self, _id):
+        return next((d for d in self.docs if d["_id"] == _id), None)
+
+    def find(self, filtro):
+        return AsyncCursor(copy.deepcopy([d for d in self.docs if _casa(d, filtro)]))
+
+    async def find_one(self, filtro):
+        return copy.deepcopy(self._achar(filtro["_id"]))
+
+    async def replace_one(self, filtro, doc, upsert=False):
+        await self.delete_one(filtro)
+        self.docs.append(copy.deepcopy(doc))
+
+    async def bulk_write(self, operacoes, ordered=True):
+        for op in operacoes:
+            await self.replace_one(op._filter, op._doc, upsert=True)
+
+    async def update_one(self, filtro, operacao, upsert=False):
+        doc = self._achar(filtro["_id"])
+        if doc is not None and any(doc.get(k) != v for k, v in filtro.items() if k != "_id"):
+            return
+        if doc is None:
+            if not upsert:
+                return
+            doc = {"_id": filtro["_id"]}
+            self.docs.append(doc)
+        doc.update(copy.deepcopy(operacao.get("$set", {})))
+        for campo, n in operacao.get("$inc", {}).items():
+            doc[campo] = doc.get(campo, 0) + n
+        for campo in operacao.get("$unset", {}):
+            doc.pop(campo, None)
+        if "$push" in operacao:
+            push = operacao["$push"]["tentativas"]
+            doc.setdefault("tentativas", []).extend(copy.deepcopy(push["$each"]))
+            doc["tentativas"].sort(key=lambda t: t["data"])
+
+    async def find_one_and_update(self, filtro, operacao, upsert=False, return_document=None):
+        await self.update_one(filtro, operacao, upsert=upsert)
+        return copy.deepcopy(self._achar(filtro["_id"]))
+
+    async def update_many(self, filtro, operacao):
+        pid = operacao["$pull"]["tentativas"]["pipeline_id"]
+        for d in self.docs:
+            if _casa(d, filtro):
+                d["tentativas"] = [t for t in d["tentativas"] if t["pipeline_id"] != pid]
+
+    async def delete_one(self, filtro):
+        self.docs = [d for d in self.docs if d["_id"] != filtro["_id"]]
+
+    async def delete_many(self, filtro):
+        self.docs = [d for d in self.docs if not _casa(d, filtro)]
+
+
+@pytest.fixture
+def indice():
+    metricas = MagicMock(find_one=AsyncMock(return_value={"valor": "accuracy_score", "label": "Acurácia"}))
+    indice = IndiceMemoria()
+    with patch("app.database.evolucao_alunos", indice), \
+         patch("app.metricas.resultado.opcoes_metricas", metricas):
+        yield indice
+
+
+async def _montar(docs, user_id=ALUNO):
+    """O que a rota faz sem índice: abre a geração, lê os pipelines (aqui, `docs`) e monta."""
+    return await evolucao_alunos.reconstruir(user_id, docs, await evolucao_alunos.iniciar(user_id))
+
+
+def _historico():
+    return [
+        _pipeline("#1", "2026-07-10", 0.70, dataset="Iris.xlsx", target="species"),
+        _pipeline("#2", "2026-07-14", 0.78, dataset="Iris", target="species", pre=["minmax_scaler"],
+                  matriz={"matriz": [[50, 10], [15, 25]]}),
+        _pipeline("titanic", "2026-07-12", 0.81),
+        _pipeline("rascunho", "2026-07-13", None, dataset="wine", target="classe"),
+    ]
+
+
+@pytest.mark.asyncio
+class TestIndice:
+    async def test_sem_marca_nao_ha_indice_e_a_reconstrucao_o_monta(self, indice):
+        docs = _historico()
+        assert await evolucao_alunos.ler(ALUNO) is None
+
+        registros = await _montar(docs)
+
+        # Iris e Iris.xlsx são a mesma base: um documento por aluno × base, mais a marca.
+        assert sorted(d["_id"].get("base", "") for d in indice.docs) == ["", "iris", "titanic", "wine"]
+        assert await evolucao_alunos.ler(ALUNO) == registros
+        assert await montar_das_tentativas(registros) == await montar_evolucao(docs)
+
+    async def test_registro_guarda_valores_prontos_e_nao_o_pipeline(self, indice):
+        doc = _historico()[1]
+        doc["resultadosDasAvaliacoes"]["_visualizacoes"] = {"Modelo": ["png..."]}
+        await _montar([doc])
+
+        (registro,) = await evolucao_alunos.ler(ALUNO)
+        assert registro["metricas"] == [{"chave": "Acurácia", "max": 0.78, "min": 0.78},
+                                        {"chave": "Matriz de confusão", "max": None, "min": None}]
+        assert registro["baseline_acuracia"] == 0.6
+        assert "resultadosDasAvaliacoes" not in registro
+
+    async def test_salvar_mover_e_excluir_mantem_o_indice_igual_ao_recalculo(self, indice):
+        docs = _historico()
+        await _montar(docs[:2])
+
+        # nova tentativa, mais antiga que as outras: entra na ordem certa
+        novo = _pipeline("#0", "2026-07-01", 0.60, dataset="iris.csv", target="species")
+        await evolucao_alunos.registrar(ALUNO, novo["_id"], novo)
+        # a #1 é editada para outra base
+        docs[0]["resultadoColetaDado"]["nomeDataset"] = "titanic"
+        docs[0]["resultadoColetaDado"]["target"] = "Survived"
+        await evolucao_alunos.registrar(ALUNO, docs[0]["_id"], docs[0])
+        atuais = [novo, docs[0], docs[1]]
+        assert await montar_das_tentativas(await evolucao_alunos.ler(ALUNO)) == await montar_evolucao(atuais)
+        iris = next(d for d in indice.docs if d["_id"].get("base") == "iris")
+        assert [t["nome"] for t in iris["tentativas"]] == ["#0", "#2"]
+
+        # excluir a única tentativa de uma base leva o documento da base junto
+        await evolucao_alunos.registrar(ALUNO, docs[0]["_id"], None)
+        assert not any(d["_id"].get("base") == "titanic" for d in indice.docs)
+        assert len(await evolucao_alunos.ler(ALUNO)) == 2
+
+    async def test_sem_marca_nao_registra_e_falha_derruba_a_marca(self, indice):
+        doc = _historico()[0]
+        await evolucao_alunos.registrar(ALUNO, doc["_id"], doc)
+        assert indice.docs == []
+
+        await _montar([])
+        indice.update_many = AsyncMock(side_effect=RuntimeError("mongo fora"))
+        await evolucao_alunos.registrar(ALUNO, doc["_id"], doc)   # não levanta
+        assert await evolucao_alunos.ler(ALUNO) is None
+
+    async def test_pipeline_salvo_durante_a_montagem_nao_se_perde(self, indice):
+        docs = _historico()[:2]
+        geracao = await evolucao_alunos.iniciar(ALUNO)
+        lidos = copy.deepcopy(docs)          # a leitura dos pipelines, antes do save
+        novo = _pipeline("#3", "2026-07-20", 0.85, dataset="Iris", target="species")
+        await evolucao_alunos.registrar(ALUNO, novo["_id"], novo)
+        await evolucao_alunos.reconstruir(ALUNO, lidos, geracao)
+
+        assert await evolucao_alunos.ler(ALUNO) is None     # não marcou: falta o #3
+        registros = await _montar(docs + [novo])
+        assert await evolucao_alunos.ler(ALUNO) == registros
+        assert "#3" in [r["nome"] for r in registros]
+
+    async def test_recentes_corta_pelas_tentativas_mais_novas(self, indice):
+        registros = await _montar(_historico())
+        assert [r["nome"] for r in evolucao_alunos.recentes(registros, 2)] == ["#2", "rascunho"]
+        assert evolucao_alunos.recentes(registros, 10) == registros
+
+
+class TestRota:
+    @pytest.mark.asyncio
+    async def test_com_indice_montado_nao_le_os_pipelines(self, client, mock_db, auth_headers, mock_user, indice):
+        user_id = str(mock_user["_id"])
+        await _montar(_historico(), user_id)
+        pipe = MagicMock(find=MagicMock(return_value=AsyncCursor([])))
+        with patch("app.routers.pipelines.pipelines", pipe):
+            r = await client.get("/pipelines/evolucao?dataset=iris&alvo=species", headers=auth_headers)
+
+        pipe.find.assert_not_called()
+        (base,) = r.json()["bases"]
+        assert (base["dataset"], base["ultima"], base["baseline"]) == ("Iris", 0.78, 0.6)
+        assert base["tentativas"][1]["mudancas"] == ["acrescentou pré-processamento"]
+
+    @pytest.mark.asyncio
+    async def test_criar_pipeline_entra_no_indice(self, client, mock_db, auth_headers, mock_user, indice):
+        user_id = str(mock_user["_id"])
+        await _montar([], user_id)
+        resp = await client.post("/pipelines/", headers=auth_headers, json={
+            "nome": "novo", "resultadoColetaDado": {"nomeDataset": "Iris", "target": "species"},
+            "resultadosDasAvaliacoes": {"Acurácia": {"knn": 0.9}}})
+
+        (registro,) = await evolucao_alunos.ler(user_id)
+        assert registro["pipeline_id"] == resp.json()["id"]
+        assert registro["metricas"] == [{"chave": "Acurácia", "max": 0.9, "min": 0.9}]
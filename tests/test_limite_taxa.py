@@ -0,0 +1,105 @@
+"""Limite de taxa compartilhado (`app.limite_taxa`): janela deslizante por contador, Mongo e fallback."""
+import pytest
+from pymongo.errors import DuplicateKeyError
+
+from app import limite_taxa
+
+
+class _ColecaoFalsa:
+    """O bastante de uma coleção do motor para o `find_one_and_update` condicional."""
+
+    def __init__(self):
+        self.docs = {}
+        self.chamadas = 0
+
+    async def find_one(self, filtro, projecao=None):
+        self.chamadas += 1
+        return self.docs.get(filtro["_id"])
+
+    async def find_one_and_update(self, filtro, update, upsert=False, return_document=None):
+        self.chamadas += 1
+        doc = self.docs.get(filtro["_id"])
+        if doc is None:
+            doc = self.docs[filtro["_id"]] = {"_id": filtro["_id"], "n": 0,
+                                              **update.get("$setOnInsert", {})}
+        elif doc["n"] > filtro["n"]["$lte"]:
+            raise DuplicateKeyError("E11000")   # o upsert tentaria inserir o mesmo _id
+        doc["n"] += update["$inc"]["n"]
+        return doc
+
+
+async def _consumir(n, backend, chave="u1", maximo=3, janela=60.0, agora=0.0, custo=1):
+    return [await backend.permitir(chave, maximo, janela, custo, agora) for _ in range(n)]
+
+
+class TestContadorLocal:
+    @pytest.mark.asyncio
+    async def test_janela_deslizante_pondera_a_janela_anterior(self):
+        memoria = limite_taxa._Memoria()
+        assert [memoria.permitir("u", 3, 60.0, 1, 1.0) for _ in range(4)] == [True, True, True, False]
+        # Meio da janela seguinte: a anterior pesa 3 * 0,5 = 1,5 — cabe mais 1, não 3.
+        assert [memoria.permitir("u", 3, 60.0, 1, 90.0) for _ in range(2)] == [True, False]
+        # Duas janelas depois, a conta recomeça.
+        assert [memoria.permitir("u", 3, 60.0, 1, 200.0) for _ in range(3)] == [True] * 3
+
+    def test_lote_que_nao_cabe_nao_consome_nada(self):
+        memoria = limite_taxa._Memoria()
+        assert memoria.permitir("u", 10, 60.0, 11, 0.0) is False
+        assert memoria.permitir("u", 10, 60.0, 10, 0.0) is True
+
+    def test_memoria_tem_teto_de_chaves(self, monkeypatch):
+        monkeypatch.setattr(limite_taxa, "MAX_CHAVES", 2)
+        memoria = limite_taxa._Memoria()
+        for u in ("a", "b", "c"):
+            memoria.permitir(u, 3, 60.0, 1, 0.0)
+        assert list(memoria._contas) == ["b", "c"]
+
+
+class TestMongo:
+    @pytest.mark.asyncio
+    async def test_dois_workers_dividem_o_mesmo_limite(self):
+        colecao = _ColecaoFalsa()
+        worker_a, worker_b = limite_taxa._Mongo(colecao), limite_taxa._Mongo(colecao)
+        assert await _consumir(2, worker_a) == [True, True]
+        assert await _consumir(2, worker_b) == [True, False]
+        assert colecao.docs["u1:0"]["n"] == 3
+        assert colecao.docs["u1:0"]["expira_em"].timestamp() == 120   # serve de "anterior" na próxima
+
+    @pytest.mark.asyncio
+    async def test_quem_estourou_e_barrado_sem_ir_ao_banco(self):
+        colecao = _ColecaoFalsa()
+        worker = limite_taxa._Mongo(colecao)
+        await _consumir(4, worker)
+        chamadas = colecao.chamadas
+        assert await _consumir(5, worker, agora=30.0) == [False] * 5
+        assert colecao.chamadas == chamadas
+        # Na janela seguinte a anterior (3) ainda pesa, mas já cabe de novo.
+        assert await _consumir(1, worker, agora=90.0) == [True]
+
+    @pytest.mark.asyncio
+    async def test_mongo_fora_do_ar_cai_para_o_contador_local(self, monkeypatch):
+        class _Quebrada(_ColecaoFalsa):
+            async def find_one(self, *a, **k):
+                self.chamadas += 1
+                raise ConnectionError("mongo fora")
+
+        colecao = _Quebrada()
+        monkeypatch.setattr(limite_taxa, "STORE", "mongo")
+        monkeypatch.setattr(limite_taxa, "_mongo", limite_taxa._Mongo(colecao))
+        resultados = [await limite_taxa.permitir("chat", "u1", maximo=2, janela=60, agora=0.0)
+                      for _ in range(3)]
+        assert resultados == [True, True, False]
+        assert colecao.chamadas == 1   # depois da falha, o banco fica de lado por um tempo
+
+
+class TestRotas:
+    @pytest.mark.asyncio
+    async def test_chat_devolve_429_ao_passar_do_limite(self, client, mock_db, auth_headers, monkeypatch):
+        from app.routers import chat_tutor
+        monkeypatch.setattr(chat_tutor, "RATE_LIMIT_MAX", 1)
+        monkeypatch.delenv("NVIDIA_API_KEY", raising=False)
+        corpo = {"mensagens": [{"role": "user", "content": "oi"}]}
+        primeira = await client.post("/tutor/chat", headers=auth_headers, json=corpo)
+        segunda = await client.post("/tutor/chat", headers=auth_headers, json=corpo)
+        assert primeira.status_code == 503   # passou do limite de taxa; parou na falta de chave
+        assert segunda.status_code == 429
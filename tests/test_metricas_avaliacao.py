@@ -4,6 +4,7 @@ from bson import ObjectId
 import base64
 import hashlib
 import io
+import os
 import joblib
 import pandas as pd
 from sklearn.neighbors import KNeighborsClassifier
@@ -42,6 +43,17 @@ def _doc_modelo(model_bytes, df, **overrides):
     return doc
 
 
+def _find_one_por_id(*docs):
+    """`find_one` que responde pelo `_id` do filtro (a rota busca o mesmo modelo mais de uma
+    vez: o documento leve e, sem o estimador em cache, os bytes)."""
+    por_id = {d["_id"]: d for d in docs}
+
+    async def _find_one(filtro, *args, **kwargs):
+        return por_id.get(filtro["_id"])
+
+    return AsyncMock(side_effect=_find_one)
+
+
 def _payload(modelo_id, metricas=None):
     return {
         "modelos": [{"label": "KNN", "id": str(modelo_id)}],
@@ -248,6 +260,310 @@ class TestAvaliarModelos:
         assert all(isinstance(v, int) for linha in matriz["matriz"] for v in linha)
 
 
+class TestAvaliacaoEmParalelo:
+    """Modelos avaliados fora do event loop, em paralelo, sob prazo, com o teste decodificado
+    uma vez por request."""
+
+    @staticmethod
+    def _payload_varios(*ids):
+        return {
+            "modelos": [{"label": f"M{i}", "id": str(oid)} for i, oid in enumerate(ids)],
+            "metricas": [{"label": "Acurácia", "valor": "accuracy_score"}],
+        }
+
+    @pytest.mark.asyncio
+    async def test_arquivo_de_teste_compartilhado_e_decodificado_uma_vez(
+        self, client, mock_db, auth_headers, monkeypatch
+    ):
+        from app.metricas import metricas as metricas_mod
+
+        df, _, model_bytes = _treinar_knn()
+        arquivo_id = ObjectId()
+        docs = [_doc_modelo(model_bytes, df, arquivo_id=str(arquivo_id)) for _ in range(3)]
+        mock_db["modelos"].find_one = _find_one_por_id(*docs)
+        mock_db["arquivos"].find_one = AsyncMock(return_value={"_id": arquivo_id, "content_teste_base64": _csv_b64(df)})
+
+        leituras = []
+        original = metricas_mod._carregar_teste
+
+        async def _contando(doc, arquivo_doc):
+            leituras.append(doc["_id"])
+            return await original(doc, arquivo_doc)
+
+        monkeypatch.setattr(metricas_mod, "_carregar_teste", _contando)
+
+        response = await client.post(
+            "/classificador/avaliar_modelos", headers=auth_headers,
+            json=self._payload_varios(*(d["_id"] for d in docs)),
+        )
+        assert response.status_code == 200
+        assert response.json()["Acurácia"] == {"M0": 1.0, "M1": 1.0, "M2": 1.0}
+        assert len(leituras) == 1
+        assert mock_db["arquivos"].find_one.await_count == 1
+
+    @pytest.mark.asyncio
+    async def test_modelo_que_estoura_o_prazo_sai_como_tempo_esgotado(
+        self, client, mock_db, auth_headers, monkeypatch
+    ):
+        import asyncio
+        from app.metricas import execucao
+
+        df, _, model_bytes = _treinar_knn()
+        lento, rapido = _doc_modelo(model_bytes, df), _doc_modelo(model_bytes, df)
+        mock_db["modelos"].find_one = _find_one_por_id(lento, rapido)
+
+        executar_original = execucao.executar
+
+        async def _executar(fn, trabalho):
+            if trabalho["id"] == str(lento["_id"]):
+                await asyncio.sleep(30)
+            return await executar_original(fn, trabalho)
+
+        monkeypatch.setattr(execucao, "executar", _executar)
+        monkeypatch.setattr(execucao, "DEADLINE_SEC", 3.0)
+
+        response = await client.post(
+            "/classificador/avaliar_modelos", headers=auth_headers,
+            json=self._payload_varios(lento["_id"], rapido["_id"]),
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["Acurácia"]["M0"] == "Tempo esgotado"
+        assert data["Acurácia"]["M1"] == 1.0
+        assert "M0" not in data["_visualizacoes"]
+
+    @pytest.mark.asyncio
+    async def test_stream_envia_um_evento_por_modelo_e_nao_para_no_erro(
+        self, client, mock_db, auth_headers
+    ):
+        import json
+
+        df, _, model_bytes = _treinar_knn()
+        bom = _doc_modelo(model_bytes, df)
+        adulterado = _doc_modelo(model_bytes, df, checksum="checksum-adulterado")
+        mock_db["modelos"].find_one = _find_one_por_id(adulterado, bom)
+
+        response = await client.post(
+            "/classificador/avaliar_modelos/stream", headers=auth_headers,
+            json=self._payload_varios(adulterado["_id"], bom["_id"]),
+        )
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        eventos = [json.loads(linha[len("data: "):]) for linha in response.text.splitlines() if linha.startswith("data: ")]
+
+        por_modelo = {e["modelo"]: e for e in eventos if "modelo" in e}
+        assert por_modelo["M0"]["status"] == 400
+        assert "integridade" in por_modelo["M0"]["error"]
+        assert por_modelo["M1"]["metricas"]["Acurácia"] == 1.0
+        assert len(por_modelo["M1"]["visualizacoes"]) >= 3
+        assert eventos[-1] == {"fim": True}
+
+    @pytest.mark.asyncio
+    async def test_pool_de_processos_avalia_fora_do_processo_da_api(
+        self, client, mock_db, auth_headers, monkeypatch
+    ):
+        from app.metricas import execucao
+
+        df, _, model_bytes = _treinar_knn()
+        docs = [_doc_modelo(model_bytes, df) for _ in range(2)]
+        mock_db["modelos"].find_one = _find_one_por_id(*docs)
+
+        monkeypatch.setattr(execucao, "WORKERS", 2)
+        try:
+            response = await client.post(
+                "/classificador/avaliar_modelos", headers=auth_headers,
+                json=self._payload_varios(*(d["_id"] for d in docs)),
+            )
+            pids = {p for p in execucao._pool._processes} if execucao._pool else set()
+        finally:
+            execucao.encerrar()
+        assert response.status_code == 200
+        assert response.json()["Acurácia"] == {"M0": 1.0, "M1": 1.0}
+        assert pids and os.getpid() not in pids
+
+    @pytest.mark.asyncio
+    async def test_so_o_que_nao_serializa_roda_fora_do_pool(self, monkeypatch):
+        """Erro de pickle vindo do worker (a avaliação levantou) não é confundido com argumento
+        que não atravessa processo: o modelo não é avaliado uma segunda vez aqui."""
+        from concurrent.futures import Future
+        from unittest.mock import MagicMock
+        from app.metricas import execucao
+
+        def falha_no_worker(*_):
+            futuro = Future()
+            futuro.set_exception(AttributeError("Can't get attribute 'Modelo' on <module> (pickle)"))
+            return futuro
+
+        pool = MagicMock(submit=MagicMock(side_effect=falha_no_worker))
+        monkeypatch.setattr(execucao, "_pool_atual", lambda: pool)
+        locais = []
+        monkeypatch.setattr(execucao, "_rodar_local", lambda fn, *a: locais.append(a) or fn(*a))
+
+        with pytest.raises(AttributeError):
+            await execucao.executar(max, 1, 2)
+        assert locais == [] and pool.submit.call_count == 1
+
+        assert await execucao.executar(lambda x: x * 2, 21) == 42   # lambda não serializa
+        assert len(locais) == 1 and pool.submit.call_count == 1
+
+
+class TestCacheDeModelos:
+    """Estimadores verificados e desserializados ficam em memória por (id, checksum)."""
+
+    @staticmethod
+    def _contar_loads(monkeypatch):
+        from app.metricas import modelos_cache
+
+        loads = []
+        original = modelos_cache.joblib.load
+
+        def _contando(arquivo):
+            loads.append(1)
+            return original(arquivo)
+
+        monkeypatch.setattr(modelos_cache.joblib, "load", _contando)
+        return loads
+
+    @pytest.mark.asyncio
+    async def test_prever_repetido_nao_desserializa_de_novo(self, client, mock_db, auth_headers, monkeypatch):
+        loads = self._contar_loads(monkeypatch)
+        df, _, model_bytes = _treinar_knn()
+        doc = _doc_modelo(model_bytes, df)
+        mock_db["modelos"].find_one = _find_one_por_id(doc)
+
+        for valores in ({"f1": 1, "f2": 6}, {"f1": 6, "f2": 1}, {"f1": 2, "f2": 5}):
+            response = await client.post(
+                "/classificador/prever", headers=auth_headers,
+                json={"modelo_id": str(doc["_id"]), "valores": valores},
+            )
+            assert response.status_code == 200
+        assert response.json()["predicao"] == "a"
+        assert len(loads) == 1
+        # A busca do documento pula os campos pesados.
+        _, projecao = mock_db["modelos"].find_one.await_args_list[0].args
+        assert projecao == {"modelo_treinado": 0, "arq_teste": 0}
+
+    @pytest.mark.asyncio
+    async def test_modelo_regravado_com_outro_checksum_e_recarregado(self, client, mock_db, auth_headers, monkeypatch):
+        loads = self._contar_loads(monkeypatch)
+        df, _, model_bytes = _treinar_knn()
+        doc = _doc_modelo(model_bytes, df)
+        mock_db["modelos"].find_one = _find_one_por_id(doc)
+        corpo = {"modelo_id": str(doc["_id"]), "valores": {"f1": 1, "f2": 6}}
+        await client.post("/classificador/prever", headers=auth_headers, json=corpo)
+
+        outro = LinearRegression().fit(df[["f1", "f2"]], [0.0, 0, 0, 1, 1, 1])
+        buffer = io.BytesIO()
+        joblib.dump(outro, buffer)
+        doc.update(modelo_treinado=buffer.getvalue(), checksum=hashlib.sha256(buffer.getvalue()).hexdigest())
+        response = await client.post("/classificador/prever", headers=auth_headers, json=corpo)
+
+        assert len(loads) == 2
+        assert isinstance(response.json()["predicao"], float)
+
+    @pytest.mark.asyncio
+    async def test_checksum_divergente_nunca_entra_no_cache(self, client, mock_db, auth_headers):
+        from app.metricas import modelos_cache
+
+        df, _, model_bytes = _treinar_knn()
+        doc = _doc_modelo(model_bytes, df, checksum="0" * 64)
+        mock_db["modelos"].find_one = _find_one_por_id(doc)
+        corpo = {"modelo_id": str(doc["_id"]), "valores": {"f1": 1, "f2": 6}}
+
+        for _ in range(2):
+            response = await client.post("/classificador/prever", headers=auth_headers, json=corpo)
+            assert response.status_code == 400
+        assert modelos_cache.obter(modelos_cache.chave(doc["_id"], "0" * 64)) is None
+
+    @pytest.mark.asyncio
+    async def test_prever_lote_devolve_uma_predicao_por_linha(self, client, mock_db, auth_headers):
+        df, _, model_bytes = _treinar_knn()
+        doc = _doc_modelo(model_bytes, df)
+        mock_db["modelos"].find_one = _find_one_por_id(doc)
+
+        response = await client.post(
+            "/classificador/prever/lote", headers=auth_headers,
+            json={"modelo_id": str(doc["_id"]), "linhas": [{"f1": 1, "f2": 6}, {"f1": 6, "f2": 1}, {"f1": "6"}]},
+        )
+        assert response.status_code == 200
+        # A terceira linha não traz f2: faltantes viram 0, como no /prever.
+        assert response.json() == {"predicoes": ["a", "b", "b"]}
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("linhas", [[], "f1=1", [{"f1": 1}, 3]])
+    async def test_prever_lote_rejeita_corpo_invalido(self, client, mock_db, auth_headers, linhas):
+        response = await client.post(
+            "/classificador/prever/lote", headers=auth_headers,
+            json={"modelo_id": str(ObjectId()), "linhas": linhas},
+        )
+        assert response.status_code == 400
+
+    @pytest.mark.asyncio
+    async def test_avaliacao_reusa_o_modelo_do_cache_sem_buscar_os_bytes(
+        self, client, mock_db, auth_headers, monkeypatch
+    ):
+        loads = self._contar_loads(monkeypatch)
+        df, _, model_bytes = _treinar_knn()
+        doc = _doc_modelo(model_bytes, df)
+        mock_db["modelos"].find_one = _find_one_por_id(doc)
+
+        for _ in range(2):
+            response = await client.post(
+                "/classificador/avaliar_modelos", headers=auth_headers, json=_payload(doc["_id"])
+            )
+            assert response.json()["Acurácia"]["KNN"] == 1.0
+        assert len(loads) == 1
+        buscas_de_bytes = [
+            c for c in mock_db["modelos"].find_one.await_args_list
+            if len(c.args) > 1 and c.args[1] == {"modelo_treinado": 1}
+        ]
+        assert len(buscas_de_bytes) == 1
+
+    def test_lru_respeita_o_teto_em_bytes(self, monkeypatch):
+        from app.metricas import modelos_cache
+
+        monkeypatch.setattr(modelos_cache, "MAX_BYTES", 100)
+        monkeypatch.setattr(modelos_cache, "_itens", type(modelos_cache._itens)())
+        monkeypatch.setattr(modelos_cache, "_total", 0)
+
+        modelos_cache.guardar(("a", "1"), "A", 40)
+        modelos_cache.guardar(("b", "1"), "B", 40)
+        assert modelos_cache.obter(("a", "1")) == "A"  # `a` vira o mais recente
+        modelos_cache.guardar(("c", "1"), "C", 40)
+        modelos_cache.guardar(("grande", "1"), "G", 101)
+
+        assert modelos_cache.obter(("b", "1")) is None
+        assert modelos_cache.obter(("a", "1")) == "A"
+        assert modelos_cache.obter(("c", "1")) == "C"
+        assert modelos_cache.obter(("grande", "1")) is None
+        assert modelos_cache.estatisticas()["bytes"] == 80
+
+    @pytest.mark.asyncio
+    async def test_metodo_do_cotovelo_nao_altera_o_modelo_compartilhado(
+        self, client, mock_db, auth_headers
+    ):
+        from sklearn.cluster import KMeans
+        from app.metricas import modelos_cache
+
+        rng = __import__("numpy").random.default_rng(0)
+        df = pd.DataFrame(rng.normal(size=(60, 2)), columns=["f1", "f2"])
+        modelo = KMeans(n_clusters=3, n_init=3, random_state=0).fit(df)
+        buffer = io.BytesIO()
+        joblib.dump(modelo, buffer)
+        doc = _doc_modelo(buffer.getvalue(), df, target="", classes=[])
+        mock_db["modelos"].find_one = _find_one_por_id(doc)
+
+        response = await client.post(
+            "/classificador/avaliar_modelos", headers=auth_headers,
+            json=_payload(doc["_id"], [{"label": "Silhouette Score", "valor": "silhouette_score"}]),
+        )
+        assert response.status_code == 200
+        assert any(v["grafico_id"] == "metodo_cotovelo" for v in response.json()["_visualizacoes"]["KNN"])
+        em_cache = modelos_cache.obter(modelos_cache.chave(doc["_id"], doc["checksum"]))
+        assert em_cache.n_clusters == 3
+        assert list(em_cache.predict(df)) == list(modelo.predict(df))
+
+
 class TestSaneamentoDoArtefato:
     """O zip do modelo vai para o aluno, então não leva metadados do servidor de treino.
 
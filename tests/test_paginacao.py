@@ -0,0 +1,133 @@
+"""Paginação por cursor (`app.funcoes_genericas.paginacao`) e o seu uso nas listagens."""
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+from unittest.mock import AsyncMock, MagicMock
+
+from app.funcoes_genericas import paginacao
+
+
+def _casa(doc, filtro):
+    """O bastante da semântica do Mongo para os filtros que a paginação monta."""
+    for campo, cond in filtro.items():
+        if campo == "$and":
+            if not all(_casa(doc, f) for f in cond):
+                return False
+        elif isinstance(cond, dict):
+            if "$lte" in cond and not doc[campo] <= cond["$lte"]:
+                return False
+            if "$nin" in cond and doc[campo] in cond["$nin"]:
+                return False
+        elif doc.get(campo) != cond:
+            return False
+    return True
+
+
+def _paginar(docs, limit, filtro=None):
+    """Percorre todas as páginas como o front faria, devolvendo a sequência de _ids."""
+    ordenados = sorted(docs, key=lambda d: d["ts"], reverse=True)
+    vistos, cursor = [], None
+    for _ in range(100):
+        f = paginacao.filtro_da_pagina(filtro or {}, "ts", cursor)
+        lidos = [d for d in ordenados if _casa(d, f)][: limit + 1]
+        pagina, cursor = paginacao.proximo_cursor(lidos, "ts", limit, cursor)
+        vistos += [d["_id"] for d in pagina]
+        if cursor is None:
+            return vistos
+    raise AssertionError("paginação não terminou")
+
+
+class TestCursor:
+    def test_ida_e_volta(self):
+        oid, t = ObjectId(), datetime(2026, 3, 10, 12, 0, 0, 123000)
+        assert paginacao.decodificar_cursor(paginacao.codificar_cursor(t, [oid, "x"])) == (t, [oid, "x"])
+
+    def test_cursor_adulterado_e_400(self):
+        with pytest.raises(HTTPException) as e:
+            paginacao.decodificar_cursor("nao-e-um-cursor")
+        assert e.value.status_code == 400
+
+    def test_todas_as_paginas_sem_repetir_nem_pular_com_empates(self):
+        base = datetime(2026, 3, 10, 12)
+        # Lotes da telemetria: vários eventos no mesmo milissegundo, inclusive mais que a página.
+        docs = [{"_id": ObjectId(), "ts": base - timedelta(seconds=i // 7)} for i in range(40)]
+        for limit in (1, 3, 5, 50):
+            vistos = _paginar(docs, limit)
+            assert sorted(vistos) == sorted(d["_id"] for d in docs), limit
+
+    def test_filtro_original_e_mantido(self):
+        base = datetime(2026, 3, 10, 12)
+        docs = [{"_id": ObjectId(), "ts": base - timedelta(minutes=i), "tipo": "chat" if i % 2 else "ui"}
+                for i in range(10)]
+        vistos = _paginar(docs, 2, filtro={"tipo": "chat"})
+        assert sorted(vistos) == sorted(d["_id"] for d in docs if d["tipo"] == "chat")
+
+
+class TestListagens:
+    class _Cursor:
+        def __init__(self, docs):
+            self.docs = docs
+
+        def sort(self, *a, **k):
+            return self
+
+        def skip(self, *a, **k):
+            return self
+
+        def limit(self, n):
+            self.docs = self.docs[:n]
+            return self
+
+        def __aiter__(self):
+            async def gen():
+                for d in self.docs:
+                    yield d
+            return gen()
+
+    @pytest.mark.asyncio
+    async def test_atividades_devolve_cursor_e_o_usa(self, client, mock_db, auth_headers, mock_admin):
+        mock_db["usuarios"].find_one = AsyncMock(return_value=mock_admin)
+        base = datetime(2026, 3, 10, 12)
+        docs = [{"_id": ObjectId(), "tipo": "ui", "timestamp": base - timedelta(minutes=i)} for i in range(3)]
+        mock_db["atividade"].find = MagicMock(side_effect=lambda f: self._Cursor(list(docs)))
+
+        r = await client.get("/atividades?limit=2&incluir_total=false", headers=auth_headers)
+        dados = r.json()
+        assert len(dados["itens"]) == 2 and dados["proximo_cursor"]
+
+        r = await client.get(f"/atividades?limit=2&cursor={dados['proximo_cursor']}", headers=auth_headers)
+        filtro = mock_db["atividade"].find.call_args.args[0]
+        assert filtro["timestamp"] == {"$lte": docs[1]["timestamp"]}
+        assert filtro["_id"] == {"$nin": [docs[1]["_id"]]}
+
+    @pytest.mark.asyncio
+    async def test_cursor_e_skip_juntos_e_400(self, client, mock_db, auth_headers, mock_admin):
+        mock_db["usuarios"].find_one = AsyncMock(return_value=mock_admin)
+        cursor = paginacao.codificar_cursor(datetime(2026, 3, 10), [])
+        r = await client.get(f"/atividades?skip=10&cursor={cursor}", headers=auth_headers)
+        assert r.status_code == 400
+
+    @pytest.mark.asyncio
+    async def test_total_aproximado_para_no_teto(self, client, mock_db, auth_headers, mock_admin, monkeypatch):
+        mock_db["usuarios"].find_one = AsyncMock(return_value=mock_admin)
+        monkeypatch.setattr(paginacao, "TOTAL_APROXIMADO_MAX", 100)
+        mock_db["mlflow_runs"].count_documents = AsyncMock(return_value=101)
+        mock_db["mlflow_runs"].find = MagicMock(return_value=self._Cursor([]))
+        r = await client.get("/tutor/artefatos?modelo=knn&total_aproximado=true", headers=auth_headers)
+        assert r.json()["total"] == 100 and r.json()["total_limitado"] is True
+        assert mock_db["mlflow_runs"].count_documents.call_args.kwargs == {"limit": 101}
+
+    @pytest.mark.asyncio
+    async def test_historico_manda_o_cursor_no_cabecalho(self, client, mock_db, auth_headers):
+        from unittest.mock import patch
+        base = datetime(2026, 3, 10, 12)
+        docs = [{"_id": ObjectId(), "titulo": f"c{i}", "atualizado_em": base - timedelta(hours=i),
+                 "criado_em": base} for i in range(3)]
+        hist = MagicMock(find=MagicMock(return_value=self._Cursor(docs)))
+        with patch("app.routers.chat_tutor.historico_chat", hist):
+            r = await client.get("/tutor/chat/historico?limit=2", headers=auth_headers)
+        assert r.status_code == 200
+        assert len(r.json()) == 2
+        assert r.headers["X-Proximo-Cursor"]
@@ -0,0 +1,154 @@
+"""Campos pesados dos pipelines fora do documento (`app.armazenamento.partes_pipeline`)."""
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from bson import ObjectId
+
+from app.armazenamento import partes_pipeline
+
+
+class _Cursor:
+    def __init__(self, docs):
+        self._docs = list(docs)
+
+    def __aiter__(self):
+        self._it = iter(self._docs)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._it)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+def _coleta():
+    return {
+        "nomeDataset": "Iris", "target": "species", "porcentagemTreino": 80,
+        "treino": {"nomeArquivo": "iris.csv", "dados": [{"a": i, "b": "x" * 20} for i in range(200)]},
+        "colunas": [f"c{i}" for i in range(5)],
+    }
+
+
+def _avaliacoes():
+    return {
+        "Acurácia": {"Árvore": 0.93},
+        "Matriz de confusão": {"Árvore": {"matriz": [[5, 1], [0, 4]]}},
+        "_visualizacoes": {"Árvore": [{"titulo": "Matriz", "base64": "iVBOR" + "A" * 40000}]},
+    }
+
+
+def _treinamento():
+    return {"Árvore": {"id": "m1", "mlflow_run_id": "abc123", "importancias": list(range(2000))}}
+
+
+class TestResumo:
+    def test_fica_o_que_os_leitores_usam_e_sai_o_pesado(self):
+        coleta = partes_pipeline.resumir(_coleta())
+        assert coleta == {"nomeDataset": "Iris", "target": "species", "porcentagemTreino": 80,
+                          "treino": {"nomeArquivo": "iris.csv"}, "colunas": [f"c{i}" for i in range(5)]}
+        avaliacoes = partes_pipeline.resumir(_avaliacoes())
+        assert "_visualizacoes" not in avaliacoes
+        assert avaliacoes["Matriz de confusão"] == _avaliacoes()["Matriz de confusão"]
+        assert partes_pipeline.resumir(_treinamento()) == {"Árvore": {"id": "m1", "mlflow_run_id": "abc123"}}
+
+    @pytest.mark.asyncio
+    async def test_separar_grava_so_o_que_mudou(self, mock_db):
+        pequeno = {"Acurácia": {"Árvore": 0.9}}
+        oid = ObjectId()
+        inline, partes = await partes_pipeline.separar(
+            oid, {"resultadoColetaDado": _coleta(), "resultadosDasAvaliacoes": pequeno, "nome": "x"})
+
+        assert set(inline) == {"resultadoColetaDado", "resultadosDasAvaliacoes"}
+        assert inline["resultadosDasAvaliacoes"] == pequeno and list(partes) == ["resultadoColetaDado"]
+        gravadas = mock_db["pipelines_partes"].insert_many.await_args.args[0]
+        assert [(g["pipeline_id"], g["campo"], g["conteudo"]) for g in gravadas] == [
+            (oid, "resultadoColetaDado", _coleta())]
+        assert partes["resultadoColetaDado"]["id"] == gravadas[0]["_id"]
+
+
+class TestRotas:
+    @pytest.mark.asyncio
+    async def test_criar_guarda_o_resumo_e_devolve_o_completo(self, client, mock_db, auth_headers):
+        resp = await client.post("/pipelines/", headers=auth_headers, json={
+            "nome": "p", "resultadoColetaDado": _coleta(), "resultadosDasAvaliacoes": _avaliacoes()})
+
+        assert resp.status_code == 200
+        assert resp.json()["resultadosDasAvaliacoes"] == _avaliacoes()
+        doc = mock_db["pipelines"].insert_one.await_args.args[0]
+        assert doc["resultadoColetaDado"] == partes_pipeline.resumir(_coleta())
+        assert "_visualizacoes" not in doc["resultadosDasAvaliacoes"]
+        gravadas = mock_db["pipelines_partes"].insert_many.await_args.args[0]
+        assert {g["campo"] for g in gravadas} == set(doc["partes"])
+        assert all(g["pipeline_id"] == doc["_id"] for g in gravadas)
+
+    @pytest.mark.asyncio
+    async def test_obter_completa_e_a_listagem_so_avisa(self, client, mock_db, auth_headers, mock_user):
+        oid, parte_id = ObjectId(), ObjectId()
+        doc = {"_id": oid, "user_id": str(mock_user["_id"]), "nome": "p",
+               "resultadosDasAvaliacoes": partes_pipeline.resumir(_avaliacoes()),
+               "partes": {"resultadosDasAvaliacoes": {"id": parte_id, "bytes": 40100}}}
+        mock_db["pipelines"].find_one = AsyncMock(return_value=doc)
+        mock_db["pipelines_partes"].find = MagicMock(
+            return_value=_Cursor([{"_id": parte_id, "conteudo": _avaliacoes()}]))
+
+        resp = await client.get(f"/pipelines/{oid}", headers=auth_headers)
+        assert resp.json()["resultadosDasAvaliacoes"] == _avaliacoes()
+
+        mock_db["pipelines"].find.return_value.to_list = AsyncMock(return_value=[doc])
+        item = (await client.get("/pipelines/", headers=auth_headers)).json()[0]
+        assert "_visualizacoes" not in item["resultadosDasAvaliacoes"]
+        assert item["partes"] == {"resultadosDasAvaliacoes": {"bytes": 40100}}
+
+    @pytest.mark.asyncio
+    async def test_parte_sob_demanda_respeita_a_visibilidade(self, client, mock_db, auth_headers):
+        oid, parte_id = ObjectId(), ObjectId()
+        doc = {"_id": oid, "user_id": "outra-pessoa", "is_public": True,
+               "partes": {"resultadoColetaDado": {"id": parte_id, "bytes": 9000}}}
+        mock_db["pipelines"].find_one = AsyncMock(return_value=doc)
+        mock_db["pipelines_partes"].find_one = AsyncMock(return_value={"conteudo": _coleta()})
+
+        resp = await client.get(f"/pipelines/{oid}/partes/resultadoColetaDado", headers=auth_headers)
+        assert resp.json() == {"campo": "resultadoColetaDado", "valor": _coleta()}
+        assert (await client.get(f"/pipelines/{oid}/partes/senha", headers=auth_headers)).status_code == 404
+
+        mock_db["pipelines"].find_one = AsyncMock(return_value={**doc, "is_public": False})
+        resp = await client.get(f"/pipelines/{oid}/partes/resultadoColetaDado", headers=auth_headers)
+        assert resp.status_code == 404
+
+    @pytest.mark.asyncio
+    async def test_atualizar_troca_a_parte_e_apaga_a_antiga(self, client, mock_db, auth_headers, mock_user):
+        oid, antiga, outra = ObjectId(), ObjectId(), ObjectId()
+        doc = {"_id": oid, "user_id": str(mock_user["_id"]), "nome": "p",
+               "partes": {"resultadoColetaDado": {"id": antiga, "bytes": 9000},
+                          "resultadosDasAvaliacoes": {"id": outra, "bytes": 40100}}}
+        mock_db["pipelines"].find_one = AsyncMock(return_value=doc)
+        mock_db["pipelines_partes"].delete_many = AsyncMock()
+
+        resp = await client.put(f"/pipelines/{oid}", headers=auth_headers,
+                                json={"resultadoColetaDado": {"nomeDataset": "Iris"}})
+
+        assert resp.status_code == 200
+        operacao = mock_db["pipelines"].update_one.await_args.args[1]
+        assert operacao["$set"]["resultadoColetaDado"] == {"nomeDataset": "Iris"}
+        assert operacao["$unset"] == {"partes.resultadoColetaDado": ""}   # ficou pequeno: só inline
+        mock_db["pipelines_partes"].insert_many.assert_not_awaited()
+        # só a parte do campo regravado sai; a das avaliações continua referenciada
+        mock_db["pipelines_partes"].delete_many.assert_awaited_once_with({"_id": {"$in": [antiga]}})
+
+    @pytest.mark.asyncio
+    async def test_nao_grava_parte_em_pipeline_alheio(self, client, mock_db, auth_headers):
+        mock_db["pipelines"].find_one = AsyncMock(return_value=None)
+        resp = await client.put(f"/pipelines/{ObjectId()}", headers=auth_headers,
+                                json={"resultadoColetaDado": _coleta()})
+        assert resp.status_code == 404
+        mock_db["pipelines_partes"].insert_many.assert_not_awaited()
+        mock_db["pipelines"].update_one.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    async def test_excluir_leva_as_partes(self, client, mock_db, auth_headers, mock_user):
+        oid, parte_id = ObjectId(), ObjectId()
+        mock_db["pipelines"].find_one = AsyncMock(return_value={
+            "_id": oid, "partes": {"resultadoColetaDado": {"id": parte_id, "bytes": 1}}})
+        mock_db["pipelines_partes"].delete_many = AsyncMock()
+        assert (await client.delete(f"/pipelines/{oid}", headers=auth_headers)).status_code == 200
+        mock_db["pipelines_partes"].delete_many.assert_awaited_once_with({"_id": {"$in": [parte_id]}})
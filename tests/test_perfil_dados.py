@@ -0,0 +1,98 @@
+"""Perfil por coluna calculado na ingestão (`app.funcoes_genericas.perfil_dados`) e seus consumidores."""
+import numpy as np
+import pandas as pd
+import pytest
+from bson import ObjectId
+from unittest.mock import AsyncMock
+
+from app.desafios.base_dados import inspecionar_dados, inspecionar_perfil
+from app.funcoes_genericas import perfil_dados
+from tests.test_treinamento import _montar_mocks_treinamento, _payload_knn
+
+
+def _df():
+    return pd.DataFrame({
+        "idade": [10.0, 20.0, np.nan, 40.0],
+        "cidade": ["Pelotas", "Bagé", "Pelotas", None],
+        "ativo": [True, False, True, True],
+        "renda": [1000, 50000, 90000, 20000],
+    })
+
+
+class TestPerfilar:
+    def test_estatisticas_por_coluna(self):
+        perfil = perfil_dados.perfilar(_df())
+        assert perfil["num_linhas"] == 4
+        idade = perfil_dados.coluna(perfil, "idade")
+        assert (idade["numerica"], idade["nulos"], idade["distintos"]) == (True, 1, 3)
+        assert (idade["min"], idade["max"]) == (10.0, 40.0)
+        assert idade["media"] == pytest.approx(70 / 3)
+        cidade = perfil_dados.coluna(perfil, "cidade")
+        assert (cidade["tipo"], cidade["nulos"], cidade["distintos"]) == ("Texto", 1, 2)
+        assert cidade["top"][0] == {"valor": "Pelotas", "contagem": 2}
+        # bool: numérica para o estimador, mas sem amplitude — vai pelas categorias.
+        ativo = perfil_dados.coluna(perfil, "ativo")
+        assert ativo["numerica"] is True and "min" not in ativo and ativo["top"]
+
+    def test_coluna_toda_nula_nao_quebra_o_json(self):
+        perfil = perfil_dados.perfilar(pd.DataFrame({"x": [np.nan, np.nan]}))
+        assert perfil_dados.coluna(perfil, "x")["min"] is None
+
+    def test_perguntas_dos_consumidores(self):
+        perfil = perfil_dados.perfilar(_df())
+        assert perfil_dados.numericas(perfil, ["cidade", "renda", "ativo"]) == ["renda", "ativo"]
+        assert perfil_dados.numericas(perfil, ["nao_existe"]) is None
+        assert perfil_dados.sem_nulos(perfil, ["renda", "ativo"]) is True
+        assert perfil_dados.sem_nulos(perfil, ["idade"]) is False
+        assert perfil_dados.sem_nulos(None, ["renda"]) is False   # sem perfil: o chamador varre
+
+    def test_desafio_le_as_mesmas_flags_do_perfil_guardado(self):
+        df = _df()
+        assert inspecionar_perfil(perfil_dados.perfilar(df), alvo="ativo") == inspecionar_dados(df, alvo="ativo")
+        assert inspecionar_dados(df, alvo="ativo") == {
+            "faltantes": True, "texto": True, "escalas_diferentes": True,
+        }
+
+
+class TestGuardadoNaIngestao:
+    @pytest.mark.asyncio
+    async def test_upload_csv_grava_o_perfil_com_a_coleta(self, client, mock_db, auth_headers):
+        resp = await client.post(
+            "/coleta_dados/csv", headers=auth_headers, data={"tipo": "treino"},
+            files={"file": ("dados.csv", b"a,b\n1,x\n2,\n3,y\n4,x", "text/csv")},
+        )
+        assert resp.status_code == 200
+        doc = mock_db["arquivos"].insert_one.call_args.args[0]
+        b = perfil_dados.coluna(doc["perfil"], "b")
+        assert (b["nulos"], b["distintos"]) == (1, 2)
+
+
+class TestConsumidores:
+    @pytest.mark.asyncio
+    async def test_treino_usa_o_tipo_do_perfil_guardado(self, client, mock_db, auth_headers):
+        df = pd.DataFrame({"f1": [1.0, 2.0, 3.0, 4.0], "target": [0, 0, 1, 1]})
+        coleta_id, config_id = _montar_mocks_treinamento(mock_db, df)
+        doc = await mock_db["arquivos"].find_one()
+        perfil = perfil_dados.perfilar(df)
+        perfil_dados.coluna(perfil, "f1")["numerica"] = False   # a decisão sai do perfil, não do df
+        mock_db["arquivos"].find_one = AsyncMock(return_value={**doc, "perfil": perfil})
+
+        resp = await client.post("/classificador/treinamento/knn", headers=auth_headers,
+                                 json=_payload_knn(coleta_id, config_id))
+        assert resp.status_code == 400 and "'f1'" in resp.json()["detail"]
+
+    @pytest.mark.asyncio
+    async def test_tutor_recebe_o_resumo_do_perfil_da_coleta(self, mock_db):
+        from app.routers.chat_tutor import _com_perfil_dos_dados
+        dono = {"_id": ObjectId()}
+        mock_db["arquivos"].find_one = AsyncMock(return_value={"perfil": perfil_dados.perfilar(_df())})
+        coleta = str(ObjectId())
+
+        contexto = await _com_perfil_dos_dados({"id_coleta": coleta}, dono)
+
+        filtro = mock_db["arquivos"].find_one.call_args.args[0]
+        assert filtro == {"_id": ObjectId(coleta), "usuario_id": str(dono["_id"])}
+        resumo = {c["coluna"]: c for c in contexto["perfil_dos_dados"]}
+        assert resumo["cidade"]["mais_frequentes"][0] == "Pelotas"
+        assert resumo["renda"]["max"] == 90000.0
+        assert await _com_perfil_dos_dados({"id_coleta": "x"}, dono) == {"id_coleta": "x"}
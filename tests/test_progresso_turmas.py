@@ -0,0 +1,168 @@
+"""Retrato do progresso das turmas (`app.progresso_turmas`) e a rota que o serve."""
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from bson import ObjectId
+
+from app import progresso_turmas
+from tests.conftest import ColecaoMemoria
+from tests.test_desafio_montagem import _prof
+
+
+def _agregacao(linhas):
+    return MagicMock(aggregate=MagicMock(return_value=MagicMock(to_list=AsyncMock(return_value=linhas))))
+
+
+@pytest.fixture
+def turma_e_colecoes(mock_db):
+    prof = _prof()
+    mock_db["usuarios"].find_one = AsyncMock(return_value=prof)
+    alunos = [str(ObjectId()), str(ObjectId())]
+    turma = {"_id": ObjectId(), "professor_id": str(prof["_id"]), "alunos": alunos,
+             "criado_em": datetime(2026, 8, 1, tzinfo=timezone.utc)}
+    colecoes = {
+        "retrato": ColecaoMemoria(),
+        "pipelines": _agregacao([{"_id": alunos[0], "atividades": ["a1", "a2", None], "ultimo": None}]),
+        "submissoes_montagem": _agregacao([]),
+        "atividade_usuario": _agregacao([{"_id": alunos[1], "chats": 4}]),
+        "colecao_usuario": ColecaoMemoria([{"_id": ObjectId(a), "nome_usuario": f"Aluno {i}"}
+                                           for i, a in enumerate(alunos)]),
+    }
+    with patch("app.database.progresso_turmas", colecoes["retrato"]), \
+         patch("app.routers.turmas.turmas", MagicMock(find_one=AsyncMock(return_value=turma))), \
+         patch("app.routers.turmas.atividades", MagicMock(count_documents=AsyncMock(return_value=3))), \
+         patch("app.routers.turmas.pipelines", colecoes["pipelines"]), \
+         patch("app.routers.turmas.submissoes_montagem", colecoes["submissoes_montagem"]), \
+         patch("app.routers.turmas.atividade_usuario", colecoes["atividade_usuario"]), \
+         patch("app.database.colecao_usuario", colecoes["colecao_usuario"]):
+        yield turma, alunos, colecoes
+
+
+async def _progresso(client, auth_headers, turma):
+    r = await client.get(f"/turmas/{turma['_id']}/progresso", headers=auth_headers)
+    assert r.status_code == 200
+    return r.json()
+
+
+class TestRetrato:
+    @pytest.mark.asyncio
+    async def test_primeira_leitura_calcula_grava_e_a_segunda_so_le(self, client, auth_headers, turma_e_colecoes):
+        turma, alunos, col = turma_e_colecoes
+        dados = await _progresso(client, auth_headers, turma)
+
+        assert [(l["aluno_nome"], l["submissoes"], l["chats"], l["total_atividades"])
+                for l in dados["alunos"]] == [("Aluno 0", 2, 0, 3), ("Aluno 1", 0, 4, 3)]
+        assert dados["atualizado_em"] is not None
+        assert str(turma["_id"]) in col["retrato"].docs       # a marca
+
+        col["pipelines"].aggregate.reset_mock()
+        de_novo = await _progresso(client, auth_headers, turma)
+        col["pipelines"].aggregate.assert_not_called()
+        assert de_novo["alunos"] == dados["alunos"]
+        assert de_novo["atualizado_em"] == dados["atualizado_em"]
+
+    @pytest.mark.asyncio
+    async def test_submissao_recalcula_so_aquele_aluno(self, client, auth_headers, turma_e_colecoes):
+        turma, alunos, col = turma_e_colecoes
+        await _progresso(client, auth_headers, turma)
+
+        await progresso_turmas.desatualizar(str(turma["_id"]), alunos[1])
+        col["pipelines"].aggregate.reset_mock()
+        await _progresso(client, auth_headers, turma)
+
+        filtro = col["pipelines"].aggregate.call_args.args[0][0]["$match"]
+        assert filtro == {"turma_id": str(turma["_id"]), "user_id": {"$in": [alunos[1]]}}
+
+    @pytest.mark.asyncio
+    async def test_chat_soma_na_linha_e_o_retrato_velho_e_refeito(self, client, auth_headers, turma_e_colecoes):
+        turma, alunos, col = turma_e_colecoes
+        await _progresso(client, auth_headers, turma)
+
+        await progresso_turmas.contar_chats([
+            {"usuario_id": alunos[0], "tipo": "chat"}, {"usuario_id": alunos[0], "tipo": "chat"},
+            {"usuario_id": alunos[0], "tipo": "pipeline"}])
+        dados = await _progresso(client, auth_headers, turma)
+        assert [l["chats"] for l in dados["alunos"]] == [2, 4]
+
+        col["retrato"].docs[str(turma["_id"])]["gerado_em"] -= timedelta(
+            seconds=progresso_turmas.MAX_IDADE_SEC + 1)
+        dados = await _progresso(client, auth_headers, turma)
+        assert [l["chats"] for l in dados["alunos"]] == [0, 4]   # de novo a partir da telemetria
+
+    @pytest.mark.asyncio
+    async def test_consulta_que_falha_nao_entra_no_retrato(self, client, auth_headers, turma_e_colecoes):
+        turma, _, col = turma_e_colecoes
+        col["atividade_usuario"].aggregate.side_effect = RuntimeError("mongo fora")
+        dados = await _progresso(client, auth_headers, turma)
+
+        assert [l["chats"] for l in dados["alunos"]] == [0, 0]   # esta leitura mostra o que tem
+        assert dados["atualizado_em"] is None
+        assert col["retrato"].docs == {}
+
+        col["atividade_usuario"].aggregate.side_effect = None
+        dados = await _progresso(client, auth_headers, turma)
+        assert [l["chats"] for l in dados["alunos"]] == [0, 4]
+        assert str(turma["_id"]) in col["retrato"].docs
+
+    @pytest.mark.asyncio
+    async def test_chats_sao_contados_desde_a_criacao_da_turma(self, client, auth_headers, turma_e_colecoes):
+        turma, _, _ = turma_e_colecoes
+        with patch("app.telemetria_rollup.estagios", AsyncMock(return_value=[])) as estagios:
+            await _progresso(client, auth_headers, turma)
+        assert estagios.await_args.kwargs["inicio"] == turma["criado_em"]
+
+    @pytest.mark.asyncio
+    async def test_consultas_da_turma_rodam_em_paralelo(self, client, auth_headers, turma_e_colecoes):
+        """A agregação dos pipelines só termina depois que a dos desafios começou: em sequência,
+        a rota ficaria presa aqui."""
+        turma, _, col = turma_e_colecoes
+        desafios_comecaram = asyncio.Event()
+
+        async def pipelines_to_list(length=None):
+            await asyncio.wait_for(desafios_comecaram.wait(), timeout=2)
+            return []
+
+        async def desafios_to_list(length=None):
+            desafios_comecaram.set()
+            return []
+
+        col["pipelines"].aggregate.return_value.to_list = pipelines_to_list
+        col["submissoes_montagem"].aggregate.return_value.to_list = desafios_to_list
+        dados = await _progresso(client, auth_headers, turma)
+        assert [l["submissoes"] for l in dados["alunos"]] == [0, 0]
+
+
+class TestEventos:
+    @pytest.mark.asyncio
+    async def test_pipeline_da_turma_desatualiza_a_linha_do_aluno(self, client, mock_db, auth_headers, mock_user):
+        with patch("app.routers.pipelines._validar_vinculo_atividade",
+                   AsyncMock(return_value=("a1", "t1"))), \
+             patch("app.progresso_turmas.desatualizar", AsyncMock()) as desatualizar:
+            await client.post("/pipelines/", headers=auth_headers, json={"nome": "p", "atividade_id": "a1"})
+        desatualizar.assert_awaited_once_with("t1", str(mock_user["_id"]))
+
+    @pytest.mark.asyncio
+    async def test_telemetria_gravada_soma_os_chats(self, monkeypatch):
+        from app import telemetria
+        assert progresso_turmas.contar_chats in telemetria._ao_gravar
+        monkeypatch.setattr("app.database.atividade_usuario", MagicMock(insert_many=AsyncMock()),
+                            raising=False)
+        contar = AsyncMock()
+        monkeypatch.setattr(telemetria, "_ao_gravar", [contar])
+        await telemetria._gravar([{"tipo": "chat", "usuario_id": "u1"}])
+        contar.assert_awaited_once_with([{"tipo": "chat", "usuario_id": "u1"}])
+
+    @pytest.mark.asyncio
+    async def test_lote_com_falha_parcial_soma_so_os_chats_gravados(self, monkeypatch):
+        from pymongo.errors import BulkWriteError
+        from app import telemetria
+        falha = BulkWriteError({"writeErrors": [{"index": 1, "code": 11000}]})
+        monkeypatch.setattr("app.database.atividade_usuario",
+                            MagicMock(insert_many=AsyncMock(side_effect=falha)), raising=False)
+        contar = AsyncMock()
+        monkeypatch.setattr(telemetria, "_ao_gravar", [contar])
+        lote = [{"tipo": "chat", "usuario_id": f"u{i}"} for i in range(3)]
+        await telemetria._gravar(lote)
+        contar.assert_awaited_once_with([lote[0], lote[2]])
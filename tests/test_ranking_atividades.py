@@ -0,0 +1,155 @@
+"""Ranking materializado das atividades (`app.ranking_atividades`) e quem o mantém."""
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from bson import ObjectId
+
+from app import ranking_atividades
+from tests.conftest import ColecaoMemoria
+
+
+def _pipe(aluno, valor, nome="p", atividade="a1"):
+    resultados = {} if valor is None else {"Erro médio absoluto": {"Árvore": valor}}
+    return {"_id": ObjectId(), "user_id": aluno, "nome": nome, "atividade_id": atividade,
+            "resultadosDasAvaliacoes": resultados}
+
+
+@pytest.fixture
+def ambiente():
+    """Ranking, pipelines e usuários em memória; métrica MAE (menor é melhor)."""
+    alunos = [str(ObjectId()) for _ in range(3)]
+    pipes = ColecaoMemoria([
+        _pipe(alunos[0], 3.0, "a0-1"), _pipe(alunos[0], 1.5, "a0-2"),
+        _pipe(alunos[1], 2.0, "a1-1"),
+        _pipe(alunos[2], None, "a2-1"),
+    ])
+    usuarios = ColecaoMemoria([{"_id": ObjectId(a), "nome_usuario": f"Aluno {i}"}
+                               for i, a in enumerate(alunos)])
+    atividade = {"_id": ObjectId(), "criterio": {"metrica": "mean_absolute_error", "ordem": "asc"}}
+    for p in pipes.docs.values():
+        p["atividade_id"] = str(atividade["_id"])
+    ranking = ColecaoMemoria([{"_id": "velho", "atividade_id": str(atividade["_id"]), "aluno_id": "saiu"}])
+    atividades = MagicMock(update_one=AsyncMock(), find_one=AsyncMock(
+        side_effect=lambda *a, **k: {**atividade, "ranking_versao": ranking_atividades.VERSAO}))
+    metricas = MagicMock(find_one=AsyncMock(return_value={"label": "Erro médio absoluto"}))
+    with patch("app.database.ranking_atividades", ranking), \
+         patch("app.database.pipelines", pipes), \
+         patch("app.database.colecao_usuario", usuarios), \
+         patch("app.database.atividades", atividades), \
+         patch("app.metricas.resultado.opcoes_metricas", metricas):
+        yield {"alunos": alunos, "pipes": pipes, "ranking": ranking, "atividade": atividade,
+               "atividades": atividades}
+
+
+class TestMelhorPorAluno:
+    def test_melhor_conforme_a_ordem_e_conta_as_tentativas(self):
+        pipes = [{"_id": ObjectId(), "nome": n, "resultadosDasAvaliacoes": {"m": {"x": v}}}
+                 for n, v in (("a", 0.7), ("b", 0.9), ("c", "N/A"))]
+        assert ranking_atividades._melhor(pipes, ["m"], "desc")["pipeline_nome"] == "b"
+        linha = ranking_atividades._melhor(pipes, ["m"], "asc")
+        assert (linha["pipeline_nome"], linha["valor"], linha["tentativas"]) == ("a", 0.7, 3)
+        assert ranking_atividades._melhor([], ["m"], "desc") is None
+
+
+class TestReconstruirELer:
+    @pytest.mark.asyncio
+    async def test_ordem_paginacao_e_marca(self, ambiente):
+        a0, a1, a2 = ambiente["alunos"]
+        atividade = ambiente["atividade"]
+
+        linhas, total = await ranking_atividades.pagina(atividade, limite=10)
+
+        # asc: 1.5 antes de 2.0; sem valor no fim. O aluno que saiu some do ranking.
+        assert [(l["aluno_id"], l["valor"], l["tentativas"]) for l in linhas] == [
+            (a0, 1.5, 2), (a1, 2.0, 1), (a2, None, 1)]
+        assert linhas[0]["aluno_nome"] == "Aluno 0" and linhas[0]["pipeline_nome"] == "a0-2"
+        assert total == 3
+        ambiente["atividades"].update_one.assert_awaited_once_with(
+            {"_id": atividade["_id"]}, {"$set": {"ranking_versao": ranking_atividades.VERSAO}})
+
+        marcada = {**atividade, "ranking_versao": ranking_atividades.VERSAO}
+        segunda, total = await ranking_atividades.pagina(marcada, limite=1, pular=1)
+        assert [l["aluno_id"] for l in segunda] == [a1] and total == 3
+        assert ambiente["atividades"].update_one.await_count == 1   # marcada: não reconstrói
+
+
+class TestRegistrarSubmissao:
+    @pytest.mark.asyncio
+    async def test_recalcula_so_o_aluno_inclusive_para_pior(self, ambiente):
+        a0, a1, _ = ambiente["alunos"]
+        aid = str(ambiente["atividade"]["_id"])
+        await ranking_atividades.reconstruir(ambiente["atividade"])
+        antes = dict(ambiente["ranking"].docs[f"{aid}:{a1}"])
+
+        # a melhor submissão do aluno 0 é editada para pior: $max/$min não desceria
+        melhor = next(p for p in ambiente["pipes"].docs.values() if p["nome"] == "a0-2")
+        melhor["resultadosDasAvaliacoes"] = {"Erro médio absoluto": {"Árvore": 9.0}}
+        await ranking_atividades.registrar_submissao(aid, a0)
+
+        linha = ambiente["ranking"].docs[f"{aid}:{a0}"]
+        assert (linha["valor"], linha["pipeline_nome"], linha["chave"]) == (3.0, "a0-1", -3.0)
+        assert ambiente["ranking"].docs[f"{aid}:{a1}"] == antes
+
+        # sem submissão nenhuma, sai do ranking
+        for p in [p for p in ambiente["pipes"].docs.values() if p["user_id"] == a0]:
+            del ambiente["pipes"].docs[p["_id"]]
+        await ranking_atividades.registrar_submissao(aid, a0)
+        assert f"{aid}:{a0}" not in ambiente["ranking"].docs
+
+    @pytest.mark.asyncio
+    async def test_submissao_durante_a_reconstrucao_nao_se_perde(self, ambiente):
+        """A reconstrução lê os pipelines; o aluno submete e o registro grava a linha (sem marca
+        ainda); a reconstrução termina e marca — sem sobrescrever a linha mais nova."""
+        a0, a1, _ = ambiente["alunos"]
+        aid = str(ambiente["atividade"]["_id"])
+        ambiente["atividades"].find_one = AsyncMock(return_value=ambiente["atividade"])
+        nomes = ranking_atividades._nomes
+
+        async def submete_no_meio(ids):
+            nova = _pipe(a1, 0.5, "a1-2", atividade=aid)
+            ambiente["pipes"].docs[nova["_id"]] = nova
+            await ranking_atividades.registrar_submissao(aid, a1)
+            return await nomes(ids)
+
+        with patch("app.ranking_atividades._nomes", submete_no_meio):
+            await ranking_atividades.reconstruir(ambiente["atividade"])
+
+        linha = ambiente["ranking"].docs[f"{aid}:{a1}"]
+        assert (linha["valor"], linha["pipeline_nome"], linha["tentativas"]) == (0.5, "a1-2", 2)
+        assert ambiente["ranking"].docs[f"{aid}:{a0}"]["valor"] == 1.5
+        assert "velho" not in ambiente["ranking"].docs
+
+    @pytest.mark.asyncio
+    async def test_falha_tira_a_marca(self, ambiente):
+        aid = str(ambiente["atividade"]["_id"])
+        aluno = ambiente["alunos"][0]
+        with patch.object(ambiente["ranking"], "replace_one", AsyncMock(side_effect=RuntimeError("caiu"))):
+            await ranking_atividades.registrar_submissao(aid, aluno)   # não levanta
+        ambiente["atividades"].update_one.assert_awaited_with(
+            {"_id": ambiente["atividade"]["_id"]}, {"$unset": {"ranking_versao": ""}})
+
+
+class TestQuemMantem:
+    @pytest.mark.asyncio
+    async def test_excluir_pipeline_recalcula_a_atividade_dele(self, client, mock_db, auth_headers, mock_user):
+        oid = ObjectId()
+        mock_db["pipelines"].find_one = AsyncMock(return_value={"_id": oid, "atividade_id": "a-1"})
+        with patch("app.ranking_atividades.registrar_submissao", AsyncMock()) as registrar:
+            r = await client.delete(f"/pipelines/{oid}", headers=auth_headers)
+        assert r.status_code == 200
+        registrar.assert_awaited_once_with("a-1", str(mock_user["_id"]))
+
+    @pytest.mark.asyncio
+    async def test_trocar_o_criterio_tira_a_marca(self, client, mock_db, auth_headers):
+        prof = {"_id": ObjectId(), "nome_usuario": "prof", "email": "p@p.com", "role": "professor"}
+        mock_db["usuarios"].find_one = AsyncMock(return_value=prof)
+        turma = {"_id": ObjectId(), "professor_id": str(prof["_id"]), "alunos": []}
+        aoid = ObjectId()
+        ativ_m = MagicMock(update_one=AsyncMock(), find_one=AsyncMock(
+            return_value={"_id": aoid, "turma_id": str(turma["_id"])}))
+        with patch("app.routers.turmas.turmas", MagicMock(find_one=AsyncMock(return_value=turma))), \
+             patch("app.routers.turmas.atividades", ativ_m):
+            r = await client.put(f"/turmas/{turma['_id']}/atividades/{aoid}", headers=auth_headers,
+                                 json={"criterio": {"metrica": "f1_score", "ordem": "desc"}})
+        assert r.status_code == 200
+        operacao = ativ_m.update_one.await_args.args[1]
+        assert operacao["$unset"] == {"ranking_versao": ""}
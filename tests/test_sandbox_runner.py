@@ -1,6 +1,7 @@
 """Testes do sandbox de execução (subprocess + setrlimit)."""
 from __future__ import annotations
 
+import asyncio
 import os
 import tempfile
 from pathlib import Path
@@ -8,9 +9,11 @@ from pathlib import Path
 import joblib
 import pandas as pd
 import pytest
+import pytest_asyncio
 
-from app.sandbox import SandboxError, executar_treinamento
+from app.sandbox import SandboxError, executar_treinamento, executar_treinamento_async
 from app.sandbox import runner as runner_mod
+from app.sandbox import transferencia
 
 
 @pytest.fixture
@@ -108,7 +111,7 @@ def test_workdir_e_limpo_apos_execucao(iris_like, monkeypatch):
         criados.append(path)
         return path
 
-    monkeypatch.setattr(runner_mod.tempfile, "mkdtemp", spy_mkdtemp)
+    monkeypatch.setattr(transferencia.tempfile, "mkdtemp", spy_mkdtemp)
     executar_treinamento(
         class_path="sklearn.linear_model.LogisticRegression",
         hiperparametros={"max_iter": 50},
@@ -131,7 +134,7 @@ def test_workdir_e_limpo_apos_erro(iris_like, monkeypatch):
         criados.append(path)
         return path
 
-    monkeypatch.setattr(runner_mod.tempfile, "mkdtemp", spy_mkdtemp)
+    monkeypatch.setattr(transferencia.tempfile, "mkdtemp", spy_mkdtemp)
     with pytest.raises(SandboxError):
         executar_treinamento(
             class_path="sklearn.modulo_que_nao_existe.X",
@@ -166,3 +169,201 @@ def test_timeout_dispara_sandbox_error():
             max_cpu_sec=2,
         )
     assert exc.value.kind in ("timeout", "memory", "exception")
+
+
+# ------------------------------------------------------------------ versão assíncrona
+@pytest.mark.asyncio
+async def test_async_treina_sem_bloquear_o_loop(iris_like):
+    """Enquanto o filho roda, o loop segue girando (antes o subprocess.run o congelava)."""
+    X, y = iris_like
+    batidas = 0
+
+    async def batimento():
+        nonlocal batidas
+        while True:
+            await asyncio.sleep(0.01)
+            batidas += 1
+
+    pulso = asyncio.create_task(batimento())
+    try:
+        res = await executar_treinamento_async(
+            class_path="sklearn.linear_model.LogisticRegression",
+            hiperparametros={"max_iter": 200},
+            X_train=X,
+            y_train=y,
+            is_clustering=False,
+        )
+    finally:
+        pulso.cancel()
+    assert "LogisticRegression" in res.model_repr
+    assert set(res.classes) == {"0", "1"}
+    assert batidas > 5
+
+
+@pytest.mark.asyncio
+
+
+async def test_async_erro_do_filho_vira_sandbox_error(iris_like):
+    X, y = iris_like
+    fila = runner_mod.FilaSandbox(1)
+    with pytest.raises(SandboxError) as exc:
+        await executar_treinamento_async(
+            class_path="sklearn.linear_model.NaoExisteEsseClassificador",
+            hiperparametros={},
+            X_train=X,
+            y_train=y,
+            is_clustering=False,
+            fila=fila,
+        )
+    assert exc.value.kind == "exception"
+    assert fila.metricas()["em_execucao"] == 0     # a vaga volta mesmo no erro
+
+
+@pytest.mark.asyncio
+
+
+async def test_desconexao_mata_o_filho_e_libera_a_vaga(iris_like, monkeypatch):
+    X, y = iris_like
+    monkeypatch.setattr(runner_mod, "INTERVALO_DESCONEXAO_SEC", 0.01)
+    fila = runner_mod.FilaSandbox(1)
+
+    async def sempre_desconectado():
+        return True
+
+    with pytest.raises(SandboxError) as exc:
+        await executar_treinamento_async(
+            class_path="sklearn.linear_model.LogisticRegression",
+            hiperparametros={},
+            X_train=X,
+            y_train=y,
+            is_clustering=False,
+            desconectado=sempre_desconectado,
+            fila=fila,
+        )
+    assert exc.value.kind == "cancelado"
+    assert fila.metricas()["em_execucao"] == 0
+
+
+class TestFilaSandbox:
+    @pytest.mark.asyncio
+    async def test_atende_em_ordem_de_chegada(self):
+        fila = runner_mod.FilaSandbox(1)
+        ordem = []
+
+        async def pedido(n):
+            await fila.entrar()
+            ordem.append(n)
+            await asyncio.sleep(0.01)
+            fila.sair()
+
+        await asyncio.gather(*(pedido(n) for n in range(5)))
+        assert ordem == [0, 1, 2, 3, 4]
+        m = fila.metricas()
+        assert m["atendidos"] == 5 and m["em_execucao"] == 0 and m["na_fila"] == 0
+        assert m["espera_max_ms"] > 0
+
+    @pytest.mark.asyncio
+
+    async def test_fila_cheia_recusa_com_ocupado(self):
+        fila = runner_mod.FilaSandbox(1, max_fila=1)
+        await fila.entrar()
+        esperando = asyncio.create_task(fila.entrar())
+        await asyncio.sleep(0)
+        assert fila.metricas()["na_fila"] == 1
+        with pytest.raises(SandboxError) as exc:
+            await fila.entrar()
+        assert exc.value.kind == "ocupado"
+        fila.sair()                     # a vaga passa para quem esperava
+        await esperando
+        fila.sair()
+        assert fila.metricas()["em_execucao"] == 0
+        assert fila.metricas()["recusados"] == 1
+
+    @pytest.mark.asyncio
+
+    async def test_cancelado_na_fila_sai_dela(self):
+        fila = runner_mod.FilaSandbox(1)
+        await fila.entrar()
+        esperando = asyncio.create_task(fila.entrar())
+        await asyncio.sleep(0)
+        esperando.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await esperando
+        assert fila.metricas()["na_fila"] == 0
+        fila.sair()
+        assert fila.metricas()["em_execucao"] == 0
+
+
+# ------------------------------------------------------------------ zygote
+@pytest_asyncio.fixture
+async def zygote_ligado(monkeypatch):
+    monkeypatch.setattr(runner_mod, "ZYGOTE_ATIVO", True)
+    monkeypatch.setattr(runner_mod, "_zygote_falhou_em", 0.0)
+    yield
+    await runner_mod.encerrar_zygote()
+
+
+@pytest.mark.asyncio
+async def test_zygote_treina_e_mantem_a_allowlist(iris_like, zygote_ligado):
+    X, y = iris_like
+    res = await executar_treinamento_async(
+        class_path="sklearn.linear_model.LogisticRegression",
+        hiperparametros={"max_iter": 200},
+        X_train=X,
+        y_train=y,
+        is_clustering=False,
+    )
+    assert res.tempos["modo"] == "zygote"
+    assert set(res.classes) == {"0", "1"}
+
+    # O filho do fork roda o mesmo child.main: _instanciar continua barrando módulos.
+    with pytest.raises(SandboxError) as exc:
+        await executar_treinamento_async(
+            class_path="os.system",
+            hiperparametros={},
+            X_train=X,
+            y_train=y,
+            is_clustering=False,
+        )
+    assert "não está na lista permitida" in str(exc.value)
+
+
+@pytest.mark.asyncio
+async def test_zygote_mata_o_filho_no_timeout(zygote_ligado):
+    import numpy as np
+
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame(rng.normal(size=(2000, 20)))
+    y = pd.Series(rng.integers(0, 2, size=2000))
+    await runner_mod.iniciar_zygote()       # o tempo de import não entra no limite
+    with pytest.raises(SandboxError) as exc:
+        await executar_treinamento_async(
+            class_path="sklearn.neural_network.MLPClassifier",
+            hiperparametros={"max_iter": 5000, "hidden_layer_sizes": (200, 200)},
+            X_train=X,
+            y_train=y,
+            is_clustering=False,
+            max_wall_sec=1,
+        )
+    assert exc.value.kind == "timeout"
+    # o zygote sobrevive ao filho morto e segue atendendo
+    zygote = await runner_mod._zygote_do_loop()
+    assert zygote is not None and zygote.disponivel
+
+
+@pytest.mark.asyncio
+async def test_zygote_e_reciclado_apos_max_jobs(iris_like, zygote_ligado, monkeypatch):
+    X, y = iris_like
+    monkeypatch.setattr(runner_mod, "ZYGOTE_MAX_JOBS", 1)
+    vistos = []
+    for _ in range(2):
+        await executar_treinamento_async(
+            class_path="sklearn.linear_model.LogisticRegression",
+            hiperparametros={},
+            X_train=X,
+            y_train=y,
+            is_clustering=False,
+        )
+        vistos.append(runner_mod._zygotes[asyncio.get_running_loop()])
+    assert vistos[0] is not vistos[1]
+    assert vistos[0].jobs == vistos[1].jobs == 1
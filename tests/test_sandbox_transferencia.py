@@ -0,0 +1,100 @@
+"""Passagem de dados pai → filho do sandbox (Arrow IPC mapeado em memória, com fallback pickle)."""
+from __future__ import annotations
+
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.sandbox import SandboxError, executar_treinamento
+from app.sandbox import transferencia
+
+
+def _dados():
+    X = pd.DataFrame(
+        {"f1": np.arange(8, dtype=float), "f2": np.arange(8, 0, -1), "cor": list("abababab")},
+        index=range(10, 18),
+    )
+    y = pd.Series([0, 0, 0, 0, 1, 1, 1, 1], index=X.index, name="target")
+    return X, y
+
+
+def test_arrow_ida_e_volta_preserva_valores_tipos_indice_e_nome_do_alvo(tmp_path):
+    X, y = _dados()
+    spec = transferencia.gravar_dados(tmp_path, X, y, formato="arrow")
+    assert spec["formato_dados"] == "arrow"
+    X2, y2 = transferencia.ler_dados(tmp_path, spec)
+    pd.testing.assert_frame_equal(X2, X)
+    pd.testing.assert_series_equal(y2, y)
+
+
+def test_arrow_le_colunas_numericas_sem_copiar(tmp_path):
+    """Os valores vêm das páginas do arquivo mapeado (copy-on-write): o array é gravável, e
+    escrever nele não altera o arquivo."""
+    import mmap
+
+    X = pd.DataFrame({"f": np.arange(1000, dtype=float)})
+    spec = transferencia.gravar_dados(tmp_path, X, formato="arrow")
+    X2, y2 = transferencia.ler_dados(tmp_path, spec)
+    assert y2 is None
+
+    valores = X2["f"].to_numpy()
+    base = valores
+    while getattr(base, "base", None) is not None:
+        base = base.base
+    assert isinstance(getattr(base, "obj", base), mmap.mmap)
+
+    assert valores.flags.writeable
+    valores[0] = -1.0
+    X3, _ = transferencia.ler_dados(tmp_path, spec)
+    assert X3["f"].iloc[0] == 0.0
+
+
+def test_coluna_mista_cai_para_pickle(tmp_path):
+    X = pd.DataFrame({"misto": [1, "dois", 3.0]})
+    spec = transferencia.gravar_dados(tmp_path, X, formato="arrow")
+    assert spec["formato_dados"] == "pickle"
+    assert not (tmp_path / "X_train.arrow").exists()
+    X2, _ = transferencia.ler_dados(tmp_path, spec)
+    pd.testing.assert_frame_equal(X2, X)
+
+
+def test_workdir_sai_do_tmpfs_quando_os_dados_nao_cabem(tmp_path, monkeypatch):
+    base = tmp_path / "shm"
+    base.mkdir()
+    monkeypatch.setattr(transferencia, "WORKDIR_BASE", str(base))
+    Uso = namedtuple("Uso", "total used free")
+
+    monkeypatch.setattr(transferencia.shutil, "disk_usage", lambda _p: Uso(1 << 40, 0, 1 << 40))
+    assert transferencia.novo_workdir(pd.DataFrame({"a": [1]})).parent == base
+
+    monkeypatch.setattr(transferencia.shutil, "disk_usage", lambda _p: Uso(1 << 20, 0, 1 << 20))
+    assert transferencia.novo_workdir(pd.DataFrame({"a": [1]})).parent != base
+
+
+@pytest.mark.parametrize("formato", transferencia.FORMATOS)
+def test_treino_funciona_nos_dois_formatos(formato, monkeypatch):
+    monkeypatch.setattr(transferencia, "FORMATO_PADRAO", formato)
+    X, y = _dados()
+    res = executar_treinamento(
+        class_path="sklearn.linear_model.LogisticRegression",
+        hiperparametros={},
+        X_train=X[["f1", "f2"]],
+        y_train=y,
+        is_clustering=False,
+    )
+    assert set(res.classes) == {"0", "1"}
+
+
+def test_supervisionado_sem_y_continua_erro_de_config():
+    X, _ = _dados()
+    with pytest.raises(SandboxError) as exc:
+        executar_treinamento(
+            class_path="sklearn.linear_model.LogisticRegression",
+            hiperparametros={},
+            X_train=X,
+            y_train=None,
+            is_clustering=False,
+        )
+    assert exc.value.kind == "config"
@@ -35,3 +35,61 @@ class TestJWT:
         token = jwt.encode({"sub": "user@test.com"}, "wrong-secret", algorithm=ALGORITHM)
         with pytest.raises(jwt.exceptions.DecodeError):
             jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
+
+class TestCacheDoUsuarioAutenticado:
+    """`get_usuario_atual` guarda o documento por (sub, iat) e as rotas que o mudam invalidam."""
+
+    @pytest.fixture(autouse=True)
+    def _cache_ligado(self, monkeypatch):
+        from app import security
+        monkeypatch.setattr(security, "USUARIO_CACHE_TTL_SEC", 60.0)
+
+    @staticmethod
+    def _token(iat=1):
+        from tests.conftest import TEST_USER_EMAIL
+        return jwt.encode({"sub": TEST_USER_EMAIL, "iat": iat, "exp": 9999999999},
+                          SECRET_KEY, algorithm=ALGORITHM)
+
+    @pytest.mark.asyncio
+    async def test_mesmo_token_le_o_banco_uma_vez_e_sem_a_senha(self, mock_db):
+        from bson import ObjectId
+        from app.security import get_usuario_atual
+        u1 = await get_usuario_atual(self._token())
+        u1["_id"] = str(u1["_id"])   # um handler mexendo no doc não estraga o cache
+        u2 = await get_usuario_atual(self._token())
+
+        busca = mock_db["usuarios"].find_one
+        assert busca.await_count == 1
+        assert busca.call_args[0][1] == {"senha": 0, "token_convite": 0}
+        assert isinstance(u2["_id"], ObjectId)
+
+        await get_usuario_atual(self._token(iat=2))   # login novo: relê
+        assert busca.await_count == 2
+
+    @pytest.mark.asyncio
+    async def test_ttl_zero_desliga(self, mock_db, monkeypatch):
+        from app import security
+        monkeypatch.setattr(security, "USUARIO_CACHE_TTL_SEC", 0)
+        for _ in range(2):
+            await security.get_usuario_atual(self._token())
+        assert mock_db["usuarios"].find_one.await_count == 2
+
+    @pytest.mark.asyncio
+    async def test_excluir_usuario_invalida_pelo_id(self, mock_db, mock_user):
+        from app import security
+        await security.get_usuario_atual(self._token())
+        security.invalidar_usuario(str(mock_user["_id"]))
+        await security.get_usuario_atual(self._token())
+        assert mock_db["usuarios"].find_one.await_count == 2
+
+    @pytest.mark.asyncio
+    async def test_salvar_preferencias_vale_no_proximo_request(self, client, mock_db, mock_user):
+        from unittest.mock import AsyncMock
+        headers = {"Authorization": f"Bearer {self._token()}"}
+        assert (await client.get("/usuario/preferencias", headers=headers)).json() == {"nivel_tutor": "basico"}
+
+        mock_db["usuarios"].find_one = AsyncMock(return_value={**mock_user, "nivel_tutor": "avancado"})
+        r = await client.put("/usuario/preferencias", headers=headers, json={"nivel_tutor": "avancado"})
+        assert r.status_code == 200
+        assert (await client.get("/usuario/preferencias", headers=headers)).json() == {"nivel_tutor": "avancado"}
@@ -0,0 +1,84 @@
+"""Escritor em lote da telemetria (`app.telemetria`): fila, lotes, teto e desligamento."""
+import asyncio
+
+import pytest
+from pymongo.errors import BulkWriteError
+from unittest.mock import AsyncMock, MagicMock
+
+from app import telemetria
+
+
+@pytest.fixture
+def colecao(monkeypatch):
+    col = MagicMock()
+    col.insert_many = AsyncMock()
+    monkeypatch.setattr("app.database.atividade_usuario", col, raising=False)
+    monkeypatch.setattr(telemetria, "MODO", "fila")
+    monkeypatch.setattr(telemetria, "INTERVALO_SEC", 30.0)
+    return col
+
+
+def _docs(n, prefixo="e"):
+    return [{"acao": f"{prefixo}{i}"} for i in range(n)]
+
+
+class TestFila:
+    @pytest.mark.asyncio
+    async def test_registrar_nao_espera_o_mongo(self, colecao):
+        assert await telemetria.registrar(_docs(3)) == 3
+        colecao.insert_many.assert_not_called()
+        assert telemetria.estatisticas()["fila"] == 3
+
+        await telemetria.encerrar()   # shutdown: grava o pendente num lote só
+        colecao.insert_many.assert_awaited_once()
+        assert len(colecao.insert_many.call_args.args[0]) == 3
+        assert colecao.insert_many.call_args.kwargs == {"ordered": False}
+        assert telemetria.estatisticas()["gravados"] == 3
+
+    @pytest.mark.asyncio
+    async def test_lote_cheio_grava_sem_esperar_o_intervalo(self, colecao, monkeypatch):
+        monkeypatch.setattr(telemetria, "LOTE_MAX", 2)
+        await telemetria.registrar(_docs(5))
+        for _ in range(10):
+            await asyncio.sleep(0)
+        tamanhos = [len(c.args[0]) for c in colecao.insert_many.call_args_list]
+        assert tamanhos == [2, 2, 1]
+        assert telemetria.estatisticas()["fila"] == 0
+
+    @pytest.mark.asyncio
+    async def test_intervalo_grava_o_lote_incompleto(self, colecao, monkeypatch):
+        monkeypatch.setattr(telemetria, "INTERVALO_SEC", 0.01)
+        await telemetria.registrar(_docs(1))
+        await asyncio.sleep(0.1)
+        colecao.insert_many.assert_awaited_once()
+
+
+class TestMongoLento:
+    @pytest.mark.asyncio
+    async def test_fila_cheia_descarta_e_conta(self, colecao, monkeypatch):
+        monkeypatch.setattr(telemetria, "MAX_FILA", 4)
+        assert await telemetria.registrar(_docs(3)) == 3
+        assert await telemetria.registrar(_docs(3)) == 1
+        assert await telemetria.registrar(_docs(1)) == 0
+        estat = telemetria.estatisticas()
+        assert estat["fila"] == 4 and estat["descartados"] == 3
+
+    @pytest.mark.asyncio
+    async def test_falha_parcial_conta_so_o_que_falhou(self, colecao):
+        colecao.insert_many = AsyncMock(side_effect=BulkWriteError(
+            {"writeErrors": [{"index": 1, "code": 11000, "errmsg": "dup"}], "nInserted": 2}))
+        await telemetria.registrar(_docs(3))
+        await telemetria.encerrar()
+        estat = telemetria.estatisticas()
+        assert estat["gravados"] == 2 and estat["falhas"] == 1
+        assert estat["fila"] == 0   # telemetria não re-tenta: o lote sai da fila mesmo assim
+
+    @pytest.mark.asyncio
+    async def test_lote_do_front_responde_sem_esperar_o_banco(self, client, mock_db, auth_headers, colecao):
+        colecao.insert_many = AsyncMock(side_effect=lambda *a, **k: asyncio.sleep(30))
+        body = {"eventos": [{"tipo": "ui", "acao": "a"}, {"tipo": "ui", "acao": "b"}]}
+        resp = await asyncio.wait_for(
+            client.post("/atividades/lote", headers=auth_headers, json=body), 5)
+        assert resp.status_code == 200
+        assert resp.json()["gravados"] == 2
+        assert telemetria.estatisticas()["enfileirados"] == 2
@@ -0,0 +1,105 @@
+"""Rollup por hora da telemetria (`app.telemetria_rollup`): divisão do período, compactador e painéis."""
+from datetime import datetime, timezone
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from app import telemetria_rollup
+
+
+def _t(h, m=0, dia=10):
+    return datetime(2026, 3, dia, h, m, tzinfo=timezone.utc)
+
+
+class _Cursor:
+    def __init__(self, docs=()):
+        self._docs = list(docs)
+
+    def __aiter__(self):
+        async def gen():
+            for d in self._docs:
+                yield d
+        return gen()
+
+    async def to_list(self, length=None):
+        return self._docs
+
+
+class TestFaixas:
+    def test_sem_marca_e_o_scan_bruto_de_antes(self):
+        assert telemetria_rollup.faixas(None, None, None) == (None, None)
+        assert telemetria_rollup.faixas(_t(10), None, None) == ({"timestamp": {"$gte": _t(10)}}, None)
+
+    def test_horas_inteiras_antes_da_marca_vao_para_o_rollup(self):
+        bruto, horas = telemetria_rollup.faixas(_t(10, 30), _t(15, 20), marca=_t(14))
+        assert horas == {"hora": {"$gte": _t(11), "$lt": _t(14)}}
+        assert bruto == {"$or": [{"timestamp": {"$gte": _t(10, 30), "$lt": _t(11)}},
+                                 {"timestamp": {"$gte": _t(14), "$lte": _t(15, 20)}}]}
+
+    def test_fim_antes_da_marca_corta_na_hora_do_fim(self):
+        bruto, horas = telemetria_rollup.faixas(_t(9), _t(12, 5), marca=_t(14))
+        assert horas == {"hora": {"$gte": _t(9), "$lt": _t(12)}}
+        assert bruto == {"timestamp": {"$gte": _t(12), "$lte": _t(12, 5)}}
+
+    def test_periodo_todo_depois_da_marca_nao_usa_o_rollup(self):
+        bruto, horas = telemetria_rollup.faixas(_t(15, 10), None, marca=_t(14))
+        assert horas is None and bruto == {"timestamp": {"$gte": _t(15, 10)}}
+
+    def test_sem_periodo_usa_tudo_ate_a_marca(self):
+        bruto, horas = telemetria_rollup.faixas(None, None, marca=_t(14))
+        assert horas == {"hora": {"$lt": _t(14)}}
+        assert bruto == {"timestamp": {"$gte": _t(14)}}
+
+
+class TestCompactador:
+    @pytest.mark.asyncio
+    async def test_primeira_rodada_resume_desde_o_evento_mais_antigo(self, mock_db):
+        bruto, rollup = mock_db["atividade"], mock_db["atividade_rollup"]
+        bruto.find_one = AsyncMock(return_value={"timestamp": _t(22, 40, dia=8)})
+        bruto.aggregate = MagicMock(side_effect=lambda p: _Cursor())
+
+        horas = await telemetria_rollup.compactar(agora=_t(10, 1))
+
+        # Última hora fechada há mais de 2 min é 9h: 8/3 22h → 10/3 9h, em passos de um dia.
+        assert horas == 35
+        janelas = [c.args[0][0]["$match"]["timestamp"] for c in bruto.aggregate.call_args_list]
+        assert janelas[0] == {"$gte": _t(22, dia=8), "$lt": _t(22, dia=9)}
+        assert janelas[-1]["$lt"] == _t(9)
+        assert all(c.args[0][-1]["$merge"]["into"] == "atividade_rollup"
+                   for c in bruto.aggregate.call_args_list)
+        assert rollup.update_one.call_args.args[1] == {"$max": {"ate": _t(9)}}
+
+    @pytest.mark.asyncio
+    async def test_refaz_a_ultima_hora_resumida(self, mock_db):
+        bruto, rollup = mock_db["atividade"], mock_db["atividade_rollup"]
+        rollup.find_one = AsyncMock(return_value={"_id": "marca_dagua", "ate": _t(9).replace(tzinfo=None)})
+        bruto.aggregate = MagicMock(side_effect=lambda p: _Cursor())
+
+        assert await telemetria_rollup.compactar(agora=_t(10, 30)) == 2
+        assert bruto.aggregate.call_args.args[0][0]["$match"]["timestamp"] == {"$gte": _t(8), "$lt": _t(10)}
+
+
+class TestPaineisLeemORollup:
+    @pytest.mark.asyncio
+    async def test_resumo_une_rollup_e_brutos_depois_da_marca(self, client, mock_db, auth_headers, mock_admin):
+        mock_db["usuarios"].find_one = AsyncMock(return_value=mock_admin)
+        mock_db["atividade_rollup"].find_one = AsyncMock(return_value={"ate": _t(14)})
+        mock_db["atividade"].aggregate = MagicMock(return_value=_Cursor([]))
+
+        resp = await client.get("/atividades/resumo", headers=auth_headers)
+
+        assert resp.status_code == 200
+        pipeline = mock_db["atividade"].aggregate.call_args.args[0]
+        assert pipeline[0] == {"$match": {"timestamp": {"$gte": _t(14)}}}
+        assert pipeline[2] == {"$unionWith": {"coll": "atividade_rollup",
+                                              "pipeline": [{"$match": {"hora": {"$lt": _t(14)}}}]}}
+
+    @pytest.mark.asyncio
+    async def test_tempo_preso_soma_os_cronometrados(self, client, mock_db, auth_headers, mock_admin):
+        mock_db["usuarios"].find_one = AsyncMock(return_value=mock_admin)
+        mock_db["atividade"].aggregate = MagicMock(return_value=_Cursor([]))
+        await client.get("/atividades/tempo-preso", headers=auth_headers)
+        pipeline = mock_db["atividade"].aggregate.call_args.args[0]
+        grupo = next(e["$group"] for e in pipeline if "$group" in e)
+        assert grupo["total"] == {"$sum": "$n_dur"} and grupo["erros"] == {"$sum": "$erros_dur"}
+        assert not any("$unionWith" in e for e in pipeline)   # sem marca: só os brutos
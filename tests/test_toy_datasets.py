@@ -318,3 +318,61 @@ class TestCarregarDatasetPorFonte:
         # de volta mas nenhum outro cliente aceita.
         json.loads(resp.text, parse_constant=lambda c: (_ for _ in ()).throw(
             AssertionError(f"resposta traz {c} literal, não é JSON válido")))
+
+
+@pytest.mark.asyncio
+class TestDatasetsPreparadosCompartilhados:
+    """A turma abrindo a mesma atividade prepara o dataset UMA vez (`app.armazenamento.datasets_exemplo`)."""
+
+    @pytest.fixture
+    def preparos(self, monkeypatch):
+        from app.routers import toy_datasets
+        chamadas = []
+        original = toy_datasets.carregar_com_rotulos
+
+        def contando(nome, ds, **params):
+            chamadas.append(nome)
+            return original(nome, ds, **params)
+
+        monkeypatch.setattr(toy_datasets, "carregar_com_rotulos", contando)
+        return chamadas
+
+    async def test_mesma_assinatura_reaproveita_as_partes(self, client, mock_db, auth_headers, preparos):
+        import asyncio
+        respostas = await asyncio.gather(*[
+            client.get("/toy_datasets/iris", headers=auth_headers) for _ in range(5)
+        ])
+        assert [r.status_code for r in respostas] == [200] * 5
+        assert preparos == ["iris"]   # os pedidos simultâneos esperaram o primeiro preparo
+
+        docs = [c.args[0] for c in mock_db["arquivos"].insert_one.call_args_list]
+        assert len(docs) == 5   # cada aluno continua com a sua coleta...
+        assert all(d["armazenamento"] == docs[0]["armazenamento"] for d in docs)   # ...nos mesmos blobs
+        # Uma referência do cache e uma por coleta: a redivisão de um aluno não solta a dos outros.
+        from app.armazenamento import blobs
+        treino = docs[0]["armazenamento"]["treino"]
+        assert blobs.registro().entradas[treino["chave"]]["refs"] == 1 + 5
+        assert respostas[0].json()["dados"] == respostas[4].json()["dados"]
+
+    async def test_nivel_em_disco_sobrevive_ao_restart(self, client, mock_db, auth_headers, preparos):
+        from app.armazenamento import datasets_exemplo
+        await client.get("/toy_datasets/wine", headers=auth_headers)
+        datasets_exemplo.limpar()   # só a memória, como num processo novo
+        resp = await client.get("/toy_datasets/wine", headers=auth_headers)
+        assert resp.status_code == 200 and resp.json()["total_dados"] == 178
+        assert preparos == ["wine"]
+
+    async def test_parametros_do_gerador_entram_na_chave(self, client, mock_db, auth_headers, preparos):
+        base = "/toy_datasets/gen_classification?seed=7&n_amostras=100"
+        for url in (base, base, base + "&n_features=3", "/toy_datasets/gen_classification?seed=8&n_amostras=100"):
+            assert (await client.get(url, headers=auth_headers)).status_code == 200
+        assert len(preparos) == 3
+
+    async def test_gerador_sem_semente_nao_e_compartilhado(self, client, mock_db, auth_headers, preparos, monkeypatch):
+        monkeypatch.setattr("app.utils.seed._global_seed", None)
+        for _ in range(2):
+            await client.get("/toy_datasets/gen_moons", headers=auth_headers)
+        assert len(preparos) == 2
+        from app.armazenamento import blobs
+        doc = mock_db["arquivos"].insert_one.call_args.args[0]
+        assert blobs.registro().entradas[doc["armazenamento"]["treino"]["chave"]]["refs"] == 1
@@ -224,6 +224,24 @@ class TestValidacaoDadosTreino:
         assert response.status_code == 400
         assert "duas classes" in response.json()["detail"]
 
+    @pytest.mark.asyncio
+    async def test_fila_do_sandbox_cheia_retorna_503(self, client, mock_db, auth_headers):
+        from unittest.mock import patch
+        from app.sandbox import SandboxError
+
+        df = pd.DataFrame({"f1": [1, 2, 3, 4], "target": [0, 0, 1, 1]})
+        coleta_id, config_id = _montar_mocks_treinamento(mock_db, df)
+        lotado = AsyncMock(side_effect=SandboxError("Servidor ocupado.", "ocupado"))
+        with patch("app.routers.treinamento_base.executar_treinamento_async", lotado):
+            response = await client.post(
+                "/classificador/treinamento/knn",
+                headers=auth_headers,
+                json=_payload_knn(coleta_id, config_id),
+            )
+        assert response.status_code == 503
+        # o handler entrega o is_disconnected do request para o sandbox poder cancelar
+        assert lotado.await_args.kwargs["desconectado"] is not None
+
 
 class TestFalhasDaRevisaoDaBanca:
     """Os três defeitos da Imagem 9, reproduzidos pela rota.
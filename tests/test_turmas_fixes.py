@@ -9,6 +9,7 @@ from unittest.mock import AsyncMock, MagicMock, patch
 from bson import ObjectId
 
 from app.routers.turmas import _valor_metrica
+from tests.conftest import ColecaoMemoria
 
 
 class AsyncCursor:
@@ -89,11 +90,14 @@ class TestRanking:
         user_m = MagicMock(find=MagicMock(return_value=AsyncCursor(
             [{"_id": ObjectId(aluno), "nome_usuario": "Aluno X"}])))
 
+        # O ranking sai da coleção materializada; sem a marca de versão na atividade, a leitura
+        # reconstrói a partir dos pipelines (`app/ranking_atividades.py`).
         with patch("app.routers.turmas.turmas", turmas_m), \
              patch("app.routers.turmas.atividades", ativ_m), \
              patch("app.metricas.resultado.opcoes_metricas", metr_m), \
-             patch("app.routers.turmas.pipelines", pipe_m), \
-             patch("app.routers.turmas.colecao_usuario", user_m):
+             patch("app.database.pipelines", pipe_m), \
+             patch("app.database.colecao_usuario", user_m), \
+             patch("app.database.ranking_atividades", ColecaoMemoria()):
             r = await client.get(
                 f"/turmas/{turma['_id']}/atividades/{atividade['_id']}/ranking",
                 headers=auth_headers)
@@ -0,0 +1,164 @@
+"""Cache de respostas do tutor (`app.tutor_cache`) e o seu uso em `/tutor/chat` e `/tutor/chat/stream`."""
+import json as json_lib
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from app import limite_taxa, tutor_cache
+from tests.test_chat_tutor import _mock_async_client, _mock_stream_client, _linha_token
+from tests.test_tutor_system_prompt import _admin
+
+PROMPT = "Você é o tutor."
+KB = "Catálogo: knn, arvore_decisao"
+
+
+def _pergunta(texto, **kw):
+    return tutor_cache.chave([{"role": "user", "content": texto}], prompt=kw.get("prompt", PROMPT),
+                             kb=kw.get("kb", KB), contexto=kw.get("contexto", {}),
+                             pipeline=kw.get("pipeline", ""))
+
+
+class TestChave:
+    def test_caixa_acento_e_pontuacao_nao_contam(self):
+        assert _pergunta("O que é overfitting?") == _pergunta("  o que e OVERFITTING ")
+
+    def test_cenario_diferente_e_chave_diferente(self):
+        base = _pergunta("o que é overfitting?")
+        assert _pergunta("o que é overfitting?", prompt="Outro prompt.") != base
+        assert _pergunta("o que é overfitting?", kb=KB + ", svm") != base
+        assert _pergunta("o que é overfitting?", contexto={"nivel": "avancado"}) != base
+        assert _pergunta("o que é overfitting?", contexto={"papel_do_usuario": "professor"}) != base
+
+    def test_contexto_do_pipeline_de_outro_aluno_nao_compartilha(self, monkeypatch):
+        monkeypatch.setattr(tutor_cache, "SIMILARIDADE", 0.5)
+        meu = _pergunta("meu modelo está bom?", pipeline='{"acuracia": 0.91}')
+        tutor_cache.guardar(meu, "Sim, 91% de acurácia.", "m")
+
+        do_colega = _pergunta("meu modelo está bom?", pipeline='{"acuracia": 0.55}')
+        assert do_colega != meu
+        assert tutor_cache.buscar(do_colega) is None
+        assert tutor_cache.buscar(_pergunta("o meu modelo esta bom", pipeline='{"acuracia": 0.55}')) is None
+        assert tutor_cache.buscar(meu)["tipo"] == "exato"
+
+    def test_so_a_primeira_pergunta_curta_e_cacheavel(self):
+        conversa = [{"role": "user", "content": "oi"}, {"role": "assistant", "content": "olá"},
+                    {"role": "user", "content": "o que é overfitting?"}]
+        assert tutor_cache.chave(conversa, prompt=PROMPT, kb=KB, contexto={}, pipeline="") is None
+        assert _pergunta("x" * 1000) is None
+        assert _pergunta("?!") is None
+
+
+class TestArmazenamento:
+    def test_ttl_e_lru(self, monkeypatch):
+        monkeypatch.setattr(tutor_cache, "MAX_ITENS", 2)
+        a, b, c = _pergunta("a"), _pergunta("b"), _pergunta("c")
+        tutor_cache.guardar(a, "ra", "m")
+        tutor_cache.guardar(b, "rb", "m")
+        assert tutor_cache.buscar(a)["resposta"] == "ra"   # `a` passa a ser a mais recente
+        tutor_cache.guardar(c, "rc", "m")
+        assert tutor_cache.buscar(b) is None
+        assert tutor_cache.buscar(a) and tutor_cache.buscar(c)
+
+        monkeypatch.setattr(tutor_cache, "TTL_SEC", -1)
+        tutor_cache.guardar(a, "ra", "m")
+        assert tutor_cache.buscar(a) is None
+
+    def test_semelhante_so_com_limiar_e_no_mesmo_cenario(self, monkeypatch):
+        tutor_cache.guardar(_pergunta("o que é overfitting?"), "resposta", "m")
+        assert tutor_cache.buscar(_pergunta("overfitting: o que é?")) is None
+
+        tutor_cache.limpar()
+        monkeypatch.setattr(tutor_cache, "SIMILARIDADE", 0.9)
+        tutor_cache.guardar(_pergunta("o que é overfitting?"), "resposta", "m")
+        acerto = tutor_cache.buscar(_pergunta("overfitting: o que é?"))
+        assert acerto == {"resposta": "resposta", "modelo": "m", "tipo": "semelhante"}
+        assert tutor_cache.buscar(_pergunta("o que é underfitting?")) is None
+        assert tutor_cache.buscar(_pergunta("overfitting: o que é?", prompt="Outro prompt.")) is None
+
+
+def _corpo_sse(texto: str) -> list:
+    return [json_lib.loads(linha[6:]) if linha[6:] != "[DONE]" else "[DONE]"
+            for linha in texto.split("\n\n") if linha.startswith("data: ")]
+
+
+class TestChatUsaOCache:
+    PERGUNTA = {"mensagens": [{"role": "user", "content": "O que é overfitting?"}],
+                "contexto": {"modelo": "knn"}}
+
+    def setup_method(self):
+        from app.routers import chat_tutor
+        limite_taxa.limpar()
+        chat_tutor._modelos_ruins.clear()
+
+    @pytest.fixture(autouse=True)
+    def _kb_fixa(self):
+        # O catálogo viria do Mongo; aqui o bloco é fixo (e a chave do cache, estável).
+        with patch("app.routers.chat_tutor.bloco_kb", AsyncMock(return_value=KB)):
+            yield
+
+    @pytest.mark.asyncio
+    async def test_pergunta_repetida_nao_chama_o_provedor(self, client, mock_db, auth_headers, monkeypatch):
+        monkeypatch.setenv("NVIDIA_API_KEY", "chave-de-teste")
+        factory = _mock_async_client(200, {"choices": [{"message": {"content": "É decorar o treino."}}]})
+        with patch("app.routers.chat_tutor.httpx.AsyncClient", factory):
+            primeira = await client.post("/tutor/chat", headers=auth_headers, json=self.PERGUNTA)
+            segunda = await client.post("/tutor/chat", headers=auth_headers, json=self.PERGUNTA)
+
+        assert primeira.status_code == segunda.status_code == 200
+        assert segunda.json()["resposta"] == primeira.json()["resposta"] == "É decorar o treino."
+        assert segunda.json()["cache"] == "exato" and "cache" not in primeira.json()
+        client_falso = factory.return_value.__aenter__.return_value
+        assert client_falso.post.await_count == 1
+
+    @pytest.mark.asyncio
+    async def test_contextos_diferentes_vao_ao_provedor(self, client, mock_db, auth_headers, monkeypatch):
+        monkeypatch.setenv("NVIDIA_API_KEY", "chave-de-teste")
+        factory = _mock_async_client(200, {"choices": [{"message": {"content": "Depende."}}]})
+        outro = {**self.PERGUNTA, "contexto": {"modelo": "knn", "metricas": {"acuracia": 0.55}}}
+        with patch("app.routers.chat_tutor.httpx.AsyncClient", factory):
+            await client.post("/tutor/chat", headers=auth_headers, json=self.PERGUNTA)
+            segunda = await client.post("/tutor/chat", headers=auth_headers, json=outro)
+
+        assert "cache" not in segunda.json()
+        assert factory.return_value.__aenter__.return_value.post.await_count == 2
+
+    @pytest.mark.asyncio
+    async def test_resposta_cortada_no_teto_nao_e_guardada(self, client, mock_db, auth_headers, monkeypatch):
+        monkeypatch.setenv("NVIDIA_API_KEY", "chave-de-teste")
+        corpo = {"choices": [{"message": {"content": "É decor"}, "finish_reason": "length"}]}
+        with patch("app.routers.chat_tutor.httpx.AsyncClient", _mock_async_client(200, corpo)):
+            await client.post("/tutor/chat", headers=auth_headers, json=self.PERGUNTA)
+        assert tutor_cache.estatisticas()["itens"] == 0
+
+    @pytest.mark.asyncio
+    async def test_stream_repetido_e_reenviado_como_sse(self, client, mock_db, auth_headers, monkeypatch):
+        monkeypatch.setenv("NVIDIA_API_KEY", "chave-de-teste")
+        monkeypatch.setenv("NVIDIA_MODEL", "escolhido")
+        from app import tutor_provedores as prov
+        monkeypatch.setitem(prov.CATALOGO, prov.NVIDIA, {**prov.CATALOGO[prov.NVIDIA],
+                                                         "modelo_padrao": "escolhido"})
+        tentados: list = []
+        linhas = [_linha_token("É decorar "), _linha_token("o treino e errar no teste."), "data: [DONE]"]
+        factory = _mock_stream_client({"escolhido": (200, linhas)}, tentados)
+        with patch("app.routers.chat_tutor.httpx.AsyncClient", factory):
+            primeira = await client.post("/tutor/chat/stream", headers=auth_headers, json=self.PERGUNTA)
+            segunda = await client.post("/tutor/chat/stream", headers=auth_headers, json=self.PERGUNTA)
+
+        assert tentados == ["escolhido"]
+        eventos = _corpo_sse(segunda.text)
+        assert eventos[-1] == "[DONE]"
+        assert len(eventos) > 2   # em pedaços, não num evento só
+        texto = "".join(e["token"] for e in eventos[:-1])
+        assert texto == "".join(e["token"] for e in _corpo_sse(primeira.text)[:-1])
+        assert texto == "É decorar o treino e errar no teste."
+
+    @pytest.mark.asyncio
+    async def test_admin_editar_o_prompt_esvazia_o_cache(self, client, mock_db, auth_headers):
+        tutor_cache.guardar(_pergunta("o que é overfitting?"), "resposta", "m")
+        mock_db["usuarios"].find_one = AsyncMock(return_value=_admin())
+        config = MagicMock(find_one=AsyncMock(return_value=None), update_one=AsyncMock())
+        with patch("app.routers.chat_tutor.configuracoes_tutor", config), \
+             patch("app.routers.chat_tutor.tutor_audit", MagicMock(insert_one=AsyncMock())):
+            r = await client.put("/tutor/system-prompt", headers=auth_headers, json={"texto": "Novo."})
+        assert r.status_code == 200
+        assert tutor_cache.estatisticas()["itens"] == 0
@@ -0,0 +1,106 @@
+"""Clientes HTTP compartilhados do tutor (`app.tutor_http`): keep-alive por provedor e métricas."""
+import asyncio
+
+import pytest
+from bson import ObjectId
+from unittest.mock import AsyncMock, patch
+
+from app import tutor_http
+from tests.test_chat_tutor import _PROVEDOR_STREAM, _coletar, _linha_token, _mock_stream_client
+
+
+async def _servidor_keepalive():
+    """Servidor HTTP/1.1 mínimo que mantém a conexão aberta entre requests."""
+    conexoes = []
+
+    async def _atender(reader, writer):
+        conexoes.append(writer)
+        while True:
+            cabecalho = await reader.readuntil(b"\r\n\r\n")
+            if not cabecalho:
+                break
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                         b"Content-Length: 11\r\n\r\n{\"data\":[]}")
+            await writer.drain()
+
+    async def _atender_ate_fechar(reader, writer):
+        try:
+            await _atender(reader, writer)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+
+    servidor = await asyncio.start_server(_atender_ate_fechar, "127.0.0.1", 0)
+    porta = servidor.sockets[0].getsockname()[1]
+    return servidor, f"http://127.0.0.1:{porta}/v1", conexoes
+
+
+class TestRegistroDeClientes:
+    @pytest.mark.asyncio
+    async def test_um_cliente_por_base_url(self):
+        a = await tutor_http.cliente("http://provedor/v1")
+        try:
+            assert await tutor_http.cliente("http://provedor/v1/") is a
+            assert await tutor_http.cliente("http://outro/v1") is not a
+        finally:
+            await tutor_http.encerrar()
+        assert a.is_closed
+
+    @pytest.mark.asyncio
+    async def test_segundo_request_reaproveita_a_conexao(self):
+        servidor, base_url, conexoes = await _servidor_keepalive()
+        try:
+            client = await tutor_http.cliente(base_url)
+            for _ in range(3):
+                r = await client.get(f"{base_url}/models", timeout=5.0)
+                assert r.status_code == 200
+        finally:
+            await tutor_http.encerrar()
+            servidor.close()
+            await servidor.wait_closed()
+
+        assert len(conexoes) == 1
+        metricas = tutor_http.estatisticas()[base_url]
+        assert metricas["requests"] == 3
+        assert metricas["conexoes_novas"] == 1
+        assert metricas["reuso"] == pytest.approx(0.667, abs=1e-3)
+
+    def test_sem_h2_instalado_fica_em_http11(self, monkeypatch):
+        monkeypatch.setattr(tutor_http.importlib.util, "find_spec", lambda nome: None)
+        for valor in ("auto", "1", "0"):
+            monkeypatch.setattr(tutor_http, "HTTP2", valor)
+            assert tutor_http._usar_http2() is False
+        monkeypatch.setattr(tutor_http.importlib.util, "find_spec", lambda nome: object())
+        monkeypatch.setattr(tutor_http, "HTTP2", "0")
+        assert tutor_http._usar_http2() is False
+        monkeypatch.setattr(tutor_http, "HTTP2", "auto")
+        assert tutor_http._usar_http2() is True
+
+
+class TestMetricasDoTutor:
+    @pytest.mark.asyncio
+    async def test_stream_registra_o_tempo_ate_o_primeiro_token(self):
+        from app.routers import chat_tutor
+        chat_tutor._modelos_ruins.clear()
+        factory = _mock_stream_client(
+            {"escolhido": (200, [_linha_token("o"), _linha_token("i"), "data: [DONE]"])}, [])
+        with patch("app.routers.chat_tutor.httpx.AsyncClient", factory):
+            await _coletar(chat_tutor._stream_llm(_PROVEDOR_STREAM, {"stream": True},
+                                                  cadeia=["escolhido"], modelo="escolhido"))
+            await _coletar(chat_tutor._stream_llm(_PROVEDOR_STREAM, {"stream": True},
+                                                  cadeia=["escolhido"], modelo="escolhido"))
+
+        # Um cliente só para as duas mensagens, e um TTFT por resposta (não por token).
+        assert factory.call_count == 1
+        ttft = tutor_http.estatisticas()["http://provedor"]["ttft_ms"]
+        assert ttft["n"] == 2 and ttft["p50"] is not None
+
+    @pytest.mark.asyncio
+    async def test_metricas_de_conexao_sao_de_admin_ou_professor(self, client, mock_db, auth_headers):
+        r = await client.get("/tutor/conexoes", headers=auth_headers)
+        assert r.status_code == 403
+
+        mock_db["usuarios"].find_one = AsyncMock(return_value={
+            "_id": ObjectId(), "email": "p@test.com", "role": "professor", "nome": "p"})
+        r = await client.get("/tutor/conexoes", headers=auth_headers)
+        assert r.status_code == 200
+        assert r.json() == {}
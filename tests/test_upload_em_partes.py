@@ -0,0 +1,129 @@
+"""Upload de CSV em partes (`app.coleta_dados.upload_em_partes`): sessão, retomada, prévia e
+finalização em background."""
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.coleta_dados import upload_em_partes
+from tests.conftest import ColecaoMemoria
+
+
+@pytest.fixture
+def sessoes(monkeypatch):
+    col = ColecaoMemoria()
+    monkeypatch.setattr("app.database.uploads_csv", col, raising=False)
+    return col
+
+
+async def _abrir(client, auth_headers, **opcoes):
+    r = await client.post("/coleta_dados/csv/sessoes", headers=auth_headers,
+                          json={"filename": "turma.csv", **opcoes})
+    assert r.status_code == 201
+    return r.json()["id_sessao"]
+
+
+async def _enviar(client, auth_headers, sid, n, dados):
+    return await client.put(f"/coleta_dados/csv/sessoes/{sid}/partes/{n}",
+                            headers=auth_headers, content=dados)
+
+
+async def _esperar_processamento():
+    await asyncio.gather(*list(upload_em_partes._tarefas))
+
+
+CSV = b"valor,classe\n" + b"".join(b"%d,%s\n" % (i, b"AB"[i % 2:i % 2 + 1]) for i in range(40))
+
+
+class TestFluxo:
+    @pytest.mark.asyncio
+    async def test_partes_em_qualquer_ordem_viram_a_coleta(self, client, mock_db, auth_headers, sessoes):
+        sid = await _abrir(client, auth_headers, test_size=0.25)
+        pedacos = [CSV[:100], CSV[100:200], CSV[200:]]
+        for n in (2, 0, 1):
+            assert (await _enviar(client, auth_headers, sid, n, pedacos[n])).status_code == 200
+
+        r = await client.post(f"/coleta_dados/csv/sessoes/{sid}/finalizar", headers=auth_headers)
+        assert r.status_code == 202
+        await _esperar_processamento()
+
+        situacao = (await client.get(f"/coleta_dados/csv/sessoes/{sid}", headers=auth_headers)).json()
+        assert situacao["status"] == "concluida" and situacao["progresso"]["percentual"] == 100
+        resultado = situacao["resultado"]
+        assert resultado["num_linhas_total"] == 40
+        assert (resultado["num_linhas_treino"], resultado["num_linhas_teste"]) == (30, 10)
+        assert resultado["colunas"] == ["valor", "classe"]
+        mock_db["arquivos"].insert_one.assert_awaited_once()
+        assert "partes" not in next(iter(sessoes.docs.values()))   # partes apagadas no fim
+
+    @pytest.mark.asyncio
+    async def test_retomada_mostra_o_que_falta_e_reenvio_substitui(self, client, mock_db, auth_headers, sessoes):
+        sid = await _abrir(client, auth_headers)
+        await _enviar(client, auth_headers, sid, 0, CSV[:100])
+        await _enviar(client, auth_headers, sid, 2, CSV[200:])
+
+        r = await client.post(f"/coleta_dados/csv/sessoes/{sid}/finalizar", headers=auth_headers)
+        assert r.status_code == 400 and "[1]" in r.json()["detail"]
+
+        await _enviar(client, auth_headers, sid, 1, b"lixo")
+        await _enviar(client, auth_headers, sid, 1, CSV[100:200])
+        situacao = (await client.get(f"/coleta_dados/csv/sessoes/{sid}", headers=auth_headers)).json()
+        assert situacao["partes_recebidas"] == [0, 1, 2]
+        assert situacao["bytes_recebidos"] == len(CSV)
+
+    @pytest.mark.asyncio
+    async def test_preview_so_com_a_primeira_parte(self, client, mock_db, auth_headers, sessoes):
+        sid = await _abrir(client, auth_headers)
+        await _enviar(client, auth_headers, sid, 0, CSV[:60])
+        await _enviar(client, auth_headers, sid, 1, CSV[60:])
+        r = await client.get(f"/coleta_dados/csv/sessoes/{sid}/preview?linhas=50", headers=auth_headers)
+        assert r.status_code == 200
+        # A linha cortada no fim da parte 0 não aparece pela metade.
+        assert r.json()["colunas"] == ["valor", "classe"]
+        assert all(linha["classe"] in ("A", "B") for linha in r.json()["preview"])
+
+    @pytest.mark.asyncio
+    async def test_falha_no_processamento_fica_na_sessao_e_pode_refazer(self, client, mock_db, auth_headers, sessoes):
+        sid = await _abrir(client, auth_headers, encoding="nao-existe")
+        await _enviar(client, auth_headers, sid, 0, CSV)
+        await client.post(f"/coleta_dados/csv/sessoes/{sid}/finalizar", headers=auth_headers)
+        await _esperar_processamento()
+        situacao = (await client.get(f"/coleta_dados/csv/sessoes/{sid}", headers=auth_headers)).json()
+        assert situacao["status"] == "erro" and "Erro ao ler CSV" in situacao["erro"]
+        assert situacao["partes_recebidas"] == [0]
+        r = await client.post(f"/coleta_dados/csv/sessoes/{sid}/finalizar", headers=auth_headers)
+        assert r.status_code == 202
+        await _esperar_processamento()
+
+
+class TestLimites:
+    @pytest.mark.asyncio
+    async def test_parte_acima_do_teto_e_413(self, client, mock_db, auth_headers, sessoes, monkeypatch):
+        monkeypatch.setattr(upload_em_partes, "PARTE_MAX_BYTES", 50)
+        sid = await _abrir(client, auth_headers)
+        assert (await _enviar(client, auth_headers, sid, 0, CSV[:51])).status_code == 413
+
+    @pytest.mark.asyncio
+    async def test_finalizar_duas_vezes_e_409(self, client, mock_db, auth_headers, sessoes):
+        sid = await _abrir(client, auth_headers)
+        await _enviar(client, auth_headers, sid, 0, CSV)
+        sessao = next(iter(sessoes.docs.values()))
+        sessao["status"], sessao["atualizado_em"] = "processando", datetime.now(timezone.utc)
+        r = await client.post(f"/coleta_dados/csv/sessoes/{sid}/finalizar", headers=auth_headers)
+        assert r.status_code == 409
+        assert (await _enviar(client, auth_headers, sid, 1, CSV)).status_code == 409
+
+    @pytest.mark.asyncio
+    async def test_sessao_de_outro_usuario_e_404(self, client, mock_db, auth_headers, sessoes):
+        sid = await _abrir(client, auth_headers)
+        next(iter(sessoes.docs.values()))["usuario_id"] = "outro"
+        r = await client.get(f"/coleta_dados/csv/sessoes/{sid}", headers=auth_headers)
+        assert r.status_code == 404
+
+    @pytest.mark.asyncio
+    async def test_limpeza_apaga_sessoes_paradas(self, sessoes):
+        antiga = datetime.now(timezone.utc) - timedelta(hours=upload_em_partes.SESSAO_TTL_HORAS + 1)
+        await sessoes.insert_one({"status": "aberta", "partes": {}, "atualizado_em": antiga})
+        await sessoes.insert_one({"status": "aberta", "partes": {}, "atualizado_em": datetime.now(timezone.utc)})
+        assert await upload_em_partes.limpar_sessoes_abandonadas() == 1
+        assert len(sessoes.docs) == 1